@@ -8,19 +8,23 @@ The model can also be input to our animation code so that it is view in the anim
 A quick summary of the classes used and their purposes is presented below:
  - Face2D: This class specifies a two dimensional shape and some assorted surface properties.
  - Face3D: This class is a wrapper around a single Face2D object which positions the 2D face in 3D space.
+ - FaceArrays: This class packs the geometry and surface properties of a list of Face3D objects into numpy arrays, so
+     that the disturbance torques can be calculated for all the faces at once.
  - Polygon3D: This class represents a 3D polygon by holding onto a list of Face3D objects. It allows you to
      translate and rotate the polygon as a whole.
  - Cubesat3D: This class inherits from Polygon3D but adds useful information such as center of mass, moment of
      inertia and magnetic properties.
+ - CubeSatEnsemble: This class holds N CubeSat models with the same geometry, so that they can be propagated together.
 """
 
 
 import numpy as np
+import hashlib
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 from typing import Union, List
-from adcsim.hysteresis_rod import HysteresisRod
-from scipy.interpolate import RegularGridInterpolator
+from adcsim.hysteresis_rod import HysteresisRod, HysteresisRodBank
+from adcsim.lookup_tables import UniformGridTable, CubeMapTable
 
 
 class Face2D:
@@ -169,24 +173,15 @@ class Face2D:
         """
         https://en.wikipedia.org/wiki/Polygon#Area
         """
-        n = v.shape[1]
-        a = 0.0
-        for i in range(n - 1):
-            a += v[0, i] * v[1, i + 1] - v[0, i + 1] * v[1, i]
-        return 0.5 * a
+        return 0.5 * float(np.sum(v[0, :-1] * v[1, 1:] - v[0, 1:] * v[1, :-1]))
 
     @staticmethod
     def _polygon_centroid(v: np.ndarray):
         """
         https://en.wikipedia.org/wiki/Centroid#Of_a_polygon
         """
-        n = v.shape[1]
-        cx = 0.0
-        cy = 0.0
-        for i in range(n - 1):
-            cx += (v[0, i] + v[0, i + 1]) * (v[0, i] * v[1, i + 1] - v[0, i + 1] * v[1, i])
-            cy += (v[1, i] + v[1, i + 1]) * (v[0, i] * v[1, i + 1] - v[0, i + 1] * v[1, i])
-        return np.array([cx, cy]) / (6 * Face2D._polygon_area(v))
+        cross = v[0, :-1] * v[1, 1:] - v[0, 1:] * v[1, :-1]
+        return ((v[:, :-1] + v[:, 1:]) @ cross) / (3 * np.sum(cross))
 
     def asdict(self):
         return {
@@ -232,12 +227,11 @@ class Face3D:
         '-z': np.array([0., 0., -1.]),
     }
     def __init__(self, face: Face2D, orientation: Union[str, np.ndarray]='+x+y', translation: np.ndarray=np.zeros(3), name='', color='k'):
-        self._orientation = np.eye(3)
-        self._translation = np.zeros((3, 1))
-        self.face = face
+        # the face positions are only calculated once, by the last setter
+        self._face = face
         self.is_solar_panel = self.face.is_solar_panel
+        self._translation = translation.reshape(3, 1)
         self.orientation = orientation
-        self.translation = translation
 
         self._name = name
         self._color = color
@@ -383,6 +377,37 @@ class Face3D:
         self._centroid += self.translation.squeeze()
 
 
+class FaceArrays:
+    """
+    The geometry and surface properties of a list of Face3D objects packed into arrays (one row per face), so that the
+    aerodynamic torque, the solar pressure torque and the solar power can be calculated for all the faces at once with
+    numpy instead of looping over the faces:
+     - normals                  (F, 3)
+     - centroids                (F, 3)  [m]
+     - lever_arms               (F, 3)  [m]     centroid - center of mass
+     - lever_arm_cross_normals  (F, 3)  [m]     lever_arm x normal
+     - areas                    (F,)    [m^2]
+     - accommodation_coeff      (F,)
+     - spec_ref_coeff           (F,)
+     - diff_ref_coeff           (F,)
+     - solar_power_efficiency   (F,)            0 for faces that are not solar panels
+    """
+    def __init__(self, faces: List[Face3D], center_of_mass: np.ndarray=np.zeros(3)):
+        self.normals = np.array([face.normal for face in faces], dtype=float).reshape(-1, 3)
+        self.centroids = np.array([face.centroid for face in faces], dtype=float).reshape(-1, 3)
+        self.lever_arms = self.centroids - center_of_mass
+        self.lever_arm_cross_normals = np.cross(self.lever_arms, self.normals)
+        self.areas = np.array([face.area for face in faces], dtype=float)
+        self.accommodation_coeff = np.array([face.accommodation_coeff for face in faces], dtype=float)
+        self.spec_ref_coeff = np.array([face.spec_ref_coeff for face in faces], dtype=float)
+        self.diff_ref_coeff = np.array([face.diff_ref_coeff for face in faces], dtype=float)
+        self.solar_power_efficiency = np.array([face.solar_power_efficiency if face.is_solar_panel else 0.0
+                                                for face in faces], dtype=float)
+
+    def __len__(self):
+        return len(self.areas)
+
+
 class Polygons3D:
     """
     A 3D polygon, represented internally as a list of Face3D objects.
@@ -457,13 +482,22 @@ class CubeSat(Polygons3D):
         self._solar_lut = None  # lookup table for solar torque
         self._power_lut = None  # lookup table for solar power
 
+        self._face_arrays = None  # faces packed into arrays, built when first needed
+        self._solar_panel_arrays = None
+        self._rod_bank = None  # hysteresis rods packed into arrays, built when first needed
+
         super().__init__(faces)
 
     @classmethod
-    def fromdict(cls, data_dict):
+    def fromdict(cls, data_dict, faces: List[Face3D]=None):
+        """
+        :param data_dict: cubesat parameters dict (see asdict), or its string representation
+        :param faces: the faces of data_dict['faces'] if they have already been created (they are copied)
+        """
         if isinstance(data_dict, str):
             data_dict = eval(data_dict)
-        faces = [Face3D.fromdict(data_dict['faces'][i]) for i in range(len(data_dict['faces']))]
+        if faces is None:
+            faces = [Face3D.fromdict(data_dict['faces'][i]) for i in range(len(data_dict['faces']))]
         hyst_rods = [HysteresisRod.fromdict(data_dict['hyst_rods'][i]) for i in range(len(data_dict['hyst_rods']))]
         return cls(faces, np.array(data_dict['center_of_mass']), np.array(data_dict['inertia']),
                    np.array(data_dict['residual_magnetic_moment']), np.array(data_dict['magnetic_moment']), hyst_rods)
@@ -484,6 +518,14 @@ class CubeSat(Polygons3D):
     def hyst_rods(self):
         return self._hyst_rods
 
+    @property
+    def rod_bank(self):
+        """The hysteresis rods packed into arrays, which holds the state of the rods in the simulations (see
+        HysteresisRodBank)"""
+        if self._rod_bank is None:
+            self._rod_bank = HysteresisRodBank.from_rods(self.hyst_rods)
+        return self._rod_bank
+
     @property
     def residual_magnetic_moment(self):
         return self._residual_magnetic_moment
@@ -496,6 +538,51 @@ class CubeSat(Polygons3D):
     def total_magnetic_moment(self):
         return self._total_magnetic_moment
 
+    @property
+    def face_arrays(self):
+        """The faces packed into arrays, with lever arms about the center of mass (see FaceArrays)"""
+        if self._face_arrays is None:
+            self._face_arrays = FaceArrays(self.faces, self.center_of_mass)
+        return self._face_arrays
+
+    @property
+    def solar_panel_arrays(self):
+        """The solar panel faces packed into arrays (see FaceArrays)"""
+        if self._solar_panel_arrays is None:
+            self._solar_panel_arrays = FaceArrays(self.solar_panel_faces, self.center_of_mass)
+        return self._solar_panel_arrays
+
+    def update_face_arrays(self):
+        """
+        Rebuild the packed face arrays the next time they are needed. This is done by rotate and translate, but it must
+        be called after changing a face directly (e.g. cubesat.faces[0].translate(...)).
+        """
+        self._face_arrays = None
+        self._solar_panel_arrays = None
+
+    def geometry_hash(self):
+        """
+        A hash of everything the aerodynamic, solar and power lookup tables depend on: the faces, their surface
+        properties and the center of mass. CubeSats that only differ in inertia, magnets or hysteresis rods have the same
+        hash, and the hash is the same in every process and every run (used as the key of LookupTableCache).
+        """
+        h = hashlib.sha256()
+        for arrays in (self.face_arrays, self.solar_panel_arrays):
+            for a in (arrays.normals, arrays.centroids, arrays.areas, arrays.accommodation_coeff,
+                      arrays.spec_ref_coeff, arrays.diff_ref_coeff, arrays.solar_power_efficiency):
+                h.update(np.ascontiguousarray(a, dtype=float).tobytes())
+            h.update(b'|')
+        h.update(np.asarray(self.center_of_mass, dtype=float).tobytes())
+        return h.hexdigest()
+
+    def rotate(self, dcm: np.ndarray=None, axis: Union[str, np.ndarray]=None, angle: float=None):
+        super().rotate(dcm=dcm, axis=axis, angle=angle)
+        self.update_face_arrays()
+
+    def translate(self, vector: np.ndarray):
+        super().translate(vector)
+        self.update_face_arrays()
+
     def asdict(self):
         d = {
             'center_of_mass': self.center_of_mass.tolist(),
@@ -517,103 +604,259 @@ class CubeSat(Polygons3D):
 
         return d
 
-    def create_aerodynamic_table(self, function, nmu, nphi):
+    @staticmethod
+    def _table_directions(nmu, nphi):
+        # the grid of the lookup tables: cosine of the zenith angle, azimuth angle and the unit vectors (nmu, nphi, 3)
+        mu = np.linspace(-1., 1., nmu)
+        nu = np.sqrt(1.0 - mu**2)
+        phi = np.linspace(-np.pi, np.pi, nphi)
+        directions = np.stack((np.outer(nu, np.cos(phi)), np.outer(nu, np.sin(phi)),
+                               np.repeat(mu[:, None], nphi, axis=1)), axis=-1)
+        return mu, phi, directions
+
+    def _create_table(self, name, function, args, nmu, nphi, cache, method, cube_map):
+        # calculate a lookup table for all the directions with one call of function (or load it from the cache)
+        if cube_map is None:
+            mu, phi, directions = self._table_directions(nmu, nphi)
+            shape = (name, nmu, nphi)
+        else:
+            directions = CubeMapTable.directions(cube_map)
+            shape = (name, 'cube_map', cube_map)
+
+        if cube_map is not None and method != 'linear':
+            raise ValueError("cube map lookup tables only support method='linear'")
+
+        def build():
+            return function(directions, *args, self)
+
+        def coefficients():
+            if cube_map is None:
+                return UniformGridTable.coefficients(mu, phi, table, method)
+            return CubeMapTable.coefficients(table)
+
+        if cache is None:
+            table = build()
+            table_coefficients = None
+        else:
+            function_name = f'{getattr(function, "__module__", "")}.{getattr(function, "__qualname__", repr(function))}'
+            key = cache.key(self.geometry_hash(), function_name, *shape)
+            table = cache.get(key, build)
+            # the interpolation uses the coefficients, which are several times the size of the table, so they are
+            # cached (and memory mapped) as well
+            table_coefficients = cache.get(cache.part_key(key, method), coefficients)
+
+        if cube_map is None:
+            return UniformGridTable(mu, phi, table, method, table_coefficients)
+        return CubeMapTable(table, table_coefficients)
+
+    def create_aerodynamic_table(self, function, nmu=101, nphi=101, cache=None, method='linear', cube_map=None):
         """
-        Creates a lookup table for aerodynamic torque
+        Creates a lookup table for aerodynamic torque. The whole table is calculated with a single call of function.
         :param function: Function that calculates aerodynamic torque. Should take the following arguments:
-          v: vector containing velocity with respect to air in m/s
+          v: array of velocities with respect to air in m/s, shape (..., 3)
           rho: air density in kg/m^3
           cubesat: CubeSat model
+        and return the torques, shape (..., 3).
         :param nmu: Number of data points in the zenith direction.
         :param nphi: Number of data points in the azimuth direction.
+        :param cache: optional LookupTableCache (see lut_cache.py) the table is loaded from, or saved to if it is new.
+        :param method: interpolation of the table, 'linear' or 'cubic' (see lookup_tables.py)
+        :param cube_map: if given, the table is a cube map with cube_map x cube_map points on each face of the cube
+        instead of a (mu, phi) grid, and nmu and nphi are not used (see CubeMapTable in lookup_tables.py)
         :return:
         """
-        mu = np.linspace(-1., 1., nmu)
-        nu = np.sqrt(1.0 - mu**2)
-        phi = np.linspace(-np.pi, np.pi, nphi)
-        cosphi = np.cos(phi)
-        sinphi = np.sin(phi)
-        table = np.zeros((nmu, nphi, 3))
-
-        for i in range(nmu):
-            for j in range(nphi):
-                ev = np.array([nu[i] * cosphi[j], nu[i] * sinphi[j], mu[i]])
-                table[i, j] = function(ev, 1.0, self)
-
-        self._aero_lut = RegularGridInterpolator((mu, phi), table)
+        self._aero_lut = None  # so that function calculates the torques instead of looking them up in an old table
+        self._aero_lut = self._create_table('aerodynamic', function, (1.0,), nmu, nphi, cache, method, cube_map)
 
     def aerodynamic_lookup(self, v: np.ndarray):
-        mu = v[2] / np.linalg.norm(v)
-        phi = np.arctan2(v[1], v[0])
-        return self._aero_lut((mu, phi))
+        # v can be a single vector or an array of vectors of shape (..., 3)
+        return self._aero_lut(v)
 
-    def create_solar_table(self, function, nmu, nphi):
+    def create_solar_table(self, function, nmu=101, nphi=101, cache=None, method='linear', cube_map=None):
         """
-        Creates a lookup table for aerodynamic torque
-        :param function: Function that calculates aerodynamic torque. Should take the following arguments:
-          sun_vec: Unit vector pointing at the sun in the body frame
+        Creates a lookup table for solar pressure torque. The whole table is calculated with a single call of function.
+        :param function: Function that calculates solar pressure torque. Should take the following arguments:
+          sun_vec: array of unit vectors pointing at the sun in the body frame, shape (..., 3)
           sun_vec_inertial: sun position in inertial frame
           satellite_vec_inertial: satellite position in inertial frame
           cubesat: CubeSat model
+        and return the torques, shape (..., 3).
         :param nmu: Number of data points in the zenith direction.
         :param nphi: Number of data points in the azimuth direction.
+        :param cache: optional LookupTableCache (see lut_cache.py) the table is loaded from, or saved to if it is new.
+        :param method: interpolation of the table, 'linear' or 'cubic' (see lookup_tables.py)
+        :param cube_map: if given, the table is a cube map with cube_map x cube_map points on each face of the cube
+        instead of a (mu, phi) grid, and nmu and nphi are not used (see CubeMapTable in lookup_tables.py)
         :return:
         """
-        mu = np.linspace(-1., 1., nmu)
-        nu = np.sqrt(1.0 - mu**2)
-        phi = np.linspace(-np.pi, np.pi, nphi)
-        cosphi = np.cos(phi)
-        sinphi = np.sin(phi)
-        table = np.zeros((nmu, nphi, 3))
-
         # these parameters just determine satellite-sun distance, which should
         # be applied after the lookup table, so these parameters just make it 1
         sun_vec_inertial = np.array([1., 0., 0.])
         satellite_vec_inertial = np.array([0., 0., 0.])
-        for i in range(nmu):
-            for j in range(nphi):
-                ev = np.array([nu[i] * cosphi[j], nu[i] * sinphi[j], mu[i]])
-                table[i, j] = function(ev, sun_vec_inertial, satellite_vec_inertial, self)
-
-        self._solar_lut = RegularGridInterpolator((mu, phi), table)
+        self._solar_lut = None
+        self._solar_lut = self._create_table('solar', function, (sun_vec_inertial, satellite_vec_inertial), nmu, nphi,
+                                             cache, method, cube_map)
 
     def solar_lookup(self, v: np.ndarray):
-        mu = v[2] / np.linalg.norm(v)
-        phi = np.arctan2(v[1], v[0])
-        return self._solar_lut((mu, phi))
+        # v can be a single vector or an array of vectors of shape (..., 3)
+        return self._solar_lut(v)
 
-    def create_power_table(self, function, nmu, nphi):
+    def create_power_table(self, function, nmu=101, nphi=101, cache=None, method='linear', cube_map=None):
         """
-        Creates a lookup table for aerodynamic torque
-        :param function: Function that calculates aerodynamic torque. Should take the following arguments:
-          sun_vec: Unit vector pointing at the sun in the body frame
+        Creates a lookup table for solar power. The whole table is calculated with a single call of function.
+        :param function: Function that calculates solar power. Should take the following arguments:
+          sun_vec: array of unit vectors pointing at the sun in the body frame, shape (..., 3)
           sun_vec_inertial: sun position in inertial frame
           satellite_vec_inertial: satellite position in inertial frame
           cubesat: CubeSat model
+        and return the power, shape (...).
         :param nmu: Number of data points in the zenith direction.
         :param nphi: Number of data points in the azimuth direction.
+        :param cache: optional LookupTableCache (see lut_cache.py) the table is loaded from, or saved to if it is new.
+        :param method: interpolation of the table, 'linear' or 'cubic' (see lookup_tables.py)
+        :param cube_map: if given, the table is a cube map with cube_map x cube_map points on each face of the cube
+        instead of a (mu, phi) grid, and nmu and nphi are not used (see CubeMapTable in lookup_tables.py)
         :return:
         """
-        mu = np.linspace(-1., 1., nmu)
-        nu = np.sqrt(1.0 - mu**2)
-        phi = np.linspace(-np.pi, np.pi, nphi)
-        cosphi = np.cos(phi)
-        sinphi = np.sin(phi)
-        table = np.zeros((nmu, nphi))
-
         # these parameters just determine satellite-sun distance, which should
         # be applied after the lookup table, so these parameters just make it 1
         sun_vec_inertial = np.array([1., 0., 0.])
         satellite_vec_inertial = np.array([0., 0., 0.])
-        for i in range(nmu):
-            for j in range(nphi):
-                ev = np.array([nu[i] * cosphi[j], nu[i] * sinphi[j], mu[i]])
-                table[i, j] = function(ev, sun_vec_inertial, satellite_vec_inertial, self)
-
-        self._power_lut = RegularGridInterpolator((mu, phi), table)
+        self._power_lut = None
+        self._power_lut = self._create_table('power', function, (sun_vec_inertial, satellite_vec_inertial), nmu, nphi,
+                                             cache, method, cube_map)
 
     def power_lookup(self, v: np.ndarray):
-        mu = v[2] / np.linalg.norm(v)
-        phi = np.arctan2(v[1], v[0])
-        return self._power_lut((mu, phi))
+        # v can be a single vector or an array of vectors of shape (..., 3)
+        return self._power_lut(v)
+
 
+
+class CubeSatEnsemble:
+    """
+    A collection of N CubeSat models that are propagated together (see sim_attitude_ensemble in simulations/sim.py).
+
+    All the members must share the same geometry (faces and center of mass), so the aerodynamic, solar and power lookup
+    tables are built once and shared. The inertia, magnetic moments and hysteresis rods can be different for each
+    member, and are held as arrays with a leading dimension of length N:
+     - inertia, inertia_inv         (N, 3, 3)
+     - total_magnetic_moment        (N, 3)
+     - rod_br, rod_bs, rod_hc, rod_k, rod_volume, rod_h, rod_b  (N, R)
+     - rod_axes                     (N, R, 3)
+    The rod arrays are those of rod_bank, a HysteresisRodBank with batch shape (N, R). Every member must have the same
+    number of hysteresis rods R.
+    """
+
+    def __init__(self, cubesats: List[CubeSat]):
+        if len(cubesats) == 0:
+            raise ValueError('A CubeSat ensemble needs at least one member')
+        self._members = cubesats
+        geometry = cubesats[0]
+        geometry_faces = [face.asdict() for face in geometry.faces]
+        for cubesat in cubesats[1:]:
+            if not np.array_equal(cubesat.center_of_mass, geometry.center_of_mass) or \
+                    [face.asdict() for face in cubesat.faces] != geometry_faces:
+                raise ValueError('All members of a CubeSat ensemble must have the same geometry')
+            if len(cubesat.hyst_rods) != len(geometry.hyst_rods):
+                raise ValueError('All members of a CubeSat ensemble must have the same number of hysteresis rods')
+        self._geometry = geometry
+
+        self._inertia = np.array([c.inertia for c in cubesats], dtype=float)
+        self._inertia_inv = np.array([c.inertia_inv for c in cubesats], dtype=float)
+        self._total_magnetic_moment = np.array([c.total_magnetic_moment for c in cubesats], dtype=float)
+
+        self._rod_bank = HysteresisRodBank.from_rods([c.hyst_rods for c in cubesats])
+
+    @classmethod
+    def fromdicts(cls, data_dicts):
+        # the members normally share their faces, so these are only created from the first dict once
+        data_dicts = [eval(d) if isinstance(d, str) else d for d in data_dicts]
+        cubesats = []
+        for d in data_dicts:
+            shared = cubesats and d['faces'] == data_dicts[0]['faces']
+            cubesats.append(CubeSat.fromdict(d, cubesats[0].faces if shared else None))
+        return cls(cubesats)
+
+    def __len__(self):
+        return len(self._members)
+
+    @property
+    def members(self):
+        return self._members
+
+    @property
+    def geometry(self):
+        """The CubeSat model whose faces (and lookup tables) are shared by all the members"""
+        return self._geometry
+
+    @property
+    def rod_bank(self):
+        """The hysteresis rods of all the members, with batch shape (N, R) (see HysteresisRodBank)"""
+        return self._rod_bank
+
+    @property
+    def num_rods(self):
+        return len(self._rod_bank)
+
+    @property
+    def rod_br(self):
+        return self._rod_bank.br
+
+    @property
+    def rod_bs(self):
+        return self._rod_bank.bs
+
+    @property
+    def rod_hc(self):
+        return self._rod_bank.hc
+
+    @property
+    def rod_k(self):
+        return self._rod_bank.k
+
+    @property
+    def rod_volume(self):
+        return self._rod_bank.volume
+
+    @property
+    def rod_axes(self):
+        return self._rod_bank.axes
+
+    @property
+    def rod_h(self):
+        return self._rod_bank.h
+
+    @property
+    def rod_b(self):
+        return self._rod_bank.b
+
+    @property
+    def inertia(self):
+        return self._inertia
+
+    @property
+    def inertia_inv(self):
+        return self._inertia_inv
+
+    @property
+    def total_magnetic_moment(self):
+        return self._total_magnetic_moment
+
+    def asdicts(self):
+        return [c.asdict() for c in self._members]
+
+    def initialize_rods(self, h):
+        """
+        Put the hysteresis rods in a reasonable initial state (on the lower limiting curve).
+        :param h: external magnetic field along each rod, shape (N, R)
+        """
+        self._rod_bank.initialize(h)
+
+    def aerodynamic_lookup(self, v: np.ndarray):
+        return self._geometry.aerodynamic_lookup(v)
+
+    def solar_lookup(self, v: np.ndarray):
+        return self._geometry.solar_lookup(v)
+
+    def power_lookup(self, v: np.ndarray):
+        return self._geometry.power_lookup(v)
@@ -37,76 +37,20 @@ from math import *
 /* ------------------------------------------------------------------- */
 """
 
-#/* PARMB */
-gsurf = [0.0];
-re = [0.0];
-
-#/* GTS3C */
-dd = 0.0;
-
-#/* DMIX */
-dm04 = 0.0
-dm16 = 0.0
-dm28 = 0.0
-dm32 = 0.0
-dm40 = 0.0
-dm01 = 0.0
-dm14 = 0.0
-
-#/* MESO7 */
-meso_tn1 = [0.0 for _ in range(5)];
-meso_tn2 = [0.0 for _ in range(4)];
-meso_tn3 = [0.0 for _ in range(5)];
-meso_tgn1 = [0.0 for _ in range(2)];
-meso_tgn2 = [0.0 for _ in range(2)];
-meso_tgn3 = [0.0 for _ in range(2)];
+#The variables the C version shares between functions (PARMB, GTS3C, DMIX, MESO7, LPOLY) are kept in a
+#nrlmsise_context (see nrlmsise_00_header.py) that is passed down from gtd7, so that calls don't share any state
+#and the model can be used from several threads at once.
 
 #/* POWER7 */
 #/* LOWER7 */
 #Dont to need to do anyt of the externs, they are all here
 from adcsim.Python_NRLMSISE.nrlmsise_00_data import *
-
-
-#/* LPOLY */
-dfa = 0.0
-plg = [[0.0 for _ in range(9)] for _ in range(4)];
-ctloc = 0.0
-stloc = 0.0
-c2tloc = 0.0
-s2tloc = 0.0
-s3tloc = 0.0
-c3tloc = 0.0
-apdf = 0.0
-apt = [0.0 for _ in range(4)]
+from adcsim.Python_NRLMSISE.nrlmsise_00_array import gtd7_array, is_array_input
 
 
 #since rgas is used eerywehre usignthe same variable, ill make it glboal
 #rgas = 831.44621
 #rgas = 831.4
-"""
-/* ------------------------------------------------------------------- */
-/* ------------------------------ TSELEC ----------------------------- */
-/* ------------------------------------------------------------------- */
-"""
-def tselec(flags):
-
-    for i in range(24):
-        if(i != 9):
-            if(flags.switches[i]==1):
-                flags.sw[i]=1
-            else:
-                flags.sw[i]=0
-
-            if(flags.switches[i]>0):
-                flags.swc[i]=1
-            else:
-                flags.swc[i]=0
-        else:
-            flags.sw[i]=flags.switches[i]
-            flags.swc[i]=flags.switches[i]
-    return
-
-
 """
 /* ------------------------------------------------------------------- */
 /* ------------------------------ GLATF ------------------------------ */
@@ -177,10 +121,10 @@ def ccor2(alt, r, h1, zh, h2):
 /* ------------------------------- SCALH ----------------------------- */
 /* ------------------------------------------------------------------- */
 """
-def scalh(alt, xm, temp):
+def scalh(alt, xm, temp, ctx):
     #rgas = 831.44621    #maybe make this a global constant?
     rgas = 831.4
-    g = gsurf[0] / (pow((1.0 + alt/re[0]),2.0))
+    g = ctx.gsurf[0] / (pow((1.0 + alt/ctx.re[0]),2.0))
     g = rgas * temp / (g * xm)
     return g
 
@@ -352,10 +296,10 @@ def spline(x, y, n, yp1, ypn, y2):
 /* ------------------------------- DENSM ----------------------------- */
 /* ------------------------------------------------------------------- */
 '''
-def zeta(zz, zl):
-    return ((zz-zl)*(re[0]+zl)/(re[0]+zz))    #re is the global variable
+def zeta(zz, zl, ctx):
+    return ((zz-zl)*(ctx.re[0]+zl)/(ctx.re[0]+zz))
 
-def densm(alt, d0, xm, tz, mn3, zn3, tn3, tgn3, mn2, zn2, tn2, tgn2):
+def densm(alt, d0, xm, tz, mn3, zn3, tn3, tgn3, mn2, zn2, tn2, tgn2, ctx):
     '''
 /*      Calculate Temperature and Density Profiles for lower atmos.  */
 '''
@@ -381,15 +325,15 @@ def densm(alt, d0, xm, tz, mn3, zn3, tn3, tgn3, mn2, zn2, tn2, tgn2):
     z2=zn2[mn-1];
     t1=tn2[0];
     t2=tn2[mn-1];
-    zg = zeta(z, z1);
-    zgdif = zeta(z2, z1);
+    zg = zeta(z, z1, ctx);
+    zgdif = zeta(z2, z1, ctx);
 
     #/* set up spline nodes */
     for k in range(mn):
-        xs[k]=zeta(zn2[k],z1)/zgdif;
+        xs[k]=zeta(zn2[k],z1, ctx)/zgdif;
         ys[k]=1.0 / tn2[k];
     yd1=-tgn2[0] / (t1*t1) * zgdif;
-    yd2=-tgn2[1] / (t2*t2) * zgdif * (pow(((re[0]+z2)/(re[0]+z1)),2.0));
+    yd2=-tgn2[1] / (t2*t2) * zgdif * (pow(((ctx.re[0]+z2)/(ctx.re[0]+z1)),2.0));
 
     #/* calculate spline coefficients */
     spline (xs, ys, mn, yd1, yd2, y2out);   #No need to change this
@@ -401,7 +345,7 @@ def densm(alt, d0, xm, tz, mn3, zn3, tn3, tgn3, mn2, zn2, tn2, tgn2):
     tz[0] = 1.0 / y[0];
     if (xm!=0.0):
         #/* calaculate stratosphere / mesospehere density */
-        glb = gsurf[0] / (pow((1.0 + z1/re[0]),2.0));
+        glb = ctx.gsurf[0] / (pow((1.0 + z1/ctx.re[0]),2.0));
         gamm = xm * glb * zgdif / rgas;
 
         #/* Integrate temperature profile */
@@ -427,18 +371,18 @@ def densm(alt, d0, xm, tz, mn3, zn3, tn3, tgn3, mn2, zn2, tn2, tgn2):
     z2=zn3[mn-1];
     t1=tn3[0];
     t2=tn3[mn-1];
-    zg=zeta(z,z1);
-    zgdif=zeta(z2,z1);
+    zg=zeta(z,z1, ctx);
+    zgdif=zeta(z2,z1, ctx);
 
 
 
     #/* set up spline nodes */
     for k in range(mn):
-        xs[k] = zeta(zn3[k],z1) / zgdif;
+        xs[k] = zeta(zn3[k],z1, ctx) / zgdif;
         ys[k] = 1.0 / tn3[k];
     
     yd1=-tgn3[0] / (t1*t1) * zgdif;
-    yd2=-tgn3[1] / (t2*t2) * zgdif * (pow(((re[0]+z2)/(re[0]+z1)),2.0));
+    yd2=-tgn3[1] / (t2*t2) * zgdif * (pow(((ctx.re[0]+z2)/(ctx.re[0]+z1)),2.0));
 
     #/* calculate spline coefficients */
     spline (xs, ys, mn, yd1, yd2, y2out);
@@ -450,7 +394,7 @@ def densm(alt, d0, xm, tz, mn3, zn3, tn3, tgn3, mn2, zn2, tn2, tgn2):
     tz[0] = 1.0 / y[0];
     if (xm!=0.0):
         #/* calaculate tropospheric / stratosphere density */
-        glb = gsurf[0] / (pow((1.0 + z1/re[0]),2.0));
+        glb = ctx.gsurf[0] / (pow((1.0 + z1/ctx.re[0]),2.0));
         gamm = xm * glb * zgdif / rgas;
 
         #/* Integrate temperature profile */
@@ -475,7 +419,7 @@ def densm(alt, d0, xm, tz, mn3, zn3, tn3, tgn3, mn2, zn2, tn2, tgn2):
 /* ------------------------------- DENSU ----------------------------- */
 /* ------------------------------------------------------------------- */
 '''
-def densu(alt, dlb, tinf, tlb, xm, alpha, tz, zlb, s2, mn1, zn1, tn1, tgn1):
+def densu(alt, dlb, tinf, tlb, xm, alpha, tz, zlb, s2, mn1, zn1, tn1, tgn1, ctx):
     '''
 /*      Calculate Temperature and Density Profiles for MSIS models
  *      New lower thermo polynomial
@@ -498,7 +442,7 @@ def densu(alt, dlb, tinf, tlb, xm, alpha, tz, zlb, s2, mn1, zn1, tn1, tgn1):
         z=za;
 
     #/* geopotential altitude difference from ZLB */
-    zg2 = zeta(z, zlb);
+    zg2 = zeta(z, zlb, ctx);
     
     #/* Bates temperature */
     tt = tinf - (tinf - tlb) * exp(-s2*zg2);
@@ -509,7 +453,7 @@ def densu(alt, dlb, tinf, tlb, xm, alpha, tz, zlb, s2, mn1, zn1, tn1, tgn1):
     if (alt<za):
         #/* calculate temperature below ZA
         # * temperature gradient at ZA from Bates profile */
-        dta = (tinf - ta) * s2 * pow(((re[0]+zlb)/(re[0]+za)),2.0);
+        dta = (tinf - ta) * s2 * pow(((ctx.re[0]+zlb)/(ctx.re[0]+za)),2.0);
         tgn1[0]=dta;
         tn1[0]=ta;
         if (alt>zn1[mn1-1]):
@@ -522,16 +466,16 @@ def densu(alt, dlb, tinf, tlb, xm, alpha, tz, zlb, s2, mn1, zn1, tn1, tgn1):
         t1=tn1[0];
         t2=tn1[mn-1];
         #/* geopotental difference from z1 */
-        zg = zeta (z, z1);
-        zgdif = zeta(z2, z1);
+        zg = zeta (z, z1, ctx);
+        zgdif = zeta(z2, z1, ctx);
         #/* set up spline nodes */
         for k in range(mn):
-            xs[k] = zeta(zn1[k], z1) / zgdif;
+            xs[k] = zeta(zn1[k], z1, ctx) / zgdif;
             ys[k] = 1.0 / tn1[k];
         
         #/* end node derivatives */
         yd1 = -tgn1[0] / (t1*t1) * zgdif;
-        yd2 = -tgn1[1] / (t2*t2) * zgdif * pow(((re[0]+z2)/(re[0]+z1)),2.0);
+        yd2 = -tgn1[1] / (t2*t2) * zgdif * pow(((ctx.re[0]+z2)/(ctx.re[0]+z1)),2.0);
         #/* calculate spline coefficients */
         spline (xs, ys, mn, yd1, yd2, y2out);
         x = zg / zgdif;
@@ -545,7 +489,7 @@ def densu(alt, dlb, tinf, tlb, xm, alpha, tz, zlb, s2, mn1, zn1, tn1, tgn1):
         return densu_temp;
 
     #/* calculate density above za */
-    glb = gsurf[0] / pow((1.0 + zlb/re[0]),2.0);
+    glb = ctx.gsurf[0] / pow((1.0 + zlb/ctx.re[0]),2.0);
     gamma = xm * glb / (s2 * rgas * tinf);
     expl = exp(-s2 * gamma * zg2);
     if (expl>50.0):
@@ -560,7 +504,7 @@ def densu(alt, dlb, tinf, tlb, xm, alpha, tz, zlb, s2, mn1, zn1, tn1, tgn1):
         return densu_temp;
 
     #/* calculate density below za */
-    glb = gsurf[0] / pow((1.0 + z1/re[0]),2.0);
+    glb = ctx.gsurf[0] / pow((1.0 + z1/ctx.re[0]),2.0);
     gamm = xm * glb * zgdif / rgas;
 
     #/* integrate spline temperatures */
@@ -601,7 +545,7 @@ def sg0(ex, p, ap):
                 g0(ap[6],p)*pow(ex,12.0))*(1.0-pow(ex,8.0))/(1.0-ex)))/sumex(ex);
 
 
-def globe7(p, Input, flags):
+def globe7(p, Input, flags, ctx):
     '''
 /*       CALCULATE G(L) FUNCTION 
  *       Upper Thermosphere Parameters */
@@ -629,45 +573,39 @@ def globe7(p, Input, flags):
     c4 = c2*c2;
     s2 = s*s;
 
-    plg[0][1] = c;
-    plg[0][2] = 0.5*(3.0*c2 -1.0);
-    plg[0][3] = 0.5*(5.0*c*c2-3.0*c);
-    plg[0][4] = (35.0*c4 - 30.0*c2 + 3.0)/8.0;
-    plg[0][5] = (63.0*c2*c2*c - 70.0*c2*c + 15.0*c)/8.0;
-    plg[0][6] = (11.0*c*plg[0][5] - 5.0*plg[0][4])/6.0;
+    ctx.plg[0][1] = c;
+    ctx.plg[0][2] = 0.5*(3.0*c2 -1.0);
+    ctx.plg[0][3] = 0.5*(5.0*c*c2-3.0*c);
+    ctx.plg[0][4] = (35.0*c4 - 30.0*c2 + 3.0)/8.0;
+    ctx.plg[0][5] = (63.0*c2*c2*c - 70.0*c2*c + 15.0*c)/8.0;
+    ctx.plg[0][6] = (11.0*c*ctx.plg[0][5] - 5.0*ctx.plg[0][4])/6.0;
 #/*      plg[0][7] = (13.0*c*plg[0][6] - 6.0*plg[0][5])/7.0; */
-    plg[1][1] = s;
-    plg[1][2] = 3.0*c*s;
-    plg[1][3] = 1.5*(5.0*c2-1.0)*s;
-    plg[1][4] = 2.5*(7.0*c2*c-3.0*c)*s;
-    plg[1][5] = 1.875*(21.0*c4 - 14.0*c2 +1.0)*s;
-    plg[1][6] = (11.0*c*plg[1][5]-6.0*plg[1][4])/5.0;
+    ctx.plg[1][1] = s;
+    ctx.plg[1][2] = 3.0*c*s;
+    ctx.plg[1][3] = 1.5*(5.0*c2-1.0)*s;
+    ctx.plg[1][4] = 2.5*(7.0*c2*c-3.0*c)*s;
+    ctx.plg[1][5] = 1.875*(21.0*c4 - 14.0*c2 +1.0)*s;
+    ctx.plg[1][6] = (11.0*c*ctx.plg[1][5]-6.0*ctx.plg[1][4])/5.0;
 #/*      plg[1][7] = (13.0*c*plg[1][6]-7.0*plg[1][5])/6.0; */
 #/*      plg[1][8] = (15.0*c*plg[1][7]-8.0*plg[1][6])/7.0; */
-    plg[2][2] = 3.0*s2;
-    plg[2][3] = 15.0*s2*c;
-    plg[2][4] = 7.5*(7.0*c2 -1.0)*s2;
-    plg[2][5] = 3.0*c*plg[2][4]-2.0*plg[2][3];
-    plg[2][6] =(11.0*c*plg[2][5]-7.0*plg[2][4])/4.0;
-    plg[2][7] =(13.0*c*plg[2][6]-8.0*plg[2][5])/5.0;
-    plg[3][3] = 15.0*s2*s;
-    plg[3][4] = 105.0*s2*s*c; 
-    plg[3][5] =(9.0*c*plg[3][4]-7.*plg[3][3])/2.0;
-    plg[3][6] =(11.0*c*plg[3][5]-8.*plg[3][4])/3.0;
+    ctx.plg[2][2] = 3.0*s2;
+    ctx.plg[2][3] = 15.0*s2*c;
+    ctx.plg[2][4] = 7.5*(7.0*c2 -1.0)*s2;
+    ctx.plg[2][5] = 3.0*c*ctx.plg[2][4]-2.0*ctx.plg[2][3];
+    ctx.plg[2][6] =(11.0*c*ctx.plg[2][5]-7.0*ctx.plg[2][4])/4.0;
+    ctx.plg[2][7] =(13.0*c*ctx.plg[2][6]-8.0*ctx.plg[2][5])/5.0;
+    ctx.plg[3][3] = 15.0*s2*s;
+    ctx.plg[3][4] = 105.0*s2*s*c; 
+    ctx.plg[3][5] =(9.0*c*ctx.plg[3][4]-7.*ctx.plg[3][3])/2.0;
+    ctx.plg[3][6] =(11.0*c*ctx.plg[3][5]-8.*ctx.plg[3][4])/3.0;
 
     if( not (((flags.sw[7]==0) and (flags.sw[8]==0)) and (flags.sw[14] == 0))):
-        global stloc
-        stloc = sin(hr*tloc);
-        global ctloc
-        ctloc = cos(hr*tloc);
-        global s2tloc
-        s2tloc = sin(2.0*hr*tloc);
-        global c2tloc
-        c2tloc = cos(2.0*hr*tloc);
-        global s3tloc
-        s3tloc = sin(3.0*hr*tloc);
-        global c3tloc
-        c3tloc = cos(3.0*hr*tloc);
+        ctx.stloc = sin(hr*tloc);
+        ctx.ctloc = cos(hr*tloc);
+        ctx.s2tloc = sin(2.0*hr*tloc);
+        ctx.c2tloc = cos(2.0*hr*tloc);
+        ctx.s3tloc = sin(3.0*hr*tloc);
+        ctx.c3tloc = cos(3.0*hr*tloc);
 
     cd32 = cos(dr*(Input.doy-p[31]));
     cd18 = cos(2.0*dr*(Input.doy-p[17]));
@@ -680,47 +618,46 @@ def globe7(p, Input, flags):
 
     #/* F10.7 EFFECT */
     df = Input.f107 - Input.f107A;
-    global dfa
-    dfa = Input.f107A - 150.0;
-    t[0] =  p[19]*df*(1.0+p[59]*dfa) + p[20]*df*df + p[21]*dfa + p[29]*pow(dfa,2.0);
-    f1 = 1.0 + (p[47]*dfa +p[19]*df+p[20]*df*df)*flags.swc[1];
-    f2 = 1.0 + (p[49]*dfa+p[19]*df+p[20]*df*df)*flags.swc[1];
+    ctx.dfa = Input.f107A - 150.0;
+    t[0] =  p[19]*df*(1.0+p[59]*ctx.dfa) + p[20]*df*df + p[21]*ctx.dfa + p[29]*pow(ctx.dfa,2.0);
+    f1 = 1.0 + (p[47]*ctx.dfa +p[19]*df+p[20]*df*df)*flags.swc[1];
+    f2 = 1.0 + (p[49]*ctx.dfa+p[19]*df+p[20]*df*df)*flags.swc[1];
 
     #/*  TIME INDEPENDENT */
-    t[1] = (p[1]*plg[0][2]+ p[2]*plg[0][4]+p[22]*plg[0][6]) + \
-          (p[14]*plg[0][2])*dfa*flags.swc[1] +p[26]*plg[0][1];
+    t[1] = (p[1]*ctx.plg[0][2]+ p[2]*ctx.plg[0][4]+p[22]*ctx.plg[0][6]) + \
+          (p[14]*ctx.plg[0][2])*ctx.dfa*flags.swc[1] +p[26]*ctx.plg[0][1];
 
     #/*  SYMMETRICAL ANNUAL */
     t[2] = p[18]*cd32;
 
     #/*  SYMMETRICAL SEMIANNUAL */
-    t[3] = (p[15]+p[16]*plg[0][2])*cd18;
+    t[3] = (p[15]+p[16]*ctx.plg[0][2])*cd18;
 
     #/*  ASYMMETRICAL ANNUAL */
-    t[4] =  f1*(p[9]*plg[0][1]+p[10]*plg[0][3])*cd14;
+    t[4] =  f1*(p[9]*ctx.plg[0][1]+p[10]*ctx.plg[0][3])*cd14;
 
     #/*  ASYMMETRICAL SEMIANNUAL */
-    t[5] =    p[37]*plg[0][1]*cd39;
+    t[5] =    p[37]*ctx.plg[0][1]*cd39;
 
     #/* DIURNAL */
     if (flags.sw[7]):
-        t71 = (p[11]*plg[1][2])*cd14*flags.swc[5];
-        t72 = (p[12]*plg[1][2])*cd14*flags.swc[5];
-        t[6] = f2*((p[3]*plg[1][1] + p[4]*plg[1][3] + p[27]*plg[1][5] + t71) * \
-                   ctloc + (p[6]*plg[1][1] + p[7]*plg[1][3] + p[28]*plg[1][5] \
-                            + t72)*stloc);
+        t71 = (p[11]*ctx.plg[1][2])*cd14*flags.swc[5];
+        t72 = (p[12]*ctx.plg[1][2])*cd14*flags.swc[5];
+        t[6] = f2*((p[3]*ctx.plg[1][1] + p[4]*ctx.plg[1][3] + p[27]*ctx.plg[1][5] + t71) * \
+                   ctx.ctloc + (p[6]*ctx.plg[1][1] + p[7]*ctx.plg[1][3] + p[28]*ctx.plg[1][5] \
+                            + t72)*ctx.stloc);
 
 
     #/* SEMIDIURNAL */
     if (flags.sw[8]):
-        t81 = (p[23]*plg[2][3]+p[35]*plg[2][5])*cd14*flags.swc[5];
-        t82 = (p[33]*plg[2][3]+p[36]*plg[2][5])*cd14*flags.swc[5];
-        t[7] = f2*((p[5]*plg[2][2]+ p[41]*plg[2][4] + t81)*c2tloc +(p[8]*plg[2][2] + p[42]*plg[2][4] + t82)*s2tloc);
+        t81 = (p[23]*ctx.plg[2][3]+p[35]*ctx.plg[2][5])*cd14*flags.swc[5];
+        t82 = (p[33]*ctx.plg[2][3]+p[36]*ctx.plg[2][5])*cd14*flags.swc[5];
+        t[7] = f2*((p[5]*ctx.plg[2][2]+ p[41]*ctx.plg[2][4] + t81)*ctx.c2tloc +(p[8]*ctx.plg[2][2] + p[42]*ctx.plg[2][4] + t82)*ctx.s2tloc);
     
 
     #/* TERDIURNAL */
     if (flags.sw[14]):
-        t[13] = f2 * ((p[39]*plg[3][3]+(p[93]*plg[3][4]+p[46]*plg[3][6])*cd14*flags.swc[5])* s3tloc +(p[40]*plg[3][3]+(p[94]*plg[3][4]+p[48]*plg[3][6])*cd14*flags.swc[5])* c3tloc);
+        t[13] = f2 * ((p[39]*ctx.plg[3][3]+(p[93]*ctx.plg[3][4]+p[46]*ctx.plg[3][6])*cd14*flags.swc[5])* ctx.s3tloc +(p[40]*ctx.plg[3][3]+(p[94]*ctx.plg[3][4]+p[48]*ctx.plg[3][6])*cd14*flags.swc[5])* ctx.c3tloc);
 
 
     #/* magnetic activity based on daily ap */
@@ -732,15 +669,15 @@ def globe7(p, Input, flags):
                     exp1=0.99999;
             if (p[24]<1.0E-4):
                     p[24]=1.0E-4;
-            apt[0]=sg0(exp1,p,ap.a);
+            ctx.apt[0]=sg0(exp1,p,ap.a);
             #/* apt[1]=sg2(exp1,p,ap->a);
             #   apt[2]=sg0(exp2,p,ap->a);
             #   apt[3]=sg2(exp2,p,ap->a);
             #*/
             if (flags.sw[9]):
-                t[8] = apt[0]*(p[50]+p[96]*plg[0][2]+p[54]*plg[0][4]+ \
-                        (p[125]*plg[0][1]+p[126]*plg[0][3]+p[127]*plg[0][5])*cd14*flags.swc[5]+ \
-                        (p[128]*plg[1][1]+p[129]*plg[1][3]+p[130]*plg[1][5])*flags.swc[7]* \
+                t[8] = ctx.apt[0]*(p[50]+p[96]*ctx.plg[0][2]+p[54]*ctx.plg[0][4]+ \
+                        (p[125]*ctx.plg[0][1]+p[126]*ctx.plg[0][3]+p[127]*ctx.plg[0][5])*cd14*flags.swc[5]+ \
+                        (p[128]*ctx.plg[1][1]+p[129]*ctx.plg[1][3]+p[130]*ctx.plg[1][5])*flags.swc[7]* \
                                        cos(hr*(tloc-p[131])));
                     
             
@@ -750,12 +687,11 @@ def globe7(p, Input, flags):
         p45=p[44];
         if (p44<0):
             p44 = 1.0E-5;
-        global apdf
-        apdf = apd + (p45-1.0)*(apd + (exp(-p44 * apd) - 1.0)/p44);
+        ctx.apdf = apd + (p45-1.0)*(apd + (exp(-p44 * apd) - 1.0)/p44);
         if (flags.sw[9]):
-            t[8]=apdf*(p[32]+p[45]*plg[0][2]+p[34]*plg[0][4]+ \
-             (p[100]*plg[0][1]+p[101]*plg[0][3]+p[102]*plg[0][5])*cd14*flags.swc[5]+
-             (p[121]*plg[1][1]+p[122]*plg[1][3]+p[123]*plg[1][5])*flags.swc[7]*
+            t[8]=ctx.apdf*(p[32]+p[45]*ctx.plg[0][2]+p[34]*ctx.plg[0][4]+ \
+             (p[100]*ctx.plg[0][1]+p[101]*ctx.plg[0][3]+p[102]*ctx.plg[0][5])*cd14*flags.swc[5]+
+             (p[121]*ctx.plg[1][1]+p[122]*ctx.plg[1][3]+p[123]*ctx.plg[1][5])*flags.swc[7]*
                 cos(hr*(tloc-p[124])));
             
     
@@ -764,51 +700,51 @@ def globe7(p, Input, flags):
 
             #/* longitudinal */
             if (flags.sw[11]):
-                    t[10] = (1.0 + p[80]*dfa*flags.swc[1])* \
-                     ((p[64]*plg[1][2]+p[65]*plg[1][4]+p[66]*plg[1][6]\
-                      +p[103]*plg[1][1]+p[104]*plg[1][3]+p[105]*plg[1][5]\
-                      +flags.swc[5]*(p[109]*plg[1][1]+p[110]*plg[1][3]+p[111]*plg[1][5])*cd14)* \
+                    t[10] = (1.0 + p[80]*ctx.dfa*flags.swc[1])* \
+                     ((p[64]*ctx.plg[1][2]+p[65]*ctx.plg[1][4]+p[66]*ctx.plg[1][6]\
+                      +p[103]*ctx.plg[1][1]+p[104]*ctx.plg[1][3]+p[105]*ctx.plg[1][5]\
+                      +flags.swc[5]*(p[109]*ctx.plg[1][1]+p[110]*ctx.plg[1][3]+p[111]*ctx.plg[1][5])*cd14)* \
                           cos(dgtr*Input.g_long) \
-                      +(p[90]*plg[1][2]+p[91]*plg[1][4]+p[92]*plg[1][6]\
-                      +p[106]*plg[1][1]+p[107]*plg[1][3]+p[108]*plg[1][5]\
-                      +flags.swc[5]*(p[112]*plg[1][1]+p[113]*plg[1][3]+p[114]*plg[1][5])*cd14)* \
+                      +(p[90]*ctx.plg[1][2]+p[91]*ctx.plg[1][4]+p[92]*ctx.plg[1][6]\
+                      +p[106]*ctx.plg[1][1]+p[107]*ctx.plg[1][3]+p[108]*ctx.plg[1][5]\
+                      +flags.swc[5]*(p[112]*ctx.plg[1][1]+p[113]*ctx.plg[1][3]+p[114]*ctx.plg[1][5])*cd14)* \
                       sin(dgtr*Input.g_long));
             
 
             #/* ut and mixed ut, longitude */
             if (flags.sw[12]):
-                    t[11]=(1.0+p[95]*plg[0][1])*(1.0+p[81]*dfa*flags.swc[1])*\
-                            (1.0+p[119]*plg[0][1]*flags.swc[5]*cd14)*\
-                            ((p[68]*plg[0][1]+p[69]*plg[0][3]+p[70]*plg[0][5])*\
+                    t[11]=(1.0+p[95]*ctx.plg[0][1])*(1.0+p[81]*ctx.dfa*flags.swc[1])*\
+                            (1.0+p[119]*ctx.plg[0][1]*flags.swc[5]*cd14)*\
+                            ((p[68]*ctx.plg[0][1]+p[69]*ctx.plg[0][3]+p[70]*ctx.plg[0][5])*\
                             cos(sr*(Input.sec-p[71])));
                     t[11]+=flags.swc[11]*\
-                            (p[76]*plg[2][3]+p[77]*plg[2][5]+p[78]*plg[2][7])*\
-                            cos(sr*(Input.sec-p[79])+2.0*dgtr*Input.g_long)*(1.0+p[137]*dfa*flags.swc[1]);
+                            (p[76]*ctx.plg[2][3]+p[77]*ctx.plg[2][5]+p[78]*ctx.plg[2][7])*\
+                            cos(sr*(Input.sec-p[79])+2.0*dgtr*Input.g_long)*(1.0+p[137]*ctx.dfa*flags.swc[1]);
             
 
             #/* ut, longitude magnetic activity */
             if (flags.sw[13]):
                 if (flags.sw[9]==-1):
                     if (p[51]):
-                            t[12]=apt[0]*flags.swc[11]*(1.+p[132]*plg[0][1])*\
-                                    ((p[52]*plg[1][2]+p[98]*plg[1][4]+p[67]*plg[1][6])*\
+                            t[12]=ctx.apt[0]*flags.swc[11]*(1.+p[132]*ctx.plg[0][1])*\
+                                    ((p[52]*ctx.plg[1][2]+p[98]*ctx.plg[1][4]+p[67]*ctx.plg[1][6])*\
                                      cos(dgtr*(Input.g_long-p[97])))\
-                                    +apt[0]*flags.swc[11]*flags.swc[5]*\
-                                    (p[133]*plg[1][1]+p[134]*plg[1][3]+p[135]*plg[1][5])*\
+                                    +ctx.apt[0]*flags.swc[11]*flags.swc[5]*\
+                                    (p[133]*ctx.plg[1][1]+p[134]*ctx.plg[1][3]+p[135]*ctx.plg[1][5])*\
                                     cd14*cos(dgtr*(Input.g_long-p[136])) \
-                                    +apt[0]*flags.swc[12]* \
-                                    (p[55]*plg[0][1]+p[56]*plg[0][3]+p[57]*plg[0][5])*\
+                                    +ctx.apt[0]*flags.swc[12]* \
+                                    (p[55]*ctx.plg[0][1]+p[56]*ctx.plg[0][3]+p[57]*ctx.plg[0][5])*\
                                     cos(sr*(Input.sec-p[58]));
                         
                 else:
-                    t[12] = apdf*flags.swc[11]*(1.0+p[120]*plg[0][1])*\
-                            ((p[60]*plg[1][2]+p[61]*plg[1][4]+p[62]*plg[1][6])*\
+                    t[12] = ctx.apdf*flags.swc[11]*(1.0+p[120]*ctx.plg[0][1])*\
+                            ((p[60]*ctx.plg[1][2]+p[61]*ctx.plg[1][4]+p[62]*ctx.plg[1][6])*\
                             cos(dgtr*(Input.g_long-p[63])))\
-                            +apdf*flags.swc[11]*flags.swc[5]* \
-                            (p[115]*plg[1][1]+p[116]*plg[1][3]+p[117]*plg[1][5])* \
+                            +ctx.apdf*flags.swc[11]*flags.swc[5]* \
+                            (p[115]*ctx.plg[1][1]+p[116]*ctx.plg[1][3]+p[117]*ctx.plg[1][5])* \
                             cd14*cos(dgtr*(Input.g_long-p[118])) \
-                            + apdf*flags.swc[12]* \
-                            (p[83]*plg[0][1]+p[84]*plg[0][3]+p[85]*plg[0][5])* \
+                            + ctx.apdf*flags.swc[12]* \
+                            (p[83]*ctx.plg[0][1]+p[84]*ctx.plg[0][3]+p[85]*ctx.plg[0][5])* \
                             cos(sr*(Input.sec-p[75]));
                     			
             
@@ -826,7 +762,7 @@ def globe7(p, Input, flags):
 /* ------------------------------- GLOB7S ---------------------------- */
 /* ------------------------------------------------------------------- */
 '''
-def glob7s(p, Input, flags):
+def glob7s(p, Input, flags, ctx):
     '''
 /*    VERSION OF GLOBE FOR LOWER ATMOSPHERE 10/26/99 
  */
@@ -855,61 +791,61 @@ def glob7s(p, Input, flags):
     p39=p[38];
 
     #/* F10.7 */
-    t[0] = p[21]*dfa;
+    t[0] = p[21]*ctx.dfa;
 
     #/* time independent */
-    t[1]=p[1]*plg[0][2] + p[2]*plg[0][4] + p[22]*plg[0][6] + p[26]*plg[0][1] + p[14]*plg[0][3] + p[59]*plg[0][5];
+    t[1]=p[1]*ctx.plg[0][2] + p[2]*ctx.plg[0][4] + p[22]*ctx.plg[0][6] + p[26]*ctx.plg[0][1] + p[14]*ctx.plg[0][3] + p[59]*ctx.plg[0][5];
 
     #/* SYMMETRICAL ANNUAL */
-    t[2]=(p[18]+p[47]*plg[0][2]+p[29]*plg[0][4])*cd32;
+    t[2]=(p[18]+p[47]*ctx.plg[0][2]+p[29]*ctx.plg[0][4])*cd32;
 
     #/* SYMMETRICAL SEMIANNUAL */
-    t[3]=(p[15]+p[16]*plg[0][2]+p[30]*plg[0][4])*cd18;
+    t[3]=(p[15]+p[16]*ctx.plg[0][2]+p[30]*ctx.plg[0][4])*cd18;
 
     #/* ASYMMETRICAL ANNUAL */
-    t[4]=(p[9]*plg[0][1]+p[10]*plg[0][3]+p[20]*plg[0][5])*cd14;
+    t[4]=(p[9]*ctx.plg[0][1]+p[10]*ctx.plg[0][3]+p[20]*ctx.plg[0][5])*cd14;
 
     #/* ASYMMETRICAL SEMIANNUAL */
-    t[5]=(p[37]*plg[0][1])*cd39;
+    t[5]=(p[37]*ctx.plg[0][1])*cd39;
 
     #/* DIURNAL */
     if (flags.sw[7]):
-        t71 = p[11]*plg[1][2]*cd14*flags.swc[5];
-        t72 = p[12]*plg[1][2]*cd14*flags.swc[5];
-        t[6] = ((p[3]*plg[1][1] + p[4]*plg[1][3] + t71) * ctloc + (p[6]*plg[1][1] + p[7]*plg[1][3] + t72) * stloc) ;
+        t71 = p[11]*ctx.plg[1][2]*cd14*flags.swc[5];
+        t72 = p[12]*ctx.plg[1][2]*cd14*flags.swc[5];
+        t[6] = ((p[3]*ctx.plg[1][1] + p[4]*ctx.plg[1][3] + t71) * ctx.ctloc + (p[6]*ctx.plg[1][1] + p[7]*ctx.plg[1][3] + t72) * ctx.stloc) ;
     
 
     #/* SEMIDIURNAL */
     if (flags.sw[8]):
-        t81 = (p[23]*plg[2][3]+p[35]*plg[2][5])*cd14*flags.swc[5];
-        t82 = (p[33]*plg[2][3]+p[36]*plg[2][5])*cd14*flags.swc[5];
-        t[7] = ((p[5]*plg[2][2] + p[41]*plg[2][4] + t81) * c2tloc + (p[8]*plg[2][2] + p[42]*plg[2][4] + t82) * s2tloc);
+        t81 = (p[23]*ctx.plg[2][3]+p[35]*ctx.plg[2][5])*cd14*flags.swc[5];
+        t82 = (p[33]*ctx.plg[2][3]+p[36]*ctx.plg[2][5])*cd14*flags.swc[5];
+        t[7] = ((p[5]*ctx.plg[2][2] + p[41]*ctx.plg[2][4] + t81) * ctx.c2tloc + (p[8]*ctx.plg[2][2] + p[42]*ctx.plg[2][4] + t82) * ctx.s2tloc);
     
 
     #/* TERDIURNAL */
     if (flags.sw[14]):
-            t[13] = p[39] * plg[3][3] * s3tloc + p[40] * plg[3][3] * c3tloc;
+            t[13] = p[39] * ctx.plg[3][3] * ctx.s3tloc + p[40] * ctx.plg[3][3] * ctx.c3tloc;
     
 
     #/* MAGNETIC ACTIVITY */
     if (flags.sw[9]):
         if (flags.sw[9]==1):
-            t[8] = apdf * (p[32] + p[45] * plg[0][2] * flags.swc[2]);
+            t[8] = ctx.apdf * (p[32] + p[45] * ctx.plg[0][2] * flags.swc[2]);
         if (flags.sw[9]==-1):	
-            t[8]=(p[50]*apt[0] + p[96]*plg[0][2] * apt[0]*flags.swc[2]);
+            t[8]=(p[50]*ctx.apt[0] + p[96]*ctx.plg[0][2] * ctx.apt[0]*flags.swc[2]);
     
 
     #/* LONGITUDINAL */
     if ( not((flags.sw[10]==0) or (flags.sw[11]==0) or (Input.g_long<=-1000.0))):
-            t[10] = (1.0 + plg[0][1]*(p[80]*flags.swc[5]*cos(dr*(Input.doy-p[81]))\
+            t[10] = (1.0 + ctx.plg[0][1]*(p[80]*flags.swc[5]*cos(dr*(Input.doy-p[81]))\
                     +p[85]*flags.swc[6]*cos(2.0*dr*(Input.doy-p[86])))\
                     +p[83]*flags.swc[3]*cos(dr*(Input.doy-p[84]))\
                     +p[87]*flags.swc[4]*cos(2.0*dr*(Input.doy-p[88])))\
-                    *((p[64]*plg[1][2]+p[65]*plg[1][4]+p[66]*plg[1][6]\
-                    +p[74]*plg[1][1]+p[75]*plg[1][3]+p[76]*plg[1][5]\
+                    *((p[64]*ctx.plg[1][2]+p[65]*ctx.plg[1][4]+p[66]*ctx.plg[1][6]\
+                    +p[74]*ctx.plg[1][1]+p[75]*ctx.plg[1][3]+p[76]*ctx.plg[1][5]\
                     )*cos(dgtr*Input.g_long)\
-                    +(p[90]*plg[1][2]+p[91]*plg[1][4]+p[92]*plg[1][6]\
-                    +p[77]*plg[1][1]+p[78]*plg[1][3]+p[79]*plg[1][5]\
+                    +(p[90]*ctx.plg[1][2]+p[91]*ctx.plg[1][4]+p[92]*ctx.plg[1][6]\
+                    +p[77]*ctx.plg[1][1]+p[78]*ctx.plg[1][3]+p[79]*ctx.plg[1][5]\
                     )*sin(dgtr*Input.g_long));
     
     tt=0;
@@ -923,7 +859,17 @@ def glob7s(p, Input, flags):
 /* ------------------------------- GTD7 ------------------------------ */
 /* ------------------------------------------------------------------- */
 '''
-def gtd7(Input, flags, output):
+def gtd7(Input, flags, output, ctx=None):
+    '''
+    The fields of Input can also be numpy arrays (of shapes that broadcast together), then the model is evaluated at
+    all of the points at once by gtd7_array and the values in output.d and output.t are arrays.
+    ctx holds the working variables of the call, a new nrlmsise_context is used if it is not given.
+    '''
+    if is_array_input(Input):
+        gtd7_array(Input, flags, output)
+        return
+    if ctx is None:
+        ctx = nrlmsise_context()
     mn3 = 5
     zn3 = [32.5,20.0,15.0,10.0,0.0]
     mn2 = 4
@@ -937,7 +883,7 @@ def gtd7(Input, flags, output):
     xlat=Input.g_lat;
     if (flags.sw[2]==0):
         xlat=45.0;
-    glatf(xlat, gsurf, re);
+    glatf(xlat, ctx.gsurf, ctx.re);
 
     xmm = pdm[2][4];
 
@@ -950,13 +896,13 @@ def gtd7(Input, flags, output):
     tmp=Input.alt;
     Input.alt=altt;
 
-    gts7(Input, flags, soutput);
+    gts7(Input, flags, soutput, ctx);
     altt=Input.alt;
     Input.alt=tmp;
     if (flags.sw[0]):   #/* metric adjustment */
-        dm28m= dm28*1.0E6;
+        dm28m= ctx.dm28*1.0E6;
     else:
-        dm28m = dm28;
+        dm28m = ctx.dm28;
     output.t[0]=soutput.t[0];
     output.t[1]=soutput.t[1];
     if (Input.alt>=zn2[0]): 
@@ -969,25 +915,25 @@ def gtd7(Input, flags, output):
 #*         Temperature at nodes and gradients at end nodes
 #*         Inverse temperature a linear function of spherical harmonics
 #*/
-    meso_tgn2[0]=meso_tgn1[1];
-    meso_tn2[0]=meso_tn1[4];
-    meso_tn2[1]=pma[0][0]*pavgm[0]/(1.0-flags.sw[20]*glob7s(pma[0], Input, flags));
-    meso_tn2[2]=pma[1][0]*pavgm[1]/(1.0-flags.sw[20]*glob7s(pma[1], Input, flags));
-    meso_tn2[3]=pma[2][0]*pavgm[2]/(1.0-flags.sw[20]*flags.sw[22]*glob7s(pma[2], Input, flags));
-    meso_tgn2[1]=pavgm[8]*pma[9][0]*(1.0+flags.sw[20]*flags.sw[22]*glob7s(pma[9], Input, flags))*meso_tn2[3]*meso_tn2[3]/(pow((pma[2][0]*pavgm[2]),2.0));
-    meso_tn3[0]=meso_tn2[3];
-
-    if (Input.alt<zn3[0]):
+    ctx.meso_tgn2[0]=ctx.meso_tgn1[1];
+    ctx.meso_tn2[0]=ctx.meso_tn1[4];
+    ctx.meso_tn2[1]=pma[0][0]*pavgm[0]/(1.0-flags.sw[20]*glob7s(pma[0], Input, flags, ctx));
+    ctx.meso_tn2[2]=pma[1][0]*pavgm[1]/(1.0-flags.sw[20]*glob7s(pma[1], Input, flags, ctx));
+    ctx.meso_tn2[3]=pma[2][0]*pavgm[2]/(1.0-flags.sw[20]*flags.sw[22]*glob7s(pma[2], Input, flags, ctx));
+    ctx.meso_tgn2[1]=pavgm[8]*pma[9][0]*(1.0+flags.sw[20]*flags.sw[22]*glob7s(pma[9], Input, flags, ctx))*ctx.meso_tn2[3]*ctx.meso_tn2[3]/(pow((pma[2][0]*pavgm[2]),2.0));
+    ctx.meso_tn3[0]=ctx.meso_tn2[3];
+
+    if (Input.alt<=zn3[0]):  # densm also uses these at exactly zn3[0]
 #/*       LOWER STRATOSPHERE AND TROPOSPHERE (below zn3[0])
 #*         Temperature at nodes and gradients at end nodes
 #*         Inverse temperature a linear function of spherical harmonics
 #*/
-        meso_tgn3[0]=meso_tgn2[1];
-        meso_tn3[1]=pma[3][0]*pavgm[3]/(1.0-flags.sw[22]*glob7s(pma[3], Input, flags));
-        meso_tn3[2]=pma[4][0]*pavgm[4]/(1.0-flags.sw[22]*glob7s(pma[4], Input, flags));
-        meso_tn3[3]=pma[5][0]*pavgm[5]/(1.0-flags.sw[22]*glob7s(pma[5], Input, flags));
-        meso_tn3[4]=pma[6][0]*pavgm[6]/(1.0-flags.sw[22]*glob7s(pma[6], Input, flags));
-        meso_tgn3[1]=pma[7][0]*pavgm[7]*(1.0+flags.sw[22]*glob7s(pma[7], Input, flags)) *meso_tn3[4]*meso_tn3[4]/(pow((pma[6][0]*pavgm[6]),2.0));
+        ctx.meso_tgn3[0]=ctx.meso_tgn2[1];
+        ctx.meso_tn3[1]=pma[3][0]*pavgm[3]/(1.0-flags.sw[22]*glob7s(pma[3], Input, flags, ctx));
+        ctx.meso_tn3[2]=pma[4][0]*pavgm[4]/(1.0-flags.sw[22]*glob7s(pma[4], Input, flags, ctx));
+        ctx.meso_tn3[3]=pma[5][0]*pavgm[5]/(1.0-flags.sw[22]*glob7s(pma[5], Input, flags, ctx));
+        ctx.meso_tn3[4]=pma[6][0]*pavgm[6]/(1.0-flags.sw[22]*glob7s(pma[6], Input, flags, ctx));
+        ctx.meso_tgn3[1]=pma[7][0]*pavgm[7]*(1.0+flags.sw[22]*glob7s(pma[7], Input, flags, ctx)) *ctx.meso_tn3[4]*ctx.meso_tn3[4]/(pow((pma[6][0]*pavgm[6]),2.0));
     
 
     #/* LINEAR TRANSITION TO FULL MIXING BELOW zn2[0] */
@@ -1000,7 +946,7 @@ def gtd7(Input, flags, output):
     #/**** N2 density ****/
     dmr=soutput.d[2] / dm28m - 1.0;
     tz = [0.0]
-    output.d[2]=densm(Input.alt,dm28m,xmm, tz, mn3, zn3, meso_tn3, meso_tgn3, mn2, zn2, meso_tn2, meso_tgn2);
+    output.d[2]=densm(Input.alt,dm28m,xmm, tz, mn3, zn3, ctx.meso_tn3, ctx.meso_tgn3, mn2, zn2, ctx.meso_tn2, ctx.meso_tgn2, ctx);
     output.d[2]=output.d[2] * (1.0 + dmr*dmc);
 
     #/**** HE density ****/
@@ -1032,8 +978,7 @@ def gtd7(Input, flags, output):
         output.d[5]=output.d[5]/1000;
 
     #/**** temperature at altitude ****/
-    global dd
-    dd = densm(Input.alt, 1.0, 0, tz, mn3, zn3, meso_tn3, meso_tgn3, mn2, zn2, meso_tn2, meso_tgn2);
+    ctx.dd = densm(Input.alt, 1.0, 0, tz, mn3, zn3, ctx.meso_tn3, ctx.meso_tgn3, mn2, zn2, ctx.meso_tn2, ctx.meso_tgn2, ctx);
     output.t[1]=tz[0];
     return
 
@@ -1043,8 +988,8 @@ def gtd7(Input, flags, output):
 /* ------------------------------- GTD7D ----------------------------- */
 /* ------------------------------------------------------------------- */
 '''
-def gtd7d(Input, flags, output):
-    gtd7(Input, flags, output)
+def gtd7d(Input, flags, output, ctx=None):
+    gtd7(Input, flags, output, ctx)
     output.d[5] = 1.66E-24 * (4.0 * output.d[0] + 16.0 * output.d[1] + 28.0 * output.d[2] + 32.0 * output.d[3] + 40.0 * output.d[4] + output.d[6] + 14.0 * output.d[7] + 16.0 * output.d[8]);
     if (flags.sw[0]):
         output.d[5]=output.d[5]/1000;
@@ -1056,12 +1001,14 @@ def gtd7d(Input, flags, output):
 /* -------------------------------- GHP7 ----------------------------- */
 /* ------------------------------------------------------------------- */
 '''
-def ghp7(Input, flags, output, press):
+def ghp7(Input, flags, output, press, ctx=None):
     bm = 1.3806E-19;
     rgas = 831.4;
     #rgas = 831.44621    #maybe make this a global constant?
     test = 0.00043;
     ltest = 12;
+    if ctx is None:
+        ctx = nrlmsise_context()
 
     pl = log10(press)
 
@@ -1100,7 +1047,7 @@ def ghp7(Input, flags, output, press):
     while(True):
         l += 1;
         Input.alt = z;
-        gtd7(Input, flags, output);
+        gtd7(Input, flags, output, ctx);
         z = Input.alt;
         xn = output.d[0] + output.d[1] + output.d[2] + output.d[3] + output.d[4] + output.d[6] + output.d[7];
         p = bm * xn * output.t[1];
@@ -1116,7 +1063,7 @@ def ghp7(Input, flags, output, press):
         xm = output.d[5] / xn / 1.66E-24;
         if (flags.sw[0]):
             xm = xm * 1.0E3;
-        g = gsurf[0] / (pow((1.0 + z/re[0]),2.0));
+        g = ctx.gsurf[0] / (pow((1.0 + z/ctx.re[0]),2.0));
         sh = rgas * output.t[1] / (xm * g);
 
         #/* new altitude estimate using scale height */
@@ -1132,7 +1079,7 @@ def ghp7(Input, flags, output, press):
 /* ------------------------------- GTS7 ------------------------------ */
 /* ------------------------------------------------------------------- */
 '''
-def gts7(Input, flags, output):
+def gts7(Input, flags, output, ctx):
     '''
 /*     Thermospheric portion of NRLMSISE-00
  *     See GTD7 for more extensive comments
@@ -1154,7 +1101,7 @@ def gts7(Input, flags, output):
     #/* TINF VARIATIONS NOT IMPORTANT BELOW ZA OR ZN1(1) */
     if (Input.alt>zn1[0]):
         tinf = ptm[0]*pt[0] * \
-                    (1.0+flags.sw[16]*globe7(pt,Input,flags));
+                    (1.0+flags.sw[16]*globe7(pt,Input,flags, ctx));
     else:
         tinf = ptm[0]*pt[0];
     output.t[0]=tinf;
@@ -1162,34 +1109,34 @@ def gts7(Input, flags, output):
     #/*  GRADIENT VARIATIONS NOT IMPORTANT BELOW ZN1(5) */
     if (Input.alt>zn1[4]):
         g0 = ptm[3]*ps[0] * \
-            (1.0+flags.sw[19]*globe7(ps,Input,flags));
+            (1.0+flags.sw[19]*globe7(ps,Input,flags, ctx));
     else:
         g0 = ptm[3]*ps[0];
-    tlb = ptm[1] * (1.0 + flags.sw[17]*globe7(pd[3],Input,flags))*pd[3][0];
+    tlb = ptm[1] * (1.0 + flags.sw[17]*globe7(pd[3],Input,flags, ctx))*pd[3][0];
     s = g0 / (tinf - tlb);
 
 #/*      Lower thermosphere temp variations not significant for
 # *       density above 300 km */
     if (Input.alt<300.0):
-        meso_tn1[1]=ptm[6]*ptl[0][0]/(1.0-flags.sw[18]*glob7s(ptl[0], Input, flags));
-        meso_tn1[2]=ptm[2]*ptl[1][0]/(1.0-flags.sw[18]*glob7s(ptl[1], Input, flags));
-        meso_tn1[3]=ptm[7]*ptl[2][0]/(1.0-flags.sw[18]*glob7s(ptl[2], Input, flags));
-        meso_tn1[4]=ptm[4]*ptl[3][0]/(1.0-flags.sw[18]*flags.sw[20]*glob7s(ptl[3], Input, flags));
-        meso_tgn1[1]=ptm[8]*pma[8][0]*(1.0+flags.sw[18]*flags.sw[20]*glob7s(pma[8], Input, flags))*meso_tn1[4]*meso_tn1[4]/(pow((ptm[4]*ptl[3][0]),2.0));
+        ctx.meso_tn1[1]=ptm[6]*ptl[0][0]/(1.0-flags.sw[18]*glob7s(ptl[0], Input, flags, ctx));
+        ctx.meso_tn1[2]=ptm[2]*ptl[1][0]/(1.0-flags.sw[18]*glob7s(ptl[1], Input, flags, ctx));
+        ctx.meso_tn1[3]=ptm[7]*ptl[2][0]/(1.0-flags.sw[18]*glob7s(ptl[2], Input, flags, ctx));
+        ctx.meso_tn1[4]=ptm[4]*ptl[3][0]/(1.0-flags.sw[18]*flags.sw[20]*glob7s(ptl[3], Input, flags, ctx));
+        ctx.meso_tgn1[1]=ptm[8]*pma[8][0]*(1.0+flags.sw[18]*flags.sw[20]*glob7s(pma[8], Input, flags, ctx))*ctx.meso_tn1[4]*ctx.meso_tn1[4]/(pow((ptm[4]*ptl[3][0]),2.0));
     else:
-        meso_tn1[1]=ptm[6]*ptl[0][0];
-        meso_tn1[2]=ptm[2]*ptl[1][0];
-        meso_tn1[3]=ptm[7]*ptl[2][0];
-        meso_tn1[4]=ptm[4]*ptl[3][0];
-        meso_tgn1[1]=ptm[8]*pma[8][0]*meso_tn1[4]*meso_tn1[4]/(pow((ptm[4]*ptl[3][0]),2.0));
+        ctx.meso_tn1[1]=ptm[6]*ptl[0][0];
+        ctx.meso_tn1[2]=ptm[2]*ptl[1][0];
+        ctx.meso_tn1[3]=ptm[7]*ptl[2][0];
+        ctx.meso_tn1[4]=ptm[4]*ptl[3][0];
+        ctx.meso_tgn1[1]=ptm[8]*pma[8][0]*ctx.meso_tn1[4]*ctx.meso_tn1[4]/(pow((ptm[4]*ptl[3][0]),2.0));
 	
 
     z0 = zn1[3];
-    t0 = meso_tn1[3];
+    t0 = ctx.meso_tn1[3];
     tr12 = 1.0;
 
     #/* N2 variation factor at Zlb */
-    g28=flags.sw[21]*globe7(pd[2], Input, flags);
+    g28=flags.sw[21]*globe7(pd[2], Input, flags, ctx);
 
     #/* VARIATION OF TURBOPAUSE HEIGHT */
     zhf=pdl[1][24]*(1.0+flags.sw[5]*pdl[0][24]*sin(dgtr*Input.g_lat)*cos(dr*(Input.doy-pt[13])));
@@ -1204,7 +1151,7 @@ def gts7(Input, flags, output):
     db28 = pdm[2][0]*exp(g28)*pd[2][0];
     #/* Diffusive density at Alt */
     RandomVariable = [output.t[1]]
-    output.d[2]=densu(z,db28,tinf,tlb,28.0,alpha[2],RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+    output.d[2]=densu(z,db28,tinf,tlb,28.0,alpha[2],RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     dd=output.d[2];
     #/* Turbopause */
@@ -1213,25 +1160,24 @@ def gts7(Input, flags, output):
     xmd=28.0-xmm;
     #/* Mixed density at Zlb */
     tz = [0]
-    b28=densu(zh28,db28,tinf,tlb,xmd,(alpha[2]-1.0),tz,ptm[5],s,mn1, zn1,meso_tn1,meso_tgn1);
+    b28=densu(zh28,db28,tinf,tlb,xmd,(alpha[2]-1.0),tz,ptm[5],s,mn1, zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     if ((flags.sw[15]) and (z<=altl[2])):
         #/*  Mixed density at Alt */
-        global dm28
-        dm28=densu(z,b28,tinf,tlb,xmm,alpha[2],tz,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        ctx.dm28=densu(z,b28,tinf,tlb,xmm,alpha[2],tz,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         #/*  Net density at Alt */
-        output.d[2]=dnet(output.d[2],dm28,zhm28,xmm,28.0);
+        output.d[2]=dnet(output.d[2],ctx.dm28,zhm28,xmm,28.0);
     
 
 
     #/**** HE DENSITY ****/
 
     #/*   Density variation factor at Zlb */
-    g4 = flags.sw[21]*globe7(pd[0], Input, flags);
+    g4 = flags.sw[21]*globe7(pd[0], Input, flags, ctx);
     #/*  Diffusive density at Zlb */
     db04 = pdm[0][0]*exp(g4)*pd[0][0];
     #/*  Diffusive density at Alt */
     RandomVariable = [output.t[1]]
-    output.d[0]=densu(z,db04,tinf,tlb, 4.,alpha[0],RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+    output.d[0]=densu(z,db04,tinf,tlb, 4.,alpha[0],RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     dd=output.d[0];
     if ((flags.sw[15]) and (z<altl[0])):
@@ -1239,16 +1185,15 @@ def gts7(Input, flags, output):
         zh04=pdm[0][2];
         #/*  Mixed density at Zlb */
         RandomVariable = [output.t[1]]
-        b04=densu(zh04,db04,tinf,tlb,4.-xmm,alpha[0]-1.,RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        b04=densu(zh04,db04,tinf,tlb,4.-xmm,alpha[0]-1.,RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         #/*  Mixed density at Alt */
         RandomVariable = [output.t[1]]
-        global dm04
-        dm04=densu(z,b04,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        ctx.dm04=densu(z,b04,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         zhm04=zhm28;
         #/*  Net density at Alt */
-        output.d[0]=dnet(output.d[0],dm04,zhm04,xmm,4.);
+        output.d[0]=dnet(output.d[0],ctx.dm04,zhm04,xmm,4.);
         #/*  Correction to specified mixing ratio at ground */
         rl=log(b28*pdm[0][1]/b04);
         zc04=pdm[0][4]*pdl[1][0];
@@ -1261,12 +1206,12 @@ def gts7(Input, flags, output):
     #/**** O DENSITY ****/
 
     #/*  Density variation factor at Zlb */
-    g16= flags.sw[21]*globe7(pd[1],Input,flags);
+    g16= flags.sw[21]*globe7(pd[1],Input,flags, ctx);
     #/*  Diffusive density at Zlb */
     db16 =  pdm[1][0]*exp(g16)*pd[1][0];
     #/*   Diffusive density at Alt */
     RandomVariable = [output.t[1]]
-    output.d[1]=densu(z,db16,tinf,tlb, 16.,alpha[1],RandomVariable,ptm[5],s,mn1, zn1,meso_tn1,meso_tgn1);
+    output.d[1]=densu(z,db16,tinf,tlb, 16.,alpha[1],RandomVariable,ptm[5],s,mn1, zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     dd=output.d[1];
     if ((flags.sw[15]) and (z<=altl[1])):
@@ -1274,16 +1219,15 @@ def gts7(Input, flags, output):
         zh16=pdm[1][2];
         #/*  Mixed density at Zlb */
         RandomVariable = [output.t[1]]
-        b16=densu(zh16,db16,tinf,tlb,16.0-xmm,(alpha[1]-1.0), RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        b16=densu(zh16,db16,tinf,tlb,16.0-xmm,(alpha[1]-1.0), RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         #/*  Mixed density at Alt */
         RandomVariable = [output.t[1]]
-        global dm16
-        dm16=densu(z,b16,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        ctx.dm16=densu(z,b16,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         zhm16=zhm28;
         #/*  Net density at Alt */
-        output.d[1]=dnet(output.d[1],dm16,zhm16,xmm,16.);
+        output.d[1]=dnet(output.d[1],ctx.dm16,zhm16,xmm,16.);
         rl=pdm[1][1]*pdl[1][16]*(1.0+flags.sw[1]*pdl[0][23]*(Input.f107A-150.0));
         hc16=pdm[1][5]*pdl[1][3];
         zc16=pdm[1][4]*pdl[1][2];
@@ -1301,12 +1245,12 @@ def gts7(Input, flags, output):
     #/**** O2 DENSITY ****/
 
     #/*   Density variation factor at Zlb */
-    g32= flags.sw[21]*globe7(pd[4], Input, flags);
+    g32= flags.sw[21]*globe7(pd[4], Input, flags, ctx);
     #/*  Diffusive density at Zlb */
     db32 = pdm[3][0]*exp(g32)*pd[4][0];
     #/*   Diffusive density at Alt */
     RandomVariable = [output.t[1]]
-    output.d[3]=densu(z,db32,tinf,tlb, 32.,alpha[3],RandomVariable,ptm[5],s,mn1, zn1,meso_tn1,meso_tgn1);
+    output.d[3]=densu(z,db32,tinf,tlb, 32.,alpha[3],RandomVariable,ptm[5],s,mn1, zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     dd=output.d[3];
     if (flags.sw[15]):
@@ -1315,16 +1259,15 @@ def gts7(Input, flags, output):
             zh32=pdm[3][2];
             #/*  Mixed density at Zlb */
             RandomVariable = [output.t[1]]
-            b32=densu(zh32,db32,tinf,tlb,32.-xmm,alpha[3]-1., RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+            b32=densu(zh32,db32,tinf,tlb,32.-xmm,alpha[3]-1., RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
             output.t[1] = RandomVariable[0]
             #/*  Mixed density at Alt */
             RandomVariable = [output.t[1]]
-            global dm32
-            dm32=densu(z,b32,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+            ctx.dm32=densu(z,b32,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
             output.t[1] = RandomVariable[0]
             zhm32=zhm28;
             #/*  Net density at Alt */
-            output.d[3]=dnet(output.d[3],dm32,zhm32,xmm,32.);
+            output.d[3]=dnet(output.d[3],ctx.dm32,zhm32,xmm,32.);
             #/*   Correction to specified mixing ratio at ground */
             rl=log(b28*pdm[3][1]/b32);
             hc32=pdm[3][5]*pdl[1][7];
@@ -1344,12 +1287,12 @@ def gts7(Input, flags, output):
     #/**** AR DENSITY ****/
 
     #/*   Density variation factor at Zlb */
-    g40= flags.sw[21]*globe7(pd[5],Input,flags);
+    g40= flags.sw[21]*globe7(pd[5],Input,flags, ctx);
     #/*  Diffusive density at Zlb */
     db40 = pdm[4][0]*exp(g40)*pd[5][0];
     #/*   Diffusive density at Alt */
     RandomVariable = [output.t[1]]
-    output.d[4]=densu(z,db40,tinf,tlb, 40.,alpha[4],RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+    output.d[4]=densu(z,db40,tinf,tlb, 40.,alpha[4],RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     dd=output.d[4];
     if ((flags.sw[15]) and (z<=altl[4])):
@@ -1357,16 +1300,15 @@ def gts7(Input, flags, output):
         zh40=pdm[4][2];
         #/*  Mixed density at Zlb */
         RandomVariable = [output.t[1]]
-        b40=densu(zh40,db40,tinf,tlb,40.-xmm,alpha[4]-1.,RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        b40=densu(zh40,db40,tinf,tlb,40.-xmm,alpha[4]-1.,RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         #/*  Mixed density at Alt */
         RandomVariable = [output.t[1]]
-        global dm40
-        dm40=densu(z,b40,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        ctx.dm40=densu(z,b40,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         zhm40=zhm28;
         #/*  Net density at Alt */
-        output.d[4]=dnet(output.d[4],dm40,zhm40,xmm,40.);
+        output.d[4]=dnet(output.d[4],ctx.dm40,zhm40,xmm,40.);
         #/*   Correction to specified mixing ratio at ground */
         rl=log(b28*pdm[4][1]/b40);
         hc40=pdm[4][5]*pdl[1][9];
@@ -1379,12 +1321,12 @@ def gts7(Input, flags, output):
     #/**** HYDROGEN DENSITY ****/
 
     #/*   Density variation factor at Zlb */
-    g1 = flags.sw[21]*globe7(pd[6], Input, flags);
+    g1 = flags.sw[21]*globe7(pd[6], Input, flags, ctx);
     #/*  Diffusive density at Zlb */
     db01 = pdm[5][0]*exp(g1)*pd[6][0];
     #/*   Diffusive density at Alt */
     RandomVariable = [output.t[1]]
-    output.d[6]=densu(z,db01,tinf,tlb,1.,alpha[6],RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+    output.d[6]=densu(z,db01,tinf,tlb,1.,alpha[6],RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     dd=output.d[6];
     if ((flags.sw[15]) and (z<=altl[6])):
@@ -1392,16 +1334,15 @@ def gts7(Input, flags, output):
         zh01=pdm[5][2];
         #/*  Mixed density at Zlb */
         RandomVariable = [output.t[1]]
-        b01=densu(zh01,db01,tinf,tlb,1.-xmm,alpha[6]-1., RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        b01=densu(zh01,db01,tinf,tlb,1.-xmm,alpha[6]-1., RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         #/*  Mixed density at Alt */
         RandomVariable = [output.t[1]]
-        global dm01
-        dm01=densu(z,b01,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        ctx.dm01=densu(z,b01,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         zhm01=zhm28;
         #/*  Net density at Alt */
-        output.d[6]=dnet(output.d[6],dm01,zhm01,xmm,1.);
+        output.d[6]=dnet(output.d[6],ctx.dm01,zhm01,xmm,1.);
         #/*   Correction to specified mixing ratio at ground */
         rl=log(b28*pdm[5][1]*sqrt(pdl[1][17]*pdl[1][17])/b01);
         hc01=pdm[5][5]*pdl[1][11];
@@ -1419,12 +1360,12 @@ def gts7(Input, flags, output):
     #/**** ATOMIC NITROGEN DENSITY ****/
 
     #/*   Density variation factor at Zlb */
-    g14 = flags.sw[21]*globe7(pd[7],Input,flags);
+    g14 = flags.sw[21]*globe7(pd[7],Input,flags, ctx);
     #/*  Diffusive density at Zlb */
     db14 = pdm[6][0]*exp(g14)*pd[7][0];
     #/*   Diffusive density at Alt */
     RandomVariable = [output.t[1]]
-    output.d[7]=densu(z,db14,tinf,tlb,14.,alpha[7],RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+    output.d[7]=densu(z,db14,tinf,tlb,14.,alpha[7],RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     dd=output.d[7];
     if ((flags.sw[15]) and (z<=altl[7])): 
@@ -1432,16 +1373,15 @@ def gts7(Input, flags, output):
         zh14=pdm[6][2];
         #/*  Mixed density at Zlb */
         RandomVariable = [output.t[1]]
-        b14=densu(zh14,db14,tinf,tlb,14.-xmm,alpha[7]-1., RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        b14=densu(zh14,db14,tinf,tlb,14.-xmm,alpha[7]-1., RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         #/*  Mixed density at Alt */
         RandomVariable = [output.t[1]]
-        global dm14
-        dm14=densu(z,b14,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,meso_tn1,meso_tgn1);
+        ctx.dm14=densu(z,b14,tinf,tlb,xmm,0.,RandomVariable,ptm[5],s,mn1,zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
         output.t[1] = RandomVariable[0]
         zhm14=zhm28;
         #/*  Net density at Alt */
-        output.d[7]=dnet(output.d[7],dm14,zhm14,xmm,14.);
+        output.d[7]=dnet(output.d[7],ctx.dm14,zhm14,xmm,14.);
         #/*   Correction to specified mixing ratio at ground */
         rl=log(b28*pdm[6][1]*sqrt(pdl[0][2]*pdl[0][2])/b14);
         hc14=pdm[6][5]*pdl[0][1];
@@ -1458,15 +1398,15 @@ def gts7(Input, flags, output):
 
     #/**** Anomalous OXYGEN DENSITY ****/
 
-    g16h = flags.sw[21]*globe7(pd[8],Input,flags);
+    g16h = flags.sw[21]*globe7(pd[8],Input,flags, ctx);
     db16h = pdm[7][0]*exp(g16h)*pd[8][0];
     tho = pdm[7][9]*pdl[0][6];
     RandomVariable = [output.t[1]]
-    dd=densu(z,db16h,tho,tho,16.,alpha[8],RandomVariable,ptm[5],s,mn1, zn1,meso_tn1,meso_tgn1);
+    dd=densu(z,db16h,tho,tho,16.,alpha[8],RandomVariable,ptm[5],s,mn1, zn1,ctx.meso_tn1,ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     zsht=pdm[7][5];
     zmho=pdm[7][4];
-    zsho=scalh(zmho,16.0,tho);
+    zsho=scalh(zmho,16.0,tho, ctx);
     output.d[8]=dd*exp(-zsht/zsho*(exp(-(z-zmho)/zsht)-1.));
 
 
@@ -1479,7 +1419,7 @@ def gts7(Input, flags, output):
     #/* temperature */
     z = sqrt(Input.alt*Input.alt);
     RandomVariable = [output.t[1]]
-    ddum = densu(z,1.0, tinf, tlb, 0.0, 0.0, RandomVariable, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1);
+    ddum = densu(z,1.0, tinf, tlb, 0.0, 0.0, RandomVariable, ptm[5], s, mn1, zn1, ctx.meso_tn1, ctx.meso_tgn1, ctx);
     output.t[1] = RandomVariable[0]
     if (flags.sw[0]):
         for i in range(9):
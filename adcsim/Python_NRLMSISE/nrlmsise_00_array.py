@@ -0,0 +1,937 @@
+"""
+The NRLMSISE-00 model 2001 for numpy arrays of inputs.
+
+This is the same model as in nrlmsise_00.py, written so that every function works on whole numpy arrays of points at
+once (e.g. all the points of an orbit) instead of one point at a time. The functions follow the ones in nrlmsise_00.py
+line for line, except that the branches that depend on the altitude are calculated for all the points and the right
+value is picked for each point with np.where (the branches are skipped when no point needs them).
+
+The model is normally called through gtd7 in nrlmsise_00.py, which uses gtd7_array when the inputs are arrays:
+>>> Input = nrlmsise_input(doy=172, sec=29000, alt=np.linspace(100, 1000, 1000), g_lat=60, g_long=-70, lst=16,
+...                        f107A=150, f107=150, ap=4)
+>>> gtd7(Input, flags, output)  # output.d[5] is an array of 1000 total mass densities
+"""
+
+import numpy as np
+from adcsim.Python_NRLMSISE.nrlmsise_00_header import *
+from adcsim.Python_NRLMSISE.nrlmsise_00_data import *
+
+_input_names = ('doy', 'sec', 'alt', 'g_lat', 'g_long', 'lst', 'f107A', 'f107', 'ap')
+
+
+def is_array_input(Input):
+    """
+    True if any of the fields of an nrlmsise_input are arrays.
+    """
+    values = [getattr(Input, name) for name in _input_names]
+    if isinstance(Input.ap_a, ap_array):
+        values += list(Input.ap_a.a)
+    return any(np.ndim(value) > 0 for value in values)
+
+
+def _flat_input(Input):
+    # broadcast all of the fields together and flatten them, so the model only ever works on 1d arrays
+    values = [getattr(Input, name) for name in _input_names]
+    if isinstance(Input.ap_a, ap_array):
+        values += list(Input.ap_a.a)
+    values = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in values])
+    shape = values[0].shape
+    values = [value.ravel() for value in values]
+    flat = nrlmsise_input(year=Input.year, **dict(zip(_input_names, values)))
+    if isinstance(Input.ap_a, ap_array):
+        flat.ap_a = ap_array()
+        flat.ap_a.a = values[len(_input_names):]
+    return shape, flat
+
+
+def _take(values, index):
+    # values[index[i]][i] for a list of arrays
+    values = np.array(np.broadcast_arrays(*values))
+    return np.take_along_axis(values, index[None, :], axis=0)[0]
+
+
+def glatf(lat):
+    dgtr = 1.74533E-2
+    c2 = np.cos(2.0*dgtr*lat)
+    gv = 980.616 * (1.0 - 0.0026373 * c2)
+    reff = 2.0 * gv / (3.085462E-6 + 2.27E-9 * c2) * 1.0E-5
+    return gv, reff
+
+
+def ccor(alt, r, h1, zh):
+    e = (alt - zh) / h1
+    ccorv = np.exp(r / (1.0 + np.exp(e)))
+    return np.where(e > 70, 1.0, np.where(e < -70, np.exp(r), ccorv))
+
+
+def ccor2(alt, r, h1, zh, h2):
+    e1 = (alt - zh) / h1
+    e2 = (alt - zh) / h2
+    ccor2v = np.exp(r / (1.0 + 0.5 * (np.exp(e1) + np.exp(e2))))
+    return np.where((e1 > 70) | (e2 > 70), 1.0, np.where((e1 < -70) & (e2 < -70), np.exp(r), ccor2v))
+
+
+def scalh(alt, xm, temp, ctx):
+    rgas = 831.4
+    g = ctx.gsurf[0] / ((1.0 + alt/ctx.re[0])**2.0)
+    g = rgas * temp / (g * xm)
+    return g
+
+
+def dnet(dd, dm, zhm, xmm, xm):
+    a = zhm / (xmm-xm)
+    ylog = a * np.log(dm/dd)
+    net = dd*(1.0 + np.exp(ylog))**(1.0/a)
+    net = np.where(ylog < -10, dd, np.where(ylog > 10, dm, net))
+    # if one of the densities is zero the other one is used
+    return np.where(dm == 0, np.where(dd == 0, 1.0, dd), np.where(dd == 0, dm, net))
+
+
+def splini(xa, ya, y2a, n, x):
+    # the C version integrates segment by segment until it reaches x, here every segment below x is added
+    yi = 0.0
+    for klo in range(n - 1):
+        khi = klo + 1
+        if khi < (n - 1):
+            xx = np.where(x < xa[khi], x, xa[khi])
+        else:
+            xx = x
+        h = xa[khi] - xa[klo]
+        a = (xa[khi] - xx)/h
+        b = (xx - xa[klo])/h
+        a2 = a*a
+        b2 = b*b
+        segment = ((1.0 - a2) * ya[klo] / 2.0 + b2 * ya[khi] / 2.0 + ((-(1.0+a2*a2)/4.0 + a2/2.0) * y2a[klo] +
+                   (b2*b2/4.0 - b2/2.0) * y2a[khi]) * h * h / 6.0) * h
+        yi = yi + np.where(x > xa[klo], segment, 0.0)
+    return yi
+
+
+def splint(xa, ya, y2a, n, x):
+    # the bisection of the C version ends on the last node at or below x
+    klo = np.zeros(np.shape(x), dtype=int)
+    for k in range(1, n - 1):
+        klo += xa[k] <= x
+    khi = klo + 1
+    xlo, xhi = _take(xa, klo), _take(xa, khi)
+    h = xhi - xlo
+    a = (xhi - x)/h
+    b = (x - xlo)/h
+    return a * _take(ya, klo) + b * _take(ya, khi) + ((a*a*a - a) * _take(y2a, klo) +
+                                                      (b*b*b - b) * _take(y2a, khi)) * h * h/6.0
+
+
+def spline(x, y, n, yp1, ypn):
+    y2 = [0.0 for _ in range(n)]
+    u = [0.0 for _ in range(n)]
+
+    y2[0] = np.where(yp1 > 0.99E30, 0.0, -0.5)
+    u[0] = np.where(yp1 > 0.99E30, 0.0, (3.0/(x[1]-x[0]))*((y[1]-y[0])/(x[1]-x[0])-yp1))
+
+    for i in range(1, n-1):
+        sig = (x[i]-x[i-1])/(x[i+1] - x[i-1])
+        p = sig * y2[i-1] + 2.0
+        y2[i] = (sig - 1.0) / p
+        u[i] = (6.0 * ((y[i+1] - y[i])/(x[i+1] - x[i]) - (y[i] - y[i-1]) / (x[i] - x[i-1]))/(x[i+1] - x[i-1]) -
+                sig * u[i-1])/p
+
+    qn = np.where(ypn > 0.99E30, 0.0, 0.5)
+    un = np.where(ypn > 0.99E30, 0.0, (3.0 / (x[n-1] - x[n-2])) * (ypn - (y[n-1] - y[n-2])/(x[n-1] - x[n-2])))
+
+    y2[n-1] = (un - qn * u[n-2]) / (qn * y2[n-2] + 1.0)
+    for k in range(n-2, -1, -1):
+        y2[k] = y2[k] * y2[k+1] + u[k]
+    return y2
+
+
+def zeta(zz, zl, ctx):
+    return (zz-zl)*(ctx.re[0]+zl)/(ctx.re[0]+zz)
+
+
+def _densm_profile(z, d0, xm, mn, zn, tn, tgn, ctx):
+    # temperature and density of one of the two spline sections of densm
+    rgas = 831.4
+    z1 = zn[0]
+    z2 = zn[mn-1]
+    t1 = tn[0]
+    t2 = tn[mn-1]
+    zg = zeta(z, z1, ctx)
+    zgdif = zeta(z2, z1, ctx)
+
+    xs = [zeta(zn[k], z1, ctx)/zgdif for k in range(mn)]
+    ys = [1.0 / tn[k] for k in range(mn)]
+    yd1 = -tgn[0] / (t1*t1) * zgdif
+    yd2 = -tgn[1] / (t2*t2) * zgdif * (((ctx.re[0]+z2)/(ctx.re[0]+z1))**2.0)
+
+    y2out = spline(xs, ys, mn, yd1, yd2)
+    x = zg/zgdif
+    tz = 1.0 / splint(xs, ys, y2out, mn, x)
+    if xm != 0.0:
+        glb = ctx.gsurf[0] / ((1.0 + z1/ctx.re[0])**2.0)
+        gamm = xm * glb * zgdif / rgas
+        expl = gamm*splini(xs, ys, y2out, mn, x)
+        expl = np.where(expl > 50.0, 50.0, expl)
+        d0 = d0 * (t1 / tz) * np.exp(-expl)
+    return d0, tz
+
+
+def densm(alt, d0, xm, tz, mn3, zn3, tn3, tgn3, mn2, zn2, tn2, tgn2, ctx):
+    # stratosphere/mesosphere
+    z = np.where(alt > zn2[mn2-1], alt, zn2[mn2-1])
+    densm_strat, tz_strat = _densm_profile(z, d0, xm, mn2, zn2, tn2, tgn2, ctx)
+    strat = alt > zn3[0]
+    if np.all(strat):
+        densm_tmp, tz_tmp = densm_strat, tz_strat
+    else:
+        # troposphere/stratosphere
+        densm_trop, tz_trop = _densm_profile(alt, densm_strat, xm, mn3, zn3, tn3, tgn3, ctx)
+        densm_tmp = np.where(strat, densm_strat, densm_trop)
+        tz_tmp = np.where(strat, tz_strat, tz_trop)
+
+    above = alt > zn2[0]
+    tz[0] = np.where(above, tz[0], tz_tmp)
+    if xm == 0.0:
+        return tz[0]
+    return np.where(above, d0, densm_tmp)
+
+
+def densu(alt, dlb, tinf, tlb, xm, alpha, tz, zlb, s2, mn1, zn1, tn1, tgn1, ctx):
+    rgas = 831.4
+
+    #/* joining altitudes of Bates and spline */
+    za = zn1[0]
+    z = np.where(alt > za, alt, za)
+
+    #/* geopotential altitude difference from ZLB */
+    zg2 = zeta(z, zlb, ctx)
+
+    #/* Bates temperature */
+    tt = tinf - (tinf - tlb) * np.exp(-s2*zg2)
+    ta = tt
+    tz[0] = tt
+
+    below = alt < za
+    if np.any(below):
+        #/* calculate temperature below ZA
+        # * temperature gradient at ZA from Bates profile */
+        dta = (tinf - ta) * s2 * (((ctx.re[0]+zlb)/(ctx.re[0]+za))**2.0)
+        tgn1[0] = dta
+        tn1[0] = ta
+        z = np.where(alt > zn1[mn1-1], alt, zn1[mn1-1])
+        mn = mn1
+        z1 = zn1[0]
+        z2 = zn1[mn-1]
+        t1 = tn1[0]
+        t2 = tn1[mn-1]
+        #/* geopotental difference from z1 */
+        zg = zeta(z, z1, ctx)
+        zgdif = zeta(z2, z1, ctx)
+        #/* set up spline nodes */
+        xs = [zeta(zn1[k], z1, ctx) / zgdif for k in range(mn)]
+        ys = [1.0 / tn1[k] for k in range(mn)]
+
+        #/* end node derivatives */
+        yd1 = -tgn1[0] / (t1*t1) * zgdif
+        yd2 = -tgn1[1] / (t2*t2) * zgdif * (((ctx.re[0]+z2)/(ctx.re[0]+z1))**2.0)
+        #/* calculate spline coefficients */
+        y2out = spline(xs, ys, mn, yd1, yd2)
+        x = zg / zgdif
+        #/* temperature at altitude */
+        tz[0] = np.where(below, 1.0 / splint(xs, ys, y2out, mn, x), tt)
+
+    if xm == 0:
+        return tz[0]
+
+    #/* calculate density above za */
+    glb = ctx.gsurf[0] / ((1.0 + zlb/ctx.re[0])**2.0)
+    gamma = xm * glb / (s2 * rgas * tinf)
+    expl = np.exp(-s2 * gamma * zg2)
+    expl = np.where((expl > 50.0) | (tt <= 0), 50.0, expl)
+
+    #/* density at altitude */
+    densa = dlb * (tlb/tt)**(1.0+alpha+gamma) * expl
+    if not np.any(below):
+        return densa
+
+    #/* calculate density below za */
+    glb = ctx.gsurf[0] / ((1.0 + z1/ctx.re[0])**2.0)
+    gamm = xm * glb * zgdif / rgas
+
+    #/* integrate spline temperatures */
+    expl = gamm * splini(xs, ys, y2out, mn, x)
+    expl = np.where((expl > 50.0) | (tz[0] <= 0), 50.0, expl)
+
+    #/* density at altitude */
+    return np.where(below, densa * (t1 / tz[0])**(1.0 + alpha) * np.exp(-expl), densa)
+
+
+#/*    3hr Magnetic activity functions */
+#/*    Eq. A24d */
+def g0(a, p):
+    return (a - 4.0 + (p[25] - 1.0) * (a - 4.0 + (np.exp(-np.sqrt(p[24]*p[24]) * (a - 4.0)) - 1.0) /
+                                       np.sqrt(p[24]*p[24])))
+
+
+#/*    Eq. A24c */
+def sumex(ex):
+    return 1.0 + (1.0 - ex**19.0) / (1.0 - ex) * ex**0.5
+
+
+#/*    Eq. A24a */
+def sg0(ex, p, ap):
+    return (g0(ap[1], p) + (g0(ap[2], p)*ex + g0(ap[3], p)*ex*ex + g0(ap[4], p)*ex**3.0 +
+                            (g0(ap[5], p)*ex**4.0 + g0(ap[6], p)*ex**12.0)*(1.0-ex**8.0)/(1.0-ex)))/sumex(ex)
+
+
+def globe7(p, Input, flags, ctx):
+    t = [0.0 for _ in range(15)]
+    sr = 7.2722E-5
+    dgtr = 1.74533E-2
+    dr = 1.72142E-2
+    hr = 0.2618
+
+    tloc = Input.lst
+
+    #/* calculate legendre polynomials */
+    c = np.sin(Input.g_lat * dgtr)
+    s = np.cos(Input.g_lat * dgtr)
+    c2 = c*c
+    c4 = c2*c2
+    s2 = s*s
+
+    plg = ctx.plg
+    plg[0][1] = c
+    plg[0][2] = 0.5*(3.0*c2 - 1.0)
+    plg[0][3] = 0.5*(5.0*c*c2-3.0*c)
+    plg[0][4] = (35.0*c4 - 30.0*c2 + 3.0)/8.0
+    plg[0][5] = (63.0*c2*c2*c - 70.0*c2*c + 15.0*c)/8.0
+    plg[0][6] = (11.0*c*plg[0][5] - 5.0*plg[0][4])/6.0
+    plg[1][1] = s
+    plg[1][2] = 3.0*c*s
+    plg[1][3] = 1.5*(5.0*c2-1.0)*s
+    plg[1][4] = 2.5*(7.0*c2*c-3.0*c)*s
+    plg[1][5] = 1.875*(21.0*c4 - 14.0*c2 + 1.0)*s
+    plg[1][6] = (11.0*c*plg[1][5]-6.0*plg[1][4])/5.0
+    plg[2][2] = 3.0*s2
+    plg[2][3] = 15.0*s2*c
+    plg[2][4] = 7.5*(7.0*c2 - 1.0)*s2
+    plg[2][5] = 3.0*c*plg[2][4]-2.0*plg[2][3]
+    plg[2][6] = (11.0*c*plg[2][5]-7.0*plg[2][4])/4.0
+    plg[2][7] = (13.0*c*plg[2][6]-8.0*plg[2][5])/5.0
+    plg[3][3] = 15.0*s2*s
+    plg[3][4] = 105.0*s2*s*c
+    plg[3][5] = (9.0*c*plg[3][4]-7.*plg[3][3])/2.0
+    plg[3][6] = (11.0*c*plg[3][5]-8.*plg[3][4])/3.0
+
+    if not (((flags.sw[7] == 0) and (flags.sw[8] == 0)) and (flags.sw[14] == 0)):
+        ctx.stloc = np.sin(hr*tloc)
+        ctx.ctloc = np.cos(hr*tloc)
+        ctx.s2tloc = np.sin(2.0*hr*tloc)
+        ctx.c2tloc = np.cos(2.0*hr*tloc)
+        ctx.s3tloc = np.sin(3.0*hr*tloc)
+        ctx.c3tloc = np.cos(3.0*hr*tloc)
+
+    cd32 = np.cos(dr*(Input.doy-p[31]))
+    cd18 = np.cos(2.0*dr*(Input.doy-p[17]))
+    cd14 = np.cos(dr*(Input.doy-p[13]))
+    cd39 = np.cos(2.0*dr*(Input.doy-p[38]))
+
+    #/* F10.7 EFFECT */
+    df = Input.f107 - Input.f107A
+    ctx.dfa = dfa = Input.f107A - 150.0
+    t[0] = p[19]*df*(1.0+p[59]*dfa) + p[20]*df*df + p[21]*dfa + p[29]*dfa**2.0
+    f1 = 1.0 + (p[47]*dfa + p[19]*df+p[20]*df*df)*flags.swc[1]
+    f2 = 1.0 + (p[49]*dfa+p[19]*df+p[20]*df*df)*flags.swc[1]
+
+    #/*  TIME INDEPENDENT */
+    t[1] = (p[1]*plg[0][2] + p[2]*plg[0][4]+p[22]*plg[0][6]) + \
+        (p[14]*plg[0][2])*dfa*flags.swc[1] + p[26]*plg[0][1]
+
+    #/*  SYMMETRICAL ANNUAL */
+    t[2] = p[18]*cd32
+
+    #/*  SYMMETRICAL SEMIANNUAL */
+    t[3] = (p[15]+p[16]*plg[0][2])*cd18
+
+    #/*  ASYMMETRICAL ANNUAL */
+    t[4] = f1*(p[9]*plg[0][1]+p[10]*plg[0][3])*cd14
+
+    #/*  ASYMMETRICAL SEMIANNUAL */
+    t[5] = p[37]*plg[0][1]*cd39
+
+    #/* DIURNAL */
+    if flags.sw[7]:
+        t71 = (p[11]*plg[1][2])*cd14*flags.swc[5]
+        t72 = (p[12]*plg[1][2])*cd14*flags.swc[5]
+        t[6] = f2*((p[3]*plg[1][1] + p[4]*plg[1][3] + p[27]*plg[1][5] + t71) * ctx.ctloc +
+                   (p[6]*plg[1][1] + p[7]*plg[1][3] + p[28]*plg[1][5] + t72)*ctx.stloc)
+
+    #/* SEMIDIURNAL */
+    if flags.sw[8]:
+        t81 = (p[23]*plg[2][3]+p[35]*plg[2][5])*cd14*flags.swc[5]
+        t82 = (p[33]*plg[2][3]+p[36]*plg[2][5])*cd14*flags.swc[5]
+        t[7] = f2*((p[5]*plg[2][2] + p[41]*plg[2][4] + t81)*ctx.c2tloc +
+                   (p[8]*plg[2][2] + p[42]*plg[2][4] + t82)*ctx.s2tloc)
+
+    #/* TERDIURNAL */
+    if flags.sw[14]:
+        t[13] = f2 * ((p[39]*plg[3][3]+(p[93]*plg[3][4]+p[46]*plg[3][6])*cd14*flags.swc[5])*ctx.s3tloc +
+                      (p[40]*plg[3][3]+(p[94]*plg[3][4]+p[48]*plg[3][6])*cd14*flags.swc[5])*ctx.c3tloc)
+
+    #/* magnetic activity based on daily ap */
+    if flags.sw[9] == -1:
+        ap = Input.ap_a
+        if p[51] != 0:
+            exp1 = np.exp(-10800.0*np.sqrt(p[51]*p[51])/(1.0+p[138]*(45.0-np.sqrt(Input.g_lat*Input.g_lat))))
+            exp1 = np.where(exp1 > 0.99999, 0.99999, exp1)
+            if p[24] < 1.0E-4:
+                p[24] = 1.0E-4
+            ctx.apt[0] = sg0(exp1, p, ap.a)
+            if flags.sw[9]:
+                t[8] = ctx.apt[0]*(p[50]+p[96]*plg[0][2]+p[54]*plg[0][4] +
+                                   (p[125]*plg[0][1]+p[126]*plg[0][3]+p[127]*plg[0][5])*cd14*flags.swc[5] +
+                                   (p[128]*plg[1][1]+p[129]*plg[1][3]+p[130]*plg[1][5])*flags.swc[7] *
+                                   np.cos(hr*(tloc-p[131])))
+    else:
+        apd = Input.ap-4.0
+        p44 = p[43]
+        p45 = p[44]
+        if p44 < 0:
+            p44 = 1.0E-5
+        ctx.apdf = apd + (p45-1.0)*(apd + (np.exp(-p44 * apd) - 1.0)/p44)
+        if flags.sw[9]:
+            t[8] = ctx.apdf*(p[32]+p[45]*plg[0][2]+p[34]*plg[0][4] +
+                             (p[100]*plg[0][1]+p[101]*plg[0][3]+p[102]*plg[0][5])*cd14*flags.swc[5] +
+                             (p[121]*plg[1][1]+p[122]*plg[1][3]+p[123]*plg[1][5])*flags.swc[7] *
+                             np.cos(hr*(tloc-p[124])))
+
+    if flags.sw[10]:
+        use_long = Input.g_long > -1000.0
+
+        #/* longitudinal */
+        if flags.sw[11]:
+            t[10] = (1.0 + p[80]*dfa*flags.swc[1]) * \
+                ((p[64]*plg[1][2]+p[65]*plg[1][4]+p[66]*plg[1][6] +
+                  p[103]*plg[1][1]+p[104]*plg[1][3]+p[105]*plg[1][5] +
+                  flags.swc[5]*(p[109]*plg[1][1]+p[110]*plg[1][3]+p[111]*plg[1][5])*cd14) *
+                 np.cos(dgtr*Input.g_long) +
+                 (p[90]*plg[1][2]+p[91]*plg[1][4]+p[92]*plg[1][6] +
+                  p[106]*plg[1][1]+p[107]*plg[1][3]+p[108]*plg[1][5] +
+                  flags.swc[5]*(p[112]*plg[1][1]+p[113]*plg[1][3]+p[114]*plg[1][5])*cd14) *
+                 np.sin(dgtr*Input.g_long))
+            t[10] = np.where(use_long, t[10], 0.0)
+
+        #/* ut and mixed ut, longitude */
+        if flags.sw[12]:
+            t[11] = (1.0+p[95]*plg[0][1])*(1.0+p[81]*dfa*flags.swc[1]) * \
+                (1.0+p[119]*plg[0][1]*flags.swc[5]*cd14) * \
+                ((p[68]*plg[0][1]+p[69]*plg[0][3]+p[70]*plg[0][5]) *
+                 np.cos(sr*(Input.sec-p[71])))
+            t[11] += flags.swc[11] * \
+                (p[76]*plg[2][3]+p[77]*plg[2][5]+p[78]*plg[2][7]) * \
+                np.cos(sr*(Input.sec-p[79])+2.0*dgtr*Input.g_long)*(1.0+p[137]*dfa*flags.swc[1])
+            t[11] = np.where(use_long, t[11], 0.0)
+
+        #/* ut, longitude magnetic activity */
+        if flags.sw[13]:
+            if flags.sw[9] == -1:
+                if p[51]:
+                    apt = ctx.apt[0]
+                    t[12] = apt*flags.swc[11]*(1.+p[132]*plg[0][1]) * \
+                        ((p[52]*plg[1][2]+p[98]*plg[1][4]+p[67]*plg[1][6]) *
+                         np.cos(dgtr*(Input.g_long-p[97]))) \
+                        + apt*flags.swc[11]*flags.swc[5] * \
+                        (p[133]*plg[1][1]+p[134]*plg[1][3]+p[135]*plg[1][5]) * \
+                        cd14*np.cos(dgtr*(Input.g_long-p[136])) \
+                        + apt*flags.swc[12] * \
+                        (p[55]*plg[0][1]+p[56]*plg[0][3]+p[57]*plg[0][5]) * \
+                        np.cos(sr*(Input.sec-p[58]))
+                    t[12] = np.where(use_long, t[12], 0.0)
+            else:
+                apdf = ctx.apdf
+                t[12] = apdf*flags.swc[11]*(1.0+p[120]*plg[0][1]) * \
+                    ((p[60]*plg[1][2]+p[61]*plg[1][4]+p[62]*plg[1][6]) *
+                     np.cos(dgtr*(Input.g_long-p[63]))) \
+                    + apdf*flags.swc[11]*flags.swc[5] * \
+                    (p[115]*plg[1][1]+p[116]*plg[1][3]+p[117]*plg[1][5]) * \
+                    cd14*np.cos(dgtr*(Input.g_long-p[118])) \
+                    + apdf*flags.swc[12] * \
+                    (p[83]*plg[0][1]+p[84]*plg[0][3]+p[85]*plg[0][5]) * \
+                    np.cos(sr*(Input.sec-p[75]))
+                t[12] = np.where(use_long, t[12], 0.0)
+
+    #/* parms not used: 82, 89, 99, 139-149 */
+    tinf = p[30]
+    for i in range(14):
+        tinf = tinf + abs(flags.sw[i+1])*t[i]
+    return tinf
+
+
+def glob7s(p, Input, flags, ctx):
+    pset = 2.0
+    t = [0.0 for _ in range(14)]
+    dr = 1.72142E-2
+    dgtr = 1.74533E-2
+
+    #/* confirm parameter set */
+    if p[99] == 0:
+        p[99] = pset
+    if p[99] != pset:
+        print("Wrong parameter set for glob7s\n")
+        return -1
+
+    plg = ctx.plg
+    cd32 = np.cos(dr*(Input.doy-p[31]))
+    cd18 = np.cos(2.0*dr*(Input.doy-p[17]))
+    cd14 = np.cos(dr*(Input.doy-p[13]))
+    cd39 = np.cos(2.0*dr*(Input.doy-p[38]))
+
+    #/* F10.7 */
+    t[0] = p[21]*ctx.dfa
+
+    #/* time independent */
+    t[1] = p[1]*plg[0][2] + p[2]*plg[0][4] + p[22]*plg[0][6] + p[26]*plg[0][1] + p[14]*plg[0][3] + p[59]*plg[0][5]
+
+    #/* SYMMETRICAL ANNUAL */
+    t[2] = (p[18]+p[47]*plg[0][2]+p[29]*plg[0][4])*cd32
+
+    #/* SYMMETRICAL SEMIANNUAL */
+    t[3] = (p[15]+p[16]*plg[0][2]+p[30]*plg[0][4])*cd18
+
+    #/* ASYMMETRICAL ANNUAL */
+    t[4] = (p[9]*plg[0][1]+p[10]*plg[0][3]+p[20]*plg[0][5])*cd14
+
+    #/* ASYMMETRICAL SEMIANNUAL */
+    t[5] = (p[37]*plg[0][1])*cd39
+
+    #/* DIURNAL */
+    if flags.sw[7]:
+        t71 = p[11]*plg[1][2]*cd14*flags.swc[5]
+        t72 = p[12]*plg[1][2]*cd14*flags.swc[5]
+        t[6] = ((p[3]*plg[1][1] + p[4]*plg[1][3] + t71) * ctx.ctloc +
+                (p[6]*plg[1][1] + p[7]*plg[1][3] + t72) * ctx.stloc)
+
+    #/* SEMIDIURNAL */
+    if flags.sw[8]:
+        t81 = (p[23]*plg[2][3]+p[35]*plg[2][5])*cd14*flags.swc[5]
+        t82 = (p[33]*plg[2][3]+p[36]*plg[2][5])*cd14*flags.swc[5]
+        t[7] = ((p[5]*plg[2][2] + p[41]*plg[2][4] + t81) * ctx.c2tloc +
+                (p[8]*plg[2][2] + p[42]*plg[2][4] + t82) * ctx.s2tloc)
+
+    #/* TERDIURNAL */
+    if flags.sw[14]:
+        t[13] = p[39] * plg[3][3] * ctx.s3tloc + p[40] * plg[3][3] * ctx.c3tloc
+
+    #/* MAGNETIC ACTIVITY */
+    if flags.sw[9]:
+        if flags.sw[9] == 1:
+            t[8] = ctx.apdf * (p[32] + p[45] * plg[0][2] * flags.swc[2])
+        if flags.sw[9] == -1:
+            t[8] = (p[50]*ctx.apt[0] + p[96]*plg[0][2] * ctx.apt[0]*flags.swc[2])
+
+    #/* LONGITUDINAL */
+    if not ((flags.sw[10] == 0) or (flags.sw[11] == 0)):
+        t[10] = (1.0 + plg[0][1]*(p[80]*flags.swc[5]*np.cos(dr*(Input.doy-p[81])) +
+                                  p[85]*flags.swc[6]*np.cos(2.0*dr*(Input.doy-p[86]))) +
+                 p[83]*flags.swc[3]*np.cos(dr*(Input.doy-p[84])) +
+                 p[87]*flags.swc[4]*np.cos(2.0*dr*(Input.doy-p[88]))) * \
+            ((p[64]*plg[1][2]+p[65]*plg[1][4]+p[66]*plg[1][6] +
+              p[74]*plg[1][1]+p[75]*plg[1][3]+p[76]*plg[1][5]) * np.cos(dgtr*Input.g_long) +
+             (p[90]*plg[1][2]+p[91]*plg[1][4]+p[92]*plg[1][6] +
+              p[77]*plg[1][1]+p[78]*plg[1][3]+p[79]*plg[1][5]) * np.sin(dgtr*Input.g_long))
+        t[10] = np.where(Input.g_long <= -1000.0, 0.0, t[10])
+
+    tt = 0
+    for i in range(14):
+        tt += abs(flags.sw[i+1])*t[i]
+    return tt
+
+
+def gtd7_array(Input, flags, output, ctx=None):
+    """
+    gtd7 for an nrlmsise_input whose fields are numpy arrays (or numbers) that broadcast together. The values in
+    output.d and output.t are set to arrays with the broadcast shape.
+    """
+    shape, Input = _flat_input(Input)
+    if ctx is None:
+        ctx = nrlmsise_context()
+    with np.errstate(all='ignore'):  # the branches that are not used for a point can overflow
+        _gtd7(Input, flags, output, ctx)
+    output.d = [np.reshape(d, shape) for d in np.broadcast_arrays(*output.d, Input.alt)[:9]]
+    output.t = [np.reshape(t, shape) for t in np.broadcast_arrays(*output.t, Input.alt)[:2]]
+
+
+def _gtd7(Input, flags, output, ctx):
+    mn3 = 5
+    zn3 = [32.5, 20.0, 15.0, 10.0, 0.0]
+    mn2 = 4
+    zn2 = [72.5, 55.0, 45.0, 32.5]
+    zmix = 62.5
+    soutput = nrlmsise_output()
+
+    tselec(flags)
+
+    #/* Latitude variation of gravity (none for sw[2]=0) */
+    xlat = Input.g_lat
+    if flags.sw[2] == 0:
+        xlat = np.full_like(Input.alt, 45.0)
+    ctx.gsurf[0], ctx.re[0] = glatf(xlat)
+
+    xmm = pdm[2][4]
+
+    #/* THERMOSPHERE / MESOSPHERE (above zn2[0]) */
+    alt = Input.alt
+    Input.alt = np.where(alt > zn2[0], alt, zn2[0])
+    gts7(Input, flags, soutput, ctx)
+    Input.alt = alt
+    if flags.sw[0]:   #/* metric adjustment */
+        dm28m = ctx.dm28*1.0E6
+    else:
+        dm28m = ctx.dm28
+    output.t[0] = soutput.t[0]
+    output.t[1] = soutput.t[1]
+    for i in range(9):
+        output.d[i] = soutput.d[i]
+    low = alt < zn2[0]
+    if not np.any(low):
+        return
+
+    #/*       LOWER MESOSPHERE/UPPER STRATOSPHERE (between zn3[0] and zn2[0])
+    #*         Temperature at nodes and gradients at end nodes
+    #*         Inverse temperature a linear function of spherical harmonics
+    #*/
+    ctx.meso_tgn2[0] = ctx.meso_tgn1[1]
+    ctx.meso_tn2[0] = ctx.meso_tn1[4]
+    ctx.meso_tn2[1] = pma[0][0]*pavgm[0]/(1.0-flags.sw[20]*glob7s(pma[0], Input, flags, ctx))
+    ctx.meso_tn2[2] = pma[1][0]*pavgm[1]/(1.0-flags.sw[20]*glob7s(pma[1], Input, flags, ctx))
+    ctx.meso_tn2[3] = pma[2][0]*pavgm[2]/(1.0-flags.sw[20]*flags.sw[22]*glob7s(pma[2], Input, flags, ctx))
+    ctx.meso_tgn2[1] = pavgm[8]*pma[9][0]*(1.0+flags.sw[20]*flags.sw[22]*glob7s(pma[9], Input, flags, ctx)) * \
+        ctx.meso_tn2[3]*ctx.meso_tn2[3]/((pma[2][0]*pavgm[2])**2.0)
+    ctx.meso_tn3[0] = ctx.meso_tn2[3]
+
+    if np.any(alt <= zn3[0]):
+        #/*       LOWER STRATOSPHERE AND TROPOSPHERE (below zn3[0])
+        #*         Temperature at nodes and gradients at end nodes
+        #*         Inverse temperature a linear function of spherical harmonics
+        #*/
+        ctx.meso_tgn3[0] = ctx.meso_tgn2[1]
+        ctx.meso_tn3[1] = pma[3][0]*pavgm[3]/(1.0-flags.sw[22]*glob7s(pma[3], Input, flags, ctx))
+        ctx.meso_tn3[2] = pma[4][0]*pavgm[4]/(1.0-flags.sw[22]*glob7s(pma[4], Input, flags, ctx))
+        ctx.meso_tn3[3] = pma[5][0]*pavgm[5]/(1.0-flags.sw[22]*glob7s(pma[5], Input, flags, ctx))
+        ctx.meso_tn3[4] = pma[6][0]*pavgm[6]/(1.0-flags.sw[22]*glob7s(pma[6], Input, flags, ctx))
+        ctx.meso_tgn3[1] = pma[7][0]*pavgm[7]*(1.0+flags.sw[22]*glob7s(pma[7], Input, flags, ctx)) * \
+            ctx.meso_tn3[4]*ctx.meso_tn3[4]/((pma[6][0]*pavgm[6])**2.0)
+
+    #/* LINEAR TRANSITION TO FULL MIXING BELOW zn2[0] */
+    dmc = np.where(alt > zmix, 1.0 - (zn2[0]-alt)/(zn2[0] - zmix), 0.0)
+    dz28 = soutput.d[2]
+    d = [0.0 for _ in range(9)]
+
+    #/**** N2 density ****/
+    dmr = soutput.d[2] / dm28m - 1.0
+    tz = [0.0]
+    d[2] = densm(alt, dm28m, xmm, tz, mn3, zn3, ctx.meso_tn3, ctx.meso_tgn3, mn2, zn2, ctx.meso_tn2, ctx.meso_tgn2,
+                 ctx)
+    d[2] = d[2] * (1.0 + dmr*dmc)
+
+    #/**** HE density ****/
+    dmr = soutput.d[0] / (dz28 * pdm[0][1]) - 1.0
+    d[0] = d[2] * pdm[0][1] * (1.0 + dmr*dmc)
+
+    #/**** O2 density ****/
+    dmr = soutput.d[3] / (dz28 * pdm[3][1]) - 1.0
+    d[3] = d[2] * pdm[3][1] * (1.0 + dmr*dmc)
+
+    #/**** AR density ***/
+    dmr = soutput.d[4] / (dz28 * pdm[4][1]) - 1.0
+    d[4] = d[2] * pdm[4][1] * (1.0 + dmr*dmc)
+
+    #/**** Total mass density */
+    d[5] = 1.66E-24 * (4.0 * d[0] + 16.0 * d[1] + 28.0 * d[2] + 32.0 * d[3] + 40.0 * d[4] + d[6] + 14.0 * d[7])
+
+    if flags.sw[0]:
+        d[5] = d[5]/1000
+
+    #/**** temperature at altitude ****/
+    ctx.dd = densm(alt, 1.0, 0, tz, mn3, zn3, ctx.meso_tn3, ctx.meso_tgn3, mn2, zn2, ctx.meso_tn2, ctx.meso_tgn2, ctx)
+    output.t[1] = np.where(low, tz[0], soutput.t[1])
+    for i in range(9):
+        output.d[i] = np.where(low, d[i], soutput.d[i])
+
+
+def gts7(Input, flags, output, ctx):
+    zn1 = [120.0, 110.0, 100.0, 90.0, 72.5]
+    mn1 = 5
+    dgtr = 1.74533E-2
+    dr = 1.72142E-2
+    alpha = [-0.38, 0.0, 0.0, 0.0, 0.17, 0.0, -0.38, 0.0, 0.0]
+    altl = [200.0, 300.0, 160.0, 250.0, 240.0, 450.0, 320.0, 450.0]
+    za = pdl[1][15]
+    zn1[0] = za
+    meso_tn1 = ctx.meso_tn1
+    meso_tgn1 = ctx.meso_tgn1
+
+    #/* TINF VARIATIONS NOT IMPORTANT BELOW ZA OR ZN1(1) */
+    tinf = np.where(Input.alt > zn1[0], ptm[0]*pt[0] * (1.0+flags.sw[16]*globe7(pt, Input, flags, ctx)),
+                    ptm[0]*pt[0])
+    output.t[0] = tinf
+
+    #/*  GRADIENT VARIATIONS NOT IMPORTANT BELOW ZN1(5) */
+    g0 = np.where(Input.alt > zn1[4], ptm[3]*ps[0] * (1.0+flags.sw[19]*globe7(ps, Input, flags, ctx)),
+                  ptm[3]*ps[0])
+    tlb = ptm[1] * (1.0 + flags.sw[17]*globe7(pd[3], Input, flags, ctx))*pd[3][0]
+    s = g0 / (tinf - tlb)
+
+    #/*      Lower thermosphere temp variations not significant for
+    # *       density above 300 km */
+    meso_tn1[1] = ptm[6]*ptl[0][0]
+    meso_tn1[2] = ptm[2]*ptl[1][0]
+    meso_tn1[3] = ptm[7]*ptl[2][0]
+    meso_tn1[4] = ptm[4]*ptl[3][0]
+    meso_tgn1[1] = ptm[8]*pma[8][0]*meso_tn1[4]*meso_tn1[4]/((ptm[4]*ptl[3][0])**2.0)
+    low = Input.alt < 300.0
+    if np.any(low):
+        tn1_4 = ptm[4]*ptl[3][0]/(1.0-flags.sw[18]*flags.sw[20]*glob7s(ptl[3], Input, flags, ctx))
+        meso_tgn1[1] = np.where(low, ptm[8]*pma[8][0]*(1.0+flags.sw[18]*flags.sw[20]*glob7s(pma[8], Input, flags, ctx)) *
+                                tn1_4*tn1_4/((ptm[4]*ptl[3][0])**2.0), meso_tgn1[1])
+        meso_tn1[1] = np.where(low, ptm[6]*ptl[0][0]/(1.0-flags.sw[18]*glob7s(ptl[0], Input, flags, ctx)),
+                               meso_tn1[1])
+        meso_tn1[2] = np.where(low, ptm[2]*ptl[1][0]/(1.0-flags.sw[18]*glob7s(ptl[1], Input, flags, ctx)),
+                               meso_tn1[2])
+        meso_tn1[3] = np.where(low, ptm[7]*ptl[2][0]/(1.0-flags.sw[18]*glob7s(ptl[2], Input, flags, ctx)),
+                               meso_tn1[3])
+        meso_tn1[4] = np.where(low, tn1_4, meso_tn1[4])
+
+    #/* N2 variation factor at Zlb */
+    g28 = flags.sw[21]*globe7(pd[2], Input, flags, ctx)
+
+    #/* VARIATION OF TURBOPAUSE HEIGHT */
+    zhf = pdl[1][24]*(1.0+flags.sw[5]*pdl[0][24]*np.sin(dgtr*Input.g_lat)*np.cos(dr*(Input.doy-pt[13])))
+    output.t[0] = tinf
+    xmm = pdm[2][4]
+    z = Input.alt
+    tz = [0.0]
+
+    #/**** N2 DENSITY ****/
+
+    #/* Diffusive density at Zlb */
+    db28 = pdm[2][0]*np.exp(g28)*pd[2][0]
+    #/* Diffusive density at Alt */
+    output.d[2] = densu(z, db28, tinf, tlb, 28.0, alpha[2], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    #/* Turbopause */
+    zh28 = pdm[2][2]*zhf
+    zhm28 = pdm[2][3]*pdl[1][5]
+    xmd = 28.0-xmm
+    #/* Mixed density at Zlb */
+    b28 = densu(zh28, db28, tinf, tlb, xmd, (alpha[2]-1.0), tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    mixed = z <= altl[2]
+    if flags.sw[15] and np.any(mixed):
+        #/*  Mixed density at Alt */
+        ctx.dm28 = densu(z, b28, tinf, tlb, xmm, alpha[2], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        #/*  Net density at Alt */
+        output.d[2] = np.where(mixed, dnet(output.d[2], ctx.dm28, zhm28, xmm, 28.0), output.d[2])
+
+    #/**** HE DENSITY ****/
+
+    #/*   Density variation factor at Zlb */
+    g4 = flags.sw[21]*globe7(pd[0], Input, flags, ctx)
+    #/*  Diffusive density at Zlb */
+    db04 = pdm[0][0]*np.exp(g4)*pd[0][0]
+    #/*  Diffusive density at Alt */
+    output.d[0] = densu(z, db04, tinf, tlb, 4., alpha[0], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    mixed = z < altl[0]
+    if flags.sw[15] and np.any(mixed):
+        #/*  Turbopause */
+        zh04 = pdm[0][2]
+        #/*  Mixed density at Zlb */
+        b04 = densu(zh04, db04, tinf, tlb, 4.-xmm, alpha[0]-1., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        #/*  Mixed density at Alt */
+        ctx.dm04 = densu(z, b04, tinf, tlb, xmm, 0., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        zhm04 = zhm28
+        #/*  Net density at Alt */
+        d = dnet(output.d[0], ctx.dm04, zhm04, xmm, 4.)
+        #/*  Correction to specified mixing ratio at ground */
+        rl = np.log(b28*pdm[0][1]/b04)
+        zc04 = pdm[0][4]*pdl[1][0]
+        hc04 = pdm[0][5]*pdl[1][1]
+        #/*  Net density corrected at Alt */
+        output.d[0] = np.where(mixed, d*ccor(z, rl, hc04, zc04), output.d[0])
+
+    #/**** O DENSITY ****/
+
+    #/*  Density variation factor at Zlb */
+    g16 = flags.sw[21]*globe7(pd[1], Input, flags, ctx)
+    #/*  Diffusive density at Zlb */
+    db16 = pdm[1][0]*np.exp(g16)*pd[1][0]
+    #/*   Diffusive density at Alt */
+    output.d[1] = densu(z, db16, tinf, tlb, 16., alpha[1], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    mixed = z <= altl[1]
+    if flags.sw[15] and np.any(mixed):
+        #/*   Turbopause */
+        zh16 = pdm[1][2]
+        #/*  Mixed density at Zlb */
+        b16 = densu(zh16, db16, tinf, tlb, 16.0-xmm, (alpha[1]-1.0), tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1,
+                    ctx)
+        #/*  Mixed density at Alt */
+        ctx.dm16 = densu(z, b16, tinf, tlb, xmm, 0., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        zhm16 = zhm28
+        #/*  Net density at Alt */
+        d = dnet(output.d[1], ctx.dm16, zhm16, xmm, 16.)
+        rl = pdm[1][1]*pdl[1][16]*(1.0+flags.sw[1]*pdl[0][23]*(Input.f107A-150.0))
+        hc16 = pdm[1][5]*pdl[1][3]
+        zc16 = pdm[1][4]*pdl[1][2]
+        hc216 = pdm[1][5]*pdl[1][4]
+        d = d*ccor2(z, rl, hc16, zc16, hc216)
+        #/*   Chemistry correction */
+        hcc16 = pdm[1][7]*pdl[1][13]
+        zcc16 = pdm[1][6]*pdl[1][12]
+        rc16 = pdm[1][3]*pdl[1][14]
+        #/*  Net density corrected at Alt */
+        output.d[1] = np.where(mixed, d*ccor(z, rc16, hcc16, zcc16), output.d[1])
+
+    #/**** O2 DENSITY ****/
+
+    #/*   Density variation factor at Zlb */
+    g32 = flags.sw[21]*globe7(pd[4], Input, flags, ctx)
+    #/*  Diffusive density at Zlb */
+    db32 = pdm[3][0]*np.exp(g32)*pd[4][0]
+    #/*   Diffusive density at Alt */
+    output.d[3] = densu(z, db32, tinf, tlb, 32., alpha[3], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    if flags.sw[15]:
+        mixed = z <= altl[3]
+        if np.any(mixed):
+            #/*   Turbopause */
+            zh32 = pdm[3][2]
+            #/*  Mixed density at Zlb */
+            b32 = densu(zh32, db32, tinf, tlb, 32.-xmm, alpha[3]-1., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1,
+                        ctx)
+            #/*  Mixed density at Alt */
+            ctx.dm32 = densu(z, b32, tinf, tlb, xmm, 0., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+            zhm32 = zhm28
+            #/*  Net density at Alt */
+            d = dnet(output.d[3], ctx.dm32, zhm32, xmm, 32.)
+            #/*   Correction to specified mixing ratio at ground */
+            rl = np.log(b28*pdm[3][1]/b32)
+            hc32 = pdm[3][5]*pdl[1][7]
+            zc32 = pdm[3][4]*pdl[1][6]
+            output.d[3] = np.where(mixed, d*ccor(z, rl, hc32, zc32), output.d[3])
+
+        #/*  Correction for general departure from diffusive equilibrium above Zlb */
+        hcc32 = pdm[3][7]*pdl[1][22]
+        hcc232 = pdm[3][7]*pdl[0][22]
+        zcc32 = pdm[3][6]*pdl[1][21]
+        rc32 = pdm[3][3]*pdl[1][23]*(1.+flags.sw[1]*pdl[0][23]*(Input.f107A-150.))
+        #/*  Net density corrected at Alt */
+        output.d[3] = output.d[3]*ccor2(z, rc32, hcc32, zcc32, hcc232)
+
+    #/**** AR DENSITY ****/
+
+    #/*   Density variation factor at Zlb */
+    g40 = flags.sw[21]*globe7(pd[5], Input, flags, ctx)
+    #/*  Diffusive density at Zlb */
+    db40 = pdm[4][0]*np.exp(g40)*pd[5][0]
+    #/*   Diffusive density at Alt */
+    output.d[4] = densu(z, db40, tinf, tlb, 40., alpha[4], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    mixed = z <= altl[4]
+    if flags.sw[15] and np.any(mixed):
+        #/*   Turbopause */
+        zh40 = pdm[4][2]
+        #/*  Mixed density at Zlb */
+        b40 = densu(zh40, db40, tinf, tlb, 40.-xmm, alpha[4]-1., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        #/*  Mixed density at Alt */
+        ctx.dm40 = densu(z, b40, tinf, tlb, xmm, 0., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        zhm40 = zhm28
+        #/*  Net density at Alt */
+        d = dnet(output.d[4], ctx.dm40, zhm40, xmm, 40.)
+        #/*   Correction to specified mixing ratio at ground */
+        rl = np.log(b28*pdm[4][1]/b40)
+        hc40 = pdm[4][5]*pdl[1][9]
+        zc40 = pdm[4][4]*pdl[1][8]
+        #/*  Net density corrected at Alt */
+        output.d[4] = np.where(mixed, d*ccor(z, rl, hc40, zc40), output.d[4])
+
+    #/**** HYDROGEN DENSITY ****/
+
+    #/*   Density variation factor at Zlb */
+    g1 = flags.sw[21]*globe7(pd[6], Input, flags, ctx)
+    #/*  Diffusive density at Zlb */
+    db01 = pdm[5][0]*np.exp(g1)*pd[6][0]
+    #/*   Diffusive density at Alt */
+    output.d[6] = densu(z, db01, tinf, tlb, 1., alpha[6], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    mixed = z <= altl[6]
+    if flags.sw[15] and np.any(mixed):
+        #/*   Turbopause */
+        zh01 = pdm[5][2]
+        #/*  Mixed density at Zlb */
+        b01 = densu(zh01, db01, tinf, tlb, 1.-xmm, alpha[6]-1., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        #/*  Mixed density at Alt */
+        ctx.dm01 = densu(z, b01, tinf, tlb, xmm, 0., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        zhm01 = zhm28
+        #/*  Net density at Alt */
+        d = dnet(output.d[6], ctx.dm01, zhm01, xmm, 1.)
+        #/*   Correction to specified mixing ratio at ground */
+        rl = np.log(b28*pdm[5][1]*np.sqrt(pdl[1][17]*pdl[1][17])/b01)
+        hc01 = pdm[5][5]*pdl[1][11]
+        zc01 = pdm[5][4]*pdl[1][10]
+        d = d*ccor(z, rl, hc01, zc01)
+        #/*   Chemistry correction */
+        hcc01 = pdm[5][7]*pdl[1][19]
+        zcc01 = pdm[5][6]*pdl[1][18]
+        rc01 = pdm[5][3]*pdl[1][20]
+        #/*  Net density corrected at Alt */
+        output.d[6] = np.where(mixed, d*ccor(z, rc01, hcc01, zcc01), output.d[6])
+
+    #/**** ATOMIC NITROGEN DENSITY ****/
+
+    #/*   Density variation factor at Zlb */
+    g14 = flags.sw[21]*globe7(pd[7], Input, flags, ctx)
+    #/*  Diffusive density at Zlb */
+    db14 = pdm[6][0]*np.exp(g14)*pd[7][0]
+    #/*   Diffusive density at Alt */
+    output.d[7] = densu(z, db14, tinf, tlb, 14., alpha[7], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    mixed = z <= altl[7]
+    if flags.sw[15] and np.any(mixed):
+        #/*   Turbopause */
+        zh14 = pdm[6][2]
+        #/*  Mixed density at Zlb */
+        b14 = densu(zh14, db14, tinf, tlb, 14.-xmm, alpha[7]-1., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        #/*  Mixed density at Alt */
+        ctx.dm14 = densu(z, b14, tinf, tlb, xmm, 0., tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+        zhm14 = zhm28
+        #/*  Net density at Alt */
+        d = dnet(output.d[7], ctx.dm14, zhm14, xmm, 14.)
+        #/*   Correction to specified mixing ratio at ground */
+        rl = np.log(b28*pdm[6][1]*np.sqrt(pdl[0][2]*pdl[0][2])/b14)
+        hc14 = pdm[6][5]*pdl[0][1]
+        zc14 = pdm[6][4]*pdl[0][0]
+        d = d*ccor(z, rl, hc14, zc14)
+        #/*   Chemistry correction */
+        hcc14 = pdm[6][7]*pdl[0][4]
+        zcc14 = pdm[6][6]*pdl[0][3]
+        rc14 = pdm[6][3]*pdl[0][5]
+        #/*  Net density corrected at Alt */
+        output.d[7] = np.where(mixed, d*ccor(z, rc14, hcc14, zcc14), output.d[7])
+
+    #/**** Anomalous OXYGEN DENSITY ****/
+
+    g16h = flags.sw[21]*globe7(pd[8], Input, flags, ctx)
+    db16h = pdm[7][0]*np.exp(g16h)*pd[8][0]
+    tho = pdm[7][9]*pdl[0][6]
+    dd = densu(z, db16h, tho, tho, 16., alpha[8], tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    zsht = pdm[7][5]
+    zmho = pdm[7][4]
+    zsho = scalh(zmho, 16.0, tho, ctx)
+    output.d[8] = dd*np.exp(-zsht/zsho*(np.exp(-(z-zmho)/zsht)-1.))
+
+    #/* total mass density */
+    output.d[5] = 1.66E-24*(4.0*output.d[0]+16.0*output.d[1]+28.0*output.d[2]+32.0*output.d[3]+40.0*output.d[4] +
+                            output.d[6]+14.0*output.d[7])
+
+    #/* temperature */
+    z = np.sqrt(Input.alt*Input.alt)
+    densu(z, 1.0, tinf, tlb, 0.0, 0.0, tz, ptm[5], s, mn1, zn1, meso_tn1, meso_tgn1, ctx)
+    output.t[1] = tz[0]
+    if flags.sw[0]:
+        for i in range(9):
+            output.d[i] = output.d[i]*1.0E6
+        output.d[5] = output.d[5]/1000
@@ -184,6 +184,77 @@ class nrlmsise_output:
         self.t = [0.0 for _ in range(2)] #/* temperatures */
 
 
+#/* ------------------------------------------------------------------- */
+#/* ------------------------------ CONTEXT ---------------------------- */
+#/* ------------------------------------------------------------------- */
+class nrlmsise_context:
+    """
+ *   The variables that the functions of the model share while evaluating
+ *   it (they are global variables in the C version). gtd7 makes a new one
+ *   for every call, so separate calls never share any state.
+ *
+ *   In gtd7_array the values are numpy arrays with one value per point.
+ """
+    def __init__(self):
+        #/* PARMB */
+        self.gsurf = [0.0]
+        self.re = [0.0]
+
+        #/* GTS3C */
+        self.dd = 0.0
+
+        #/* DMIX */
+        self.dm04 = 0.0
+        self.dm16 = 0.0
+        self.dm28 = 0.0
+        self.dm32 = 0.0
+        self.dm40 = 0.0
+        self.dm01 = 0.0
+        self.dm14 = 0.0
+
+        #/* MESO7 */
+        self.meso_tn1 = [0.0 for _ in range(5)]
+        self.meso_tn2 = [0.0 for _ in range(4)]
+        self.meso_tn3 = [0.0 for _ in range(5)]
+        self.meso_tgn1 = [0.0 for _ in range(2)]
+        self.meso_tgn2 = [0.0 for _ in range(2)]
+        self.meso_tgn3 = [0.0 for _ in range(2)]
+
+        #/* LPOLY */
+        self.dfa = 0.0
+        self.plg = [[0.0 for _ in range(9)] for _ in range(4)]
+        self.ctloc = 0.0
+        self.stloc = 0.0
+        self.c2tloc = 0.0
+        self.s2tloc = 0.0
+        self.s3tloc = 0.0
+        self.c3tloc = 0.0
+        self.apdf = 0.0
+        self.apt = [0.0 for _ in range(4)]
+
+
+#/* ------------------------------------------------------------------- */
+#/* ------------------------------ TSELEC ----------------------------- */
+#/* ------------------------------------------------------------------- */
+def tselec(flags):
+
+    for i in range(24):
+        if(i != 9):
+            if(flags.switches[i]==1):
+                flags.sw[i]=1
+            else:
+                flags.sw[i]=0
+
+            if(flags.switches[i]>0):
+                flags.swc[i]=1
+            else:
+                flags.swc[i]=0
+        else:
+            flags.sw[i]=flags.switches[i]
+            flags.swc[i]=flags.switches[i]
+    return
+
+
 #/* ------------------------------------------------------------------- */
 #/* --------------------------- PROTOTYPES ---------------------------- */
 #/* ------------------------------------------------------------------- */
@@ -73,11 +73,7 @@ class AirDensityModel:
 
         input = nrlmsise_input(year=year, doy=doy, sec=sec, alt=alt, g_lat=g_lat, g_long=g_long,
                                lst=(sec/3600 + g_long/15), f107A=f107A, f107=f107, ap=ap, ap_a=ap_a)
-        flags = nrlmsise_flags()
-        # using the default recommended switches for now
-        flags.switches[0] = 0
-        for i in range(1, len(flags.switches)):
-            flags.switches[i] = 1
+        flags = self._default_flags()
 
         # call the model
         gtd7(input, flags, output)
@@ -86,6 +82,54 @@ class AirDensityModel:
 
         return mass_density * 1000  # convert to kg/m3
 
+    def air_mass_density_array(self, dates, alt, g_lat, g_long):
+        """
+        Same as air_mass_density, but for arrays of times and locations (e.g. a whole orbit). The model is evaluated
+        for all of them in one call, which is a lot faster than calling air_mass_density for each point.
+
+        Parameters
+        ----------
+        dates : np.ndarray
+            numpy datetime64 array of the times (UTC)
+        alt : np.ndarray
+            altitudes in kilometers
+        g_lat : np.ndarray
+            geodetic latitudes
+        g_long : np.ndarray
+            geodetic longitudes
+
+        Returns
+        -------
+        np.ndarray
+             air mass densities in kg/m3, with the broadcast shape of the inputs
+        """
+        dates = np.asarray(dates, dtype='datetime64[us]')
+        days = dates.astype('datetime64[D]')
+        doy = (days - days.astype('datetime64[Y]')).astype(int) + 1
+        sec = (dates - days) / np.timedelta64(1, 's')
+        year = days.astype('datetime64[Y]').astype(int) + 1970
+
+        selected_data = self._space_dataset.sel(date=days.ravel())
+        f107A = selected_data.ctr81_obs.values.reshape(days.shape)
+        f107 = selected_data.f107_obs.values.reshape(days.shape)
+        ap = selected_data.ap_avg.values.reshape(days.shape)
+
+        output = nrlmsise_output()
+        input = nrlmsise_input(year=year, doy=doy, sec=sec, alt=alt, g_lat=g_lat, g_long=g_long,
+                               lst=(sec/3600 + g_long/15), f107A=f107A, f107=f107, ap=ap, ap_a=ap)
+        gtd7(input, self._default_flags(), output)
+
+        return output.d[5] * 1000  # convert to kg/m3
+
+    @staticmethod
+    def _default_flags():
+        flags = nrlmsise_flags()
+        # using the default recommended switches for now
+        flags.switches[0] = 0
+        for i in range(1, len(flags.switches)):
+            flags.switches[i] = 1
+        return flags
+
     def _get_date(self, year, doy):
         """
         Parameters
@@ -0,0 +1,136 @@
+"""
+How the attitude is saved in the simulation datasets, and the reconstruction of the DCMs from it.
+
+The 'attitude_output' simulation parameter chooses what is saved:
+* 'dcm' (the default): dcm_bn and dcm_bo, 18 numbers per data point (only dcm_bn for ensembles)
+* 'quaternion': quaternion_bn, the quaternion (scalar first) of dcm_bn, 4 numbers per data point
+* 'mrp': mrp_bn, the MRP coordinates of dcm_bn, 3 numbers per data point
+Nothing is lost with the last two: dcm_bo = dcm_bn @ dcm_on^T, and dcm_on only depends on the position and velocity,
+which are saved anyway.
+
+Importing this module adds an 'attitude' accessor to xarray datasets, which gives the DCMs, quaternions and MRPs of a
+simulation dataset no matter which of them were saved. They are calculated when they are asked for, with one batched
+conversion, so select the times you need first:
+
+>>> import adcsim.attitude_output
+>>> data = xr.open_dataset('sim1.nc')
+>>> data.attitude.dcm_bn
+>>> data.isel(time=slice(0, 1000)).attitude.dcm_bo  # only reads and converts the first 1000 data points
+"""
+import numpy as np
+import xarray as xr
+from adcsim import transformations as tr, util as ut
+
+attitude_outputs = ('dcm', 'quaternion', 'mrp')
+quaternion_coords = ['s', 'x', 'y', 'z']  # coordinates of the 'quaternion' dimension, the scalar part first
+
+
+def attitude_variables(attitude_output: str, ensemble: bool=False):
+    """
+    :param attitude_output: 'dcm', 'quaternion' or 'mrp'
+    :param ensemble: the variables of sim_attitude_ensemble, with a leading 'run' dimension
+    :return: {name: dims} of the attitude variables of a simulation dataset
+    """
+    dims = ('run', 'time') if ensemble else ('time',)
+    if attitude_output == 'dcm':
+        variables = {'dcm_bn': dims + ('dcm_mat_dim1', 'dcm_mat_dim2')}
+        if not ensemble:
+            variables['dcm_bo'] = dims + ('dcm_mat_dim1', 'dcm_mat_dim2')
+        return variables
+    if attitude_output == 'quaternion':
+        return {'quaternion_bn': dims + ('quaternion',)}
+    if attitude_output == 'mrp':
+        return {'mrp_bn': dims + ('cord',)}
+    raise ValueError(f'attitude_output must be one of {attitude_outputs}, not {attitude_output!r}')
+
+
+def attitude_values(attitude_output: str, sigma, dcm_bn, dcm_bo=None):
+    """
+    :param attitude_output: 'dcm', 'quaternion' or 'mrp'
+    :param sigma: MRP coordinates of the attitude, shape (3,) (or (N, 3) for ensembles)
+    :param dcm_bn: DCM of the same attitude
+    :param dcm_bo: DCM from the orbit frame to the body frame, if it is saved
+    :return: {name: value} of the attitude variables of a data point
+    """
+    if attitude_output == 'dcm':
+        values = {'dcm_bn': dcm_bn}
+        if dcm_bo is not None:
+            values['dcm_bo'] = dcm_bo
+        return values
+    if attitude_output == 'quaternion':
+        return {'quaternion_bn': tr.mrp_to_quaternions(sigma)}
+    return {'mrp_bn': sigma}
+
+
+@xr.register_dataset_accessor('attitude')
+class AttitudeAccessor:
+    """
+    The attitude of a simulation dataset, from whichever of dcm_bn, quaternion_bn or mrp_bn it has
+    """
+    def __init__(self, data: xr.Dataset):
+        self._data = data
+
+    def _saved(self):
+        for name in ('dcm_bn', 'quaternion_bn', 'mrp_bn'):
+            if name in self._data:
+                return self._data[name]
+        raise KeyError('The dataset has no attitude (dcm_bn, quaternion_bn or mrp_bn)')
+
+    @staticmethod
+    def _array(like, values, last_dims, coords=None):
+        # DataArray with the leading dimensions (e.g. run and time) of like, and the given last dimensions
+        leading = like.dims[:-2] if like.dims[-1] == 'dcm_mat_dim2' else like.dims[:-1]
+        data = xr.DataArray(values, dims=leading + tuple(last_dims),
+                            coords={d: like.coords[d] for d in leading if d in like.coords})
+        if coords:
+            data = data.assign_coords(coords)
+        return data
+
+    @property
+    def dcm_bn(self):
+        """DCM from the inertial frame to the body frame"""
+        saved = self._saved()
+        if saved.name == 'dcm_bn':
+            return saved
+        if saved.name == 'quaternion_bn':
+            values = tr.quaternions_to_dcm_array(saved.values)
+        else:
+            values = tr.mrp_to_dcm_array(saved.values.reshape(-1, 3)).reshape(saved.shape + (3,))
+        return self._array(saved, values, ('dcm_mat_dim1', 'dcm_mat_dim2'))
+
+    @property
+    def quaternion_bn(self):
+        """Quaternion (scalar first, the 'short rotation') of dcm_bn"""
+        saved = self._saved()
+        if saved.name == 'quaternion_bn':
+            return saved
+        if saved.name == 'mrp_bn':
+            values = tr.mrp_to_quaternions(saved.values)
+        else:
+            values = tr.dcm_to_quaternions_array(saved.values)
+        return self._array(saved, values, ('quaternion',), {'quaternion': quaternion_coords})
+
+    @property
+    def mrp_bn(self):
+        """MRP coordinates of dcm_bn"""
+        saved = self._saved()
+        if saved.name == 'mrp_bn':
+            return saved
+        return self._array(saved, tr.quaternions_to_mrp(self.quaternion_bn.values), ('cord',),
+                           {'cord': ['x', 'y', 'z']})
+
+    @property
+    def dcm_on(self):
+        """DCM from the inertial frame to the orbit frame, from the positions and velocities"""
+        data = self._data
+        values = ut.inertial_to_orbit_frame_array(data.positions.values, data.velocities.values)
+        return self._array(data.positions, values, ('dcm_mat_dim1', 'dcm_mat_dim2'))
+
+    @property
+    def dcm_bo(self):
+        """DCM from the orbit frame to the body frame"""
+        if 'dcm_bo' in self._data:
+            return self._data.dcm_bo
+        dcm_bn = self.dcm_bn
+        values = dcm_bn.values @ np.swapaxes(self.dcm_on.values, -1, -2)
+        return self._array(dcm_bn, values, ('dcm_mat_dim1', 'dcm_mat_dim2'))
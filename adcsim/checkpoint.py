@@ -0,0 +1,103 @@
+"""
+Checkpoints of sim_attitude, so that a run that was stopped (killed, crashed, out of time on a cluster) can carry on
+from where it was and end up exactly the same as if it had never stopped.
+
+With the 'checkpoint_every' simulation parameter, sim_attitude writes a checkpoint every checkpoint_every saved data
+points, and once more at the end. A checkpoint has everything the integration needs to carry on:
+* the state [sigma, omega, B of each hysteresis rod] and the number of integration steps done (and the time, step
+size and first stage of the next step of the 'rk45' integrator)
+* the h and b of every hysteresis rod
+* the torques that are held between updates (see DisturbanceTorques.get_state)
+* the state of the numpy random number generator
+* the number of saved data points, which are all in the netcdf file when the checkpoint is written
+* the simulation and cubesat parameters of the run
+
+resume_sim(file_name) then carries on with the run from its last checkpoint and appends to the same netcdf file, and
+continue_sim(file_name, duration) makes a finished run longer in the same way. fork_sim starts new runs (with other
+parameters) from the last checkpoint of a run, which only save what comes after it, see check_fork.
+
+The checkpoint is written under a temporary name and then renamed, so a run that is killed while it writes one still
+has the previous one.
+"""
+import numpy as np
+import pickle
+import os
+
+
+def checkpoint_path(path: str):
+    """
+    :param path: path of the simulation output without the .nc extension
+    :return: path of its checkpoint file
+    """
+    return path + '.checkpoint'
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """
+    :param path: checkpoint file
+    :param checkpoint: dict of everything needed to resume the simulation (see the module docstring)
+    """
+    checkpoint = dict(checkpoint, rng_state=np.random.get_state())
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump(checkpoint, f)
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path: str, restore_rng: bool=True):
+    """
+    :param path: checkpoint file
+    :param restore_rng: set the state of the numpy random number generator to the one in the checkpoint
+    :return: dict saved by save_checkpoint
+    """
+    with open(path, 'rb') as f:
+        checkpoint = pickle.load(f)
+    if restore_rng:
+        np.random.set_state(checkpoint['rng_state'])
+    return checkpoint
+
+
+def check_resume(checkpoint: dict, sim_params: dict, cubesat_params: dict):
+    """
+    Raises a ValueError if a simulation can't be resumed from the checkpoint with these parameters. They have to be the
+    ones of the checkpointed run, except that the duration can be longer and checkpoint_every can be different.
+    """
+    ignored = ('duration', 'checkpoint_every')
+    old = {key: value for key, value in checkpoint['sim_params'].items() if key not in ignored}
+    new = {key: value for key, value in sim_params.items() if key not in ignored}
+    if not _equal(old, new):
+        raise ValueError('The simulation parameters are not the same as the ones of the checkpointed run')
+    if not _equal(checkpoint['cubesat_params'], cubesat_params):
+        raise ValueError('The cubesat parameters are not the same as the ones of the checkpointed run')
+    if sim_params['duration'] < checkpoint['sim_params']['duration']:
+        raise ValueError(f'The duration can not be shorter than the {checkpoint["sim_params"]["duration"]} s of the '
+                         f'checkpointed run')
+
+
+def _equal(a, b):
+    # equality of parameter dicts, which can have numpy arrays in them
+    if isinstance(a, dict) or isinstance(b, dict):
+        return isinstance(a, dict) and isinstance(b, dict) and a.keys() == b.keys() and \
+            all(_equal(a[key], b[key]) for key in a)
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(a, b)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def check_fork(checkpoint: dict, sim_params: dict, cubesat_params: dict):
+    """
+    Raises a ValueError if a simulation can't carry on from the checkpoint of another one with these parameters. The
+    time grid (start_time, time_step, save_every and the integrator) and the number of hysteresis rods have to be the
+    same, anything else can be changed.
+    """
+    for key in ('start_time', 'time_step', 'save_every'):
+        if not _equal(checkpoint['sim_params'][key], sim_params[key]):
+            raise ValueError(f'{key} must be the same as in the parent run')
+    if checkpoint['sim_params'].get('integrator', 'rk4') != sim_params.get('integrator', 'rk4'):
+        raise ValueError('integrator must be the same as in the parent run')
+    if len(cubesat_params.get('hyst_rods', [])) != len(checkpoint['rod_b']):
+        raise ValueError('The number of hysteresis rods must be the same as in the parent run')
+    if sim_params['duration'] <= checkpoint['t']:
+        raise ValueError(f'The duration must be longer than the {checkpoint["t"]} s of the parent run')
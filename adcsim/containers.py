@@ -2,10 +2,11 @@ import numpy as np
 import xarray as xr
 from datetime import datetime, timedelta
 from skyfield.api import utc
-from scipy.interpolate.interpolate import interp1d
+from scipy.interpolate import interp1d
+import math
 from collections import namedtuple
 
-from adcsim.CubeSat_model import CubeSat
+from adcsim.CubeSat_model import CubeSat, CubeSatEnsemble
 
 class OrbitData:
     def __init__(self, sim_params: dict, saved_data: xr.Dataset):
@@ -34,8 +35,87 @@ class OrbitData:
                             axis=1)
         self._interp_data = interp1d(t, ab.T)
 
+        # The pre-processed orbit files are on a uniform time grid, so the interval that t falls in can be found with
+        # arithmetic instead of the binary search (and checks) of interp1d. The result is exactly the same as interp1d
+        # because the same bracketing points and the same formula are used. Anything non-uniform uses interp1d.
+        self._t = t
+        self._data = np.ascontiguousarray(ab)
+        self._slopes = (ab[1:] - ab[:-1]) / (t[1:] - t[:-1])[:, None]
+        self._dt = (t[-1] - t[0]) / (len(t) - 1) if len(t) > 1 else 0.0
+        self._uniform = len(t) > 1 and bool(np.all(np.abs(np.diff(t) - self._dt) <= 1e-6 * self._dt))
+
+    def interpolate(self, t: float, out: np.ndarray=None):
+        """
+        Linear interpolation of all the orbit data at time t.
+        :param t: time since the start of the simulation in seconds
+        :param out: optional array of length 16 to write the result into
+        :return: np.ndarray. sun vector, magnetic field, density, longitude, latitude, altitude, position and velocity
+        all in one array (same order as in set_time)
+        """
+        if not self._uniform:
+            if out is None:
+                return self._interp_data(t)
+            out[:] = self._interp_data(t)
+            return out
+
+        lo = self._segment(t)
+        if out is None:
+            out = np.empty(self._data.shape[1])
+        np.multiply(self._slopes[lo], t - self._t[lo], out=out)
+        out += self._data[lo]
+        return out
+
+    def _segment(self, t: float):
+        # index of the interval of the time grid that t falls in (the lower bracketing point)
+        x = self._t
+        n = len(x)
+        if not x[0] <= t <= x[-1]:
+            raise ValueError(f'Time {t} is outside of the range of the orbit data ({x[0]} to {x[-1]})')
+        if not self._uniform:
+            return min(max(np.searchsorted(x, t), 1), n - 1) - 1
+
+        # index of the first grid point >= t (what np.searchsorted does), starting from a guess that is at most
+        # one or two off due to round off in the grid
+        hi = min(max(math.ceil((t - x[0]) / self._dt), 0), n - 1)
+        while hi > 0 and x[hi - 1] >= t:
+            hi -= 1
+        while x[hi] < t:
+            hi += 1
+        return min(max(hi, 1), n - 1) - 1
+
+    def rate(self, t: float):
+        """
+        Time derivative of the interpolated orbit data at time t (the slope of the interval t is in, so it is constant
+        between the points of the saved data).
+        :param t: time since the start of the simulation in seconds
+        :return: np.ndarray of length 16, same order as interpolate; units per second
+        """
+        return self._slopes[self._segment(t)]
+
+    def rate_many(self, times: np.ndarray):
+        """
+        Same as rate, but for an array of times at once.
+        :param times: times since the start of the simulation in seconds, shape (M,)
+        :return: np.ndarray of shape (M, 16)
+        """
+        return self._slopes[np.searchsorted(self._t, times).clip(1, len(self._t) - 1) - 1]
+
+    def interpolate_many(self, times: np.ndarray):
+        """
+        Same as interpolate, but for an array of times at once.
+        :param times: times since the start of the simulation in seconds, shape (M,)
+        :return: np.ndarray of shape (M, 16)
+        """
+        x = self._t
+        times = np.asarray(times, dtype=float)
+        if len(times) and (times.min() < x[0] or times.max() > x[-1]):
+            raise ValueError(f'Times {times.min()} to {times.max()} are outside of the range of the orbit data '
+                             f'({x[0]} to {x[-1]})')
+        lo = np.searchsorted(x, times).clip(1, len(x) - 1) - 1
+        return self._slopes[lo] * (times - x[lo])[:, None] + self._data[lo]
+
     def set_time(self, t: float):
-        interpolated = self._interp_data(t)
+        interpolated = self.interpolate(t)
         self.sun_vec = interpolated[0:3]
         self.mag_field = interpolated[3:6]
         self.density = interpolated[6]
@@ -45,23 +125,97 @@ class OrbitData:
         self.positions = interpolated[10:13]
         self.velocities = interpolated[13:16]
 
+class PresampledOrbitData:
+    """
+    With a fixed step rk4 integration all the times the orbit data is needed at are known before the integration
+    starts: time[i], time[i] + time_step/2 (twice) and time[i] + time_step for every step i. This interpolates the orbit
+    data at all of those times with one vectorized call (per block of steps, so long simulations don't need all of it in
+    memory at once) and then the integration just looks up the rows. The values are exactly the same as calling
+    OrbitData.interpolate at each stage. Any other time is passed on to OrbitData.interpolate.
+    """
+    def __init__(self, orbit: OrbitData, time: np.ndarray, time_step: float, block_steps: int=20000):
+        """
+        :param orbit: orbit data to sample
+        :param time: start times of the integration steps (the same array the integration loop uses)
+        :param time_step: integration time step
+        :param block_steps: number of integration steps that are sampled at once
+        """
+        self._orbit = orbit
+        self._time = time
+        self._time_step = time_step
+        self._block_steps = block_steps
+        self._block = None
+        self._times = np.zeros(0)
+        self._values = np.zeros((0, 16))
+        self._rates = np.zeros((0, 16))
+        self._cursor = 0
+
+    def _load_block(self, block: int):
+        time = self._time[block * self._block_steps:(block + 1) * self._block_steps + 1]
+        # the same floating point operations as in integrators.rk4
+        stage_times = np.concatenate((time, time + 0.5 * self._time_step, time + self._time_step))
+        stage_times = stage_times[stage_times <= self._orbit._t[-1]]
+        self._times = np.unique(stage_times)
+        self._values = self._orbit.interpolate_many(self._times)
+        self._rates = self._orbit.rate_many(self._times)
+        self._block = block
+        self._cursor = 0
+
+    def _find(self, t: float):
+        # the stages are called in order, so the row is almost always at or just after the last one
+        times = self._times
+        c = self._cursor
+        for i in range(c, min(c + 3, len(times))):
+            if times[i] == t:
+                return i
+        i = np.searchsorted(times, t)
+        if i < len(times) and times[i] == t:
+            return i
+        return None
+
+    def interpolate(self, t: float, out: np.ndarray=None):
+        i = self._find(t)
+        if i is None:
+            block = max(np.searchsorted(self._time, t, side='right') - 1, 0) // self._block_steps
+            if block != self._block:
+                self._load_block(block)
+                i = self._find(t)
+        if i is None:
+            return self._orbit.interpolate(t, out=out)
+        self._cursor = i
+        if out is None:
+            return self._values[i].copy()
+        out[:] = self._values[i]
+        return out
+
+    def rate(self, t: float):
+        """Same as OrbitData.rate. Usually called right after interpolate at the same time, so the row is found at once"""
+        i = self._find(t)
+        if i is None:
+            return self._orbit.rate(t)
+        return self._rates[i]
+
+
 class AttitudeData:
     class _AttitudeData:
         def __init__(self, cubesat: CubeSat):
+            # the interpolated orbit data. The orbit vectors below are views into this, so OrbitData.interpolate can
+            # write straight into them
+            self.orbit_data = np.zeros(16)
             self.states = np.zeros((2, 3))
             self.dcm_bn = np.zeros((3, 3))
             self.dcm_on = np.zeros((3, 3))
             self.dcm_bo = np.zeros((3, 3))
             self.controls = np.zeros(3)
             self.nadir = np.zeros(3)
-            self.sun_vec = np.zeros(3)
+            self.sun_vec = self.orbit_data[0:3]
             self.sun_vec_body = np.zeros(3)
             self.density = 0.0
             self.aerod = np.zeros(3)
             self.gravityd = np.zeros(3)
             self.solard = np.zeros(3)
             self.magneticd = np.zeros(3)
-            self.mag_field = np.zeros(3)
+            self.mag_field = self.orbit_data[3:6]
             self.mag_field_body = np.zeros(3)
             self.solar_power = 0.0
             self.is_eclipse = 0.0
@@ -71,30 +225,42 @@ class AttitudeData:
             self.lons = 0.0
             self.lats = 0.0
             self.alts = 0.0
-            self.positions = np.zeros(3)
-            self.velocities = np.zeros(3)
+            self.positions = self.orbit_data[10:13]
+            self.velocities = self.orbit_data[13:16]
 
     def __init__(self, cubesat):
         self.temp = self._AttitudeData(cubesat)
         self.save = self._AttitudeData(cubesat)
 
+        # work space for state_dot_mrp, so that it doesn't need to allocate new arrays every call
+        self.state_dot = np.zeros(6 + len(cubesat.rod_bank))
+        self.state_dot_work = np.zeros(3)
+
     def interp_orbit_data(self, orbit: OrbitData, t: float, save: bool=False):
-        orbit.set_time(t)
-        if save:
-            self.save.sun_vec = orbit.sun_vec
-            self.save.mag_field = orbit.mag_field
-            self.save.density = orbit.density
-            self.save.lons = orbit.lons
-            self.save.lats = orbit.lats
-            self.save.alts = orbit.alts
-            self.save.positions = orbit.positions
-            self.save.velocities = orbit.velocities
-        else:
-            self.temp.sun_vec = orbit.sun_vec
-            self.temp.mag_field = orbit.mag_field
-            self.temp.density = orbit.density
-            self.temp.lons = orbit.lons
-            self.temp.lats = orbit.lats
-            self.temp.alts = orbit.alts
-            self.temp.positions = orbit.positions
-            self.temp.velocities = orbit.velocities
+        c = self.save if save else self.temp
+        orbit.interpolate(t, out=c.orbit_data)
+        c.density, c.lons, c.lats, c.alts = c.orbit_data[6:10].tolist()
+
+
+class EnsembleAttitudeData(AttitudeData):
+    """
+    Same as AttitudeData, but for a CubeSatEnsemble. The orbit and environment quantities are shared by all the members,
+    everything that depends on the attitude has a leading dimension of length N.
+    """
+    class _AttitudeData(AttitudeData._AttitudeData):
+        def __init__(self, ensemble: CubeSatEnsemble):
+            super().__init__(ensemble.geometry)
+            n = len(ensemble)
+            self.states = np.zeros((n, 2, 3))
+            self.dcm_bn = np.zeros((n, 3, 3))
+            self.controls = np.zeros((n, 3))
+            self.sun_vec_body = np.zeros((n, 3))
+            self.aerod = np.zeros((n, 3))
+            self.gravityd = np.zeros((n, 3))
+            self.solard = np.zeros((n, 3))
+            self.magneticd = np.zeros((n, 3))
+            self.mag_field_body = np.zeros((n, 3))
+            self.solar_power = np.zeros(n)
+            self.hyst_rod = np.zeros((n, ensemble.num_rods, 3))
+            self.h_rods = np.zeros((n, ensemble.num_rods))
+            self.b_rods = np.zeros((n, ensemble.num_rods))
@@ -13,13 +13,22 @@ from adcsim.dcm_convert.stk_xarray_conversion import xarray_to_stk
 
 
 
-def dcm_to_stk_simple(t_time, dcm, outfile):
+def dcm_to_stk_simple(t_time, dcm, outfile, block_size=10000):
     # a quick and dirty function to convert dcm to stk .a file
+    # dcm can also be a (lazily loaded) xr.DataArray, it is converted block_size rows at a time
+    quaternions_to_stk(t_time, dcm, outfile, block_size,
+                       convert=lambda block: np.array([dcm_to_quaternions(dcm_line) for dcm_line in block]))
 
-    assert(len(t_time) == len(dcm)), "unequal arrays!"
+
+def quaternions_to_stk(t_time, quaternions, outfile, block_size=10000, convert=None):
+    # writes an stk .a file from quaternions (scalar first), which can also be a (lazily loaded) xr.DataArray
+    # convert is an optional function that turns a block of rows of the given array into quaternions, e.g.
+    # transformations.mrp_to_quaternions to write MRPs
+
+    assert(len(t_time) == len(quaternions)), "unequal arrays!"
 
     version = "stk.v.11.0"
-    NumberOfAttitudePoints = len(dcm)
+    NumberOfAttitudePoints = len(quaternions)
     BlockingFactor = 20
     InterpolationOrder = 1
     CentralBody = "Earth"
@@ -42,12 +51,18 @@ def dcm_to_stk_simple(t_time, dcm, outfile):
     header = ''.join(meta_lines)
     footer = '\nEND Attitude'
 
-    out = np.zeros((len(t_time), 5))
-    for i, dcm_line in enumerate(dcm):
-        quat = dcm_to_quaternions(dcm_line)
-        out[i] = [t_time[i], quat[1], quat[2], quat[3], quat[0]]  # note: STK puts the scalar quaternion last, not first
-
-    np.savetxt(outfile, out, fmt='%.16e', comments='', header=header, footer=footer)
+    with open(outfile, 'w') as f:
+        f.write(header + '\n')
+        for start in range(0, len(quaternions), block_size):
+            quat = np.asarray(quaternions[start:start + block_size])
+            if convert is not None:
+                quat = convert(quat)
+            out = np.zeros((len(quat), 5))
+            out[:, 0] = t_time[start:start + len(quat)]
+            out[:, 1:4] = quat[:, 1:]  # note: STK puts the scalar quaternion last, not first
+            out[:, 4] = quat[:, 0]
+            np.savetxt(f, out, fmt='%.16e')
+        f.write(footer + '\n')
 
 
 def xdcm_to_stk(t_time, dcm, outfile):  # convert dcm using xarray conversions
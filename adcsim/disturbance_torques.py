@@ -18,29 +18,92 @@ how similar the calculation is to the Solar Pressure torque calculation.
 
 from adcsim import util as ut
 import numpy as np
-from adcsim.CubeSat_model import CubeSat
-from adcsim.containers import AttitudeData, OrbitData
-from adcsim.transformations import mrp_to_dcm
+import math
+from adcsim.CubeSat_model import CubeSat, CubeSatEnsemble
+from adcsim.containers import AttitudeData, OrbitData, EnsembleAttitudeData
+from adcsim.transformations import mrp_to_dcm, mrp_to_dcm_array
 from adcsim.util import inertial_to_orbit_frame
 
 
+def _cross(a, b):
+    # cross product of single vectors or of arrays of vectors of shape (..., 3)
+    if a.ndim == 1:
+        return ut.cross_product(a, b)
+    return ut.cross_product_array(a, b)
+
+
 class DisturbanceTorques(object):
     _a_solar_constant = (3.823 * 10 ** 26) / (3 * (10 ** 8)) / 4 / np.pi
     _a_solar_constant_2 = (3.823 * 10**26) / 4 / np.pi
     _a_gravity_gradient_constant = 3 * 3.986004418 * (10**14)
     _a_earth_rotational_constant = 0.000072921158553
     _u0 = 4 * np.pi * 10**-7
-    # Note: it appears that ut.cross_product_operator is a significant amount faster than using np.cross()
+    # Note: it appears that ut.cross_product_operator is a significant amount faster than using np.cross(), and
+    # ut.cross_product is faster again.
+
+    # torques that change on orbital timescales, and so can be updated less often than the integration rate
+    _a_slow_torques = ('gravity', 'aerodynamic', 'solar')
 
-    def __init__(self, gravity=False, aerodynamic=False, solar=False, magnetic=False, hysteresis=False, power=False):
+    def __init__(self, gravity=False, aerodynamic=False, solar=False, magnetic=False, hysteresis=False, power=False,
+                 update_periods=None, hold='hold', outputs=None):
+        """
+        :param update_periods: optional dict of {torque name: period in seconds} for the gravity, aerodynamic and solar
+        torques. A torque in here is only recalculated once its period has passed since the last time it was
+        calculated, in between it is held or extrapolated (see hold). Torques that aren't in here are calculated every
+        call, and the magnetic and hysteresis torques always are.
+        :param hold: 'hold' keeps the last calculated value of a torque between updates, 'extrapolate' linearly
+        extrapolates from the last two calculated values.
+        :param outputs: names of the variables the simulation saves (its 'output_channels'), all of them by default.
+        The quantities that are only saved (see diagnostics) are not calculated for the ones that aren't saved.
+        """
         self._include_torques = dict(gravity=gravity, aerodynamic=aerodynamic, solar=solar, magnetic=magnetic, hysteresis=hysteresis)
+        update_periods = {} if update_periods is None else dict(update_periods)
+        for key in update_periods:
+            if key not in self._a_slow_torques:
+                raise ValueError(f'update periods can only be given for the {", ".join(self._a_slow_torques)} torques, '
+                                 f'not {key}')
+        if hold not in ('hold', 'extrapolate'):
+            raise ValueError(f"hold must be 'hold' or 'extrapolate', not {hold}")
+        self._update_periods = update_periods
+        self._hold = hold
         self._previous_torques = {key: np.zeros(3) for key in self._include_torques}
+        self._older_torques = {key: np.zeros(3) for key in self._include_torques}
+        self._previous_torque_times = {key: [None, None] for key in self._include_torques}  # [last, one before]
         self._include_power = power
-        self.propagate_hysteresis = False
-        self.save_hysteresis = False
+        self._outputs = None if outputs is None else set(outputs)
         self.save_torques = False
+        # work space for intermediate vectors of the torque function
+        self._ue = np.zeros(3)
+        self._air_velocity = np.zeros(3)
+        self._sun_vec_norm = np.zeros(3)
+
+    def get_state(self):
+        """
+        :return: dict of the torques held between updates (see update_periods), for checkpoints of the simulations
+        """
+        return {'previous_torques': {key: np.array(value) for key, value in self._previous_torques.items()},
+                'older_torques': {key: np.array(value) for key, value in self._older_torques.items()},
+                'previous_torque_times': {key: list(value) for key, value in self._previous_torque_times.items()}}
+
+    def set_state(self, state: dict):
+        """
+        Restores the torques held between updates from get_state
+        """
+        self._previous_torques = {key: np.array(value) for key, value in state['previous_torques'].items()}
+        self._older_torques = {key: np.array(value) for key, value in state['older_torques'].items()}
+        self._previous_torque_times = {key: list(value) for key, value in state['previous_torque_times'].items()}
 
     def torque(self, time: float, state: np.ndarray, attitude: AttitudeData, orbit: OrbitData, cubesat: CubeSat):
+        """
+        Calculates the total torque on the cubesat. Only what the included torques need is calculated, the quantities
+        that are only saved by the simulations are added on the calls where save_torques is set (see diagnostics).
+
+        This is evaluated 4 times every rk4 step, so the results are written into the arrays that are already allocated
+        in the attitude container instead of making new arrays every call. The returned array is the controls array of
+        the container, which gets overwritten the next time the same container is used.
+        :param state: [sigma, omega, B of each hysteresis rod] (see state_propagations.py)
+        :return: np.ndarray. total torque in the cubesat body frame
+        """
         # interpolate all the pre-calculated data
         attitude.interp_orbit_data(orbit, time, save=self.save_torques)
 
@@ -50,76 +113,240 @@ class DisturbanceTorques(object):
         else:
             c = attitude.temp
 
+        controls = c.controls
+        controls.fill(0.0)
+
+        dcm_bn = mrp_to_dcm(state[0:3], out=c.dcm_bn)
+
+        np.matmul(dcm_bn, c.mag_field, out=c.mag_field_body)
+        c.mag_field_body *= 1e-9  # body frame, units T
 
-        c.controls = np.zeros(3)
+        # the magnetization of the rods is part of the state, state_dot_mrp uses c.h_rods for its rate of change
+        rods = cubesat.rod_bank
+        if len(rods) > 0:
+            c.h_rods = rods.project(c.mag_field_body)
+            c.b_rods = state[6:]
 
-        c.dcm_bn = mrp_to_dcm(state[0])
-        c.dcm_on = inertial_to_orbit_frame(c.positions, c.velocities)
-        c.dcm_bo = c.dcm_bn @ c.dcm_on.T
+        if self._include_torques['gravity']:
+            if self._torque_is_due('gravity', time):
+                R0 = math.sqrt(c.positions @ c.positions)
+                np.multiply(c.positions, -1 / R0, out=c.nadir)
+                ue = np.matmul(dcm_bn, c.nadir, out=self._ue)
+                self.gravity_gradient(ue, R0, cubesat, out=c.gravityd)
+                self._update_torque('gravity', time, c.gravityd)
+            else:
+                c.gravityd[:] = self._held_torque('gravity', time)
+            controls += c.gravityd
+        if self._include_torques['aerodynamic']:
+            if self._torque_is_due('aerodynamic', time):
+                vel_body = dcm_bn @ self.get_air_velocity(c.velocities, c.positions, out=self._air_velocity)
+                c.aerod = self.aerodynamic_torque(vel_body, c.density, cubesat)
+                self._update_torque('aerodynamic', time, c.aerod)
+            else:
+                c.aerod = self._held_torque('aerodynamic', time)
+            controls += c.aerod
+        if self._include_torques['solar']:
+            self._sun(c)
+            if not c.is_eclipse:
+                if self._torque_is_due('solar', time):
+                    c.solard = self.solar_pressure(c.sun_vec_body, c.sun_vec, c.positions, cubesat)
+                    self._update_torque('solar', time, c.solard)
+                else:
+                    c.solard = self._held_torque('solar', time)
+                controls += c.solard
+            else:
+                c.solard = np.zeros(3)  # a new array, the old one can be a held torque
+        if self._include_torques['magnetic']:
+            self.total_magnetic(c.mag_field_body, cubesat, out=c.magneticd)
+            controls += c.magneticd
+        if self._include_torques['hysteresis'] and len(rods) > 0:
+            if c is attitude.save and self._saves('hyst_rod_torque'):
+                # the torque of each rod is only needed for the saved data
+                c.hyst_rod = rods.torques(c.b_rods, c.mag_field_body)
+                controls += c.hyst_rod.sum(axis=0)
+            else:
+                controls += rods.torque(c.b_rods, c.mag_field_body)
 
-        R0 = np.linalg.norm(c.positions)
-        c.nadir = -c.positions / R0
+        if c is attitude.save:
+            self.diagnostics(state, c)
+        return controls
+
+    def diagnostics(self, state: np.ndarray, c):
+        """
+        The quantities that the simulations save but that the torques don't need (the attitude as MRPs, dcm_on,
+        dcm_bo, nadir, and the eclipse and body frame sun vector of the solar power). torque calls this after the
+        torques when save_torques is set, which the simulations only do for the data points that are saved.
+        :param state: [sigma, omega, B of each hysteresis rod]
+        :param c: the attitude data container to complete, the one torque was called with
+        """
+        c.states[0] = state[0:3]  # the saved attitude, if it is saved as MRPs or quaternions (see attitude_output.py)
+        if self._saves('dcm_bo'):
+            inertial_to_orbit_frame(c.positions, c.velocities, out=c.dcm_on)
+            np.matmul(c.dcm_bn, c.dcm_on.T, out=c.dcm_bo)
+        if self._saves('nadir'):
+            np.multiply(c.positions, -1 / math.sqrt(c.positions @ c.positions), out=c.nadir)
+        if self._include_power and not self._include_torques['solar'] and self._saves_sun():
+            self._sun(c)
+
+    def _saves(self, name):
+        # whether the simulation saves this variable (see outputs)
+        return self._outputs is None or name in self._outputs
+
+    def _saves_sun(self):
+        return self._saves('solar_power') or self._saves('is_eclipse')
+
+    def _sun(self, c):
+        # whether the cubesat is in the shadow of the earth, and the sun direction in the body frame
+        sun_vec_norm = np.multiply(c.sun_vec, 1 / math.sqrt(c.sun_vec @ c.sun_vec), out=self._sun_vec_norm)
+        theta = math.asin(6.378e6 / (6.378e6 + float(c.alts)))
+        angle_btw = math.acos(-(c.positions @ sun_vec_norm) / math.sqrt(c.positions @ c.positions))
+        c.is_eclipse = float(angle_btw < theta)
+        np.matmul(c.dcm_bn, sun_vec_norm, out=c.sun_vec_body)
+
+    def torque_ensemble(self, time: float, state: np.ndarray, attitude: EnsembleAttitudeData, orbit: OrbitData,
+                        ensemble: CubeSatEnsemble):
+        """
+        Same as torque, but for all the members of a CubeSat ensemble at once. The orbit interpolation is done once and
+        shared by all the members. The aerodynamic, solar and power calculations always use the lookup tables of the
+        ensemble geometry.
+        :param state: states of all the members, shape (N, 6 + R)
+        :return: np.ndarray. The total torque on each member, shape (N, 3)
+        """
+        attitude.interp_orbit_data(orbit, time, save=self.save_torques)
+
+        if self.save_torques:
+            c = attitude.save
+            self.save_torques = False
+        else:
+            c = attitude.temp
+
+        c.controls[:] = 0
+
+        c.dcm_bn = mrp_to_dcm_array(state[:, 0:3])
 
         c.mag_field_body = (c.dcm_bn @ c.mag_field) * 1e-9  # body frame, units T
 
-        # the request for propagation should come at the beginning of each step
-        if self.propagate_hysteresis:
-            h = c.mag_field_body / self._u0
-            for rod in cubesat.hyst_rods:
-                h_proj = h @ rod.axes_alignment
-                # the request to save should come in every X steps
-                if self.save_hysteresis:
-                    rod.propagate_and_save_magnetization(h_proj)
-                else:
-                    rod.propagate_magnetization(h_proj)
-            self.save_hysteresis = False
-            self.propagate_hysteresis = False
+        rods = ensemble.rod_bank
+        c.h_rods = rods.project(c.mag_field_body)  # component of h along the axis of each rod
+        c.b_rods = state[:, 6:]
 
         if self._include_torques['gravity']:
-            ue = c.dcm_bn @ c.nadir
-            c.gravityd = self.gravity_gradient(ue, R0, cubesat)
+            if self._torque_is_due('gravity', time):
+                R0 = math.sqrt(c.positions @ c.positions)
+                c.nadir = -c.positions / R0
+                ue = c.dcm_bn @ c.nadir
+                c.gravityd = ut.cross_product_array(ue, np.einsum('nij,nj->ni', ensemble.inertia, ue))
+                c.gravityd *= self._a_gravity_gradient_constant/(R0**3)
+                self._update_torque('gravity', time, c.gravityd)
+            else:
+                c.gravityd = self._held_torque('gravity', time)
             c.controls += c.gravityd
         if self._include_torques['aerodynamic']:
-            vel_body = c.dcm_bn @ self.get_air_velocity(c.velocities, c.positions)
-            c.aerod = self.aerodynamic_torque(vel_body, c.density, cubesat)
+            if self._torque_is_due('aerodynamic', time):
+                vel_body = c.dcm_bn @ self.get_air_velocity(c.velocities, c.positions)
+                vm2 = np.einsum('ij,ij->i', vel_body, vel_body)[:, None]
+                c.aerod = ensemble.aerodynamic_lookup(vel_body) * c.density * vm2
+                self._update_torque('aerodynamic', time, c.aerod)
+            else:
+                c.aerod = self._held_torque('aerodynamic', time)
             c.controls += c.aerod
-        if self._include_power or self._include_torques['solar']:
-            sun_vec_norm = c.sun_vec / np.linalg.norm(c.sun_vec)
-            theta = np.arcsin(6.378e6 / (6.378e6 + c.alts))
-            angle_btw = np.arccos(c.nadir @ sun_vec_norm)
-            if angle_btw < theta:
-                c.is_eclipse = 1
-            if self._include_torques['solar']:
-                c.sun_vec_body = c.dcm_bn @ sun_vec_norm
-                if not c.is_eclipse:
-                    c.solard = self.solar_pressure(c.sun_vec_body, c.sun_vec, c.positions, cubesat)
-                    c.controls += c.solard
+        if self._include_torques['solar']:
+            self._sun_ensemble(c)
+            if c.is_eclipse:
+                c.solard = np.zeros((len(ensemble), 3))
+            else:
+                if self._torque_is_due('solar', time):
+                    r = c.sun_vec - c.positions
+                    c.solard = ensemble.solar_lookup(c.sun_vec_body) / (r @ r)
+                    self._update_torque('solar', time, c.solard)
+                else:
+                    c.solard = self._held_torque('solar', time)
+                c.controls += c.solard
         if self._include_torques['magnetic']:
-            c.magneticd = self.total_magnetic(c.mag_field_body, cubesat)
+            c.magneticd = ut.cross_product_array(ensemble.total_magnetic_moment, c.mag_field_body)
             c.controls += c.magneticd
-        if self._include_torques['hysteresis']:
-            c.hyst_rod = self.hysteresis_rod_torque_peek(c.mag_field_body, cubesat)
-            c.controls += c.hyst_rod
-
+        if self._include_torques['hysteresis'] and ensemble.num_rods > 0:
+            if c is attitude.save and self._saves('hyst_rod_torque'):
+                c.hyst_rod = rods.torques(c.b_rods, c.mag_field_body)
+                c.controls += c.hyst_rod.sum(axis=1)
+            else:
+                c.controls += rods.torque(c.b_rods, c.mag_field_body)
+
+        if c is attitude.save:
+            # the quantities that are only saved, see diagnostics
+            c.states[:, 0] = state[:, 0:3]
+            if self._saves('nadir'):
+                c.nadir = -c.positions / np.linalg.norm(c.positions)
+            if self._include_power and not self._include_torques['solar'] and self._saves_sun():
+                self._sun_ensemble(c)
         return c.controls
 
+    @staticmethod
+    def _sun_ensemble(c):
+        # same as _sun, the eclipse is shared by all the members
+        sun_vec_norm = c.sun_vec / math.sqrt(c.sun_vec @ c.sun_vec)
+        theta = math.asin(6.378e6 / (6.378e6 + c.alts))
+        angle_btw = math.acos(-(c.positions @ sun_vec_norm) / math.sqrt(c.positions @ c.positions))
+        c.is_eclipse = float(angle_btw < theta)
+        c.sun_vec_body = c.dcm_bn @ sun_vec_norm
 
+    def _torque_is_due(self, name, time):
+        """
+        Whether a torque needs to be recalculated at this time. Always true for torques without an update period.
+        """
+        period = self._update_periods.get(name)
+        if period is None:
+            return True
+        last = self._previous_torque_times[name][0]
+        return last is None or time >= last + period
 
+    def _update_torque(self, name, time, value):
+        """
+        Remembers a newly calculated value of a torque that has an update period.
+        """
+        if name not in self._update_periods:
+            return
+        times = self._previous_torque_times[name]
+        self._older_torques[name] = self._previous_torques[name]
+        self._previous_torques[name] = np.array(value, dtype=float)  # copy, value could be a work space array
+        times[1], times[0] = times[0], time
+
+    def _held_torque(self, name, time):
+        """
+        Value of a torque in between its updates, either the last calculated value or a linear extrapolation of the last
+        two calculated values.
+        """
+        last, before = self._previous_torque_times[name]
+        if self._hold == 'extrapolate' and before is not None:
+            slope = (self._previous_torques[name] - self._older_torques[name]) / (last - before)
+            return self._previous_torques[name] + slope * (time - last)
+        return self._previous_torques[name]
+
+    def solar_panel_power_ensemble(self, sun_vec, sun_vec_inertial, satellite_vec_inertial,
+                                   ensemble: CubeSatEnsemble):
+        """
+        Same as solar_panel_power, but for all the members of a CubeSat ensemble at once.
+        :param sun_vec: sun unit vector in the body frame of each member, shape (N, 3)
+        :return: np.ndarray. solar panel power output of each member, shape (N,)
+        """
+        solar_distance_2 = np.linalg.norm(sun_vec_inertial - satellite_vec_inertial) ** 2
+        return ensemble.power_lookup(sun_vec) / solar_distance_2
 
-
-
-    def gravity_gradient(self, ue, r0, cubesat: CubeSat):
+    def gravity_gradient(self, ue, r0, cubesat: CubeSat, out=None):
         """
         Calculates the gravity gradient disturbance torque
         :param ue: Unit vector towards nadir in the cubesat body frame
         :param r0: distance to the center of the earth
         :param cubesat: CubeSat model
+        :param out: optional array of length 3 to write the torque into
         :return: np.ndarray. gravity gradient disturbance torque in the cubesat body frame
         """
-        return (self._a_gravity_gradient_constant/(r0**3)) * (ut.cross_product_operator(ue) @ cubesat.inertia @ ue)
+        out = ut.cross_product(ue, cubesat.inertia @ ue, out=out)
+        out *= self._a_gravity_gradient_constant/(r0**3)
+        return out
 
 
-    def get_air_velocity(self, vel_inertial, pos_inertial):
+    def get_air_velocity(self, vel_inertial, pos_inertial, out=None):
         """
         Calculates the velocity the spacecraft is moving relative to air
 
@@ -130,44 +357,55 @@ class DisturbanceTorques(object):
 
         :param vel_inertial: inertial velocity vector
         :param pos_inertial: inertial position vector
+        :param out: optional array of length 3 to write the result into
         :return: np.ndarray. velocity of spacecraft relative to air
         """
-
-        return np.array([vel_inertial[0] + self._a_earth_rotational_constant*pos_inertial[1],
-                         vel_inertial[1] - self._a_earth_rotational_constant*pos_inertial[0],
-                         vel_inertial[2]])
+        if out is None:
+            out = np.empty(3)
+        out[0] = vel_inertial[0] + self._a_earth_rotational_constant*pos_inertial[1]
+        out[1] = vel_inertial[1] - self._a_earth_rotational_constant*pos_inertial[0]
+        out[2] = vel_inertial[2]
+        return out
 
 
     def aerodynamic_torque(self, v, rho, cubesat: CubeSat):
         """
         Calculates the aerodynamic disturbance torque
-        :param v: velocity of spacecraft relative to air in body frame in m/s
+        :param v: velocity of spacecraft relative to air in body frame in m/s, a single vector or an array of vectors of
+        shape (..., 3) (e.g. all the directions of a lookup table)
         :param rho: atmospheric density in kg/m^3
         :param cubesat: CubeSat model
-        :return: np.ndarray. aerodynamic disturbance torque in the cubesat body frame
+        :return: np.ndarray. aerodynamic disturbance torque in the cubesat body frame, same shape as v
         """
         # This function uses the equations for the free molecular flow dynamics
         # (i.e. neglecting the affect of reemitted particles on the incident stream)
 
-        vm = np.linalg.norm(v)
+        if v.ndim == 1:
+            vm = math.sqrt(v @ v)
+        else:
+            vm = np.sqrt(np.sum(v * v, axis=-1, keepdims=True))
 
         if cubesat._aero_lut is None:
             ev = v * (1.0 / vm)
-
-            # calculate net torque
-            net_torque = np.zeros(3)
-            for face in cubesat.faces:
-                mu = np.dot(ev, face.normal)  # cosine of angle between velocity and surface normal
-                if mu >= 0:
-                    # units N, see eq'n 2-2 in NASA SP-8058 Spacecraft Aerodynamic Torques
-                    force = -rho * vm**2 * (2 * (1-face.accommodation_coeff) * mu**2 * face.normal +
-                                            face.accommodation_coeff * mu * ev) * face.area  # units N, see eq'n 2-2 in NASA SP-8058 Spacecraft Aerodynamic Torques
-                    # This addition is the diffuse term in Chris Robson's thesis. Just use 5 % of vm for now for the diffuse vel
-                    # note: I think Chris is missing a second cosine in the specular reflection equation
-                    force += face.accommodation_coeff * rho * vm * (0.05*vm) * face.area * mu * face.normal
-                    net_torque += ut.cross_product_operator(face.centroid - cubesat.center_of_mass) @ force  # units N.m
-
-            return net_torque
+            faces = cubesat.face_arrays
+
+            # cosine of angle between velocity and surface normal of each face, shape (..., F). Faces facing away from
+            # the flow have no force on them, clipping their cosine to zero makes every term of their force zero.
+            mu = np.maximum(ev @ faces.normals.T, 0.0)
+
+            # The force on each face is split into a part along the face normal and a part along the velocity:
+            # force = -rho * vm**2 * (2 * (1-accommodation_coeff) * mu**2 * normal + accommodation_coeff * mu * ev) * area
+            # (units N, see eq'n 2-2 in NASA SP-8058 Spacecraft Aerodynamic Torques)
+            # plus accommodation_coeff * rho * vm * (0.05*vm) * area * mu * normal, which is the diffuse term in Chris
+            # Robson's thesis. Just use 5 % of vm for now for the diffuse vel
+            # note: I think Chris is missing a second cosine in the specular reflection equation
+            acc = faces.accommodation_coeff
+            scale = rho * vm**2 * faces.areas * mu
+            normal_force = scale * (0.05*acc - 2*(1 - acc)*mu)
+            velocity_force = -scale * acc
+
+            # net torque (units N.m), the sum over the faces of lever_arm x force
+            return normal_force @ faces.lever_arm_cross_normals + _cross(velocity_force @ faces.lever_arms, ev)
         else:
             net_torque =  cubesat.aerodynamic_lookup(v) * rho * vm**2
             return net_torque
@@ -176,7 +414,7 @@ class DisturbanceTorques(object):
     def solar_pressure(self, sun_vec, sun_vec_inertial, satellite_vec_inertial, cubesat: CubeSat):
         """
         Calculate the solar pressure torque on the cubesat.
-        :param sun_vec: sun unit vector in body frame
+        :param sun_vec: sun unit vector in body frame, a single vector or an array of vectors of shape (..., 3)
         :param sun_vec_inertial: sun vector in inertial frame
         :param satellite_vec_inertial: satellite position vector in inertial frame
         :param cubesat: CubeSat model
@@ -186,26 +424,29 @@ class DisturbanceTorques(object):
         if cubesat._solar_lut is None:
             # calculate the solar irradiance using equation 3-53 in Chris Robson's thesis
             const = self._a_solar_constant / solar_distance_2
-
-            net_torque = np.zeros(3)
-            for face in cubesat.faces:
-                cos_theta = face.normal @ sun_vec
-
-                if cos_theta > 0:
-                    # calculate the solar radiation pressure torque using the equation in SMAD
-                    # net_torque += const * face.area * (1 + face.reflection_coeff) * cos_theta * \
-                    #               (ut.cross_product_operator(face.centroid - cubesat.center_of_mass) @
-                    #                -face.normal)  # force is opposite to area
-
-                    # Calculate the solar radiation pressure torque using equation 3.167 in Landis Markley's Fundamentals of
-                    # Spacecraft Attitude Determination and Control textbook. This equation is equivalent to Chris Robson's
-                    # equations 3-55 to 3-58. Note: I think Chris is missing a second cosine in the specular reflection equation
-                    force = -const * face.area * cos_theta * \
-                            (2*(face.diff_ref_coeff/3 + face.spec_ref_coeff*cos_theta)*face.normal
-                             + (1 - face.spec_ref_coeff)*sun_vec)
-                    net_torque += ut.cross_product_operator(face.centroid - cubesat.center_of_mass) @ force
-
-            return net_torque
+            faces = cubesat.face_arrays
+
+            # cosine of angle between the sun and surface normal of each face, clipped to zero for faces in shadow
+            cos_theta = np.maximum(sun_vec @ faces.normals.T, 0.0)
+
+            # calculate the solar radiation pressure torque using the equation in SMAD
+            # net_torque += const * face.area * (1 + face.reflection_coeff) * cos_theta * \
+            #               (ut.cross_product_operator(face.centroid - cubesat.center_of_mass) @
+            #                -face.normal)  # force is opposite to area
+
+            # Calculate the solar radiation pressure torque using equation 3.167 in Landis Markley's Fundamentals of
+            # Spacecraft Attitude Determination and Control textbook. This equation is equivalent to Chris Robson's
+            # equations 3-55 to 3-58. Note: I think Chris is missing a second cosine in the specular reflection equation
+            # force = -const * face.area * cos_theta * \
+            #         (2*(face.diff_ref_coeff/3 + face.spec_ref_coeff*cos_theta)*face.normal
+            #          + (1 - face.spec_ref_coeff)*sun_vec)
+            # which is split into a part along the face normal and a part along the sun vector
+            scale = -const * faces.areas * cos_theta
+            normal_force = scale * 2*(faces.diff_ref_coeff/3 + faces.spec_ref_coeff*cos_theta)
+            sun_force = scale * (1 - faces.spec_ref_coeff)
+
+            # net torque, the sum over the faces of lever_arm x force
+            return normal_force @ faces.lever_arm_cross_normals + _cross(sun_force @ faces.lever_arms, sun_vec)
         else:
             net_torque = cubesat.solar_lookup(sun_vec) / solar_distance_2
             return net_torque
@@ -215,7 +456,7 @@ class DisturbanceTorques(object):
     def solar_panel_power(self, sun_vec, sun_vec_inertial, satellite_vec_inertial, cubesat: CubeSat):
         """
         This function calculates the current solar panel power output
-        :param sun_vec: sun unit vector in body frame
+        :param sun_vec: sun unit vector in body frame, a single vector or an array of vectors of shape (..., 3)
         :param sun_vec_inertial: sun vector in inertial frame
         :param satellite_vec_inertial: satellite position vector in inertial frame
         :param cubesat: CubeSat model
@@ -224,85 +465,25 @@ class DisturbanceTorques(object):
         solar_distance_2 = np.linalg.norm(sun_vec_inertial - satellite_vec_inertial) ** 2
         if cubesat._power_lut is None:
             watt_per_meter = self._a_solar_constant_2 / solar_distance_2
-            power = 0
-
-            for face in cubesat.solar_panel_faces:
-                cos_theta = face.normal @ sun_vec
+            panels = cubesat.solar_panel_arrays
 
-                if cos_theta > 0:
-                    power += watt_per_meter * face.area * cos_theta * face.solar_power_efficiency
-
-            return power
+            # panels facing away from the sun have their cosine clipped to zero
+            cos_theta = np.maximum(sun_vec @ panels.normals.T, 0.0)
+            return watt_per_meter * (cos_theta @ (panels.areas * panels.solar_power_efficiency))
         else:
             power = cubesat.power_lookup(sun_vec) / solar_distance_2
             return power
 
 
-    def total_magnetic(self, b, cubesat: CubeSat):
+    def total_magnetic(self, b, cubesat: CubeSat, out=None):
         """
         This function calculates the total magnetic torque exhibited on the satellite from magnetic moments defined in
         the CubeSat model
         :param b: external magnetic field in the body frame (Units: Telsa)
         :param cubesat: CubeSat model
+        :param out: optional array of length 3 to write the torque into
         :return: np.ndarray. magnetic torque in the cubesat body frame
         """
-        return ut.cross_product_operator(cubesat.total_magnetic_moment) @ b  # both vectors must be in the body frame
-
-    def _hysteresis_rod_torque(self, b, cubesat: CubeSat, rod_function: str):
-        h = b / self._u0
-        torque = 0
-
-        # for each hysteresis rod
-        for rod in cubesat.hyst_rods:
-
-            # propagate the magnetic field of the rod
-            h_proj = h @ rod.axes_alignment  # calculate component of h along axis of hysteresis rod
-            if rod_function == 'propagate_magnetization':
-                b_current = rod.propagate_magnetization(h_proj)
-            elif rod_function == 'propagate_and_save_magnetization':
-                b_current = rod.propagate_and_save_magnetization(h_proj)
-            elif rod_function == 'peek_magnetization':
-                b_current = rod.peek_magnetization(h_proj)
-            else:
-                raise ValueError(f'Unknown rod function {rod_function}')
-
-            # calculate m from b of the rod
-            m = rod.axes_alignment * b_current * rod.volume / self._u0
-
-            # calculate m x B torque
-            torque += ut.cross_product_operator(m) @ b
-
-        return torque
-
-    def hysteresis_rod_torque(self, b, cubesat: CubeSat):
-        """
-        This function calculates the torque exerted on the spacecraft from any hysteresis rods in the cubesat model
-        :param b: external magnetic field in the body frame (Units: Telsa)
-        :param cubesat: CubeSat model
-        :return: np.ndarray. magnetic torque from hysteresis rods in the cubesat body frame
-        """
-        return self._hysteresis_rod_torque(b, cubesat, 'propagate_magnetization')
-
-
-    # if you want to save the hysteresis data
-    def hysteresis_rod_torque_save(self, b, cubesat: CubeSat):
-        """
-        This function is the same as above but should be used if you want to save the hystersis rods data.
-        :param b: external magnetic field in the body frame (Units: Telsa)
-        :param i: current index of integration
-        :param cubesat: CubeSat model
-        :return:
-        """
-        return self._hysteresis_rod_torque(b, cubesat, 'propagate_and_save_magnetization')
-
-    def hysteresis_rod_torque_peek(self, b, cubesat: CubeSat):
-        """
-        This function is the same as above but should be used if don't want to propagate the magnetization.
-        :param b: external magnetic field in the body frame (Units: Telsa)
-        :param i: current index of integration
-        :param cubesat: CubeSat model
-        :return:
-        """
-        return self._hysteresis_rod_torque(b, cubesat, 'peek_magnetization')
+        return ut.cross_product(cubesat.total_magnetic_moment, b, out=out)  # both vectors must be in the body frame
 
 
@@ -1,9 +1,14 @@
 """
 Model for hysteresis rods. This model is capable of propagating the state of the hysteresis rod. The state being the
 magnetization of it.
+
+HysteresisRodBank holds all the hysteresis rods of a CubeSat (or of all the members of a CubeSatEnsemble) as arrays, so
+that dB/dt of all of them is one vectorized evaluation. The simulations integrate the magnetizations of the rods as
+part of the state with it (see state_propagations.py).
 """
 import numpy as np
 from adcsim.integrators import rk4_general
+from adcsim import util as ut
 
 
 class HysteresisRod:
@@ -163,6 +168,133 @@ class HysteresisRod:
         plt.ylabel('B')
 
 
+class HysteresisRodBank:
+    """
+    The parameters and state of a set of hysteresis rods held as arrays, with batch shape (R,) for the R rods of one
+    CubeSat, or (N, R) for the rods of the N members of a CubeSatEnsemble:
+     - br, bs, hc, k, volume, h, b  (..., R)
+     - axes                         (..., R, 3)
+    dB/dt of every rod (b_dot) is one evaluation on these arrays (the positive or negative h branch of each rod is
+    picked by the sign of dH/dt), so a CubeSat with several rods costs about the same per step as one with a single rod.
+
+    The bank is made from HysteresisRod objects, and after that it holds the initial state of the rods (the h_current
+    and b_current of the HysteresisRod objects are not updated).
+    """
+    u0 = 4 * np.pi * 10**-7
+
+    def __init__(self, br, bs, hc, volume, axes):
+        """
+        :param br: remanence of each rod, shape (..., R)
+        :param bs: saturation of each rod, shape (..., R)
+        :param hc: coercivity of each rod, shape (..., R)
+        :param volume: volume of each rod, shape (..., R)
+        :param axes: unit vector along each rod in the body frame, shape (..., R, 3)
+        """
+        self.br = np.array(br, dtype=float)
+        self.bs = np.array(bs, dtype=float)
+        self.hc = np.array(hc, dtype=float)
+        self.volume = np.array(volume, dtype=float)
+        self.axes = np.array(axes, dtype=float).reshape(self.br.shape + (3,))
+        self.k = (1 / self.hc) * np.tan(np.pi * self.br / 2 / self.bs)
+        self._scale = 2 * self.bs / np.pi
+        self._scale_k = self._scale * self.k
+        self._k_hc = self.k * self.hc
+        self.h = np.zeros(self.br.shape)
+        self.b = np.zeros(self.br.shape)
+
+    @classmethod
+    def from_rods(cls, rods):
+        """
+        :param rods: list of HysteresisRod objects, or a list of N lists of R HysteresisRod objects
+        :return: HysteresisRodBank with the parameters and current state of the rods
+        """
+        if len(rods) > 0 and isinstance(rods[0], list):
+            shape = (len(rods), len(rods[0]))
+            rods = [rod for member in rods for rod in member]
+        else:
+            shape = (len(rods),)
+
+        def stack(attribute, item_shape=()):
+            return np.array([getattr(rod, attribute) for rod in rods], dtype=float).reshape(shape + item_shape)
+
+        bank = cls(stack('br'), stack('bs'), stack('hc'), stack('volume'), stack('axes_alignment', (3,)))
+        bank.h = stack('h_current')
+        bank.b = stack('b_current')
+        return bank
+
+    def __len__(self):
+        return self.br.shape[-1]
+
+    def project(self, b):
+        """
+        :param b: external magnetic field in the body frame, shape (..., 3); T
+        :return: component of h = b / u0 along the axis of each rod, shape (..., R)
+        """
+        return (self.axes @ b[..., None])[..., 0] / self.u0
+
+    def b_field_top(self, h):
+        return 2 * self.bs * np.arctan(self.k * (h + self.hc)) / np.pi
+
+    def b_field_bottom(self, h):
+        return 2 * self.bs * np.arctan(self.k * (h - self.hc)) / np.pi
+
+    def initialize(self, h):
+        """
+        Put the hysteresis rods in a reasonable initial state (on the lower limiting curve).
+        :param h: external magnetic field along each rod, shape (..., R)
+        """
+        self.h = np.array(h, dtype=float)
+        self.b = self.b_field_bottom(self.h)
+
+    def b_dot(self, h, b, h_dot):
+        """
+        Rate of change of the magnetization of each rod, dB/dt = dB/dH * dH/dt, on the branch picked by the sign of
+        dH/dt. This is what the simulations integrate as part of the state (see state_propagations.py).
+        :param h: external magnetic field along each rod, shape (..., R)
+        :param b: induced magnetic field of each rod, shape (..., R)
+        :param h_dot: rate of change of h, shape (..., R)
+        :return: dB/dt, shape (..., R)
+        """
+        # HysteresisRod.mag_process_positive_h/mag_process_negative_h * h_dot, written out. On the branch the rods are
+        # on dB/dH = u0 + (target - b) * (d_other - u0) / (target - other), where target is the limiting curve b is
+        # heading towards (top for increasing h) and d_other the derivative of the other one.
+        kh = self.k * h
+        c = np.copysign(self._k_hc, h_dot)
+        x_other = kh - c
+        target = self._scale * np.arctan(kh + c)
+        g = (self._scale_k / (1 + x_other * x_other) - self.u0) / (target - self._scale * np.arctan(x_other))
+        return (self.u0 + g * (target - b)) * h_dot
+
+    def magnetic_moments(self, b_rods):
+        """
+        :param b_rods: induced magnetic field of each rod, shape (..., R)
+        :return: magnetic moment of each rod in the body frame, shape (..., R, 3)
+        """
+        return self.axes * (b_rods * self.volume / self.u0)[..., None]
+
+    def torques(self, b_rods, b):
+        """
+        :param b_rods: induced magnetic field of each rod, shape (..., R)
+        :param b: external magnetic field in the body frame, shape (..., 3); T
+        :return: m x B torque of each rod in the body frame, shape (..., R, 3)
+        """
+        m = self.magnetic_moments(b_rods)
+        if b.ndim == 1:
+            return m @ ut.cross_product_operator(b)  # m x b = -(b x m) for each row of m
+        return ut.cross_product_array(m, b[..., None, :])
+
+    def torque(self, b_rods, b):
+        """
+        :param b_rods: induced magnetic field of each rod, shape (..., R)
+        :param b: external magnetic field in the body frame, shape (..., 3); T
+        :return: total m x B torque of the rods in the body frame, shape (..., 3)
+        """
+        m = ((b_rods * self.volume / self.u0)[..., None, :] @ self.axes)[..., 0, :]
+        if b.ndim == 1:
+            return ut.cross_product(m, b)
+        return ut.cross_product_array(m, b)
+
+
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
 
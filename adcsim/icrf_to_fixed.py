@@ -4,8 +4,10 @@ with the earth.
 """
 
 import numpy as np
+import math
 import pysofa
 import datetime
+from collections import OrderedDict
 
 
 def icrf_to_fixed(epoch: datetime.datetime, seconds: np.ndarray=0.0):
@@ -52,6 +54,134 @@ def icrf_to_fixed(epoch: datetime.datetime, seconds: np.ndarray=0.0):
         return rc2ti
 
 
+class IcrfToFixed:
+    """
+    Faster version of icrf_to_fixed, for when the rotation matrices are needed at a lot of times (e.g. the magnetic
+    field model in pre_process_orbit.py or in on the fly simulations).
+
+    The CIP X, Y and CIO locator s (the precession-nutation part of the rotation, pysofa.xys06a) change very slowly, so
+    they are only calculated on a coarse grid of times and linearly interpolated in between. The grid points are kept,
+    so they are only ever calculated once. With the default 1 hour grid the interpolation error is around 2e-11 rad,
+    which is far below the corrections that are already ignored in icrf_to_fixed. The Earth rotation angle and the
+    final rotation are done with numpy for all the times at once. Matrices of single times are also cached by date,
+    since GeoMag needs the same matrix twice for every inertial field evaluation.
+
+    Call it just like icrf_to_fixed:
+    >>> rotation = IcrfToFixed()
+    >>> R = rotation(epoch)  # (3, 3)
+    >>> Rs = rotation(epoch, seconds)  # (len(seconds), 3, 3)
+    """
+    _dj00 = 2451545.0  # reference epoch J2000.0, julian date
+
+    def __init__(self, xys_step: float=3600.0, cache_size: int=4096):
+        """
+        :param xys_step: time between the points the precession-nutation terms are calculated at; seconds
+        :param cache_size: number of single time matrices to remember
+        """
+        self._xys_step = xys_step / 86400.
+        self._xys_nodes = {}  # grid index -> (x, y, s)
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __call__(self, epoch: datetime.datetime, seconds: np.ndarray=0.0):
+        if isinstance(seconds, float):
+            key = (epoch, seconds)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            matrix = self._matrix(epoch, seconds)
+            self._cache[key] = matrix
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            return matrix
+        return self._matrices(epoch, np.atleast_1d(seconds))
+
+    def _xys(self, djmjd0, tt):
+        # linear interpolation of the precession-nutation terms from the coarse grid
+        position = tt / self._xys_step
+        index = np.floor(position).astype(int)
+        first = index.min()
+        for k in range(first, index.max() + 2):
+            if k not in self._xys_nodes:
+                self._xys_nodes[k] = pysofa.xys06a(djmjd0, k * self._xys_step)
+        nodes = np.array([self._xys_nodes[k] for k in range(first, index.max() + 2)])
+        lo = nodes[index - first]
+        hi = nodes[index - first + 1]
+        fraction = (position - index)[:, None]
+        return (lo + fraction * (hi - lo)).T
+
+    def _matrix(self, epoch, sec):
+        # a single time is faster with the pysofa functions than with numpy
+        djmjd0, date = pysofa.cal2jd(epoch.year, epoch.month, epoch.day)
+        time0 = (60. * (60. * epoch.hour + epoch.minute) + epoch.second) / 86400.
+        dat = pysofa.dat(epoch.year, epoch.month, epoch.day, time0)
+
+        time = (60. * (60. * epoch.hour + epoch.minute) + epoch.second + sec) / 86400.
+        tt = date + time + dat / 86400. + 32.184 / 86400.
+        position = tt / self._xys_step
+        k = math.floor(position)
+        for node in (k, k + 1):
+            if node not in self._xys_nodes:
+                self._xys_nodes[node] = pysofa.xys06a(djmjd0, node * self._xys_step)
+        fraction = position - k
+        x, y, s = [lo + fraction * (hi - lo) for lo, hi in zip(self._xys_nodes[k], self._xys_nodes[k + 1])]
+        rc2i = pysofa.c2ixys(x, y, s)
+        era = pysofa.era00(djmjd0 + date, time)
+        return pysofa.rz(era, rc2i)
+
+    def _matrices(self, epoch, sec):
+        djmjd0, date = pysofa.cal2jd(epoch.year, epoch.month, epoch.day)
+        time0 = (60. * (60. * epoch.hour + epoch.minute) + epoch.second) / 86400.
+        dat = pysofa.dat(epoch.year, epoch.month, epoch.day, time0)
+
+        time = (60. * (60. * epoch.hour + epoch.minute) + epoch.second + sec) / 86400.
+        utc = date + time
+        tai = utc + dat / 86400.
+        tt = tai + 32.184 / 86400.
+
+        # cip and cio, IAU 2006/2006A
+        x, y, s = self._xys(djmjd0, tt)
+
+        # gcrs to cirs matrix, same as pysofa.c2ixys: rz(-(e+s)) @ ry(d) @ rz(e)
+        r2 = x*x + y*y
+        e = np.where(r2 > 0, np.arctan2(y, x), 0.0)
+        d = np.arctan(np.sqrt(r2 / (1.0 - r2)))
+        rc2i = _rz(-(e + s)) @ _ry(d) @ _rz(e)
+
+        # earth rotation angle, same as pysofa.era00
+        d1 = djmjd0 + date
+        t = time + (d1 - self._dj00)
+        f = np.fmod(time, 1.0) + math.fmod(d1, 1.0)
+        era = np.mod(2 * np.pi * (f + 0.7790572732640 + 0.00273781191135448 * t), 2 * np.pi)
+
+        # form celestial-terrestrial matrix (no polar motion yet)
+        return _rz(era) @ rc2i
+
+
+def _rz(psi):
+    # rotation matrices about the z axis, shape (N, 3, 3) (same sign convention as pysofa.rz)
+    c, s = np.cos(psi), np.sin(psi)
+    r = np.zeros((len(psi), 3, 3))
+    r[:, 0, 0] = c
+    r[:, 0, 1] = s
+    r[:, 1, 0] = -s
+    r[:, 1, 1] = c
+    r[:, 2, 2] = 1.0
+    return r
+
+
+def _ry(theta):
+    # rotation matrices about the y axis, shape (N, 3, 3) (same sign convention as pysofa.ry)
+    c, s = np.cos(theta), np.sin(theta)
+    r = np.zeros((len(theta), 3, 3))
+    r[:, 0, 0] = c
+    r[:, 0, 2] = -s
+    r[:, 1, 1] = 1.0
+    r[:, 2, 0] = s
+    r[:, 2, 2] = c
+    return r
+
+
 if __name__ == '__main__':
     rc = np.array([7e6, 0., 0.])  # vector in celestial frame
     epoch = datetime.datetime(year=2019, month=1, day=1, hour=12)
@@ -17,9 +17,25 @@ def mrp_switching(state):
     """
     Integral consideration for the Modified Rodriguez Parameter (MRP) attitude parametrization. Checks to see if the
     magnitude of the MRP vector is greater than one, if it is we 'switch' to the 'Shadow MRP set'.
-    :param state: The current attitude state
+    :param state: The current state, either flat with the MRP in the first 3 elements or of shape (2, 3)
     :return: The attitude state after the switching is done
     """
-    if np.linalg.norm(state[0]) > 1:
-        state[0] = -(state[0]) / (state[0] @ state[0])
+    sigma = state.reshape(-1)[:3]  # a view, so the switch is written into state
+    if np.linalg.norm(sigma) > 1:
+        sigma[:] = -sigma / (sigma @ sigma)
     return state
+
+
+def mrp_switching_array(states):
+    """
+    Same as mrp_switching, but for an ensemble of states of shape (N, 6 + R) (or (N, 2, 3)). Only the members whose MRP
+    vector has a magnitude greater than one are switched.
+    :param states: The current states
+    :return: The states after the switching is done
+    """
+    sigma = states.reshape(len(states), -1)[:, :3]
+    s = np.einsum('ij,ij->i', sigma, sigma)
+    switch = s > 1
+    if np.any(switch):
+        sigma[switch] = -sigma[switch] / s[switch, None]
+    return states
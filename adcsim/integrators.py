@@ -2,7 +2,16 @@
 Implementations of the rk4 numeral integration algorithm. These can be used to propagate attitude states.
 
 see https://en.wikipedia.org/wiki/Runge%E2%80%93Kutta_methods for rk4 implementation
+
+There is also an adaptive step Dormand-Prince 5(4) embedded Runge-Kutta pair (rk45) in here. A single call to rk45
+takes one step and returns an estimate of the local error along with the new state. The step size control is left to
+the caller (see new_step_size), so that things like MRP switching can be done after every accepted step. The last stage
+of a step is the first stage of the next one (and of a retry of a rejected step), so a step costs 6 evaluations of the
+differential equation, and rk45_dense_output gives the state anywhere inside a step without any more evaluations.
+
+see https://en.wikipedia.org/wiki/Dormand%E2%80%93Prince_method for the rk45 coefficients
 """
+import numpy as np
 
 
 def rk4(fn, time, state, time_step, *args):
@@ -42,3 +51,102 @@ def rk4_general(fn, time_step, t, y, *args):
     k4 = time_step*fn(t + time_step, y + k3, *args)
     return y + (1/6)*(k1 + 2*k2 + 2*k3 + k4)
 
+
+
+# Dormand-Prince 5(4) coefficients
+_dp_c = (0, 1/5, 3/10, 4/5, 8/9, 1, 1)
+_dp_a = ((),
+         (1/5,),
+         (3/40, 9/40),
+         (44/45, -56/15, 32/9),
+         (19372/6561, -25360/2187, 64448/6561, -212/729),
+         (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+         (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84))
+_dp_b = (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0)  # 5th order solution (same as the last row of _dp_a)
+_dp_e = (71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)  # 5th order minus 4th order weights
+# coefficients of theta, theta^2, theta^3, theta^4 of each stage in the 4th order continuous extension (dense output)
+_dp_p = np.array([[1, -8048581381/2820520608, 8663915743/2820520608, -12715105075/11282082432],
+                  [0, 0, 0, 0],
+                  [0, 131558114200/32700410799, -68118460800/10900136933, 87487479700/32700410799],
+                  [0, -1754552775/470086768, 14199869525/1410260304, -10690763975/1880347072],
+                  [0, 127303824393/49829197408, -318862633887/49829197408, 701980252875/199316789632],
+                  [0, -282668133/205662961, 2019193451/616988883, -1453857185/822651844],
+                  [0, 40617522/29380423, -110615467/29380423, 69997945/29380423]])
+
+
+def rk45(fn, time, state, time_step, *args, first_stage=None):
+    """
+    Takes a single Dormand-Prince 5(4) step of the differential equation defined in 'fn'. The arguments are the same as
+    the rk4 function so the two can be swapped out easily.
+
+    The 5th order solution is returned (local extrapolation) along with the difference between the 5th and 4th order
+    solutions, which is an estimate of the local truncation error of the step.
+    :param fn: function that evaluates differential equation.
+    :param time: time at the beginning of the step
+    :param state: current state of the variables being integrated
+    :param time_step: time step of integration
+    :param args: everything (other than the state, which is taken care of automatically) that you would want to pass to
+    'fn'
+    :param first_stage: fn(time, state, *args) if it is already known, i.e. stages[-1] of the previous step, or
+    stages[0] of a rejected try of this step. fn is then only evaluated 6 times.
+    :return: (new state, error estimate, stages). The new state and the error have the same shape as state, stages are
+    the 7 values of fn, shape (7,) + state.shape. stages[-1] is fn at the new state.
+    """
+    stages = np.empty((7,) + np.shape(state))
+    stages[0] = fn(time, state, *args) if first_stage is None else first_stage
+    for i in range(1, 7):
+        ds = 0
+        for a_j, k_j in zip(_dp_a[i], stages):
+            if a_j:
+                ds = ds + a_j * k_j
+        stages[i] = fn(time + _dp_c[i]*time_step, state + time_step*ds, *args)
+    new_state = state + time_step*sum(b * k_j for b, k_j in zip(_dp_b, stages) if b)
+    error = time_step*sum(e * k_j for e, k_j in zip(_dp_e, stages) if e)
+    return new_state, error, stages
+
+
+def rk45_dense_output(state, stages, time_step, theta):
+    """
+    The state inside a step of rk45, from the 4th order continuous extension of the Dormand-Prince pair.
+    :param state: state at the beginning of the step
+    :param stages: stages returned by rk45 for the step
+    :param time_step: time step of the step
+    :param theta: where in the step, 0 (beginning) to 1 (end)
+    :return: the state at time + theta * time_step
+    """
+    powers = np.array([theta, theta**2, theta**3, theta**4])
+    return state + time_step*np.tensordot(_dp_p @ powers, stages, axes=1)
+
+
+def error_norm(error, state, new_state, rtol, atol):
+    """
+    Root mean square of the error estimate, scaled by the mixed relative/absolute tolerance of each component. A value
+    less than or equal to 1 means that the step meets the tolerances.
+    :param error: error estimate returned by rk45
+    :param state: state at the beginning of the step
+    :param new_state: state at the end of the step
+    :param rtol: relative tolerance
+    :param atol: absolute tolerance
+    :return: float
+    """
+    scale = atol + rtol * np.maximum(np.abs(state), np.abs(new_state))
+    return np.sqrt(np.mean((error / scale)**2))
+
+
+def new_step_size(time_step, err, order=5, safety=0.9, min_factor=0.2, max_factor=5.0):
+    """
+    Standard step size controller for embedded Runge-Kutta pairs. Works for both accepted (err <= 1) and rejected
+    (err > 1) steps.
+    :param time_step: the step size that produced the error
+    :param err: the error norm from error_norm
+    :param order: order of the error estimate plus one (5 for rk45)
+    :param safety: safety factor so that the next step is likely to be accepted
+    :param min_factor: smallest allowed ratio of the new step size to the old one
+    :param max_factor: largest allowed ratio of the new step size to the old one
+    :return: the new step size
+    """
+    if err == 0:
+        factor = max_factor
+    else:
+        factor = min(max_factor, max(min_factor, safety * err**(-1/order)))
+    return time_step * factor
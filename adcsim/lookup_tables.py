@@ -0,0 +1,243 @@
+"""
+Interpolation of the aerodynamic, solar pressure and solar power lookup tables of CubeSat models (see
+CubeSat.create_aerodynamic_table).
+
+The tables are functions of a direction in the body frame (of the air velocity or of the sun), calculated on a uniform
+grid of mu (cosine of the zenith angle) and phi (azimuth angle). Because the grid is uniform, the cell a direction is in
+is found with arithmetic instead of a search, and the interpolation polynomial of every cell is calculated when the
+table is made. Evaluating the table is then one small dot product, which is a lot faster than
+scipy.interpolate.RegularGridInterpolator for the single directions of the attitude simulations.
+
+The (mu, phi) grid has a lot more points near the poles than near the equator, and a seam at phi = +-pi. The
+alternative CubeMapTable projects the directions onto the 6 faces of a cube instead, with a uniform grid of angles on
+each face, so the points are spread almost evenly over the sphere and far fewer are needed for the same accuracy.
+"""
+import numpy as np
+import math
+
+
+class UniformGridTable:
+    """
+    Bilinear ('linear') or bicubic ('cubic', Catmull-Rom) interpolation of a table on a uniform (mu, phi) grid.
+
+    Call it with a direction (does not need to be a unit vector), or an array of directions of shape (..., 3):
+    >>> table = UniformGridTable(mu, phi, values)
+    >>> table(v)  # values.shape[2:]
+    >>> table(vs)  # vs.shape[:-1] + values.shape[2:]
+    """
+    # polynomial coefficients of the Catmull-Rom weights of the 4 neighbouring points: weights = [1, t, t^2, t^3] @ M
+    _catmull_rom = 0.5 * np.array([[0., 2., 0., 0.],
+                                   [-1., 0., 1., 0.],
+                                   [2., -5., 4., -1.],
+                                   [-1., 3., -3., 1.]])
+
+    def __init__(self, mu: np.ndarray, phi: np.ndarray, values: np.ndarray, method: str='linear',
+                 coefficients: np.ndarray=None):
+        """
+        :param mu: uniform grid of the cosine of the zenith angle, e.g. np.linspace(-1, 1, nmu)
+        :param phi: uniform grid of the azimuth angle, e.g. np.linspace(-pi, pi, nphi). If it covers a full circle the
+        table is treated as periodic in phi by the 'cubic' method.
+        :param values: table, shape (len(mu), len(phi), ...)
+        :param method: 'linear' or 'cubic'
+        :param coefficients: the coefficients of the table from UniformGridTable.coefficients, if they are already
+        calculated (e.g. memory mapped from a LookupTableCache). values is then not read.
+        """
+        if method not in ('linear', 'cubic'):
+            raise ValueError(f"method must be 'linear' or 'cubic', not {method!r}")
+        self.values = values
+        self.method = method
+        self._mu0 = mu[0]
+        self._phi0 = phi[0]
+        self._inv_dmu = (len(mu) - 1) / (mu[-1] - mu[0])
+        self._inv_dphi = (len(phi) - 1) / (phi[-1] - phi[0])
+        self._last_i = len(mu) - 2  # index of the last cell
+        self._last_j = len(phi) - 2
+        self._value_shape = values.shape[2:]
+        if coefficients is None:
+            coefficients = self.coefficients(mu, phi, values, method)
+        self._coefficients = np.asarray(coefficients)  # a plain view of a memory map, which is faster to index
+
+    @classmethod
+    def coefficients(cls, mu: np.ndarray, phi: np.ndarray, values: np.ndarray, method: str='linear'):
+        """
+        :return: the coefficients of the interpolation polynomial of each cell, shape (nmu - 1, nphi - 1, P, K), so
+        that the interpolated value is basis(t, u) @ coefficients[i, j]. They take 4 ('linear') or 16 ('cubic') times
+        the memory of the table.
+        """
+        f = np.asarray(values, dtype=float).reshape(len(mu), len(phi), -1)
+        if method == 'linear':
+            return _bilinear_coefficients(f)
+        periodic = np.isclose(phi[-1] - phi[0], 2 * np.pi)
+        f = cls._pad(f, periodic)
+        m = cls._catmull_rom
+        n_i, n_j = len(mu) - 1, len(phi) - 1
+        patches = np.empty((n_i, n_j, 4, 4, f.shape[-1]))
+        for a in range(4):
+            for b in range(4):
+                patches[:, :, a, b] = f[a:a + n_i, b:b + n_j]
+        # polynomial coefficients in t (zenith) and u (azimuth): M @ patch @ M.T
+        coefficients = np.einsum('pa,ijabk,qb->ijpqk', m, patches, m)
+        return coefficients.reshape(n_i, n_j, 16, -1)
+
+    @staticmethod
+    def _pad(f, periodic):
+        # one extra row/column on each side of the table for the 4x4 neighbourhoods of the cubic method
+        if periodic:
+            # the first and last phi are the same direction
+            f = np.concatenate((f[:, -2:-1], f, f[:, 1:2]), axis=1)
+        else:
+            f = np.concatenate((2 * f[:, :1] - f[:, 1:2], f, 2 * f[:, -1:] - f[:, -2:-1]), axis=1)
+        return np.concatenate((2 * f[:1] - f[1:2], f, 2 * f[-1:] - f[-2:-1]), axis=0)
+
+    def _basis(self, t, u):
+        if self.method == 'linear':
+            return np.array([1.0, t, u, t * u])
+        return np.outer((1.0, t, t * t, t * t * t), (1.0, u, u * u, u * u * u)).ravel()
+
+    def _basis_array(self, t, u):
+        # the columns are filled in directly, np.stack is slow for the few directions of a small ensemble
+        if self.method == 'linear':
+            basis = np.empty((len(t), 4))
+            basis[:, 0] = 1.0
+            basis[:, 1] = t
+            basis[:, 2] = u
+            np.multiply(t, u, out=basis[:, 3])
+            return basis
+        return (self._powers(t)[:, :, None] * self._powers(u)[:, None, :]).reshape(len(t), 16)
+
+    @staticmethod
+    def _powers(t):
+        p = np.empty((len(t), 4))
+        p[:, 0] = 1.0
+        p[:, 1] = t
+        np.multiply(t, t, out=p[:, 2])
+        np.multiply(p[:, 2], t, out=p[:, 3])
+        return p
+
+    def __call__(self, v: np.ndarray):
+        if v.ndim == 1:
+            return self._single(v)
+        shape = v.shape[:-1]
+        v = v.reshape(-1, 3)
+        mu = v[:, 2] / np.sqrt(np.einsum('ij,ij->i', v, v))
+        phi = np.arctan2(v[:, 1], v[:, 0])
+        x = (mu - self._mu0) * self._inv_dmu
+        y = (phi - self._phi0) * self._inv_dphi
+        i = np.minimum(np.maximum(np.floor(x), 0), self._last_i).astype(int)  # np.clip has a large overhead
+        j = np.minimum(np.maximum(np.floor(y), 0), self._last_j).astype(int)
+        basis = self._basis_array(x - i, y - j)
+        out = np.einsum('np,npk->nk', basis, self._coefficients[i, j])
+        return out.reshape(shape + self._value_shape)
+
+    def _single(self, v):
+        # same as __call__ for a single direction, with python floats for speed
+        v1, v2, v3 = v.tolist()
+        x = (v3 / math.sqrt(v1*v1 + v2*v2 + v3*v3) - self._mu0) * self._inv_dmu
+        y = (math.atan2(v2, v1) - self._phi0) * self._inv_dphi
+        i = min(max(int(math.floor(x)), 0), self._last_i)
+        j = min(max(int(math.floor(y)), 0), self._last_j)
+        out = self._basis(x - i, y - j) @ self._coefficients[i, j]
+        if self._value_shape:
+            return out.reshape(self._value_shape)
+        return float(out[0])
+
+
+class CubeMapTable:
+    """
+    Bilinear interpolation of a table on a cube map: the directions are projected onto the 6 faces of a cube (+x, -x,
+    +y, -y, +z, -z), and each face has an n x n grid that is uniform in the angles between the directions and the
+    center of the face (an equi-angular cube map). The largest cells cover less than 1.4 times the solid angle of the
+    smallest ones, there are no poles or seams, and neighbouring faces share their edge points so the interpolation is
+    continuous.
+
+    Call it with a direction (does not need to be a unit vector), or an array of directions of shape (..., 3):
+    >>> table = CubeMapTable(values)  # values calculated at CubeMapTable.directions(n)
+    >>> table(v)  # values.shape[3:]
+    >>> table(vs)  # vs.shape[:-1] + values.shape[3:]
+    """
+    # the axes of the two grid coordinates of the faces along x, y and z
+    _u_axes = (1, 2, 0)
+    _v_axes = (2, 0, 1)
+
+    def __init__(self, values: np.ndarray, coefficients: np.ndarray=None):
+        """
+        :param values: table calculated at CubeMapTable.directions(n), shape (6, n, n, ...)
+        :param coefficients: the coefficients of the table from CubeMapTable.coefficients, if they are already
+        calculated (e.g. memory mapped from a LookupTableCache). values is then not read.
+        """
+        self.values = values
+        n = values.shape[1]
+        self._scale = 2 * (n - 1) / np.pi  # grid index per radian, the grid goes from -pi/4 to pi/4
+        self._last = n - 2
+        self._value_shape = values.shape[3:]
+        if coefficients is None:
+            coefficients = self.coefficients(values)
+        self._coefficients = np.asarray(coefficients)
+
+    @staticmethod
+    def coefficients(values: np.ndarray):
+        """
+        :return: the coefficients of the bilinear polynomial of each cell of each face, shape (6, n - 1, n - 1, 4, K).
+        They take 4 times the memory of the table.
+        """
+        n = values.shape[1]
+        return _bilinear_coefficients(np.asarray(values, dtype=float).reshape(6, n, n, -1))
+
+    @staticmethod
+    def directions(n: int):
+        """
+        Unit vectors of the points of a cube map with n x n points on each face, shape (6, n, n, 3)
+        """
+        s = np.tan(np.linspace(-np.pi / 4, np.pi / 4, n))
+        s[0], s[-1] = -1.0, 1.0  # exactly on the edges of the cube
+        directions = np.empty((6, n, n, 3))
+        for k in range(3):
+            for sign in range(2):
+                face = directions[2 * k + sign]
+                face[..., k] = -1.0 if sign else 1.0
+                face[..., CubeMapTable._u_axes[k]] = s[:, None]
+                face[..., CubeMapTable._v_axes[k]] = s[None, :]
+        return directions / np.linalg.norm(directions, axis=-1, keepdims=True)
+
+    def __call__(self, v: np.ndarray):
+        if v.ndim == 1:
+            return self._single(v)
+        shape = v.shape[:-1]
+        v = v.reshape(-1, 3)
+        n = np.arange(len(v))
+        k = np.argmax(np.abs(v), axis=1)
+        major = v[n, k]
+        face = 2 * k + (major < 0)
+        major = np.abs(major)
+        x = (np.arctan(v[n, np.take(self._u_axes, k)] / major) + np.pi / 4) * self._scale
+        y = (np.arctan(v[n, np.take(self._v_axes, k)] / major) + np.pi / 4) * self._scale
+        i = np.clip(np.floor(x).astype(int), 0, self._last)
+        j = np.clip(np.floor(y).astype(int), 0, self._last)
+        t, u = x - i, y - j
+        basis = np.stack((np.ones_like(t), t, u, t * u), axis=-1)
+        out = np.einsum('np,npk->nk', basis, self._coefficients[face, i, j])
+        return out.reshape(shape + self._value_shape)
+
+    def _single(self, v):
+        # same as __call__ for a single direction, with python floats for speed
+        c = v.tolist()
+        a = [abs(c[0]), abs(c[1]), abs(c[2])]
+        k = 0 if a[0] >= a[1] and a[0] >= a[2] else (1 if a[1] >= a[2] else 2)
+        face = 2 * k + (c[k] < 0)
+        x = (math.atan(c[self._u_axes[k]] / a[k]) + math.pi / 4) * self._scale
+        y = (math.atan(c[self._v_axes[k]] / a[k]) + math.pi / 4) * self._scale
+        i = min(max(int(x), 0), self._last)
+        j = min(max(int(y), 0), self._last)
+        t, u = x - i, y - j
+        out = np.array([1.0, t, u, t * u]) @ self._coefficients[face, i, j]
+        if self._value_shape:
+            return out.reshape(self._value_shape)
+        return float(out[0])
+
+
+def _bilinear_coefficients(f):
+    # coefficients of the bilinear polynomial of each cell of a grid of values f (..., ni, nj, K), shape
+    # (..., ni - 1, nj - 1, 4, K), the interpolated value is [1, t, u, t*u] @ coefficients[..., i, j]
+    f00, f10, f01, f11 = f[..., :-1, :-1, :], f[..., 1:, :-1, :], f[..., :-1, 1:, :], f[..., 1:, 1:, :]
+    return np.stack((f00, f10 - f00, f01 - f00, f11 - f10 - f01 + f00), axis=-2)
+
@@ -0,0 +1,145 @@
+"""
+An on-disk cache of the aerodynamic, solar pressure and solar power lookup tables of CubeSat models.
+
+The tables only depend on the geometry of the CubeSat (the faces, their surface properties and the center of mass, see
+CubeSat.geometry_hash), not on the inertia, the magnets or the hysteresis rods. So simulations that only change those
+(e.g. permanent_magnet_strength.py) can all use the same tables. Each table is saved as a .npy file named after a hash
+of the geometry, the table type, the function that calculated it and its resolution, and the coefficients of its
+interpolation (see lookup_tables.py, 4 or 16 times the size of the table) are saved next to it. Both are loaded memory
+mapped, and the interpolation only reads the coefficients, so all the processes of a multiprocessing pool share one
+copy of them in memory.
+
+When the files in the cache directory add up to more than max_size, the least recently used tables are deleted together
+with their coefficients (see part_key), but never the table that is being loaded. The cache does not know about changes to the code of the torque functions, so clear it after changing them.
+
+>>> cache = LookupTableCache()
+>>> cubesat.create_aerodynamic_table(disturbance_torques.aerodynamic_torque, 101, 101, cache=cache)
+"""
+import numpy as np
+import hashlib
+import os
+
+
+class LookupTableCache:
+    def __init__(self, directory: str=None, max_size: float=100e6):
+        """
+        :param directory: directory the tables are saved in, created if it does not exist. Defaults to lut_cache in the
+        root of this project (next to orbit_pre_process.nc).
+        :param max_size: largest total size of the saved tables; bytes
+        """
+        if directory is None:
+            directory = os.path.join(os.path.dirname(__file__), '../lut_cache')
+        self._directory = directory
+        self._max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @staticmethod
+    def key(*parts):
+        """
+        Cache key made from the given parts (e.g. geometry hash, table type, function name and resolution)
+        """
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    @staticmethod
+    def part_key(key, *parts):
+        """
+        Cache key of something that belongs to the table of key (e.g. the coefficients of its interpolation), which is
+        only evicted together with the table
+        """
+        return '.'.join((key,) + tuple(str(part) for part in parts))
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + '.npy')
+
+    def load(self, key):
+        """
+        :param key: cache key
+        :return: the table (memory mapped and read only), or None if it is not in the cache
+        """
+        path = self._path(key)
+        try:
+            table = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError, OSError):  # not saved yet, or another process is still writing it
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return table
+
+    def save(self, key, table: np.ndarray):
+        """
+        Saves a table and deletes the least recently used tables if the cache has become too large. The file is written
+        under a temporary name and then renamed, so other processes never see half written tables.
+        :param key: cache key
+        :param table: the table to save
+        """
+        path = self._path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(table))
+        os.replace(temp_path, path)
+        self._evict(keep=key)
+
+    def get(self, key, build):
+        """
+        Loads a table from the cache, or builds and saves it if it is not there yet.
+        :param key: cache key
+        :param build: function with no arguments that calculates the table
+        :return: the table, memory mapped if possible
+        """
+        table = self.load(key)
+        if table is None:
+            table = build()
+            self.save(key, table)
+            saved = self.load(key)
+            if saved is not None:
+                table = saved
+        return table
+
+    def size(self):
+        """Total size of the saved tables; bytes"""
+        return sum(os.path.getsize(path) for path, _ in self._files())
+
+    def clear(self):
+        """Deletes all the saved tables"""
+        for path, _ in self._files():
+            _remove(path)
+
+    def _files(self):
+        files = []
+        for name in os.listdir(self._directory):
+            if name.endswith('.npy'):
+                path = os.path.join(self._directory, name)
+                try:
+                    files.append((path, os.stat(path)))
+                except FileNotFoundError:  # deleted by another process
+                    pass
+        return files
+
+    def _evict(self, keep=None):
+        # a table and its parts (see part_key) are one entry, which is used when any of its files is
+        entries = {}
+        for path, stat in self._files():
+            entries.setdefault(os.path.basename(path).split('.')[0], []).append((path, stat))
+        keep = None if keep is None else keep.split('.')[0]
+        total = sum(stat.st_size for files in entries.values() for _, stat in files)
+        for entry, files in sorted(entries.items(), key=lambda e: max(stat.st_mtime for _, stat in e[1])):
+            if total <= self._max_size:
+                break
+            if entry == keep:
+                continue
+            for path, stat in files:
+                _remove(path)  # memory mapped copies that are still open stay valid on posix systems
+                total -= stat.st_size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
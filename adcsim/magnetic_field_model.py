@@ -182,7 +182,7 @@ class GeoMag:
             alt *= 1e3
         elif location_format == 'cartesian' or location_format == 'inertial':
             if location_format == 'inertial':
-                location = icrf_to_fixed.icrf_to_fixed(time) @ location
+                location = self._icrf_to_fixed(time) @ location
             x, y, z = location[0], location[1], location[2]
             h = math.sqrt(x**2 + y**2)
             r = math.sqrt(x**2 + y**2 + z**2)
@@ -215,16 +215,200 @@ class GeoMag:
             bz = ct*br - st*bt
             b = np.array([bx, by, bz])
             if output_format == 'inertial':
-                return icrf_to_fixed.icrf_to_fixed(time).T @ b
+                return self._icrf_to_fixed(time).T @ b
             return b
         else:
             raise ValueError(f'Invalid output format \'{output_format}\'')
 
+    def _GeoMagSphericalArray(self, sintheta, costheta, sinphi, cosphi, r, decimal_year):
+        # same as _GeoMagSpherical, but every input is an array of length N and the calculation is done for all N
+        # points at once. The loops over degree and order are still there, but the work in them is on arrays.
+        dt = decimal_year - self.epoch
+
+        st = sintheta
+        ct = costheta
+        r = r * 1e-3
+        num = len(r)
+
+        sp = np.zeros((self.maxord + 1, num))
+        cp = np.zeros((self.maxord + 1, num))
+        cp[0] = 1.0
+        sp[1] = sinphi
+        cp[1] = cosphi
+        for m in range(2, self.maxord+1):
+            sp[m] = sp[1]*cp[m-1]+cp[1]*sp[m-1]
+            cp[m] = cp[1]*cp[m-1]-sp[1]*sp[m-1]
+
+        # unnormalized associated legendre polynomials and derivatives, p[m, n]
+        p = np.zeros((self.maxord + 1, self.maxord + 1, num))
+        dp = np.zeros((self.maxord + 1, self.maxord + 1, num))
+        p[0, 0] = 1.0
+        pp = np.zeros((self.maxord + 1, num))  # only used at the poles
+        pp[0] = 1.0
+
+        c = np.array(self.c)
+        cd = np.array(self.cd)
+
+        aor = self.re/r
+        ar = aor*aor
+        br = np.zeros(num)
+        bt = np.zeros(num)
+        bp = np.zeros(num)
+        bpp = np.zeros(num)
+        for n in range(1, self.maxord+1):
+            ar = ar*aor
+            for m in range(n + 1):
+                # compute unnormalized associated legendre polynomials and derivatives via recursion relations
+                if n == m:
+                    p[m, n] = st * p[m-1, n-1]
+                    dp[m, n] = st*dp[m-1, n-1]+ct*p[m-1, n-1]
+                elif n == 1 and m == 0:
+                    p[m, n] = ct*p[m, n-1]
+                    dp[m, n] = ct*dp[m, n-1]-st*p[m, n-1]
+                else:
+                    p[m, n] = ct*p[m, n-1]-self.k[m][n]*p[m, n-2]
+                    dp[m, n] = ct*dp[m, n-1] - st*p[m, n-1]-self.k[m][n]*dp[m, n-2]
+
+                # time adjust the gauss coefficients
+                tc_mn = c[m, n]+dt*cd[m, n]
+
+                # accumulate terms of the spherical harmonic expansions
+                par = ar*p[m, n]
+                if m == 0:
+                    temp1 = tc_mn*cp[m]
+                    temp2 = tc_mn*sp[m]
+                else:
+                    tc_nm = c[n, m-1]+dt*cd[n, m-1]
+                    temp1 = tc_mn*cp[m]+tc_nm*sp[m]
+                    temp2 = tc_mn*sp[m]-tc_nm*cp[m]
+
+                bt = bt-ar*temp1*dp[m, n]
+                bp = bp + (self.fm[m] * temp2 * par)
+                br = br + (self.fn[n] * temp1 * par)
+
+                # special case: north/south geographic poles
+                if m == 1:
+                    if n == 1:
+                        pp[n] = pp[n-1]
+                    else:
+                        pp[n] = ct*pp[n-1]-self.k[m][n]*pp[n-2]
+                    parp = ar*pp[n]
+                    bpp = bpp + (self.fm[m]*temp2*parp)
+
+        pole = st == 0.0
+        bp = np.where(pole, bpp, bp / np.where(pole, 1.0, st))
+
+        return br, bt, bp
+
+    def GeoMagArray(self, locations, times, location_format='geodetic', output_format='geodetic'):
+        """
+        Same as GeoMag, but for many locations (and times) at once. This is much faster per point than calling GeoMag
+        in a loop, e.g. for the whole orbit in pre_process_orbit.py.
+
+        Parameters
+        ----------
+        locations : np.ndarray
+            Array of shape (N, 3), each row interpreted like the location argument of GeoMag.
+        times : datetime.datetime or sequence of datetime.datetime or np.ndarray of np.datetime64
+            The date of each location (length N), or a single date used for all of them.
+        location_format : str
+            Same as GeoMag.
+        output_format : str
+            Same as GeoMag.
+
+        Returns
+        -------
+        np.ndarray of shape (N, 3)
+        """
+        locations = np.asarray(locations, dtype=float)
+        num = len(locations)
+        if isinstance(times, (datetime.datetime, datetime.date)):
+            times = [times] * num
+        times = np.array([t.replace(tzinfo=None) if isinstance(t, datetime.datetime) else t for t in times],
+                         dtype='datetime64[us]')
+        years = times.astype('datetime64[Y]')
+        day_of_year = (times.astype('datetime64[D]') - years.astype('datetime64[D]')).astype(float) + 1
+        decimal_year = years.astype(float) + 1970 + day_of_year/365.0
+
+        # convert location to spherical coordinates
+        if location_format == 'geodetic':
+            lat, lon, alt = np.deg2rad(locations[:, 0]), np.deg2rad(locations[:, 1]), locations[:, 2] * 1e-3
+            slon = np.sin(lon)
+            slat = np.sin(lat)
+            clon = np.cos(lon)
+            clat = np.cos(lat)
+            slat2 = slat*slat
+            clat2 = clat*clat
+            q = np.sqrt(self.a2-self.c2*slat2)
+            q1 = alt*q
+            q2 = ((q1+self.a2)/(q1+self.b2))*((q1+self.a2)/(q1+self.b2))
+            ct = slat/np.sqrt(q2*clat2+slat2)
+            st = np.sqrt(1.0-(ct*ct))
+            r2 = (alt*alt)+2.0*q1+(self.a4-self.c4*slat2)/(q*q)
+            r = np.sqrt(r2)
+            sp = slon
+            cp = clon
+
+            d = np.sqrt(self.a2*clat2+self.b2*slat2)
+            ca = (alt+d)/r
+            sa = self.c2*clat*slat/(r*d)
+
+            # convert back to meters
+            r = r * 1e3
+        elif location_format == 'cartesian' or location_format == 'inertial':
+            if location_format == 'inertial':
+                locations = np.einsum('nij,nj->ni', self._icrf_to_fixed_array(times), locations)
+            x, y, z = locations[:, 0], locations[:, 1], locations[:, 2]
+            h = np.sqrt(x**2 + y**2)
+            r = np.sqrt(x**2 + y**2 + z**2)
+            sp = y / h
+            cp = x / h
+            st = h / r
+            ct = z / r
+        else:
+            raise ValueError(f'Invalid location format \'{location_format}\'')
+
+        br, bt, bp = self._GeoMagSphericalArray(st, ct, sp, cp, r, decimal_year)
+
+        # convert magnetic field from spherical coordinates to output_format
+        if output_format == 'geodetic' or output_format == 'compass':
+            if location_format != 'geodetic':
+                raise ValueError('At this time, a geodetic location must be specified to get geodetic or compass output')
+            bnorth = -bt*ca-br*sa
+            beast = bp
+            bdown = bt*sa-br*ca
+            if output_format == 'compass':
+                bh = np.sqrt((bnorth*bnorth)+(beast*beast))
+                ti = np.sqrt((bh*bh)+(bdown*bdown))
+                dec = np.rad2deg(np.arctan2(beast, bnorth))
+                dip = np.rad2deg(np.arctan2(bdown, bh))
+                return np.stack((dec, dip, ti), axis=1)
+            return np.stack((bnorth, beast, bdown), axis=1)
+        elif output_format == 'cartesian' or output_format == 'inertial':
+            bx = cp*st*br + cp*ct*bt - sp*bp
+            by = sp*st*br + sp*ct*bt + cp*bp
+            bz = ct*br - st*bt
+            b = np.stack((bx, by, bz), axis=1)
+            if output_format == 'inertial':
+                return np.einsum('nji,nj->ni', self._icrf_to_fixed_array(times), b)
+            return b
+        else:
+            raise ValueError(f'Invalid output format \'{output_format}\'')
+
+    def _icrf_to_fixed_array(self, times):
+        # rotation matrices of all the times, shape (N, 3, 3)
+        epoch = times[0].astype(datetime.datetime)
+        seconds = (times - times[0]).astype('timedelta64[us]').astype(float) * 1e-6
+        return self._icrf_to_fixed(epoch, seconds)
+
     def __init__(self, wmm_filename=None):
         if wmm_filename is None:
             wmm_filename = os.path.join(os.path.dirname(__file__), 'WMM_2015_v2.COF')
         print(wmm_filename)
 
+        # rotation between the inertial and earth fixed frames, with cached precession-nutation terms and matrices
+        self._icrf_to_fixed = icrf_to_fixed.IcrfToFixed()
+
         wmm=[]
         with open(wmm_filename) as wmm_file:
             for line in wmm_file:
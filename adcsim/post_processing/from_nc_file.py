@@ -8,6 +8,7 @@ from adcsim.CubeSat_model import CubeSat
 from adcsim.CubeSat_model_examples import CubeSatModel
 from adcsim.hysteresis_rod import HysteresisRod
 from adcsim.animation import AnimateAttitude, DrawingVectors, AdditionalPlots
+import adcsim.attitude_output  # noqa: F401 the data.attitude accessor, which works whichever way the attitude was saved
 import os
 ####################################
 in_file = '../../sim1.nc'  # name and location of input .nc file; default is '../../run0.c'
@@ -79,7 +80,7 @@ plt.legend()
 
 # Calculate angles between body axis and magnetic field
 mag_angles = np.zeros((le, 3))
-dcm_bn = data.dcm_bn.values
+dcm_bn = data.attitude.dcm_bn.values
 mag = data.mag.values
 
 if sim_params['save_every'] == 1:
@@ -101,12 +102,12 @@ if display_animation:
     vec1 = DrawingVectors(data.nadir.values[start:end:num], 'single', color='b', label='nadir', length=0.5)
     vec3 = DrawingVectors(data.velocities.values[start:end:num], 'single', color='g', label='velocity', length=0.5)
     vec4 = DrawingVectors(data.mag.values[start:end:num], 'single', color='r', label='magnetic field', length=0.5)
-    ref1 = DrawingVectors(data.dcm_bn.values[start:end:num], 'axes', color=['C0', 'C1', 'C2'], label=['Body x', 'Body y', 'Body z'], length=0.2)
-    ref2 = DrawingVectors(data.dcm_bo.values[start:end:num], 'axes', color=['C0', 'C1', 'C2'], label=['Body x', 'Body y', 'Body z'], length=0.2)
+    ref1 = DrawingVectors(dcm_bn[start:end:num], 'axes', color=['C0', 'C1', 'C2'], label=['Body x', 'Body y', 'Body z'], length=0.2)
+    ref2 = DrawingVectors(data.attitude.dcm_bo.values[start:end:num], 'axes', color=['C0', 'C1', 'C2'], label=['Body x', 'Body y', 'Body z'], length=0.2)
     plot1 = AdditionalPlots(time[start:end:num], data.controls.values[start:end:num], labels=['X', 'Y', 'Z'])
     plot2 = AdditionalPlots(data.lons.values[start:end:num], data.lats.values[start:end:num], groundtrack=True)
     plot3 = AdditionalPlots(data.hyst_rod_external_field.values[:, 1][start:end:num], data.hyst_rod_magnetization.values[:, 1][start:end:num], hyst_curve=rods[1])
-    a = AnimateAttitude(data.dcm_bn.values[start:end:num], draw_vector=[ref1, vec4, vec1], additional_plots=[plot2, plot3],
+    a = AnimateAttitude(dcm_bn[start:end:num], draw_vector=[ref1, vec4, vec1], additional_plots=[plot2, plot3],
                         cubesat_model=cubesat)
     a.animate_and_plot()
 
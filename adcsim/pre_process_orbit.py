@@ -9,12 +9,20 @@ The time_step you can use for this script also does not need to be as short as i
 10 second time step is fine, but it could probably be even shorter.
 
 In the simulations this data is always interpolated.
+
+The orbit, sub point, sun vector, magnetic field and atmospheric density are calculated for large chunks of time at
+once (skyfield and astropy both take arrays of times, and see GeoMag.GeoMagArray and
+AirDensityModel.air_mass_density_array), which is a lot faster than one time at a time. The pre_process_orbit function
+can also be imported to make a file for a different TLE, e.g.
+
+>>> from adcsim.pre_process_orbit import pre_process_orbit
+>>> data = pre_process_orbit(line1, line2, datetime(2019, 3, 24, 18, 35, 1), duration=86400, file_name='orbit.nc')
 """
 import numpy as np
 from skyfield.api import load, EarthSatellite, utc
 from astropy.coordinates import get_sun
 from astropy.time import Time
-from datetime import datetime, timedelta
+from datetime import datetime
 from adcsim.atmospheric_density import AirDensityModel
 from adcsim.magnetic_field_model import GeoMag
 from tqdm import tqdm
@@ -22,99 +30,83 @@ import astropy.units as u
 import xarray as xr
 import os
 
-# declare time step for integration
-time_step = 10
-end_time = 3000000
-time = np.arange(0, end_time, time_step)
-
-# create atmospheric density model
-air_density = AirDensityModel()
-
-# create magnetic field model
-geomag = GeoMag()
-
-# declare memory
-sun_vec = np.zeros((len(time), 3))
-lons = np.zeros(len(time))
-lats = np.zeros(len(time))
-alts = np.zeros(len(time))
-positions = np.zeros((len(time), 3))
-velocities = np.zeros((len(time), 3))
-density = np.zeros(len(time))
-mag_field = np.zeros((len(time), 3))
-
-# declare all orbit stuff
-line1 = '1 44031U 98067PX  19083.14584174  .00005852  00000-0  94382-4 0  9997'
-line2 = '2 44031  51.6393  63.5548 0003193 165.0023 195.1063 15.54481029  8074'
-satellite = EarthSatellite(line1, line2)
-ts = load.timescale()
-time_track = datetime(2019, 3, 24, 18, 35, 1, tzinfo=utc)
-time_tracks = [datetime(2019, 3, 24, 18, 35, 1, tzinfo=utc) + timedelta(seconds=time_step*i) for i in range(len(time))]
-t = ts.utc(time_track)
-geo = satellite.at(t)
-subpoint = geo.subpoint()
-
-# declare initial conditions
-positions[0] = geo.position.m
-velocities[0] = geo.velocity.km_per_s * 1000
-lons[0] = subpoint.longitude.degrees
-lats[0] = subpoint.latitude.degrees
-alts[0] = subpoint.elevation.m
-
-# get initial b field so that hysteresis rods can be initialized properly
-mag_field[0] = geomag.GeoMag(np.array([lats[0], lons[0], alts[0]]), time_track, output_format='inertial')
-
-# the integration
-for i in tqdm(range(len(time) - 1)):
-    # get magnetic field in inertial frame (for show right now)
-    mag_field[i] = geomag.GeoMag(np.array([lats[i], lons[i], alts[i]]), time_tracks[i], output_format='inertial')
-
-    # get sun vector in inertial frame (GCRS) (for solar pressure torque)
-    sun_obj = get_sun(Time(time_tracks[i])).cartesian.xyz
-    sun_vec[i] = sun_obj.to(u.meter).value
-
-    # get atmospheric density and velocity vector in body frame (for aerodynamic torque)
-    density[i] = air_density.air_mass_density(date=time_tracks[i], alt=alts[i]/1000, g_lat=lats[i], g_long=lons[i])
-
-    # propagate orbit
-    t = ts.utc(time_tracks[i])
-    geo = satellite.at(t)
-    positions[i+1] = geo.position.m
-    velocities[i+1] = geo.velocity.km_per_s * 1000
-    subpoint = geo.subpoint()
-    lons[i+1] = subpoint.longitude.degrees
-    lats[i+1] = subpoint.latitude.degrees
-    alts[i+1] = subpoint.elevation.m
-
-mag_field[i+1] = geomag.GeoMag(np.array([lats[i+1], lons[i+1], alts[i+1]]), time_tracks[i+1], output_format='inertial')
-sun_obj = get_sun(Time(time_tracks[i+1])).cartesian.xyz
-sun_vec[i+1] = sun_obj.to(u.meter).value
-density[i+1] = air_density.air_mass_density(date=time_tracks[i+1], alt=alts[i+1]/1000, g_lat=lats[i+1], g_long=lons[i+1])
-
-# import matplotlib.pyplot as plt
-#
-#
-# def _plot(data, title='', ylabel=''):
-#     plt.figure()
-#     plt.plot(time, data)
-#     plt.title(title)
-#     plt.xlabel('Time (s)')
-#     plt.ylabel(ylabel)
-#
-#
-# _plot(mag_field)
-# _plot(sun_vec)
-# _plot(density)
-# _plot(positions)
-# _plot(velocities)
-# _plot(lons)
-# _plot(lats)
-# _plot(alts)
-
-
-a = xr.Dataset({'sun': (['time', 'cord'], sun_vec),
-                'mag': (['time', 'cord'], mag_field), 'atmos': ('time', density), 'lons': ('time', lons),
-                'lats': ('time', lats), 'alts': ('time', alts), 'positions': (['time', 'cord'], positions),
-                'velocities': (['time', 'cord'], velocities)},
-               coords={'time': time_tracks, 'cord': ['x', 'y', 'z']})
-a.to_netcdf(os.path.join(os.path.dirname(__file__), '../orbit_pre_process.nc'))
+
+def pre_process_orbit(line1, line2, start_time, duration, time_step=10, chunk_size=10000, file_name=None):
+    """
+    Calculates the orbit and environment (sun vector, magnetic field and atmospheric density) of a satellite on a uniform
+    time grid, in the format the simulations load.
+    :param line1: first line of the Two Line Element of the satellite
+    :param line2: second line of the Two Line Element of the satellite
+    :param start_time: datetime of the first data point (UTC), or a string formatted like '2019/03/24 18:35:01'
+    :param duration: length of time covered; seconds
+    :param time_step: time between data points; seconds
+    :param chunk_size: number of data points that are propagated in each vectorized call
+    :param file_name: if given, the data is saved to this netcdf file
+    :return: xr.Dataset
+    """
+    if isinstance(start_time, str):
+        start_time = datetime.strptime(start_time, "%Y/%m/%d %H:%M:%S")
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=utc)
+
+    time = np.arange(0, duration, time_step)
+    time_tracks = np.datetime64(start_time.replace(tzinfo=None)) + (time * 1e9).astype('timedelta64[ns]')
+
+    # declare memory
+    sun_vec = np.zeros((len(time), 3))
+    lons = np.zeros(len(time))
+    lats = np.zeros(len(time))
+    alts = np.zeros(len(time))
+    positions = np.zeros((len(time), 3))
+    velocities = np.zeros((len(time), 3))
+    density = np.zeros(len(time))
+    mag_field = np.zeros((len(time), 3))
+
+    satellite = EarthSatellite(line1, line2)
+    ts = load.timescale()
+
+    # create magnetic field model
+    geomag = GeoMag()
+
+    # create atmospheric density model
+    air_density = AirDensityModel()
+
+    # propagate the orbit, get the sun vector in inertial frame (GCRS) (for solar pressure torque) and the magnetic field
+    for start in tqdm(range(0, len(time), chunk_size)):
+        chunk = slice(start, start + chunk_size)
+        t = ts.utc(start_time.year, start_time.month, start_time.day, start_time.hour, start_time.minute,
+                   start_time.second + start_time.microsecond * 1e-6 + time[chunk])
+        geo = satellite.at(t)
+        positions[chunk] = geo.position.m.T
+        velocities[chunk] = geo.velocity.km_per_s.T * 1000
+        subpoint = geo.subpoint()
+        lons[chunk] = subpoint.longitude.degrees
+        lats[chunk] = subpoint.latitude.degrees
+        alts[chunk] = subpoint.elevation.m
+
+        sun_vec[chunk] = get_sun(Time(time_tracks[chunk], scale='utc')).cartesian.xyz.to(u.meter).value.T
+
+        # get magnetic field in inertial frame
+        mag_field[chunk] = geomag.GeoMagArray(np.stack((lats[chunk], lons[chunk], alts[chunk]), axis=1),
+                                              time_tracks[chunk], output_format='inertial')
+
+        # get atmospheric density (for aerodynamic torque)
+        density[chunk] = air_density.air_mass_density_array(time_tracks[chunk], alts[chunk]/1000, lats[chunk],
+                                                            lons[chunk])
+
+    a = xr.Dataset({'sun': (['time', 'cord'], sun_vec),
+                    'mag': (['time', 'cord'], mag_field), 'atmos': ('time', density), 'lons': ('time', lons),
+                    'lats': ('time', lats), 'alts': ('time', alts), 'positions': (['time', 'cord'], positions),
+                    'velocities': (['time', 'cord'], velocities)},
+                   coords={'time': time_tracks, 'cord': ['x', 'y', 'z']})
+    if file_name is not None:
+        a.to_netcdf(file_name)
+    return a
+
+
+if __name__ == "__main__":
+    # the TLE used for all of our simulations so far
+    line1 = '1 44031U 98067PX  19083.14584174  .00005852  00000-0  94382-4 0  9997'
+    line2 = '2 44031  51.6393  63.5548 0003193 165.0023 195.1063 15.54481029  8074'
+    pre_process_orbit(line1, line2, datetime(2019, 3, 24, 18, 35, 1, tzinfo=utc), duration=3000000, time_step=10,
+                      file_name=os.path.join(os.path.dirname(__file__), '../orbit_pre_process.nc'))
@@ -0,0 +1,232 @@
+"""
+Streaming output of the simulations.
+
+The simulations used to keep every saved data point in memory and build one xr.Dataset at the end, so the memory a run
+needed grew with its duration, and a crash lost all of it. The Recorder only keeps chunk_size saved rows in memory.
+When they are full they are appended to a netcdf file along its unlimited 'time' dimension, so memory stays bounded no
+matter how long the run is, and a crash only loses the rows since the last chunk.
+
+The file is only open while a chunk is being written, so it can be read with xr.open_dataset during the run (it then
+has all the complete chunks so far) and after it. Load what you need and close it again while the simulation is
+running, e.g.
+
+>>> with xr.open_dataset('sim1.nc') as data:
+>>>     omega = data.angular_vel.values
+
+HDF5 locks the files that are open, so if the file is still open somewhere else when a chunk is due, the chunk stays in
+memory (with a warning) and is written together with the next one.
+
+A Recorder can also carry on with a file that already has rows in it (resume_rows), which is how the simulations
+resume from a checkpoint (see checkpoint.py). The rows after resume_rows are overwritten as the new rows come in.
+
+Without a file name the chunks are kept in memory and dataset() puts them together, which is what the simulations do
+with save=False.
+
+Each variable can be saved with its own dtype and compression (the same encoding keys as xarray uses for netcdf4 files),
+e.g. encoding={'dcm_bn': {'dtype': 'f4', 'zlib': True, 'shuffle': True}}. The default is float64 without compression.
+"""
+import numpy as np
+import xarray as xr
+import netCDF4
+import warnings
+import time
+
+
+class Recorder:
+    _encoding_keys = ('dtype', 'zlib', 'complevel', 'shuffle')
+
+    def __init__(self, file_name, variables: dict, coords: dict, attrs: dict=None, chunk_size: int=10000,
+                 encoding: dict=None, resume_rows: int=None, first_row: int=0):
+        """
+        :param file_name: netcdf file the rows are appended to (it is overwritten), or None to keep them in memory
+        :param variables: {name: dims} of the recorded variables, e.g. {'angular_vel': ('time', 'cord')}. One of the
+        dims of every variable is 'time', the others must be in coords.
+        :param coords: {dim: values} of all the dimensions except 'time'. 'time' is the index of the saved row.
+        :param attrs: attributes of the dataset
+        :param chunk_size: number of saved rows that are kept in memory before they are written
+        :param encoding: {name: {'dtype': ..., 'zlib': ..., 'complevel': ..., 'shuffle': ...}} of any of the variables.
+        The encoding under 'default' is used for all the variables that are not in here.
+        :param resume_rows: if given, the file already exists and the rows are appended after its first resume_rows rows
+        instead of creating a new file. Its attributes are replaced with attrs.
+        :param first_row: 'time' of the first row, for data that carries on from another file (see sim.fork_sim)
+        """
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+        self.first_row = first_row
+        self._variables = {name: tuple(dims) for name, dims in variables.items()}
+        self._coords = {dim: np.asarray(values) for dim, values in coords.items()}
+        self._attrs = dict(attrs or {})
+        self._encoding = {}
+        encoding = dict(encoding or {})
+        default = encoding.pop('default', {})
+        for name, settings in encoding.items():
+            if name not in self._variables:
+                raise ValueError(f'Encoding given for {name}, which is not recorded')
+        for name in self._variables:
+            settings = dict(default, **encoding.get(name, {}))
+            unknown = set(settings) - set(self._encoding_keys)
+            if unknown:
+                raise ValueError(f'Unknown encoding {sorted(unknown)} of {name}, use {self._encoding_keys}')
+            settings['dtype'] = np.dtype(settings.get('dtype', 'f8'))
+            self._encoding[name] = settings
+        # the rows of each variable, with time as the first axis, are buffered in memory before they are written
+        self._buffers = {name: np.zeros((chunk_size,) + tuple(len(self._coords[d]) for d in dims if d != 'time'))
+                         for name, dims in self._variables.items()}
+        self._buffers['time'] = np.zeros(chunk_size, dtype=int)
+        self._n = 0  # rows in the buffers
+        self._count = 0  # rows recorded
+        self._written = 0  # rows written to the file (or kept in memory)
+        self._chunks = []  # the written chunks of each variable when there is no file
+        self._pending = []  # chunks that could not be written to the file yet
+        if file_name is not None:
+            if resume_rows is None:
+                self._create()
+            else:
+                self._reopen(resume_rows)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, name):
+        return name in self._variables
+
+    def _create(self):
+        with netCDF4.Dataset(self.file_name, 'w') as f:
+            f.setncatts(self._attrs)
+            f.createDimension('time', None)
+            f.createVariable('time', 'i8', ('time',))
+            for dim, values in self._coords.items():
+                f.createDimension(dim, len(values))
+                if values.dtype.kind in 'US':
+                    f.createVariable(dim, str, (dim,))[:] = values.astype(object)
+                else:
+                    f.createVariable(dim, values.dtype, (dim,))[:] = values
+            for name, dims in self._variables.items():
+                encoding = self._encoding[name]
+                # chunks of up to about 1 MB along time, reading a few rows or a whole variable are both fast
+                row_size = encoding['dtype'].itemsize * max(self._buffers[name][0].size, 1)
+                chunks = [len(self._coords[d]) if d != 'time' else max(1, min(self.chunk_size, 2**20 // row_size))
+                          for d in dims]
+                f.createVariable(name, encoding['dtype'], dims, zlib=encoding.get('zlib', False),
+                                 complevel=encoding.get('complevel', 4), shuffle=encoding.get('shuffle', True),
+                                 chunksizes=chunks, fill_value=False)
+
+    def _reopen(self, rows, retries: int=60):
+        # the same as when a chunk is written, the file can still be open somewhere else for a while
+        for attempt in range(retries + 1):
+            try:
+                f = netCDF4.Dataset(self.file_name, 'a')
+                break
+            except OSError as e:
+                if attempt == retries:
+                    raise OSError(f'Could not open {self.file_name} to carry on with it ({e}). Is the file still open '
+                                  f'somewhere else, e.g. the dataset of the run?') from e
+                if not attempt:
+                    warnings.warn(f'Could not open {self.file_name} ({e}), trying again for {retries} s. Is the file '
+                                  f'still open somewhere else?')
+                time.sleep(1)
+        with f:
+            missing = [name for name in self._variables if name not in f.variables]
+            if missing:
+                raise ValueError(f'{self.file_name} does not have the variables {missing}')
+            if len(f.dimensions['time']) < rows:
+                raise ValueError(f'{self.file_name} has {len(f.dimensions["time"])} rows, not {rows}')
+            for name in f.ncattrs():
+                f.delncattr(name)
+            f.setncatts(self._attrs)
+        self._count = self._written = rows
+
+    def append(self, values: dict):
+        """
+        Records one saved row.
+        :param values: {name: value} of the row. Variables that are not given are 0 in this row, and values of
+        variables that are not recorded are ignored.
+        """
+        n = self._n
+        buffers = self._buffers
+        for name, value in values.items():
+            if name in buffers:
+                buffers[name][n] = value
+        self._buffers['time'][n] = self.first_row + self._count
+        self._n = n + 1
+        self._count += 1
+        if self._n == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows"""
+        n = self._n
+        if not n:
+            return
+        chunk = {name: buffer[:n].copy() for name, buffer in self._buffers.items()}
+        for buffer in self._buffers.values():
+            buffer[:n] = 0
+        self._n = 0
+        if self.file_name is None:
+            self._chunks.append(chunk)
+            self._written += n
+        else:
+            self._pending.append(chunk)
+            self._write_pending()
+
+    def _write_pending(self):
+        try:
+            with netCDF4.Dataset(self.file_name, 'a') as f:
+                while self._pending:
+                    chunk = self._pending[0]
+                    start = self._written
+                    n = len(chunk['time'])
+                    f['time'][start:start + n] = chunk['time']
+                    for name, dims in self._variables.items():
+                        axis = dims.index('time')
+                        index = (slice(None),) * axis + (slice(start, start + n),)
+                        f[name][index] = np.moveaxis(chunk[name], 0, axis)
+                    self._pending.pop(0)
+                    self._written = start + n
+        except OSError as e:
+            # most likely someone has the file open (HDF5 locks it). Don't lose the run over it, try again next time
+            warnings.warn(f'Could not write to {self.file_name} ({e}), the rows are kept in memory until it can be '
+                          f'written. Is the file still open somewhere else?')
+
+    def sync(self):
+        """
+        Writes the buffered rows, and any rows that could not be written before.
+        :return: whether all the recorded rows are in the file now
+        """
+        if self._n:
+            self.flush()
+        elif self._pending:
+            self._write_pending()
+        return not self._pending
+
+    def close(self, retries: int=60):
+        """
+        Writes the rows that are still buffered.
+        :param retries: if the file can't be written, the number of times to try again (once a second) before giving up
+        """
+        self.flush()
+        for _ in range(retries):
+            if not self._pending:
+                break
+            time.sleep(1)
+            self._write_pending()
+        if self._pending:
+            raise OSError(f'Could not write the last {len(self) - self._written} rows to {self.file_name}')
+
+    def dataset(self):
+        """
+        :return: xr.Dataset of everything recorded so far. It is opened from the file (lazily loaded, close it when you
+        are done with it) if there is one.
+        """
+        self.flush()
+        if self.file_name is not None:
+            return xr.open_dataset(self.file_name)
+        data = {}
+        for name, dims in self._variables.items():
+            rows = np.concatenate([chunk[name] for chunk in self._chunks]) if self._chunks else self._buffers[name][:0]
+            data[name] = (dims, np.moveaxis(rows, 0, dims.index('time')).astype(self._encoding[name]['dtype']))
+        coords = dict(self._coords, time=np.arange(self.first_row, self.first_row + self._written))
+        dataset = xr.Dataset(data, coords=coords, attrs=self._attrs)
+        for name in self._variables:
+            dataset[name].encoding.update(self._encoding[name])  # kept if the dataset is saved with to_netcdf
+        return dataset
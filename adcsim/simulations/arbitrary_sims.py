@@ -1,21 +1,19 @@
-from adcsim.simulations.sim import sim_attitude
+from adcsim.simulations.sweep import run_sweep
 import numpy as np
 from adcsim.hysteresis_rod import HysteresisRod
 from adcsim.CubeSat_model_examples import CubeSatModel
-from multiprocessing import Pool
-import os
-import copy
 
 
 # create initial simulation parameters dict
 sim_params = {
     'time_step': 0.01,
     'save_every': 10,
-    'end_time_index': 5000,
+    'duration': 50,
     'start_time': '2019/03/24 18:35:01',
-    'final_time': '2019/03/24 18:35:51',
     'omega0_body': np.array([-2, 3, 3.5]),
-    'sigma0': [0.6440095705520482, 0.39840861883760637, 0.18585931442943798]
+    'sigma0': [0.6440095705520482, 0.39840861883760637, 0.18585931442943798],
+    'disturbance_torques': ['gravity', 'magnetic', 'hysteresis', 'aerodynamic', 'solar'],
+    'calculate_power': False
 }
 
 # create inital cubesat parameters dict (the raw data is way to large to do manually like above)
@@ -27,31 +25,18 @@ cubesat_params = cubesat.asdict()
 
 
 # USING MULTIPLE CORES
+# Each run changes the parameters of the axes below to the next value in their lists ('list' mode, see sweep.py). All
+# the runs are saved to one file with a 'run' dimension, and the values of the axes as coordinates.
 if __name__ == "__main__":
-    pool = Pool(os.cpu_count())  # the number of cores differ on different computers
-
-    cp = []
-
-    # First simulation (parameters what is shown above)
-    cp.append([copy.deepcopy(sim_params), copy.deepcopy(cubesat_params), 'first'])
-
-    # Second simulation (alter the parameters as desired before appending it to cp)
-    cubesat_params['hyst_rods'][0]['axes_alignment'] = np.array([0, 0, 1.0])
-    cubesat_params['magnetic_moment'] = np.array([1.5, 0, 0])
-    cp.append([copy.deepcopy(sim_params), copy.deepcopy(cubesat_params), 'second'])
-
-    # Third simulation (alter the parameters as desired before appending it to cp)
-    sim_params['omega0_body'] = [0, -0.06666, 0]
-    cp.append([copy.deepcopy(sim_params), copy.deepcopy(cubesat_params), 'third'])
-
-    # Second simulation (alter the parameters as desired before appending it to cp)
-    cubesat_params['hyst_rods'][0]['axes_alignment'] = np.array([1.0, 0, 0])
-    cubesat_params['magnetic_moment'] = np.array([0, 0, 1.5])
-    cp.append([copy.deepcopy(sim_params), copy.deepcopy(cubesat_params), 'fourth'])
-
-    # ...
-    # ...
-    # ...
-    # Infinity simulation
-
-    pool.starmap(sim_attitude, cp)
+    config = {
+        'sim_params': sim_params,
+        'cubesat_params': cubesat_params,
+        'mode': 'list',
+        'axes': {
+            'rod0_axes': ('cubesat_params.hyst_rods.0.axes_alignment',
+                          [[1.0, 0, 0], [0, 0, 1.0], [0, 0, 1.0], [1.0, 0, 0]]),
+            'magnetic_moment': ('cubesat_params.magnetic_moment', [[0, 0, 1.5], [1.5, 0, 0], [1.5, 0, 0], [0, 0, 1.5]]),
+            'omega0_body': ('sim_params.omega0_body', [[-2, 3, 3.5], [-2, 3, 3.5], [0, -0.06666, 0], [0, -0.06666, 0]])
+        }
+    }
+    run_sweep(config, 'arbitrary_sims')
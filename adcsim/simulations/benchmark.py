@@ -0,0 +1,179 @@
+"""
+Timing of the integration loop of sim_attitude. This does not need the pre-processed orbit file, a simple circular orbit
+with a dipole magnetic field is made up instead. The numbers are only meant to be compared between versions of the code
+on the same computer.
+
+The functions called in every state_dot_mrp evaluation write into arrays that are kept between calls (their out
+argument). time_preallocated_kernels times each of them with and without out, so what the preallocated buffers save
+per step can be checked against the step time. time_ensemble compares a sim_attitude_ensemble run with running
+sim_attitude once for each member.
+
+run with:
+$ python adcsim/simulations/benchmark.py
+"""
+import numpy as np
+import xarray as xr
+import os
+import tempfile
+import time as tim
+import timeit
+from adcsim import disturbance_torques as dt, integrators as it, state_propagations as st, \
+    integral_considerations as ic, transformations as tr, util as ut
+from adcsim.containers import AttitudeData, OrbitData, PresampledOrbitData
+from adcsim.CubeSat_model_examples import CubeSatModel
+from adcsim.hysteresis_rod import HysteresisRod
+from adcsim.simulations.sim import sim_attitude, sim_attitude_ensemble
+
+
+def synthetic_orbit_dataset(duration=20000, time_step=10.0, start_time='2019-03-24T18:35:01'):
+    """
+    Makes a dataset with the same layout as the one created by pre_process_orbit.py, for a circular orbit at ISS
+    altitude and inclination, a dipole magnetic field and a fixed sun direction.
+    """
+    t = np.arange(0, duration, time_step)
+    w = 2 * np.pi / 5550
+    r = 6.78e6
+    inc = np.deg2rad(51.6)
+    positions = r * np.stack([np.cos(w*t), np.sin(w*t)*np.cos(inc), np.sin(w*t)*np.sin(inc)], axis=1)
+    velocities = r * w * np.stack([-np.sin(w*t), np.cos(w*t)*np.cos(inc), np.cos(w*t)*np.sin(inc)], axis=1)
+    m = np.array([0, 0, -8e15])
+    rn = np.linalg.norm(positions, axis=1)[:, None]
+    rh = positions / rn
+    mag_field = 1e-7 * (3 * rh * (rh @ m)[:, None] - m) / rn**3 * 1e9  # nT
+    sun_vec = np.tile([1.4e11, 3e10, 1e10], (len(t), 1)).astype(float)
+    times = np.datetime64(start_time) + (t * 1e9).astype('timedelta64[ns]')
+    return xr.Dataset({'sun': (['time', 'cord'], sun_vec),
+                       'mag': (['time', 'cord'], mag_field),
+                       'atmos': ('time', 1e-12 * (1 + 0.3 * np.sin(w * t))),
+                       'lons': ('time', np.rad2deg(np.arctan2(positions[:, 1], positions[:, 0]))),
+                       'lats': ('time', np.rad2deg(np.arcsin(positions[:, 2] / r))),
+                       'alts': ('time', rn[:, 0] - 6.378e6),
+                       'positions': (['time', 'cord'], positions),
+                       'velocities': (['time', 'cord'], velocities)},
+                      coords={'time': times, 'cord': ['x', 'y', 'z']})
+
+
+def benchmark_sim_params(duration=60.0):
+    return {
+        'time_step': 0.1,
+        'save_every': 10,
+        'duration': duration,
+        'start_time': '2019/03/24 18:35:01',
+        'omega0_body': (np.pi / 180) * np.array([-2, 3, 3.5]),
+        'sigma0': [0.6440095705520482, 0.39840861883760637, 0.18585931442943798],
+        'disturbance_torques': ['gravity', 'magnetic', 'hysteresis', 'aerodynamic', 'solar'],
+        'calculate_power': False
+    }
+
+
+def benchmark_cubesat():
+    rod1 = HysteresisRod(br=0.35, bs=0.73, hc=1.59, volume=0.075/(100**3), axes_alignment=np.array([1.0, 0, 0]))
+    rod2 = HysteresisRod(br=0.35, bs=0.73, hc=1.59, volume=0.075/(100**3), axes_alignment=np.array([0, 1.0, 0]))
+    return CubeSatModel(inertia=np.diag([8*(10**-3), 8*(10**-3), 2*(10**-3)]), magnetic_moment=np.array([0, 0, 1.5]),
+                        hyst_rods=[rod1, rod2])
+
+
+def time_integration_steps(num_steps=500, repeat=10):
+    """
+    Times the rk4 integration loop of sim_attitude (everything but the saving of data, the quantities that are only
+    saved are calculated on the save_every steps like in sim_attitude).
+    :return: best per step wall time in seconds
+    """
+    sim_params = benchmark_sim_params(duration=num_steps * 0.1 + 1)
+    orbit = OrbitData(sim_params, synthetic_orbit_dataset())
+    time = np.arange(0, sim_params['duration'], sim_params['time_step'])
+    orbit = PresampledOrbitData(orbit, time, sim_params['time_step'])
+    cubesat = benchmark_cubesat()
+    attitude = AttitudeData(cubesat)
+    disturbance_torques = dt.DisturbanceTorques(**{torque: True for torque in sim_params['disturbance_torques']},
+                                                power=sim_params['calculate_power'])
+    cubesat.create_aerodynamic_table(disturbance_torques.aerodynamic_torque)
+    cubesat.create_solar_table(disturbance_torques.solar_pressure)
+    time_step = sim_params['time_step']
+    save_every = sim_params['save_every']
+
+    best = np.inf
+    for _ in range(repeat):
+        cubesat.rod_bank.initialize(np.zeros(len(cubesat.rod_bank)))
+        state = np.concatenate((sim_params['sigma0'], sim_params['omega0_body'], cubesat.rod_bank.b))
+        start = tim.perf_counter()
+        for i in range(num_steps):
+            disturbance_torques.save_torques = not (i + 1) % save_every
+            state = it.rk4(st.state_dot_mrp, time[i], state, time_step, attitude, orbit, cubesat,
+                           disturbance_torques)
+            state = ic.mrp_switching(state)
+        best = min(best, (tim.perf_counter() - start) / num_steps)
+    return best
+
+
+def time_preallocated_kernels(number=20000, repeat=5):
+    """
+    Times the functions that state_dot_mrp calls with a preallocated out array against the same calls that make a new
+    array (out=None, which is what they all did before).
+    :return: dict of name: (best wall time per call without out, with out) in seconds
+    """
+    sim_params = benchmark_sim_params()
+    orbit = OrbitData(sim_params, synthetic_orbit_dataset())
+    cubesat = benchmark_cubesat()
+    disturbance_torques = dt.DisturbanceTorques()
+    sigma = np.array(sim_params['sigma0'])
+    values = orbit.interpolate(12.3)
+    position, velocity, b = values[0:3], values[3:6], values[6:9] * 1e-9
+    vector, matrix = np.empty(3), np.empty((3, 3))
+    kernels = {
+        'OrbitData.interpolate': lambda out: orbit.interpolate(12.3, out=out),
+        'mrp_to_dcm': lambda out: tr.mrp_to_dcm(sigma, out=out),
+        'inertial_to_orbit_frame': lambda out: ut.inertial_to_orbit_frame(position, velocity, out=out),
+        'get_air_velocity': lambda out: disturbance_torques.get_air_velocity(velocity, position, out=out),
+        'gravity_gradient': lambda out: disturbance_torques.gravity_gradient(sigma, 6.78e6, cubesat, out=out),
+        'total_magnetic': lambda out: disturbance_torques.total_magnetic(b, cubesat, out=out),
+        'cross_product': lambda out: ut.cross_product(sigma, b, out=out),
+    }
+    buffers = {'OrbitData.interpolate': np.empty_like(values), 'mrp_to_dcm': matrix, 'inertial_to_orbit_frame': matrix}
+
+    times = {}
+    for name, kernel in kernels.items():
+        out = buffers.get(name, vector)
+        allocating = min(timeit.repeat(lambda: kernel(None), number=number, repeat=repeat)) / number
+        preallocated = min(timeit.repeat(lambda: kernel(out), number=number, repeat=repeat)) / number
+        times[name] = (allocating, preallocated)
+    return times
+
+
+def time_ensemble(sim_params, num_members, repeat=3):
+    """
+    Times a sim_attitude_ensemble run of num_members copies of benchmark_cubesat against num_members sim_attitude runs
+    one after the other. Both are whole runs (the setup and the lookup tables included) that don't save anything.
+    :param sim_params: simulation parameters with an 'orbit_file', e.g. synthetic_orbit_dataset saved with to_netcdf
+    :return: (best wall time of the serial runs, best wall time of the ensemble run) in seconds
+    """
+    cubesat_params = benchmark_cubesat().asdict()
+    serial = ensemble = np.inf
+    for _ in range(repeat):
+        start = tim.perf_counter()
+        for _ in range(num_members):
+            sim_attitude(sim_params, cubesat_params, 'serial', save=False)
+        serial = min(serial, tim.perf_counter() - start)
+        start = tim.perf_counter()
+        sim_attitude_ensemble(sim_params, [cubesat_params] * num_members, 'ensemble', save=False)
+        ensemble = min(ensemble, tim.perf_counter() - start)
+    return serial, ensemble
+
+
+if __name__ == '__main__':
+    per_step = time_integration_steps()
+    print(f'sim_attitude integration step: {per_step * 1e6:.1f} us per step ({per_step * 1e6 / 4:.1f} us per '
+          f'state_dot_mrp evaluation)')
+
+    print(f'\n{"per call":24} {"new array":>10} {"out array":>10}')
+    for name, (allocating, preallocated) in time_preallocated_kernels().items():
+        print(f'{name:24} {allocating * 1e6:8.2f}us {preallocated * 1e6:8.2f}us')
+
+    with tempfile.TemporaryDirectory() as directory:
+        orbit_file = os.path.join(directory, 'orbit.nc')
+        synthetic_orbit_dataset().to_netcdf(orbit_file)
+        print(f'\n{"members":>8} {"serial":>9} {"ensemble":>9} {"speed up":>9}')
+        for num_members in (1, 16, 64):
+            serial, ensemble = time_ensemble(dict(benchmark_sim_params(20.0), orbit_file=orbit_file), num_members,
+                                             repeat=1)
+            print(f'{num_members:8} {serial:8.2f}s {ensemble:8.2f}s {serial / ensemble:9.2f}')
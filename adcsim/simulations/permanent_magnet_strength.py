@@ -1,10 +1,7 @@
-from adcsim.simulations.sim import sim_attitude
+from adcsim.simulations.sweep import run_sweep
 import numpy as np
 from adcsim.hysteresis_rod import HysteresisRod
 from adcsim.CubeSat_model_examples import CubeSatModel
-from multiprocessing import Pool
-import os
-import copy
 
 
 # create initial simulation parameters dict
@@ -12,11 +9,13 @@ spin = -1 / 36 * np.pi  # maximum 5 degree per axis spin by requirement 3.08
 sim_params = {
     'time_step': 0.01,
     'save_every': 10,
-    'end_time_index': 50,
+    'duration': 50,
     'start_time': '2019/03/24 18:35:01',
-    'final_time': '2019/03/24 18:35:51',
-    'omega0_body': [-2, 3, 3.5],
-    'sigma0': [0.6440095705520482, 0.39840861883760637, 0.18585931442943798]
+    'omega0_body': (np.pi / 180) * np.array([-2, 3, 3.5]),
+    'sigma0': [0.6440095705520482, 0.39840861883760637, 0.18585931442943798],
+    'disturbance_torques': ['gravity', 'magnetic', 'hysteresis', 'aerodynamic', 'solar'],
+    'calculate_power': False,
+    'lut_cache': True  # every run has the same geometry, so the lookup tables are only built by the first one
 }
 
 # create inital cubesat parameters dict (the raw data is way to large to do manually like above)
@@ -35,14 +34,15 @@ cubesat_params = cubesat.asdict()
 #     sim_attitude(sim_params, cubesat_params, f'run_magmoment_{p}')
 
 
-# USING MULTIPLE CORES
-if __name__ == "__main__":
-    pool = Pool(os.cpu_count())  # the number of cores differ on different computers
+# All the configurations share the same geometry, so they can be propagated together as one ensemble in a single
+# process. Set this to False to run one simulation per configuration on as many cores as there are instead. Either way
+# the results are saved to a single file with a 'run' dimension and the strength of each run as the 'magnetic_moment'
+# coordinate (see sweep.py)
+use_ensemble = True
 
-    cp = []
-    perm_strengths = np.arange(0.25, 5 + 0.25, 0.25)
-    for p in perm_strengths:
-        cubesat_params['magnetic_moment'][-1] = p
-        cp.append([copy.deepcopy(sim_params), copy.deepcopy(cubesat_params), f'run_magmoment_{p:.2f}'])
 
-    pool.starmap(sim_attitude, cp)
+if __name__ == "__main__":
+    perm_strengths = np.arange(0.25, 5 + 0.25, 0.25)
+    run_sweep({'sim_params': sim_params, 'cubesat_params': cubesat_params,
+               'axes': {'magnetic_moment': ('cubesat_params.magnetic_moment.2', perm_strengths)}},
+              'run_magmoment_sweep', ensemble=use_ensemble)
@@ -1,17 +1,85 @@
 import numpy as np
 from adcsim import disturbance_torques as dt, integrators as it, transformations as tr, util as ut, \
     state_propagations as st, integral_considerations as ic
-from adcsim.CubeSat_model import CubeSat
+from adcsim.CubeSat_model import CubeSat, CubeSatEnsemble
 from tqdm import tqdm
 import xarray as xr
-from adcsim.dcm_convert.dcm_to_stk import dcm_to_stk_simple
-from adcsim.containers import AttitudeData, OrbitData
+from adcsim.dcm_convert.dcm_to_stk import dcm_to_stk_simple, quaternions_to_stk
+from adcsim.containers import AttitudeData, OrbitData, PresampledOrbitData, EnsembleAttitudeData
+from adcsim.lut_cache import LookupTableCache
+from adcsim.recorder import Recorder
+from adcsim.attitude_output import attitude_variables, attitude_values, quaternion_coords
+from adcsim.checkpoint import checkpoint_path, save_checkpoint, load_checkpoint, check_resume, check_fork
 import os
 from datetime import datetime, timedelta
 from skyfield.api import utc
 
 
-def sim_attitude(sim_params, cubesat_params, file_name, save=True, ret=False):
+def create_lookup_tables(cubesat, disturbance_torques, sim_params):
+    """
+    Creates the aerodynamic, solar and power lookup tables the simulation needs, with the 'lut_resolution',
+    'lut_cube_map', 'lut_cache' and 'lut_interpolation' simulation parameters.
+    :param cubesat: CubeSat model (the shared geometry for ensembles)
+    :param disturbance_torques: DisturbanceTorques object of the simulation
+    :param sim_params: simulation parameters dict
+    """
+    nmu, nphi = sim_params.get('lut_resolution', (101, 101))  # (zenith, azimuth) points of the lookup tables
+    method = sim_params.get('lut_interpolation', 'linear')
+    cube_map = sim_params.get('lut_cube_map')  # points per cube face, used instead of lut_resolution if given
+    # tables are only built once for each geometry and resolution if they are saved in a cache directory
+    cache = sim_params.get('lut_cache')
+    cache = LookupTableCache(None if cache is True else cache) if cache else None
+    if 'aerodynamic' in sim_params['disturbance_torques']:
+        cubesat.create_aerodynamic_table(disturbance_torques.aerodynamic_torque, nmu, nphi, cache, method, cube_map)
+    if 'solar' in sim_params['disturbance_torques']:
+        cubesat.create_solar_table(disturbance_torques.solar_pressure, nmu, nphi, cache, method, cube_map)
+    if sim_params['calculate_power']:
+        cubesat.create_power_table(disturbance_torques.solar_panel_power, nmu, nphi, cache, method, cube_map)
+
+
+def load_orbit_data(sim_params):
+    """
+    Loads the pre-processed orbit and environment data (see pre_process_orbit.py) of the 'orbit_file' simulation
+    parameter, orbit_pre_process.nc in the root of this project by default.
+    :param sim_params: simulation parameters dict
+    :return: OrbitData
+    """
+    orbit_file = sim_params.get('orbit_file') or os.path.join(os.path.dirname(__file__), '../../orbit_pre_process.nc')
+    with xr.open_dataset(orbit_file) as saved_data:
+        return OrbitData(sim_params, saved_data)
+
+
+def create_recorder(file_name, variables, coords, attrs, sim_params, resume_rows=None, first_row=0):
+    """
+    Creates the Recorder of the saved data of a simulation, with the 'output_channels', 'output_encoding' and
+    'output_chunk_size' simulation parameters.
+    :param file_name: netcdf file to write, or None to keep the data in memory
+    :param variables: {name: dims} of all the channels the simulation can save
+    :param coords: {dim: values} of the dimensions other than time
+    :param attrs: attributes of the dataset
+    :param sim_params: simulation parameters dict
+    :param resume_rows: number of rows the file already has, when a simulation is resumed from a checkpoint
+    :param first_row: index of the first saved data point, when a simulation carries on from another one
+    :return: Recorder
+    """
+    channels = sim_params.get('output_channels')  # all of them by default
+    if channels is not None:
+        unknown = set(channels) - set(variables)
+        if unknown:
+            raise ValueError(f'Unknown output channels {sorted(unknown)}, the channels are {list(variables)}')
+        variables = {name: dims for name, dims in variables.items() if name in channels}
+    return Recorder(file_name, variables, coords, attrs, sim_params.get('output_chunk_size', 10000),
+                    sim_params.get('output_encoding'), resume_rows, first_row)
+
+
+def sim_attitude(sim_params, cubesat_params, file_name, save=True, ret=False, resume=False, parent=None):
+    """
+    :param resume: carry on from the last checkpoint of the run saved as file_name and append to its netcdf file (see
+    checkpoint.py, resume_sim and continue_sim). sim_params and cubesat_params must be those of that run, only the
+    duration can be longer.
+    :param parent: file_name of another run to start from the last checkpoint of (see fork_sim). Only the data after
+    it is saved, the dataset has the name of the parent in its 'parent' attribute and the first row in 'fork_row'.
+    """
     if isinstance(sim_params, str):
         sim_params = eval(sim_params)
 
@@ -20,6 +88,9 @@ def sim_attitude(sim_params, cubesat_params, file_name, save=True, ret=False):
     # declare time step for integration
     time_step = sim_params['time_step']
     end_time = sim_params['duration']
+    integrator = sim_params.get('integrator', 'rk4')  # 'rk4' (fixed step) or 'rk45' (adaptive step)
+    rtol = sim_params.get('rtol', 1e-6)  # error tolerances, only used by adaptive integrators
+    atol = sim_params.get('atol', 1e-8)
     time = np.arange(0, end_time, time_step)
     le = (len(time) - 1) // save_every + 1     # Number of time steps where data points are saved
 
@@ -30,178 +101,525 @@ def sim_attitude(sim_params, cubesat_params, file_name, save=True, ret=False):
 
     # create the CubeSat model
     cubesat = CubeSat.fromdict(cubesat_params)
+    num_rods = len(cubesat.hyst_rods)
+    attitude_output = sim_params.get('attitude_output', 'dcm')  # 'dcm', 'quaternion' or 'mrp', see attitude_output.py
+    checkpoint_every = sim_params.get('checkpoint_every')  # saved data points between checkpoints, see checkpoint.py
+    if (checkpoint_every or resume) and not save:
+        raise ValueError('Checkpoints need the data to be saved to a file (save=True)')
+    path = os.path.join(os.path.dirname(__file__), f'../../{file_name}')
+    checkpoint = None
+    if resume and parent is not None:
+        raise ValueError('Give either resume or parent, not both')
+    if resume:
+        checkpoint = load_run_checkpoint(file_name)
+        check_resume(checkpoint, sim_params, cubesat_params)
+        parent = checkpoint.get('parent')
+        first_row = checkpoint.get('first_row', 0)  # a resumed fork still only saves the rows after the fork
+    elif parent is not None:
+        checkpoint = load_run_checkpoint(parent)
+        check_fork(checkpoint, sim_params, cubesat_params)
+        first_row = checkpoint.get('first_row', 0) + checkpoint['rows']
+    else:
+        first_row = 0
 
-    states = np.zeros((le, 2, 3))
-    dcm_bn = np.zeros((le, 3, 3))
-    dcm_on = np.zeros((le, 3, 3))
-    dcm_bo = np.zeros((le, 3, 3))
-    controls = np.zeros((le, 3))
-    nadir = np.zeros((le, 3))
-    sun_vec = np.zeros((le, 3))
-    sun_vec_body = np.zeros((le, 3))
-    lons = np.zeros(le)
-    lats = np.zeros(le)
-    alts = np.zeros(le)
-    positions = np.zeros((le, 3))
-    velocities = np.zeros((le, 3))
-    aerod = np.zeros((le, 3))
-    gravityd = np.zeros((le, 3))
-    solard = np.zeros((le, 3))
-    magneticd = np.zeros((le, 3))
-    density = np.zeros(le)
-    mag_field = np.zeros((le, 3))
-    mag_field_body = np.zeros((le, 3))
-    solar_power = np.zeros(le)
-    is_eclipse = np.zeros(le)
-    hyst_rod = np.zeros((le, len(cubesat.hyst_rods), 3))
-    h_rods = np.zeros((le, len(cubesat.hyst_rods)))
-    b_rods = np.zeros((le, len(cubesat.hyst_rods)))
+    # the saved data is written to the file in chunks while the simulation runs, see recorder.py
+    sim_params_dict = {'time_step': time_step, 'save_every': save_every, 'duration': end_time,
+                       'start_time': start_time.strftime('%Y/%m/%d %H:%M:%S'),
+                       'final_time': final_time.strftime('%Y/%m/%d %H:%M:%S'),
+                       'omega0_body': np.array(sim_params['omega0_body']).tolist(),
+                       'sigma0': np.array(sim_params['sigma0']).tolist(), 'integrator': integrator, 'rtol': rtol,
+                       'atol': atol, 'torque_update_periods': sim_params.get('torque_update_periods', {}),
+                       'torque_hold': sim_params.get('torque_hold', 'hold'),
+                       'lut_resolution': list(sim_params.get('lut_resolution', (101, 101))),
+                       'lut_cache': sim_params.get('lut_cache'),
+                       'lut_interpolation': sim_params.get('lut_interpolation', 'linear'),
+                       'lut_cube_map': sim_params.get('lut_cube_map'),
+                       'output_chunk_size': sim_params.get('output_chunk_size', 10000),
+                       'output_channels': sim_params.get('output_channels'),
+                       'output_encoding': sim_params.get('output_encoding'), 'attitude_output': attitude_output,
+                       'checkpoint_every': checkpoint_every, 'orbit_file': sim_params.get('orbit_file')}
+    variables = {'sun': ('time', 'cord'),
+                 'mag': ('time', 'cord'),
+                 'atmos': ('time',),
+                 'lons': ('time',),
+                 'lats': ('time',),
+                 'alts': ('time',),
+                 'positions': ('time', 'cord'),
+                 'velocities': ('time', 'cord'),
+                 **attitude_variables(attitude_output),
+                 'angular_vel': ('time', 'cord'),
+                 'controls': ('time', 'cord'),
+                 'gg_torque': ('time', 'cord'),
+                 'aero_torque': ('time', 'cord'),
+                 'solar_torque': ('time', 'cord'),
+                 'magnetic_torque': ('time', 'cord'),
+                 'hyst_rod_torque': ('time', 'hyst_rod', 'cord'),
+                 'hyst_rod_magnetization': ('time', 'hyst_rod'),
+                 'hyst_rod_external_field': ('time', 'hyst_rod'),
+                 'nadir': ('time', 'cord'),
+                 'solar_power': ('time',),
+                 'is_eclipse': ('time',)}
+    coords = {'cord': ['x', 'y', 'z'], 'dcm_mat_dim1': np.arange(3), 'dcm_mat_dim2': np.arange(3),
+              'quaternion': quaternion_coords, 'hyst_rod': [f'rod{i}' for i in range(num_rods)]}
+    # Note: the simulation and cubesat parameter dictionaries are saved as strings for the nc file. If you wish
+    # you could just eval(a.cubesat_parameters) to get the dictionary back.
+    attrs = {'simulation_parameters': str(sim_params_dict), 'cubesat_parameters': str(cubesat.asdict()),
+             'description': 'University of kentucky attitude propagator software (they call it SNAP) recreation'}
+    if parent is not None:
+        attrs.update(parent=parent, fork_row=first_row)
+    recorder = create_recorder(path + '.nc' if save else None, variables, coords, attrs, sim_params,
+                               checkpoint['rows'] if resume else None, first_row)
 
     # load saved orbit and environment data
-    with xr.open_dataset(os.path.join(os.path.dirname(__file__), '../../orbit_pre_process.nc')) as saved_data:
-        orbit = OrbitData(sim_params, saved_data)
+    orbit = load_orbit_data(sim_params)
 
     # allocate space for attitude data
     attitude = AttitudeData(cubesat)
 
     # initialize attitude so that z direction of body frame is aligned with nadir
-    # sun_vec[0], mag_field[0], density[0], lons[0], lats[0], alts[0], positions[0], velocities[0] = interp_info(0)
     attitude.interp_orbit_data(orbit, 0.0)
-    sun_vec[0], mag_field[0], density[0], lons[0], lats[0], alts[0], positions[0], velocities[0] = attitude.temp.sun_vec, attitude.temp.mag_field, attitude.temp.density, attitude.temp.lons, attitude.temp.lats, attitude.temp.alts, attitude.temp.positions, attitude.temp.velocities
     sigma0 = np.array(sim_params['sigma0'])
     omega0_body = np.array(sim_params['omega0_body'])
-    states[0] = state = [sigma0, omega0_body]
-    dcm_bn[0] = tr.mrp_to_dcm(states[0][0])
-    dcm_on[0] = ut.inertial_to_orbit_frame(positions[0], velocities[0])
-    dcm_bo[0] = dcm_bn[0] @ dcm_on[0].T
+    dcm_bn = tr.mrp_to_dcm(sigma0)
+    dcm_on = ut.inertial_to_orbit_frame(attitude.temp.positions, attitude.temp.velocities)
 
     # Put hysteresis rods in an initial state that is reasonable. (Otherwise you can get large magnetization from the rods)
-    mag_field_body[0] = (dcm_bn[0] @ mag_field[0]) * 10 ** -9  # in the body frame in units of T
-    for rod in cubesat.hyst_rods:
-        rod.define_integration_size(le)
-        axes = np.argwhere(rod.axes_alignment == 1)[0][0]
-        rod.h[0] = rod.h_current = mag_field_body[0][axes]/cubesat.hyst_rods[0].u0
-        rod.b[0] = rod.b_current = rod.b_field_bottom(rod.h_current)
+    mag_field_body = (dcm_bn @ attitude.temp.mag_field) * 10 ** -9  # in the body frame in units of T
+    rods = cubesat.rod_bank
+    rods.initialize(rods.project(mag_field_body))
+
+    if checkpoint is None:
+        recorder.append({'sun': attitude.temp.sun_vec, 'mag': attitude.temp.mag_field, 'atmos': attitude.temp.density,
+                         'lons': attitude.temp.lons, 'lats': attitude.temp.lats, 'alts': attitude.temp.alts,
+                         'positions': attitude.temp.positions, 'velocities': attitude.temp.velocities,
+                         **attitude_values(attitude_output, sigma0, dcm_bn, dcm_bn @ dcm_on.T),
+                         'angular_vel': omega0_body, 'hyst_rod_magnetization': rods.b,
+                         'hyst_rod_external_field': rods.h})
+
+        # the state is [sigma, omega, B of each hysteresis rod], see state_propagations.py
+        state = np.concatenate((sigma0, omega0_body, rods.b))
+    else:
+        state = checkpoint['state'].copy()
+        rods.h = checkpoint['rod_h'].copy()
+        rods.b = checkpoint['rod_b'].copy()
 
     # initialize the disturbance torque object
-    disturbance_torques = dt.DisturbanceTorques(*([True for _ in range(len(sim_params['disturbance_torques']))] + [sim_params['calculate_power']]))
-    if 'aerodynamic' in sim_params['disturbance_torques']:
-        cubesat.create_aerodynamic_table(disturbance_torques.aerodynamic_torque, 101, 101)
-    if 'solar' in sim_params['disturbance_torques']:
-        cubesat.create_solar_table(disturbance_torques.solar_pressure, 101, 101)
-    if sim_params['calculate_power']:
-        cubesat.create_power_table(disturbance_torques.solar_panel_power, 101, 101)
-    disturbance_torques.save_hysteresis = True
+    disturbance_torques = dt.DisturbanceTorques(**{torque: True for torque in sim_params['disturbance_torques']},
+                                                power=sim_params['calculate_power'],
+                                                update_periods=sim_params.get('torque_update_periods'),
+                                                hold=sim_params.get('torque_hold', 'hold'),
+                                                outputs=sim_params.get('output_channels'))
+    create_lookup_tables(cubesat, disturbance_torques, sim_params)
+    if checkpoint is not None:
+        disturbance_torques.set_state(checkpoint['torques'])
+
+    def save_data(state):
+        c = attitude.save
+        row = {'sun': c.sun_vec, 'mag': c.mag_field, 'atmos': c.density, 'lons': c.lons, 'lats': c.lats,
+               'alts': c.alts, 'positions': c.positions, 'velocities': c.velocities,
+               **attitude_values(attitude_output, c.states[0], c.dcm_bn, c.dcm_bo),
+               'angular_vel': state[3:6], 'controls': c.controls, 'gg_torque': c.gravityd,
+               'aero_torque': c.aerod, 'solar_torque': c.solard, 'magnetic_torque': c.magneticd,
+               'hyst_rod_torque': c.hyst_rod, 'hyst_rod_magnetization': c.b_rods,
+               'hyst_rod_external_field': c.h_rods, 'nadir': c.nadir, 'is_eclipse': c.is_eclipse}
+        if sim_params['calculate_power'] and 'solar_power' in recorder and not c.is_eclipse:
+            row['solar_power'] = disturbance_torques.solar_panel_power(c.sun_vec_body, c.sun_vec, c.positions, cubesat)
+        recorder.append(row)
+
+    checkpoint_rows = len(recorder)  # saved data points at the last checkpoint
+
+    def write_checkpoint(t, state, integrator_state):
+        nonlocal checkpoint_rows
+        if not recorder.sync():
+            return  # the file is open somewhere else, try again on the next saved data point
+        # h and b of the rods at time t (the integration only needs b, which is in the state)
+        attitude.interp_orbit_data(orbit, t)
+        rods.h = rods.project(tr.mrp_to_dcm(state[0:3]) @ attitude.temp.mag_field * 1e-9)
+        rods.b = state[6:].copy()
+        save_checkpoint(checkpoint_path(path), {'sim_params': sim_params, 'cubesat_params': cubesat_params,
+                                                'parent': parent, 'first_row': first_row, 'rows': len(recorder),
+                                                't': t, 'state': state.copy(), 'rod_h': rods.h, 'rod_b': rods.b,
+                                                'torques': disturbance_torques.get_state(), **integrator_state})
+        checkpoint_rows = len(recorder)
+
+    # the integration
+    if integrator == 'rk4':
+        # all the times the orbit data is needed at are known ahead of time for a fixed step integration
+        orbit = PresampledOrbitData(orbit, time, time_step)
+        start = checkpoint['step'] if checkpoint else 0
+        steps = (le - 1) * save_every  # the integration ends with the last saved step
+        for i in tqdm(range(start, steps), initial=start, total=steps):
+            # propagate the state
+            # the quantities that are only saved are calculated in the first stage of the steps that are saved
+            disturbance_torques.save_torques = not (i + 1) % save_every
+            state = it.rk4(st.state_dot_mrp, time[i], state, time_step, attitude, orbit, cubesat, disturbance_torques)
+            # controls[k] = ...
+
+            # do 'tidy' up things at the end of integration (needed for many types of attitude coordinates)
+            state = ic.mrp_switching(state)
+            if not (i + 1) % save_every:
+                save_data(state)
+                if checkpoint_every and len(recorder) - checkpoint_rows >= checkpoint_every:
+                    write_checkpoint(time[i + 1], state, {'step': i + 1})
+        step = max(start, steps)
+        t = time[step]
+        integrator_state = {'step': step}
+    elif integrator == 'rk45':
+        # adaptive step size. The steps don't stop at the saved data points, the state at those is interpolated from the
+        # step they are in (dense output). The integration ends exactly at the last saved data point.
+        save_interval = save_every * time_step
+        t_end = (le - 1) * save_interval
+        max_step = sim_params.get('max_step', np.inf)
+        h = checkpoint['h'] if checkpoint else time_step
+        t = checkpoint['t'] if checkpoint else 0.0
+        # first stage of the next step (a fork has other parameters, so it evaluates its own)
+        state_dot = checkpoint.get('state_dot') if resume else None
+        step = None  # (start time, start state, step size, stages) of the last accepted step
+        track_torques = bool(sim_params.get('torque_update_periods'))
+        start = first_row + len(recorder)
+        for k in tqdm(range(start, le), initial=start - 1, total=le - 1):
+            t_save = k * save_interval
+            while t_save - t > 1e-9 * save_interval:
+                h_try = min(h, max_step, t_end - t)
+                clipped = h_try < min(h, max_step)
+                # the stages of a rejected step must not leave their torques held (see torque_update_periods)
+                torques = disturbance_torques.get_state() if track_torques else None
+                while True:
+                    new_state, error, stages = it.rk45(st.state_dot_mrp, t, state, h_try, attitude, orbit, cubesat,
+                                                       disturbance_torques, first_stage=state_dot)
+                    state_dot = stages[0]  # a retry starts from the same state
+                    err = it.error_norm(error, state, new_state, rtol, atol)
+                    if not np.isfinite(err):
+                        raise RuntimeError(f'The rk45 error estimate is not finite ({err}) at t = {t} s')
+                    if err <= 1:
+                        break
+                    if torques is not None:
+                        disturbance_torques.set_state(torques)
+                    h_try = it.new_step_size(h_try, err)
+                    clipped = False
+                    if h_try < 1e-12 * save_interval:
+                        raise RuntimeError(f'The rk45 step size fell to {h_try} s at t = {t} s without meeting '
+                                           f'rtol={rtol} and atol={atol}')
+                step = (t, state, h_try, stages)
+                t += h_try
+                if not clipped:
+                    h = it.new_step_size(h_try, err)
+
+                # MRP switching must happen after every accepted step, not just the saved ones. The last stage is the
+                # first stage of the next step, unless the switch changed the state.
+                switched = new_state[0:3] @ new_state[0:3] > 1
+                state = ic.mrp_switching(new_state)
+                state_dot = None if switched else stages[-1]
+
+            if step is None or abs(t - t_save) <= 1e-9 * save_interval:
+                t_save, saved_state = t, state
+            else:
+                t0, state0, h0, stages0 = step
+                saved_state = ic.mrp_switching(it.rk45_dense_output(state0, stages0, h0, (t_save - t0) / h0))
+
+            # the saved quantities are evaluated right on the save time (which is before t), without changing the held
+            # torques that the integration carries on with
+            torques = disturbance_torques.get_state() if track_torques else None
+            disturbance_torques.save_torques = True
+            st.state_dot_mrp(t_save, saved_state, attitude, orbit, cubesat, disturbance_torques)
+            if torques is not None:
+                disturbance_torques.set_state(torques)
+            save_data(saved_state)
+            # a checkpoint is only written once every saved data point up to t is saved
+            if checkpoint_every and len(recorder) - checkpoint_rows >= checkpoint_every and \
+                    (k + 1) * save_interval - t > 1e-9 * save_interval:
+                write_checkpoint(t, state, {'t': t, 'h': h, 'state_dot': state_dot})
+        integrator_state = {'t': t, 'h': h, 'state_dot': state_dot}
+    else:
+        raise ValueError(f'Unknown integrator {integrator}')
+    recorder.close()
+    if checkpoint_every:
+        write_checkpoint(t, state, integrator_state)
+
+    if save:
+        saved_time = time[::save_every][first_row:]  # a fork only has the data after the fork
+        with xr.open_dataset(path + '.nc') as data:
+            if 'dcm_bn' in data:
+                dcm_to_stk_simple(saved_time, data.dcm_bn, path + '.a')
+            elif 'quaternion_bn' in data:
+                quaternions_to_stk(saved_time, data.quaternion_bn, path + '.a')
+            elif 'mrp_bn' in data:
+                quaternions_to_stk(saved_time, data.mrp_bn, path + '.a', convert=tr.mrp_to_quaternions)
+    if ret:
+        return recorder.dataset()
+
+
+def sim_attitude_ensemble(sim_params, cubesat_params, file_name, save=True, ret=False):
+    """
+    Propagates N CubeSats in a single rk4 loop. The state is an array of shape (N, 6 + R) and each rk4 stage evaluates
+    all the members with batched numpy operations, sharing the orbit interpolation and lookup tables. This is faster
+    than running sim_attitude N times when N is large (e.g. sweeps over magnetic moments or hysteresis rods), but not
+    for a single member: on the made up orbit of benchmark.py (see time_ensemble) 16 members take about as long as 3
+    sim_attitude runs, 64 members as long as 12, and a single member about twice as long as one.
+
+    :param sim_params: same as sim_attitude. 'omega0_body' and 'sigma0' can either be a single vector used for every
+    member or an array of shape (N, 3).
+    :param cubesat_params: list of N cubesat parameter dicts. They must all have the same geometry (see CubeSatEnsemble)
+    :return: xr.Dataset with a 'run' dimension for everything that differs between members.
+    """
+    if isinstance(sim_params, str):
+        sim_params = eval(sim_params)
+    if sim_params.get('integrator', 'rk4') != 'rk4':
+        raise ValueError('sim_attitude_ensemble only supports the rk4 integrator')
+
+    save_every = sim_params['save_every']
+    time_step = sim_params['time_step']
+    end_time = sim_params['duration']
+    time = np.arange(0, end_time, time_step)
+    le = (len(time) - 1) // save_every + 1
+
+    num_simulation_data_points = int(sim_params['duration'] // sim_params['time_step']) + 1
+    start_time = datetime.strptime(sim_params['start_time'], "%Y/%m/%d %H:%M:%S")
+    start_time = start_time.replace(tzinfo=utc)
+    final_time = start_time + timedelta(seconds=sim_params['time_step']*num_simulation_data_points)
+
+    # create the CubeSat models
+    ensemble = CubeSatEnsemble.fromdicts(cubesat_params)
+    n = len(ensemble)
+    num_rods = ensemble.num_rods
+    sigma0 = np.broadcast_to(np.array(sim_params['sigma0'], dtype=float), (n, 3))
+    omega0_body = np.broadcast_to(np.array(sim_params['omega0_body'], dtype=float), (n, 3))
+    attitude_output = sim_params.get('attitude_output', 'dcm')  # 'dcm', 'quaternion' or 'mrp', see attitude_output.py
+
+    # the saved data is written to the file in chunks while the simulation runs, see recorder.py. The run dimension
+    # comes first for everything that differs between members
+    sim_params_dict = {'time_step': time_step, 'save_every': save_every, 'duration': end_time,
+                       'start_time': start_time.strftime('%Y/%m/%d %H:%M:%S'),
+                       'final_time': final_time.strftime('%Y/%m/%d %H:%M:%S'), 'omega0_body': omega0_body.tolist(),
+                       'sigma0': sigma0.tolist(),
+                       'torque_update_periods': sim_params.get('torque_update_periods', {}),
+                       'torque_hold': sim_params.get('torque_hold', 'hold'),
+                       'lut_resolution': list(sim_params.get('lut_resolution', (101, 101))),
+                       'lut_cache': sim_params.get('lut_cache'),
+                       'lut_interpolation': sim_params.get('lut_interpolation', 'linear'),
+                       'lut_cube_map': sim_params.get('lut_cube_map'),
+                       'output_chunk_size': sim_params.get('output_chunk_size', 10000),
+                       'output_channels': sim_params.get('output_channels'),
+                       'output_encoding': sim_params.get('output_encoding'), 'attitude_output': attitude_output,
+                       'orbit_file': sim_params.get('orbit_file')}
+    variables = {'sun': ('time', 'cord'),
+                 'mag': ('time', 'cord'),
+                 'atmos': ('time',),
+                 'lons': ('time',),
+                 'lats': ('time',),
+                 'alts': ('time',),
+                 'positions': ('time', 'cord'),
+                 'velocities': ('time', 'cord'),
+                 **attitude_variables(attitude_output, ensemble=True),
+                 'angular_vel': ('run', 'time', 'cord'),
+                 'controls': ('run', 'time', 'cord'),
+                 'gg_torque': ('run', 'time', 'cord'),
+                 'aero_torque': ('run', 'time', 'cord'),
+                 'solar_torque': ('run', 'time', 'cord'),
+                 'magnetic_torque': ('run', 'time', 'cord'),
+                 'hyst_rod_torque': ('run', 'time', 'hyst_rod', 'cord'),
+                 'hyst_rod_magnetization': ('run', 'time', 'hyst_rod'),
+                 'hyst_rod_external_field': ('run', 'time', 'hyst_rod'),
+                 'solar_power': ('run', 'time'),
+                 'is_eclipse': ('time',)}
+    coords = {'run': np.arange(n), 'cord': ['x', 'y', 'z'], 'dcm_mat_dim1': np.arange(3),
+              'dcm_mat_dim2': np.arange(3), 'quaternion': quaternion_coords,
+              'hyst_rod': [f'rod{i}' for i in range(num_rods)]}
+    attrs = {'simulation_parameters': str(sim_params_dict), 'cubesat_parameters': str(ensemble.asdicts()),
+             'description': 'University of kentucky attitude propagator software (they call it SNAP) recreation, '
+                            'ensemble run'}
+    recorder = create_recorder(os.path.join(os.path.dirname(__file__), f'../../{file_name}.nc') if save else None,
+                               variables, coords, attrs, sim_params)
+
+    # load saved orbit and environment data (only once for every member)
+    orbit = load_orbit_data(sim_params)
+
+    attitude = EnsembleAttitudeData(ensemble)
+
+    attitude.interp_orbit_data(orbit, 0.0)
+    dcm_bn = tr.mrp_to_dcm_array(sigma0)
+
+    # Put hysteresis rods in an initial state that is reasonable. (Otherwise you can get large magnetization from the rods)
+    mag_field_body = (dcm_bn @ attitude.temp.mag_field) * 10 ** -9  # in the body frame in units of T
+    ensemble.initialize_rods(ensemble.rod_bank.project(mag_field_body))
+
+    recorder.append({'sun': attitude.temp.sun_vec, 'mag': attitude.temp.mag_field, 'atmos': attitude.temp.density,
+                     'lons': attitude.temp.lons, 'lats': attitude.temp.lats, 'alts': attitude.temp.alts,
+                     'positions': attitude.temp.positions, 'velocities': attitude.temp.velocities,
+                     **attitude_values(attitude_output, sigma0, dcm_bn),
+                     'angular_vel': omega0_body, 'hyst_rod_magnetization': ensemble.rod_b,
+                     'hyst_rod_external_field': ensemble.rod_h})
+
+    # the state of each member is [sigma, omega, B of each hysteresis rod], see state_propagations.py
+    state = np.concatenate((sigma0, omega0_body, ensemble.rod_b), axis=1)
+
+    # initialize the disturbance torque object. The lookup tables are built once for the shared geometry
+    disturbance_torques = dt.DisturbanceTorques(**{torque: True for torque in sim_params['disturbance_torques']},
+                                                power=sim_params['calculate_power'],
+                                                update_periods=sim_params.get('torque_update_periods'),
+                                                hold=sim_params.get('torque_hold', 'hold'),
+                                                outputs=sim_params.get('output_channels'))
+    create_lookup_tables(ensemble.geometry, disturbance_torques, sim_params)
 
     # the integration
+    orbit = PresampledOrbitData(orbit, time, time_step)
     k = 0
     for i in tqdm(range(len(time) - 1)):
-        # propagate attitude state
-        disturbance_torques.propagate_hysteresis = True  # should propagate the hysteresis history, bringing it up to the current position
-        disturbance_torques.save_torques = True
-        state = it.rk4(st.state_dot_mrp, time[i], state, time_step, attitude, orbit, cubesat, disturbance_torques)
-        # controls[k] = ...
-
-        # do 'tidy' up things at the end of integration (needed for many types of attitude coordinates)
-        state = ic.mrp_switching(state)
+        disturbance_torques.save_torques = not (i + 1) % save_every
+        state = it.rk4(st.state_dot_mrp_ensemble, time[i], state, time_step, attitude, orbit, ensemble,
+                       disturbance_torques)
+        state = ic.mrp_switching_array(state)
         if not (i + 1) % save_every:
             k += 1
-            states[k] = state
-            dcm_bn[k] = attitude.save.dcm_bn
-            dcm_on[k] = attitude.save.dcm_on
-            dcm_bo[k] = attitude.save.dcm_bo
-            controls[k] = attitude.save.controls
-            nadir[k] = attitude.save.nadir
-            sun_vec[k] = attitude.save.sun_vec
-            sun_vec_body[k] = attitude.save.sun_vec_body
-            lons[k] = attitude.save.lons
-            lats[k] = attitude.save.lats
-            alts[k] = attitude.save.alts
-            positions[k] = attitude.save.positions
-            velocities[k] = attitude.save.velocities
-            aerod[k] = attitude.save.aerod
-            gravityd[k] = attitude.save.gravityd
-            solard[k] = attitude.save.solard
-            magneticd[k] = attitude.save.magneticd
-            density[k] = attitude.save.density
-            mag_field[k] = attitude.save.mag_field
-            mag_field_body[k] = attitude.save.mag_field_body
-            if not attitude.save.is_eclipse:
-                solar_power[k] = disturbance_torques.solar_panel_power(attitude.save.sun_vec_body,
-                                                                       attitude.save.sun_vec,
-                                                                       attitude.save.positions, cubesat)
-            is_eclipse[k] = attitude.save.is_eclipse
-            hyst_rod[k] = attitude.save.hyst_rod
-            disturbance_torques.save_hysteresis = True
+            c = attitude.save
+            row = {'sun': c.sun_vec, 'mag': c.mag_field, 'atmos': c.density, 'lons': c.lons, 'lats': c.lats,
+                   'alts': c.alts, 'positions': c.positions, 'velocities': c.velocities,
+                   **attitude_values(attitude_output, c.states[:, 0], c.dcm_bn), 'angular_vel': state[:, 3:6],
+                   'controls': c.controls, 'gg_torque': c.gravityd,
+                   'aero_torque': c.aerod, 'solar_torque': c.solard, 'magnetic_torque': c.magneticd,
+                   'hyst_rod_torque': c.hyst_rod, 'hyst_rod_magnetization': c.b_rods,
+                   'hyst_rod_external_field': c.h_rods, 'is_eclipse': c.is_eclipse}
+            if sim_params['calculate_power'] and 'solar_power' in recorder and not c.is_eclipse:
+                row['solar_power'] = disturbance_torques.solar_panel_power_ensemble(c.sun_vec_body, c.sun_vec,
+                                                                                    c.positions, ensemble)
+            recorder.append(row)
             if k >= le - 1:
                 break
+    recorder.close()
 
-    for i, rod in enumerate(cubesat.hyst_rods):
-        b_rods[:, i] = rod.b
-        h_rods[:, i] = rod.h
+    if ret:
+        return recorder.dataset()
 
-    omegas = states[:, 1]
-    sigmas = states[:, 0]
 
-    # save the data
-    sim_params_dict = {'time_step': time_step, 'save_every': save_every, 'duration': end_time,
-                       'start_time': start_time.strftime('%Y/%m/%d %H:%M:%S'),
-                       'final_time': final_time.strftime('%Y/%m/%d %H:%M:%S'), 'omega0_body': omega0_body.tolist(),
-                       'sigma0': sigma0.tolist()}
-    a = xr.Dataset({'sun': (['time', 'cord'], sun_vec),
-                    'mag': (['time', 'cord'], mag_field),
-                    'atmos': ('time', density),
-                    'lons': ('time', lons),
-                    'lats': ('time', lats),
-                    'alts': ('time', alts),
-                    'positions': (['time', 'cord'], positions),
-                    'velocities': (['time', 'cord'], velocities),
-                    'dcm_bn': (['time', 'dcm_mat_dim1', 'dcm_mat_dim2'], dcm_bn),
-                    'dcm_bo': (['time', 'dcm_mat_dim1', 'dcm_mat_dim2'], dcm_bo),
-                    'angular_vel': (['time', 'cord'], omegas),
-                    'controls': (['time', 'cord'], controls),
-                    'gg_torque': (['time', 'cord'], gravityd),
-                    'aero_torque': (['time', 'cord'], aerod),
-                    'solar_torque': (['time', 'cord'], solard),
-                    'magnetic_torque': (['time', 'cord'], magneticd),
-                    'hyst_rod_torque': (['time', 'hyst_rod', 'cord'], hyst_rod),
-                    'hyst_rod_magnetization': (['time', 'hyst_rod'], b_rods),
-                    'hyst_rod_external_field': (['time', 'hyst_rod'], h_rods),
-                    'nadir': (['time', 'cord'], nadir),
-                    'solar_power': ('time', solar_power),
-                    'is_eclipse': ('time', is_eclipse)},
-                   coords={'time': np.arange(0, le, 1), 'cord': ['x', 'y', 'z'], 'hyst_rod': [f'rod{i}' for i in range(len(cubesat.hyst_rods))]},
-                   attrs={'simulation_parameters': str(sim_params_dict), 'cubesat_parameters': str(cubesat.asdict()),
-                          'description': 'University of kentucky attitude propagator software '
-                                         '(they call it SNAP) recreation'})
-    # Note: the simulation and cubesat parameter dictionaries are saved as strings for the nc file. If you wish
-    # you could just eval(a.cubesat_parameters) to get the dictionary back.
-    if save:
-        a.to_netcdf(os.path.join(os.path.dirname(__file__), f'../../{file_name}.nc'))
-        dcm_to_stk_simple(time[::save_every], dcm_bn, os.path.join(os.path.dirname(__file__), f'../../{file_name}.a'))
-    if ret:
-        return a
-
-
-# function to continue a simulation from the simulation data time for a given number of additional iterations
-def continue_sim(sim_dataset, num_iter, file_name):
-    import copy
-    original_params = eval(sim_dataset.simulation_parameters)
-    sim_params = copy.deepcopy(original_params)
-    sim_params['duration'] = num_iter
-    sim_params['start_time'] = sim_params['final_time']
-    last_data = sim_dataset.isel(time=-1)
-    sim_params['omega0_body'] = last_data.dcm_bn.values @ last_data.angular_vel.values
-    sim_params['sigma0'] = tr.dcm_to_mrp(last_data.dcm_bn.values)
-    cubesat_params = eval(sim_dataset.cubesat_parameters)
-    new_data = sim_attitude(sim_params, cubesat_params, 'easter_egg', save=False, ret=True)
-    new_data['time'] = np.arange(len(sim_dataset.time), len(sim_dataset.time) + sim_params['duration']*sim_params['save_every'], 1)
-    a = xr.concat([sim_dataset, new_data], dim='time')
-    true_sim_params = eval(a.simulation_parameters)
-    true_sim_params['duration'] = original_params['duration'] + num_iter
-    true_sim_params['final_time'] = eval(new_data.simulation_parameters)['final_time']
-    a.attrs['simulation_parameters'] = str(true_sim_params)
-    a.to_netcdf(os.path.join(os.path.dirname(__file__), f'../../{file_name}.nc'))
+def compare_torque_update_periods(sim_params, cubesat_params, torque_update_periods, torque_hold='hold'):
+    """
+    Runs sim_attitude twice, once calculating every torque at every integration stage (the baseline) and once with the
+    given torque update periods, and reports how much faster the second run was and how far it drifted from the
+    baseline.
+    :param sim_params: simulation parameters. Any 'torque_update_periods' and 'torque_hold' in here are ignored, and
+    the attitude, angular_vel and controls are saved even if they are not in the 'output_channels'.
+    :param cubesat_params: cubesat parameters dict
+    :param torque_update_periods: dict of {torque name: update period in seconds}, e.g. {'aerodynamic': 10}
+    :param torque_hold: 'hold' or 'extrapolate', see DisturbanceTorques
+    :return: dict with the wall times of both runs, the speed up, the largest attitude error (degrees, the rotation
+    angle between the two body frames), the largest angular velocity error (rad/s) and the largest error of the total
+    torque (N.m)
+    """
+    import time as tim
+    baseline_params = {key: value for key, value in sim_params.items()
+                       if key not in ('torque_update_periods', 'torque_hold')}
+    channels = sim_params.get('output_channels')
+    if channels is not None:
+        # the comparison needs the attitude, the angular velocity and the total torque, whatever else is saved
+        attitude = next(iter(attitude_variables(sim_params.get('attitude_output', 'dcm'))))
+        baseline_params['output_channels'] = list(channels) + [name for name in (attitude, 'angular_vel', 'controls')
+                                                               if name not in channels]
+    multirate_params = dict(baseline_params, torque_update_periods=torque_update_periods, torque_hold=torque_hold)
+
+    start = tim.perf_counter()
+    baseline = sim_attitude(baseline_params, cubesat_params, 'baseline', save=False, ret=True)
+    baseline_time = tim.perf_counter() - start
+    start = tim.perf_counter()
+    multirate = sim_attitude(multirate_params, cubesat_params, 'multirate', save=False, ret=True)
+    multirate_time = tim.perf_counter() - start
+
+    # rotation angle of dcm_b1b2 = dcm_b1n @ dcm_b2n^T
+    traces = np.einsum('tij,tij->t', baseline.attitude.dcm_bn.values, multirate.attitude.dcm_bn.values)
+    attitude_error = np.rad2deg(np.arccos(np.clip((traces - 1) / 2, -1, 1)))
+    return {'baseline_time': baseline_time, 'time': multirate_time, 'speed_up': baseline_time / multirate_time,
+            'max_attitude_error': float(attitude_error.max()),
+            'max_angular_velocity_error': float(np.abs(baseline.angular_vel.values -
+                                                       multirate.angular_vel.values).max()),
+            'max_torque_error': float(np.abs(baseline.controls.values - multirate.controls.values).max())}
+
+
+def load_run_checkpoint(file_name, restore_rng=True):
+    """
+    :param file_name: file_name a simulation was run with
+    :param restore_rng: set the state of the numpy random number generator to the one in the checkpoint
+    :return: the last checkpoint of the simulation (see checkpoint.py)
+    """
+    path = checkpoint_path(os.path.join(os.path.dirname(__file__), f'../../{file_name}'))
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'{file_name} has no checkpoint ({path}). Only simulations that were run with the '
+                                f"'checkpoint_every' simulation parameter can be resumed, continued or forked, run it "
+                                f'again with it')
+    return load_checkpoint(path, restore_rng)
+
+
+def resume_sim(file_name, ret=False):
+    """
+    Carries on with a simulation that was stopped, from its last checkpoint (it must have been run with
+    'checkpoint_every', see checkpoint.py). The rest of the run is appended to its netcdf file, and the result is
+    exactly the same as if it had never stopped.
+    :param file_name: file_name the simulation was run with
+    :param ret: return the whole dataset (lazily loaded from the file)
+    """
+    checkpoint = load_run_checkpoint(file_name, restore_rng=False)
+    return sim_attitude(checkpoint['sim_params'], checkpoint['cubesat_params'], file_name, ret=ret, resume=True)
+
+
+def continue_sim(file_name, duration, ret=False):
+    """
+    Runs a finished simulation for longer, from its last checkpoint (it must have been run with 'checkpoint_every', see
+    checkpoint.py). The new data is appended to its netcdf file.
+    :param file_name: file_name the simulation was run with
+    :param duration: how much longer to run it; seconds
+    :param ret: return the whole dataset (lazily loaded from the file)
+    """
+    if isinstance(file_name, xr.Dataset):
+        raise TypeError('continue_sim takes the file_name of a run made with checkpoint_every and how much longer to '
+                        'run it, continue_sim(file_name, duration), not a dataset')
+    checkpoint = load_run_checkpoint(file_name, restore_rng=False)
+    sim_params = dict(checkpoint['sim_params'], duration=checkpoint['sim_params']['duration'] + duration)
+    return sim_attitude(sim_params, checkpoint['cubesat_params'], file_name, ret=ret, resume=True)
+
+
+def fork_sim(parent_file_name, children: dict, duration, processes=None):
+    """
+    Runs variants of a simulation that share its start (e.g. the detumbling, with different magnets or torques after a
+    deployment event) without simulating the start again. They all carry on from the last checkpoint of the parent run
+    (it must have been run with 'checkpoint_every', see checkpoint.py, so e.g. run it with the duration of the shared
+    part). Each child only saves the data after the fork, see open_branch to get its whole history.
+    :param parent_file_name: file_name the parent simulation was run with
+    :param children: {file_name of a child: {'sim_params': {...}, 'cubesat_params': {...}}}, the parameters of each
+    child that are different from the parent's, e.g.
+    {'fork_weak': {'cubesat_params': {'magnetic_moment': [0, 0, 0.5]}}}.
+    The time step, save_every, integrator and the number of hysteresis rods can't be changed.
+    :param duration: how much longer than the parent the children run (the same as continue_sim); seconds
+    :param processes: number of children that are run at the same time, as many as there are processors by default
+    """
+    checkpoint = load_run_checkpoint(parent_file_name, restore_rng=False)
+    args = []
+    for file_name, changes in children.items():
+        sim_params = dict(checkpoint['sim_params'], **changes.get('sim_params', {}))
+        sim_params['duration'] = checkpoint['sim_params']['duration'] + duration
+        cubesat_params = dict(checkpoint['cubesat_params'], **changes.get('cubesat_params', {}))
+        args.append((sim_params, cubesat_params, file_name, True, False, False, parent_file_name))
+    processes = min(len(args), processes or os.cpu_count())
+    if processes > 1:
+        from multiprocessing import Pool
+        with Pool(processes) as pool:
+            pool.starmap(sim_attitude, args)
+    else:
+        for arg in args:
+            sim_attitude(*arg)
+
+
+def open_branch(file_name):
+    """
+    Opens the data of a simulation together with the data of its parents before the fork, if it was forked from another
+    one (see fork_sim).
+    :param file_name: file_name the simulation was run with
+    :return: xr.Dataset of the whole history of the simulation (lazily loaded)
+    """
+    data = xr.open_dataset(os.path.join(os.path.dirname(__file__), f'../../{file_name}.nc'))
+    if 'parent' not in data.attrs:
+        return data
+    prefix = open_branch(data.attrs['parent']).isel(time=slice(0, int(data.attrs['fork_row'])))
+    branch = xr.concat([prefix, data], dim='time')
+    branch.attrs = data.attrs
+    return branch
 
 
 if __name__ == "__main__":
@@ -229,6 +647,7 @@ if __name__ == "__main__":
 
     # Run simulation
     data = sim_attitude(sim_params, cubesat_params, 'sim1', save=True, ret=True)
+    data.close()  # the file is locked while it is open, close it before anything else writes to it
 
-    # run the simulation longer
-    # continue_sim(data, 30, 'test1')
\ No newline at end of file
+    # run the simulation longer (needs 'checkpoint_every' in sim_params)
+    # continue_sim('sim1', 3000)
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+Parameter sweeps of sim_attitude, described with a config instead of hand built lists of parameter dicts.
+
+A sweep config has the base sim_params and cubesat_params, and named axes of parameters to change. Each axis is
+(parameter, values), where parameter is the path of the parameter in the base dicts ('sim_params.' or
+'cubesat_params.' and then the keys and list indices separated by dots), or a list of paths that all get the same value:
+
+>>> config = {'sim_params': sim_params, 'cubesat_params': cubesat_params,
+>>>           'axes': {'magnet': ('cubesat_params.magnetic_moment.2', np.arange(0.25, 5.25, 0.25)),
+>>>                    'rod_volume': (['cubesat_params.hyst_rods.0.volume', 'cubesat_params.hyst_rods.1.volume'],
+>>>                                   [0.05e-6, 0.075e-6, 0.1e-6])},
+>>>           'mode': 'grid'}
+>>> data = run_sweep(config, 'magnet_sweep', ret=True)
+
+With mode 'grid' (the default) every combination of the values of the axes is run (60 runs above), with 'list' all the
+axes have the same number of values and run i uses value i of every axis. The runs are spread over a process pool and
+each result is copied into one netcdf file as soon as it is done, with a 'run' dimension in front of every variable
+and the value of every axis as a coordinate along 'run'. So one file has the whole sweep, e.g.
+data.angular_vel.sel(run=data.magnet == 1.5), and a grid can be unstacked with
+data.set_index(run=['magnet', 'rod_volume']).unstack('run'). Runs that save fewer data points than the longest one are
+padded with NaN.
+
+Each run streams its data to a file of its own (file_name_run0.nc, ...) with the Recorder of the simulation, so the
+memory a run needs doesn't grow with its duration. The file is then copied into the sweep file a block of data points at
+a time and deleted. Only a sweep without a file name (file_name=None) keeps the runs in memory.
+Sweeps that only change the cubesat parameters of the same geometry (the magnets, the hysteresis rods or the inertia)
+can be run as one sim_attitude_ensemble with ensemble=True, which gives the same dataset. It runs in one process, and is
+faster than running the runs one after the other when there are many of them (see sim_attitude_ensemble).
+"""
+import numpy as np
+import xarray as xr
+import netCDF4
+import itertools
+import warnings
+import copy
+import time
+import os
+from adcsim.simulations.sim import sim_attitude, sim_attitude_ensemble
+
+sweep_modes = ('grid', 'list')
+
+
+def sweep_runs(config: dict):
+    """
+    :param config: sweep config, see the module docstring
+    :return: list of (sim_params, cubesat_params) of every run, and {axis name: values of each run}
+    """
+    axes = config.get('axes', {})
+    mode = config.get('mode', 'grid')
+    if mode not in sweep_modes:
+        raise ValueError(f'mode must be one of {sweep_modes}, not {mode!r}')
+    values = [list(axis_values) for _, axis_values in axes.values()]
+    if mode == 'grid':
+        combinations = list(itertools.product(*values))
+    else:
+        if len({len(v) for v in values}) > 1:
+            raise ValueError(f"All the axes of a 'list' sweep need the same number of values, not "
+                             f"{ {name: len(v) for name, v in zip(axes, values)} }")
+        combinations = list(zip(*values))
+    runs = []
+    for combination in combinations:
+        params = {'sim_params': copy.deepcopy(config['sim_params']),
+                  'cubesat_params': copy.deepcopy(config['cubesat_params'])}
+        for (parameter, _), value in zip(axes.values(), combination):
+            for path in [parameter] if isinstance(parameter, str) else parameter:
+                _set_parameter(params, path, value)
+        runs.append((params['sim_params'], params['cubesat_params']))
+    run_values = {name: [combination[i] for combination in combinations] for i, name in enumerate(axes)}
+    return runs, run_values
+
+
+def _set_parameter(params, path, value):
+    keys = path.split('.')
+    if keys[0] not in params:
+        raise ValueError(f"Parameter paths start with 'sim_params' or 'cubesat_params', not {path!r}")
+    target = params
+    for key in keys[:-1]:
+        target = target[int(key) if isinstance(target, (list, np.ndarray)) else key]
+    key = keys[-1]
+    target[int(key) if isinstance(target, (list, np.ndarray)) else key] = copy.deepcopy(value)
+
+
+def _path(file_name):
+    # file names of the simulations are relative to the root of this project
+    return os.path.join(os.path.dirname(__file__), f'../../{file_name}')
+
+
+def _run(args):
+    i, sim_params, cubesat_params, file_name, sim_function = args
+    if file_name is None:
+        return i, sim_function(sim_params, cubesat_params, f'sweep_run{i}', save=False, ret=True)
+    sim_function(sim_params, cubesat_params, f'{file_name}_run{i}', save=True, ret=False)
+    return i, _path(f'{file_name}_run{i}')
+
+
+def run_sweep(config: dict, file_name, processes: int=None, ret: bool=False, sim_function=None,
+              ensemble: bool=False):
+    """
+    Runs all the simulations of a sweep and saves them in one netcdf file (see the module docstring).
+    :param config: sweep config
+    :param file_name: name of the netcdf file of the sweep (without .nc), or None to only keep the results in memory
+    :param processes: number of simulations that are run at the same time, as many as there are processors by default
+    :param ret: return the dataset of the sweep (lazily loaded from the file if there is one)
+    :param sim_function: function that runs one simulation, sim_attitude by default. It is called as
+    sim_function(sim_params, cubesat_params, file_name, save=True, ret=False) and saves the run to file_name.nc
+    (relative to the root of this project, the same as sim_attitude), or with save=False, ret=True and returns its
+    dataset when the sweep has no file
+    :param ensemble: run all the runs together as one ensemble (sim_function is sim_attitude_ensemble by default, and
+    is given the list of the cubesat parameters of the runs). The runs can only differ in their cubesat parameters.
+    """
+    runs, run_values = sweep_runs(config)
+    coords = {}
+    for name, values in run_values.items():
+        values = np.asarray(values)
+        coords[name] = (('run',) + tuple(f'{name}_dim{k}' for k in range(values.ndim - 1)), values)
+    attrs = {'simulation_parameters': str(config['sim_params']), 'cubesat_parameters': str(config['cubesat_params']),
+             'sweep_axes': str({name: (parameter, list(values)) for name, (parameter, values)
+                                in config.get('axes', {}).items()}),
+             'sweep_mode': config.get('mode', 'grid'),
+             'description': 'University of kentucky attitude propagator software (they call it SNAP) recreation, '
+                            'parameter sweep'}
+    if ensemble:
+        return _run_ensemble(runs, file_name, ret, sim_function or sim_attitude_ensemble, coords, attrs)
+    writer = _SweepWriter(None if file_name is None else _path(f'{file_name}.nc'), len(runs), coords, attrs)
+
+    args = [(i, sim_params, cubesat_params, file_name, sim_function or sim_attitude)
+            for i, (sim_params, cubesat_params) in enumerate(runs)]
+    processes = min(len(args), processes or os.cpu_count())
+    if processes > 1:
+        from multiprocessing import Pool
+        with Pool(processes) as pool:
+            for i, result in pool.imap_unordered(_run, args):
+                writer.write(i, result)
+    else:
+        for arg in args:
+            writer.write(*_run(arg))
+    writer.close()
+    if ret:
+        return writer.dataset()
+
+
+def _run_ensemble(runs, file_name, ret, sim_function, coords, attrs):
+    # the whole sweep as one ensemble run, which already has the 'run' dimension. Only the axes need to be added
+    sim_params = runs[0][0]
+    if any(str(params) != str(sim_params) for params, _ in runs):
+        raise ValueError('The runs of an ensemble sweep can only differ in their cubesat parameters')
+    cubesat_params = [params for _, params in runs]
+    if file_name is None:
+        data = sim_function(sim_params, cubesat_params, 'sweep', save=False, ret=True)
+        data = data.assign_coords(**coords)
+        data.attrs.update(attrs)
+        return data if ret else None
+    sim_function(sim_params, cubesat_params, file_name, save=True, ret=False)
+    path = _path(f'{file_name}.nc')
+    with netCDF4.Dataset(path, 'a') as f:
+        f.setncatts(attrs)
+        _create_axes(f, coords)
+        if coords:
+            for name, v in f.variables.items():
+                if 'run' in v.dimensions and name != 'run' and name not in coords:
+                    v.setncattr('coordinates', ' '.join(coords))  # so xarray opens the axes as coordinates
+    if ret:
+        return xr.open_dataset(path)
+
+
+def _create_axes(f, coords):
+    # the values of the axes of each run, as variables along 'run'
+    for name, (dims, values) in coords.items():
+        for dim, size in zip(dims[1:], values.shape[1:]):
+            f.createDimension(dim, size)
+        if values.dtype.kind in 'US':
+            f.createVariable(name, str, dims)[:] = values.astype(object)
+        else:
+            f.createVariable(name, values.dtype, dims)[:] = values
+
+
+class _SweepWriter:
+    """
+    Copies the file of each run of a sweep into its place along the 'run' dimension of one netcdf file as soon as it is
+    done, block_size data points at a time, and deletes it. The sweep file is only open while a run is copied (the same
+    as Recorder), and if it can't be written the run waits in its own file until the next time.
+    """
+    block_size = 10000
+    def __init__(self, path, num_runs, coords, attrs):
+        self._path = path
+        self._num_runs = num_runs
+        self._coords = coords
+        self._attrs = attrs
+        self._created = False
+        self._pending = []
+        self._results = {}  # the datasets of the runs when there is no file
+
+    def write(self, i, result):
+        """
+        :param i: index of the run
+        :param result: path of the run without .nc, or its dataset if the sweep has no file
+        """
+        if self._path is None:
+            self._results[i] = result.load()
+            return
+        self._pending.append((i, result))
+        self._write_pending()
+
+    def _write_pending(self):
+        try:
+            with netCDF4.Dataset(self._path, 'a' if self._created else 'w') as f:
+                while self._pending:
+                    i, path = self._pending[0]
+                    with netCDF4.Dataset(path + '.nc') as run:
+                        if not self._created:
+                            self._create(f, run)
+                            self._created = True
+                        self._write_run(f, i, run)
+                    self._pending.pop(0)
+                    for extension in ('.nc', '.a', '.checkpoint'):  # everything the simulation saved of the run
+                        if os.path.exists(path + extension):
+                            os.remove(path + extension)
+        except OSError as e:
+            warnings.warn(f'Could not write to {self._path} ({e}), the runs are kept in their own files until it can '
+                          f'be written. Is the file still open somewhere else?')
+
+    @staticmethod
+    def _data_variables(run):
+        # the variables of a run that aren't coordinates
+        return {name: v for name, v in run.variables.items() if name not in run.dimensions}
+
+    def _create(self, f, run):
+        f.setncatts(self._attrs)
+        f.createDimension('run', self._num_runs)
+        f.createDimension('time', None)
+        f.createVariable('time', 'i8', ('time',))
+        f.createVariable('run', 'i8', ('run',))[:] = np.arange(self._num_runs)
+        for dim, dimension in run.dimensions.items():
+            if dim != 'time':
+                f.createDimension(dim, len(dimension))
+                if dim in run.variables:
+                    f.createVariable(dim, run[dim].dtype, (dim,))[:] = run[dim][:]
+        _create_axes(f, self._coords)
+        for name, variable in self._data_variables(run).items():
+            filters = variable.filters() or {}
+            # one run per chunk, so reading a run is fast
+            chunks = [1] + [min(len(run.dimensions[d]), self.block_size) if d == 'time' else len(run.dimensions[d])
+                            for d in variable.dimensions]
+            v = f.createVariable(name, variable.dtype, ('run',) + variable.dimensions,
+                                 zlib=filters.get('zlib', False), complevel=filters.get('complevel', 4),
+                                 shuffle=filters.get('shuffle', True), chunksizes=chunks,
+                                 fill_value=np.nan if variable.dtype.kind == 'f' else None)
+            if self._coords:
+                v.setncattr('coordinates', ' '.join(self._coords))  # so xarray opens the axes as coordinates
+
+    def _write_run(self, f, i, run):
+        n = len(run.dimensions['time'])
+        if len(f['time']) < n:
+            f['time'][:n] = run['time'][:]
+        run.set_auto_mask(False)
+        for name, variable in self._data_variables(run).items():
+            if name not in f.variables:
+                continue
+            for start in range(0, n, self.block_size):
+                index = tuple(slice(start, min(start + self.block_size, n)) if d == 'time' else slice(None)
+                              for d in variable.dimensions)
+                f[name][(i,) + index] = variable[index]
+
+    def close(self, retries: int=60):
+        for _ in range(retries):
+            if not self._pending:
+                break
+            time.sleep(1)
+            self._write_pending()
+        if self._pending:
+            raise OSError(f'Could not write {len(self._pending)} runs to {self._path}')
+
+    def dataset(self):
+        if self._path is not None:
+            return xr.open_dataset(self._path)
+        data = xr.concat([self._results[i] for i in range(self._num_runs)], dim='run', join='outer')
+        data = data.assign_coords(run=np.arange(self._num_runs), **self._coords)
+        data.attrs = self._attrs
+        return data
@@ -6,35 +6,97 @@ Includes the 'differential attitude equation" and the 'differential angular velo
 equation of motion).
 
 The angular velocity equation is always the same, but the attitude equation can use any attitude parametrization.
+
+The state is a flat array [sigma, omega, B of each hysteresis rod] of length 6 + R (or shape (N, 6 + R) for an
+ensemble). The magnetization of the rods is integrated along with the attitude: dB/dt = dB/dH * dH/dt, where dH/dt
+comes from the rate of change of the magnetic field in the body frame. So any integrator in integrators.py propagates
+the rods consistently with the attitude.
 """
 import numpy as np
 from adcsim import util as ut
-from adcsim.CubeSat_model import CubeSat
+from adcsim.CubeSat_model import CubeSat, CubeSatEnsemble
 from adcsim.disturbance_torques import DisturbanceTorques
-from adcsim.simulations.sim import AttitudeData, OrbitData
+from adcsim.containers import AttitudeData, OrbitData, EnsembleAttitudeData
 
 
 # differential equations for an MRP attitude parametrization
 def state_dot_mrp(time: float, state: np.ndarray, attitude: AttitudeData, orbit: OrbitData, cubesat: CubeSat, disturbance_torques: DisturbanceTorques):
     """
     Differential attitude equation for the Modified Rodriguez Parameters (MRP) attitude parametrization, with eulers
-    rotational equation of motion.
-    :param state: np.ndarray. The current attitude state (first index is attitude, second index is angular velocity)
+    rotational equation of motion and the magnetization of the hysteresis rods.
+    :param state: np.ndarray. The current state [sigma, omega, B of each hysteresis rod], length 6 + R
     :param
-    :return: np.ndarray. First index is value of attitude differential equation, second is value of angular velocity
-    differential equation
+    :return: np.ndarray. Value of the attitude differential equation, the angular velocity differential equation and
+    the rod magnetization differential equation, same layout as state
+
+    The result is written into attitude.state_dot (so no new arrays are made every call), which means the returned
+    array is overwritten by the next call. The integrators in integrators.py are fine with this.
     """
-    # sigmas
-    a = (1 - state[0] @ state[0]) * np.identity(3) + 2 * ut.cross_product_operator(state[0]) + 2 * \
-        np.outer(state[0], state[0])
-    sigma_propagation = (1/4) * a  @ state[1]
+    s1, s2, s3, w1, w2, w3 = state[:6].tolist()
+    out = attitude.state_dot
+
+    # sigmas. This is (1/4) * a @ omega with a = (1 - s.s) * I + 2 * [s] + 2 * s * s^T, written out element by element
+    a = 1 - (s1*s1 + s2*s2 + s3*s3)
+    sw = 2 * (s1*w1 + s2*w2 + s3*w3)
+    out[0] = 0.25 * (a*w1 + 2*(s2*w3 - s3*w2) + sw*s1)
+    out[1] = 0.25 * (a*w2 + 2*(s3*w1 - s1*w3) + sw*s2)
+    out[2] = 0.25 * (a*w3 + 2*(s1*w2 - s2*w1) + sw*s3)
 
+    c = attitude.save if disturbance_torques.save_torques else attitude.temp  # the container torque is about to use
     control = disturbance_torques.torque(time, state, attitude, orbit, cubesat)
 
+    # omegas: inertia_inv @ (-omega x (inertia @ omega) + control)
+    omega = state[3:6]
+    h1, h2, h3 = (cubesat.inertia @ omega).tolist()
+    c1, c2, c3 = control.tolist()
+    rhs = attitude.state_dot_work
+    rhs[0] = c1 - (w2*h3 - w3*h2)
+    rhs[1] = c2 - (w3*h1 - w1*h3)
+    rhs[2] = c3 - (w1*h2 - w2*h1)
+    np.matmul(cubesat.inertia_inv, rhs, out=out[3:6])
+
+    # rod magnetizations: the field in the body frame changes with the orbit and with the rotation of the body,
+    # dB_body/dt = dcm_bn @ dB_n/dt - omega x B_body
+    if len(out) > 6:
+        rods = cubesat.rod_bank
+        b_dot = c.dcm_bn @ orbit.rate(time)[3:6] * 1e-9 - ut.cross_product(omega, c.mag_field_body)
+        out[6:] = rods.b_dot(c.h_rods, state[6:], rods.project(b_dot))
+
+    return out
+
+
+def state_dot_mrp_ensemble(time: float, state: np.ndarray, attitude: EnsembleAttitudeData, orbit: OrbitData,
+                           ensemble: CubeSatEnsemble, disturbance_torques: DisturbanceTorques):
+    """
+    Same as state_dot_mrp, but for all the members of a CubeSat ensemble at once.
+    :param state: np.ndarray. The current states, shape (N, 6 + R)
+    :return: np.ndarray. The value of the differential equations for each member, shape (N, 6 + R)
+    """
+    sigma = state[:, 0:3]
+    omega = state[:, 3:6]
+    out = np.empty(state.shape)
+
+    # sigmas (this is the same as (1/4) * a @ omega from above, written without building the matrix a)
+    s = np.einsum('ij,ij->i', sigma, sigma)[:, None]
+    sigma_omega = np.einsum('ij,ij->i', sigma, omega)[:, None]
+    ut.cross_product_array(sigma, omega, out=out[:, 0:3])
+    out[:, 0:3] = (1/4) * ((1 - s) * omega + 2 * out[:, 0:3] + 2 * sigma * sigma_omega)
+
+    c = attitude.save if disturbance_torques.save_torques else attitude.temp  # the container torque is about to use
+    control = disturbance_torques.torque_ensemble(time, state, attitude, orbit, ensemble)
+
     # omegas
-    omega_propagation = cubesat.inertia_inv @ ((-ut.cross_product_operator(state[1]) @ cubesat.inertia @ state[1]) + control)
+    h = np.einsum('nij,nj->ni', ensemble.inertia, omega)
+    rhs = control - ut.cross_product_array(omega, h)
+    np.einsum('nij,nj->ni', ensemble.inertia_inv, rhs, out=out[:, 3:6])
 
-    return np.array([sigma_propagation, omega_propagation])
+    # rod magnetizations (see state_dot_mrp)
+    if out.shape[1] > 6:
+        rods = ensemble.rod_bank
+        b_dot = c.dcm_bn @ (orbit.rate(time)[3:6] * 1e-9) - ut.cross_product_array(omega, c.mag_field_body)
+        out[:, 6:] = rods.b_dot(c.h_rods, state[:, 6:], rods.project(b_dot))
+
+    return out
 
 
 # old (could be in 'old' folder)
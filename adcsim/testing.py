@@ -4,9 +4,36 @@ the code you can rerun all of these unittests to confirm nothing broke from the
 """
 
 import unittest
-from adcsim import transformations as tr, util as ut
+from unittest import mock
+from adcsim import transformations as tr, util as ut, integrators as it, integral_considerations as ic
 import numpy as np
-from adcsim.CubeSat_model import Face2D
+from adcsim.CubeSat_model import Face2D, CubeSatEnsemble
+from adcsim.CubeSat_model_examples import CubeSatEx1, CubeSatModel
+from adcsim.hysteresis_rod import HysteresisRod, HysteresisRodBank
+from adcsim import disturbance_torques as dt, state_propagations as st
+from adcsim.containers import AttitudeData, OrbitData, PresampledOrbitData
+from adcsim.simulations.benchmark import synthetic_orbit_dataset, benchmark_sim_params, benchmark_cubesat, time_ensemble
+from adcsim.Python_NRLMSISE import nrlmsise_00 as msis
+from adcsim.lut_cache import LookupTableCache
+from adcsim.recorder import Recorder
+from adcsim.checkpoint import checkpoint_path, save_checkpoint, load_checkpoint, check_resume, check_fork
+from adcsim.attitude_output import attitude_variables, attitude_values
+from adcsim.simulations import sweep
+from adcsim.simulations.sweep import run_sweep, sweep_runs
+from adcsim.simulations.sim import sim_attitude, sim_attitude_ensemble, compare_torque_update_periods, continue_sim, \
+    resume_sim
+from adcsim.lookup_tables import UniformGridTable, CubeMapTable
+from scipy.interpolate import RegularGridInterpolator
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import tempfile
+import xarray as xr
+import os
+try:
+    from adcsim.magnetic_field_model import GeoMag
+    from adcsim import icrf_to_fixed as itf
+except ImportError:  # pysofa is not installed
+    GeoMag = itf = None
 
 
 class CubeSatModelTests(unittest.TestCase):
@@ -39,6 +66,822 @@ class CubeSatModelTests(unittest.TestCase):
         np.testing.assert_almost_equal(face1.centroid, np.array([-0.9, 0.]))
         np.testing.assert_almost_equal(face1.area, 0.2)
 
+    @staticmethod
+    def test_tables_match_single_directions():
+        cubesat = CubeSatModel()
+        torques = dt.DisturbanceTorques()
+        sun_inertial, sat_inertial = np.array([1., 0., 0.]), np.zeros(3)
+        cubesat.create_aerodynamic_table(torques.aerodynamic_torque, 7, 9)
+        cubesat.create_solar_table(torques.solar_pressure, 7, 9)
+        cubesat.create_power_table(torques.solar_panel_power, 7, 9)
+        aero_lut, solar_lut, power_lut = cubesat._aero_lut, cubesat._solar_lut, cubesat._power_lut
+        cubesat._aero_lut = cubesat._solar_lut = cubesat._power_lut = None
+        mu, phi, directions = cubesat._table_directions(7, 9)
+        for i in range(7):
+            for j in range(9):
+                ev = directions[i, j]
+                np.testing.assert_allclose(aero_lut.values[i, j], torques.aerodynamic_torque(ev, 1.0, cubesat),
+                                           rtol=1e-12, atol=1e-12 * np.abs(aero_lut.values).max())
+                np.testing.assert_allclose(solar_lut.values[i, j],
+                                           torques.solar_pressure(ev, sun_inertial, sat_inertial, cubesat),
+                                           rtol=1e-12, atol=1e-12 * np.abs(solar_lut.values).max())
+                np.testing.assert_allclose(power_lut.values[i, j],
+                                           torques.solar_panel_power(ev, sun_inertial, sat_inertial, cubesat),
+                                           rtol=1e-12)
+
+
+class UniformGridTableTests(unittest.TestCase):
+    @staticmethod
+    def _directions():
+        v = np.random.randn(200, 3)
+        return v / np.linalg.norm(v, axis=1)[:, None]
+
+    @staticmethod
+    def test_linear_matches_regular_grid_interpolator():
+        mu = np.linspace(-1., 1., 21)
+        phi = np.linspace(-np.pi, np.pi, 31)
+        values = np.random.randn(21, 31, 3)
+        table = UniformGridTable(mu, phi, values)
+        reference = RegularGridInterpolator((mu, phi), values)
+        v = UniformGridTableTests._directions() * 3.0
+        expected = reference((v[:, 2] / np.linalg.norm(v, axis=1), np.arctan2(v[:, 1], v[:, 0])))
+        np.testing.assert_allclose(table(v), expected, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(table(v.reshape(20, 10, 3)), expected.reshape(20, 10, 3), rtol=1e-12, atol=1e-12)
+        for vi, e in zip(v, expected):
+            np.testing.assert_allclose(table(vi), e, rtol=1e-12, atol=1e-12)
+
+    @staticmethod
+    def test_cubic_is_more_accurate_for_smooth_tables():
+        def function(v):
+            return np.sin(2 * v[..., 0]) + v[..., 1] * v[..., 2]
+
+        mu = np.linspace(-1., 1., 41)
+        phi = np.linspace(-np.pi, np.pi, 41)
+        nu = np.sqrt(1 - mu**2)[:, None]
+        grid = np.stack((nu * np.cos(phi), nu * np.sin(phi), np.repeat(mu[:, None], len(phi), axis=1)), axis=-1)
+        v = UniformGridTableTests._directions()
+        v = v[np.abs(v[:, 2]) < 0.9]  # near the poles the table is not smooth in mu for either method
+        linear = np.abs(UniformGridTable(mu, phi, function(grid))(v) - function(v)).max()
+        cubic_table = UniformGridTable(mu, phi, function(grid), method='cubic')
+        cubic = np.abs(cubic_table(v) - function(v)).max()
+        assert cubic < linear / 4
+        np.testing.assert_allclose([cubic_table(vi) for vi in v], cubic_table(v), rtol=1e-12, atol=1e-14)
+        np.testing.assert_allclose(cubic_table(grid), function(grid), atol=1e-12)  # passes through the grid points
+
+
+class CubeMapTableTests(unittest.TestCase):
+    @staticmethod
+    def test_points_edges_and_single_directions():
+        def function(v):
+            return np.stack((np.sin(2 * v[..., 0]) + v[..., 1] * v[..., 2], v[..., 2]**2), axis=-1)
+
+        directions = CubeMapTable.directions(9)
+        table = CubeMapTable(function(directions))
+        np.testing.assert_allclose(table(directions), function(directions), atol=1e-14)
+        # continuous across the edges and corners of the cube
+        for edge in (np.array([1., 1., 0.3]), np.array([-0.2, -1., 1.]), np.array([1., -1., -1.])):
+            for offset in np.eye(3) * 1e-9:
+                np.testing.assert_allclose(table(edge + offset), table(edge - offset), atol=1e-7)
+        v = UniformGridTableTests._directions()
+        np.testing.assert_allclose([table(vi) for vi in v], table(v), rtol=1e-12, atol=1e-14)
+
+    @staticmethod
+    def test_fewer_points_than_grid():
+        cubesat = CubeSatModel()
+        torques = dt.DisturbanceTorques()
+        v = UniformGridTableTests._directions()
+        exact = torques.aerodynamic_torque(v, 1.0, cubesat)
+        cubesat.create_aerodynamic_table(torques.aerodynamic_torque, cube_map=25)
+        cube_error = np.sqrt(np.mean((cubesat.aerodynamic_lookup(v) - exact)**2))
+        cubesat.create_aerodynamic_table(torques.aerodynamic_torque, 101, 101)
+        grid_error = np.sqrt(np.mean((cubesat.aerodynamic_lookup(v) - exact)**2))
+        assert 6 * 25**2 < 101**2 / 2
+        assert cube_error < 1.5 * grid_error
+
+
+class LookupTableCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self._directory.cleanup)
+
+    def test_same_geometry_is_loaded(self):
+        cache = LookupTableCache(self._directory.name)
+        torques = dt.DisturbanceTorques()
+        calls = []
+
+        def aerodynamic_torque(v, rho, cubesat):
+            calls.append(v.shape)
+            return torques.aerodynamic_torque(v, rho, cubesat)
+
+        first = CubeSatModel()
+        first.create_aerodynamic_table(aerodynamic_torque, 11, 13, cache=cache)
+        second = CubeSatModel(magnetic_moment=np.array([0., 0., 2.]))  # magnets don't change the table
+        second.create_aerodynamic_table(aerodynamic_torque, 11, 13, cache=cache)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first.geometry_hash(), second.geometry_hash())
+        np.testing.assert_array_equal(first._aero_lut.values, second._aero_lut.values)
+        self.assertFalse(second._aero_lut.values.flags.writeable)  # memory mapped from the saved file
+        self.assertFalse(second._aero_lut._coefficients.flags.writeable)  # and so are the coefficients
+        np.testing.assert_array_equal(second._aero_lut._coefficients, CubeSatModel()._create_table(
+            'aerodynamic', torques.aerodynamic_torque, (1.0,), 11, 13, None, 'linear', None)._coefficients)
+
+        second.translate(np.array([0.01, 0., 0.]))  # a different geometry needs a new table
+        self.assertNotEqual(first.geometry_hash(), second.geometry_hash())
+        second.create_aerodynamic_table(aerodynamic_torque, 11, 13, cache=cache)
+        self.assertEqual(len(calls), 2)
+
+    def test_eviction(self):
+        table_size = LookupTableCache(self._directory.name).get('a', lambda: np.zeros(1000)).nbytes + 128
+        cache = LookupTableCache(self._directory.name, max_size=2.5 * table_size)
+        for key in 'bcd':
+            cache.get(key, lambda: np.zeros(1000))
+        self.assertLessEqual(cache.size(), 2.5 * table_size)
+        self.assertIsNotNone(cache.load('d'))
+        self.assertIsNone(cache.load('a'))
+
+    def test_eviction_keeps_the_table_in_use(self):
+        torques = dt.DisturbanceTorques()
+        calls = []
+
+        def aerodynamic_torque(v, rho, cubesat):
+            calls.append(v.shape)
+            return torques.aerodynamic_torque(v, rho, cubesat)
+
+        cubesat = CubeSatModel()
+        cubesat.create_aerodynamic_table(aerodynamic_torque, 11, 13, cache=LookupTableCache(self._directory.name))
+        entry_size = LookupTableCache(self._directory.name).size()
+        cache = LookupTableCache(self._directory.name, max_size=entry_size)  # room for one table and its coefficients
+
+        other = CubeSatModel()
+        other.translate(np.array([0.01, 0., 0.]))
+        other.create_aerodynamic_table(aerodynamic_torque, 11, 13, cache=cache)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(os.listdir(self._directory.name)), 2)  # the first table went with its coefficients
+        other.create_aerodynamic_table(aerodynamic_torque, 11, 13, cache=cache)
+        self.assertEqual(len(calls), 2)
+
+        cache = LookupTableCache(self._directory.name, max_size=1)  # smaller than any table
+        cubesat.create_aerodynamic_table(aerodynamic_torque, 11, 13, cache=cache)
+        cubesat.create_aerodynamic_table(aerodynamic_torque, 11, 13, cache=cache)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(os.listdir(self._directory.name)), 2)
+        self.assertFalse(cubesat._aero_lut._coefficients.flags.writeable)
+
+
+
+class RecorderTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self._directory.cleanup)
+
+    @staticmethod
+    def _record(file_name, num_rows):
+        variables = {'angular_vel': ('time', 'cord'), 'solar_power': ('run', 'time'), 'atmos': ('time',)}
+        coords = {'cord': ['x', 'y', 'z'], 'run': np.arange(2)}
+        recorder = Recorder(file_name, variables, coords, {'description': 'test'}, chunk_size=4)
+        for i in range(num_rows):
+            row = {'angular_vel': [i, 2 * i, 3 * i], 'solar_power': [i, -i]}
+            if i % 2:
+                row['atmos'] = i
+            recorder.append(row)
+        return recorder
+
+    def test_file_matches_memory(self):
+        file_name = os.path.join(self._directory.name, 'sim.nc')
+        recorder = self._record(file_name, 10)
+        with xr.open_dataset(file_name) as data:  # readable while recording, with the complete chunks so far
+            self.assertEqual(data.sizes['time'], 8)
+        recorder.close()
+        expected = self._record(None, 10).dataset()
+        with recorder.dataset() as data:
+            xr.testing.assert_identical(data.load(), expected)
+        np.testing.assert_array_equal(expected.solar_power.values[1], -np.arange(10))
+        np.testing.assert_array_equal(expected.atmos.values, np.arange(10) % 2 * np.arange(10))
+
+    def test_encoding(self):
+        file_name = os.path.join(self._directory.name, 'sim.nc')
+        variables = {'angular_vel': ('time', 'cord'), 'atmos': ('time',)}
+        encoding = {'default': {'dtype': 'f4', 'zlib': True, 'shuffle': True}, 'atmos': {'dtype': 'f8'}}
+        recorder = Recorder(file_name, variables, {'cord': ['x', 'y', 'z']}, chunk_size=4, encoding=encoding)
+        self.assertNotIn('solar_power', recorder)
+        for i in range(6):
+            recorder.append({'angular_vel': [0.1 * i, 0., 1.], 'atmos': 0.1 * i, 'solar_power': 1.})  # not recorded
+        recorder.close()
+        with recorder.dataset() as data:
+            self.assertEqual(data.angular_vel.dtype, np.float32)
+            self.assertTrue(data.angular_vel.encoding['zlib'])
+            self.assertEqual(data.atmos.dtype, np.float64)
+            self.assertNotIn('solar_power', data)
+            np.testing.assert_allclose(data.angular_vel.values[:, 0], 0.1 * np.arange(6), rtol=1e-7)
+        with self.assertRaises(ValueError):
+            Recorder(None, variables, {'cord': ['x', 'y', 'z']}, encoding={'atmos': {'compression': 'zlib'}})
+
+    def test_resume(self):
+        # carrying on after 6 of 10 rows (e.g. from a checkpoint) overwrites the rows after them
+        file_name = os.path.join(self._directory.name, 'sim.nc')
+        self._record(file_name, 9).close()
+        variables = {'angular_vel': ('time', 'cord'), 'solar_power': ('run', 'time'), 'atmos': ('time',)}
+        coords = {'cord': ['x', 'y', 'z'], 'run': np.arange(2)}
+        recorder = Recorder(file_name, variables, coords, {'description': 'resumed'}, chunk_size=4, resume_rows=6)
+        self.assertEqual(len(recorder), 6)
+        for i in range(6, 10):
+            row = {'angular_vel': [i, 2 * i, 3 * i], 'solar_power': [i, -i]}
+            if i % 2:
+                row['atmos'] = i
+            recorder.append(row)
+        self.assertTrue(recorder.sync())
+        recorder.close()
+        expected = self._record(None, 10).dataset()
+        expected.attrs['description'] = 'resumed'
+        with recorder.dataset() as data:
+            xr.testing.assert_identical(data.load(), expected)
+        with self.assertRaises(ValueError):
+            Recorder(file_name, variables, coords, resume_rows=11)
+
+    def test_resume_while_open(self):
+        # a file that is still open somewhere else (HDF5 locks it) is retried with a warning, and then given up on
+        file_name = os.path.join(self._directory.name, 'sim.nc')
+        self._record(file_name, 6).close()
+        variables = {'angular_vel': ('time', 'cord'), 'solar_power': ('run', 'time'), 'atmos': ('time',)}
+        coords = {'cord': ['x', 'y', 'z'], 'run': np.arange(2)}
+        data = xr.open_dataset(file_name)
+        with mock.patch('time.sleep'), self.assertWarns(UserWarning), self.assertRaises(OSError):
+            Recorder(file_name, variables, coords, resume_rows=6)
+        with mock.patch('time.sleep', side_effect=lambda _: data.close()), self.assertWarns(UserWarning):
+            self.assertEqual(len(Recorder(file_name, variables, coords, resume_rows=6)), 6)
+
+    def test_first_row(self):
+        # the rows of a fork are numbered after the rows of its parent
+        file_name = os.path.join(self._directory.name, 'fork.nc')
+        for name in (file_name, None):
+            recorder = Recorder(name, {'atmos': ('time',)}, {}, chunk_size=4, first_row=7)
+            for i in range(6):
+                recorder.append({'atmos': i})
+            recorder.close()
+            with recorder.dataset() as data:
+                np.testing.assert_array_equal(data.time.values, np.arange(7, 13))
+                np.testing.assert_array_equal(data.atmos.values, np.arange(6))
+
+
+class CheckpointTests(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = checkpoint_path(os.path.join(directory, 'sim'))
+            np.random.seed(3)
+            save_checkpoint(path, {'state': np.arange(8.), 'step': 10})
+            expected = np.random.random(3)
+            np.random.seed(4)
+            checkpoint = load_checkpoint(path)
+            np.testing.assert_array_equal(checkpoint['state'], np.arange(8.))
+            self.assertEqual(checkpoint['step'], 10)
+            np.testing.assert_array_equal(np.random.random(3), expected)
+            self.assertEqual(os.listdir(directory), ['sim.checkpoint'])
+
+    def test_check_resume(self):
+        sim_params = {'duration': 100, 'sigma0': np.array([0.1, 0.2, 0.3]), 'checkpoint_every': 10}
+        checkpoint = {'sim_params': sim_params, 'cubesat_params': {'inertia': [[1, 0], [0, 1]]}}
+        check_resume(checkpoint, dict(sim_params, duration=200, checkpoint_every=5), {'inertia': [[1, 0], [0, 1]]})
+        with self.assertRaises(ValueError):
+            check_resume(checkpoint, dict(sim_params, sigma0=np.array([0.1, 0.2, 0.4])), checkpoint['cubesat_params'])
+        with self.assertRaises(ValueError):
+            check_resume(checkpoint, sim_params, {'inertia': [[2, 0], [0, 1]]})
+        with self.assertRaises(ValueError):
+            check_resume(checkpoint, dict(sim_params, duration=50), checkpoint['cubesat_params'])
+
+    def test_check_fork(self):
+        sim_params = {'duration': 100, 'start_time': '2019/03/24 18:35:01', 'time_step': 0.1, 'save_every': 10}
+        checkpoint = {'sim_params': sim_params, 't': 99.0, 'rod_b': np.zeros(2),
+                      'cubesat_params': {'hyst_rods': [{}, {}], 'magnetic_moment': [0, 0, 1.5]}}
+        check_fork(checkpoint, dict(sim_params, duration=200, disturbance_torques=['gravity']),
+                   {'hyst_rods': [{}, {}], 'magnetic_moment': [0, 0, 0.5]})
+        with self.assertRaises(ValueError):
+            check_fork(checkpoint, dict(sim_params, duration=200, time_step=0.2), checkpoint['cubesat_params'])
+        with self.assertRaises(ValueError):
+            check_fork(checkpoint, dict(sim_params, duration=200), {'hyst_rods': [{}]})
+        with self.assertRaises(ValueError):
+            check_fork(checkpoint, dict(sim_params, duration=99), checkpoint['cubesat_params'])
+
+
+def _sweep_sim(sim_params, cubesat_params, file_name, save=True, ret=False):
+    # stands in for sim_attitude in the sweep tests
+    n = int(sim_params['duration'])
+    recorder = Recorder(os.path.join(os.path.dirname(sweep.__file__), f'../../{file_name}.nc') if save else None,
+                        {'angular_vel': ('time', 'cord'), 'atmos': ('time',)}, {'cord': ['x', 'y', 'z']}, chunk_size=3)
+    for i in range(n):
+        recorder.append({'angular_vel': np.full(3, float(cubesat_params['magnetic_moment'][2])),
+                         'atmos': i * sim_params['time_step']})
+    recorder.close()
+    if ret:
+        return recorder.dataset()
+
+
+class SweepTests(unittest.TestCase):
+    _config = {'sim_params': {'duration': 4, 'time_step': 0.1},
+               'cubesat_params': {'magnetic_moment': [0, 0, 1.5], 'hyst_rods': [{'volume': 1}, {'volume': 1}]},
+               'axes': {'magnet': ('cubesat_params.magnetic_moment.2', [0.5, 1.0, 2.0]),
+                        'rod_volume': (['cubesat_params.hyst_rods.0.volume', 'cubesat_params.hyst_rods.1.volume'],
+                                       [2, 3])}}
+
+    def test_runs(self):
+        runs, values = sweep_runs(self._config)
+        self.assertEqual(len(runs), 6)
+        self.assertEqual(values['magnet'], [0.5, 0.5, 1.0, 1.0, 2.0, 2.0])
+        self.assertEqual(runs[3][1], {'magnetic_moment': [0, 0, 1.0], 'hyst_rods': [{'volume': 3}, {'volume': 3}]})
+        self.assertEqual(self._config['cubesat_params']['magnetic_moment'], [0, 0, 1.5])  # the base is not changed
+        runs, values = sweep_runs(dict(self._config, mode='list', axes={
+            'magnet': ('cubesat_params.magnetic_moment.2', [0.5, 1.0]), 'duration': ('sim_params.duration', [4, 2])}))
+        self.assertEqual([(r[0]['duration'], r[1]['magnetic_moment'][2]) for r in runs], [(4, 0.5), (2, 1.0)])
+        with self.assertRaises(ValueError):
+            sweep_runs(dict(self._config, mode='list'))
+        with self.assertRaises(ValueError):
+            sweep_runs(dict(self._config, axes={'dt': ('time_step', [0.1])}))
+
+    def test_file_matches_memory(self):
+        config = dict(self._config, axes=dict(self._config['axes'], duration=('sim_params.duration', [4, 2])))
+        with tempfile.TemporaryDirectory() as directory:
+            root = os.path.join(os.path.dirname(sweep.__file__), '../..')
+            file_name = os.path.relpath(os.path.join(directory, 'sweep'), root)
+            with mock.patch.object(sweep._SweepWriter, 'block_size', 3):
+                with run_sweep(config, file_name, processes=1, ret=True, sim_function=_sweep_sim) as data:
+                    data.load()
+            self.assertEqual(os.listdir(directory), ['sweep.nc'])  # the files of the runs are deleted
+        expected = run_sweep(config, None, processes=1, ret=True, sim_function=_sweep_sim)
+        xr.testing.assert_identical(data, expected)
+        self.assertEqual(data.sizes['run'], 12)
+        np.testing.assert_array_equal(data.angular_vel.values[:, 0, 0], data.magnet.values)
+        self.assertTrue(np.isnan(data.atmos.values[data.duration.values == 2, 2:]).all())  # shorter runs are padded
+
+
+class SimulationTests(unittest.TestCase):
+    # whole simulations on the made up orbit of benchmark.py, so that they don't need orbit_pre_process.nc
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self._directory.cleanup)
+        self._orbit_file = os.path.join(self._directory.name, 'orbit.nc')
+        synthetic_orbit_dataset().to_netcdf(self._orbit_file)
+
+    def _sim_params(self, duration=20.0, **kwargs):
+        return dict(benchmark_sim_params(duration), orbit_file=self._orbit_file, **kwargs)
+
+    def test_ensemble_matches_sim_attitude(self):
+        cubesat_params = []
+        for magnet, hc in ((0.5, 1.59), (1.5, 2.0), (3.0, 1.59)):
+            params = benchmark_cubesat().asdict()
+            params['magnetic_moment'] = [0, 0, magnet]
+            params['hyst_rods'][0]['hc'] = hc
+            cubesat_params.append(params)
+        sim_params = self._sim_params(calculate_power=True)
+        ensemble = sim_attitude_ensemble(sim_params, cubesat_params, 'ensemble', save=False, ret=True)
+        for j, params in enumerate(cubesat_params):
+            data = sim_attitude(sim_params, params, 'member', save=False, ret=True)
+            for name, variable in ensemble.data_vars.items():
+                member = variable.isel(run=j) if 'run' in variable.dims else variable
+                np.testing.assert_allclose(member.values, data[name].values, rtol=1e-10,
+                                           atol=1e-12 * np.nanmax(np.abs(data[name].values)), err_msg=name)
+
+    def test_ensemble_speed_up(self):
+        # 16 members run about 6 times faster as an ensemble than one after the other (the margin is for busy machines)
+        serial, ensemble = time_ensemble(self._sim_params(), 16, repeat=2)
+        self.assertGreater(serial / ensemble, 3)
+
+    def _file_name(self, name):
+        # file names of the simulations are relative to the root of this project
+        root = os.path.join(os.path.dirname(sweep.__file__), '../..')
+        return os.path.relpath(os.path.join(self._directory.name, name), root)
+
+    def test_continue_sim(self):
+        cubesat_params = benchmark_cubesat().asdict()
+        whole = sim_attitude(self._sim_params(20.0), cubesat_params, 'whole', save=False, ret=True)
+        file_name = self._file_name('continued')
+        data = sim_attitude(self._sim_params(10.0, checkpoint_every=5), cubesat_params, file_name, ret=True)
+        data.close()  # the file can't be appended to while it is open
+        with continue_sim(file_name, 10.0, ret=True) as data:
+            xr.testing.assert_equal(data.drop_attrs(), whole.drop_attrs())
+        with self.assertRaises(FileNotFoundError):
+            continue_sim(self._file_name('no_checkpoint'), 10.0)
+        with self.assertRaises(TypeError):
+            continue_sim(whole, 10.0)
+
+    def test_ensemble_sweep(self):
+        config = {'sim_params': self._sim_params(), 'cubesat_params': benchmark_cubesat().asdict(),
+                  'axes': {'magnet': ('cubesat_params.magnetic_moment.2', [0.5, 3.0])}}
+        expected = run_sweep(config, None, processes=1, ret=True)
+        with run_sweep(config, self._file_name('ensemble_sweep'), ret=True, ensemble=True) as data:
+            np.testing.assert_array_equal(data.magnet.values, [0.5, 3.0])
+            self.assertEqual(data.attrs['sweep_axes'], expected.attrs['sweep_axes'])
+            for name in ('angular_vel', 'hyst_rod_magnetization', 'controls'):
+                np.testing.assert_allclose(data[name].values, expected[name].values, rtol=1e-10, atol=1e-20)
+        with self.assertRaises(ValueError):
+            run_sweep(dict(config, axes={'duration': ('sim_params.duration', [10.0, 20.0])}), None, ensemble=True)
+
+    def test_compare_torque_update_periods(self):
+        # the runs save what the comparison needs whatever the attitude output and the output channels are
+        for attitude_output, channels in (('dcm', None), ('quaternion', None), ('mrp', ['atmos'])):
+            sim_params = self._sim_params(attitude_output=attitude_output, output_channels=channels)
+            result = compare_torque_update_periods(sim_params, benchmark_cubesat().asdict(), {'aerodynamic': 1.0})
+            self.assertLess(result['max_attitude_error'], 1e-3)
+            self.assertGreater(result['max_torque_error'], 0)
+
+    def test_rk45_stops_when_the_step_fails(self):
+        sim_params = self._sim_params(integrator='rk45')
+        # a step that is never accepted makes the step size fall to the floor
+        with self.assertRaises(RuntimeError), mock.patch.object(it, 'error_norm', return_value=2.0):
+            sim_attitude(sim_params, benchmark_cubesat().asdict(), 'rk45', save=False)
+        # zero tolerances make the error estimate infinite
+        with self.assertRaises(RuntimeError), np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            sim_attitude(dict(sim_params, rtol=0.0, atol=0.0), benchmark_cubesat().asdict(), 'rk45', save=False)
+
+    def test_rk45_rejected_steps_are_forgotten(self):
+        # a rejected step must not leave the torques of its stages (which are after the accepted step) held
+        sim_params = self._sim_params(integrator='rk45', torque_update_periods={'aerodynamic': 0.3})
+        rk45, error_norm = it.rk45, it.error_norm
+        calls = iter(range(10 ** 6))
+        held_from_the_future = []
+
+        def checked_rk45(fn, time, state, time_step, *args, **kwargs):
+            last = args[-1].get_state()['previous_torque_times']['aerodynamic'][0]
+            held_from_the_future.append(last is not None and last > time)
+            return rk45(fn, time, state, time_step, *args, **kwargs)
+
+        def rejecting_error_norm(*args):
+            return 2.0 if next(calls) % 2 == 0 else error_norm(*args)  # every other try is rejected
+
+        with mock.patch.object(it, 'rk45', checked_rk45), mock.patch.object(it, 'error_norm', rejecting_error_norm):
+            sim_attitude(sim_params, benchmark_cubesat().asdict(), 'rk45', save=False)
+        self.assertGreater(len(held_from_the_future), 20)
+        self.assertFalse(any(held_from_the_future))
+
+    def test_rk45_matches_rk4(self):
+        cubesat_params = benchmark_cubesat().asdict()
+        expected = sim_attitude(self._sim_params(60.0), cubesat_params, 'rk4', save=False, ret=True)
+        data = sim_attitude(self._sim_params(60.0, integrator='rk45', rtol=1e-9, atol=1e-12), cubesat_params, 'rk45',
+                            save=False, ret=True)
+        for name in ('angular_vel', 'hyst_rod_magnetization'):
+            np.testing.assert_allclose(data[name].values, expected[name].values, rtol=1e-6,
+                                       atol=1e-6 * np.abs(expected[name].values).max(), err_msg=name)
+        # rk4 saves the attitude of the first stage of the last step before the data point (one time step earlier)
+        omega = np.abs(expected.angular_vel.values).max()
+        np.testing.assert_allclose(data.dcm_bn.values, expected.dcm_bn.values, atol=2 * omega * 0.1)
+
+    def test_rk45_resume(self):
+        # the steps of rk45 don't stop at the saved data points, a run stopped after a checkpoint still carries on
+        # exactly as if it had never stopped
+        sim_params = self._sim_params(60.0, integrator='rk45', torque_update_periods={'aerodynamic': 2.0})
+        whole = sim_attitude(sim_params, benchmark_cubesat().asdict(), 'whole', save=False, ret=True)
+        file_name = self._file_name('stopped')
+        append = Recorder.append
+        rows = iter(range(10 ** 6))
+
+        def stopping_append(recorder, row):
+            if next(rows) == 37:
+                raise KeyboardInterrupt
+            append(recorder, row)
+
+        with self.assertRaises(KeyboardInterrupt), mock.patch.object(Recorder, 'append', stopping_append):
+            sim_attitude(dict(sim_params, checkpoint_every=4), benchmark_cubesat().asdict(), file_name)
+        with resume_sim(file_name, ret=True) as data:
+            for name in ('angular_vel', 'hyst_rod_magnetization', 'controls', 'dcm_bn'):
+                np.testing.assert_array_equal(data[name].values, whole[name].values, err_msg=name)
+
+    def test_rk45_evaluations(self):
+        # a slowly rotating cubesat needs a lot fewer evaluations of the state derivative with rk45 than with rk4
+        sim_params = self._sim_params(200.0, omega0_body=np.deg2rad([0.05, -0.03, 0.02]), rtol=1e-9, atol=1e-12)
+        evaluations = {}
+        data = {}
+        for integrator in ('rk4', 'rk45'):
+            with mock.patch.object(st, 'state_dot_mrp', wraps=st.state_dot_mrp) as state_dot_mrp:
+                data[integrator] = sim_attitude(dict(sim_params, integrator=integrator), benchmark_cubesat().asdict(),
+                                                integrator, save=False, ret=True)
+            evaluations[integrator] = state_dot_mrp.call_count
+        self.assertEqual(evaluations['rk4'], 4 * 1990)
+        self.assertLess(evaluations['rk45'], evaluations['rk4'] / 10)
+        np.testing.assert_allclose(data['rk45'].angular_vel.values, data['rk4'].angular_vel.values, rtol=1e-6,
+                                   atol=1e-6 * np.abs(data['rk4'].angular_vel.values).max())
+
+
+class AttitudeOutputTests(unittest.TestCase):
+    @staticmethod
+    def test_accessor_matches_dcm():
+        sigmas = np.array([tr.dcm_to_mrp(ut.random_dcm()) for _ in range(6)])
+        positions = np.random.normal(size=(6, 3)) * 7e6
+        velocities = np.random.normal(size=(6, 3)) * 7e3
+        dcm_bn = tr.mrp_to_dcm_array(sigmas)
+        dcm_on = np.array([ut.inertial_to_orbit_frame(p, v) for p, v in zip(positions, velocities)])
+        orbit = {'positions': (('time', 'cord'), positions), 'velocities': (('time', 'cord'), velocities)}
+        saved = xr.Dataset(dict(orbit, dcm_bn=(('time', 'dcm_mat_dim1', 'dcm_mat_dim2'), dcm_bn),
+                                dcm_bo=(('time', 'dcm_mat_dim1', 'dcm_mat_dim2'), dcm_bn @ dcm_on.transpose(0, 2, 1))))
+        for attitude_output in ('quaternion', 'mrp'):
+            values = attitude_values(attitude_output, sigmas, dcm_bn)
+            data = xr.Dataset(dict(orbit, **{name: (dims, values[name]) for name, dims in
+                                             attitude_variables(attitude_output).items()}))
+            for name in ('dcm_bn', 'dcm_bo', 'quaternion_bn', 'mrp_bn'):
+                np.testing.assert_almost_equal(getattr(data.attitude, name).values,
+                                               getattr(saved.attitude, name).values)
+            np.testing.assert_almost_equal(data.isel(time=slice(2, 4)).attitude.dcm_bo.values, saved.dcm_bo.values[2:4])
+
+
+class HysteresisRodBankTests(unittest.TestCase):
+    @staticmethod
+    def _rods():
+        return [HysteresisRod(0.35, 0.73, 1.59, volume=1e-7, axes_alignment=np.array([1.0, 0, 0])),
+                HysteresisRod(0.5, 0.9, 3.0, volume=2e-7, axes_alignment=np.array([0, 1.0, 0])),
+                HysteresisRod(0.35, 0.73, 1.59, volume=1e-7, axes_alignment=np.array([0, 0.6, 0.8]))]
+
+    def test_bank_matches_single_rods(self):
+        rods = self._rods()
+        bank = HysteresisRodBank.from_rods(rods)
+        torques = dt.DisturbanceTorques()
+        b0 = np.array([2e-5, -3e-5, 1e-5])
+        bank.initialize(bank.project(b0))
+        for rod, h in zip(rods, bank.h):
+            rod.h_current = h
+            rod.b_current = rod.b_field_bottom(h)
+        for b in (b0 * 1.5, -b0, b0 * 0.5 + np.array([1e-5, 0, 0])):
+            h = bank.project(b)
+            b_rods = np.array([rod.propagate_magnetization(x) for rod, x in zip(rods, h)])
+            for h_dot in (h - bank.h, bank.h - h):
+                expected = [(rod.mag_process_positive_h(x, y) if x_dot >= 0 else rod.mag_process_negative_h(x, y)) *
+                            x_dot for rod, x, y, x_dot in zip(rods, h, b_rods, h_dot)]
+                np.testing.assert_allclose(bank.b_dot(h, b_rods, h_dot), expected, rtol=1e-12)
+            expected = [ut.cross_product(rod.axes_alignment * rod.b_current * rod.volume / torques._u0, b)
+                        for rod in rods]
+            np.testing.assert_allclose(bank.torques(b_rods, b), expected, rtol=1e-12)
+            np.testing.assert_allclose(bank.torque(b_rods, b), np.sum(expected, axis=0), rtol=1e-12)
+
+    def test_b_dot_matches_propagate(self):
+        # integrating dB/dt along a path of h gives the same B as propagating the rods along it
+        rods = self._rods()
+        bank = HysteresisRodBank.from_rods(rods)
+        path = lambda t: np.array([20.0, -10.0, 5.0]) * np.sin(t)
+        path_rate = lambda t: np.array([20.0, -10.0, 5.0]) * np.cos(t)
+        bank.initialize(path(0.0))
+        for rod, h, b in zip(rods, bank.h, bank.b):
+            rod.h_current, rod.b_current = h, b
+        b = bank.b
+        time_step = 1e-3
+        for i in range(3000):
+            b = it.rk4(lambda t, y: bank.b_dot(path(t), y, path_rate(t)), i * time_step, b, time_step)
+            for rod, h in zip(rods, path((i + 1) * time_step)):
+                rod.propagate_magnetization(h)
+        np.testing.assert_allclose(b, [rod.b_current for rod in rods], atol=1e-6)
+
+
+class CubeSatEnsembleTests(unittest.TestCase):
+    @staticmethod
+    def _cubesats():
+        cubesats = []
+        for i in range(3):
+            rods = [HysteresisRod(0.35, 0.73, 1.59 + i, volume=1e-7, axes_alignment=np.array([1.0, 0, 0])),
+                    HysteresisRod(0.35, 0.73, 1.59, volume=1e-7, axes_alignment=np.array([0, 1.0, 0]))]
+            cubesat = CubeSatEx1()
+            cubesat._hyst_rods = rods
+            cubesats.append(cubesat)
+        return cubesats
+
+    def test_rods_match_single_rods(self):
+        cubesats = self._cubesats()
+        ensemble = CubeSatEnsemble(cubesats)
+        h0 = np.array([[10.0, -5.0], [3.0, 2.0], [-1.0, 0.0]])
+        ensemble.initialize_rods(h0)
+        for j, cubesat in enumerate(cubesats):
+            for r, rod in enumerate(cubesat.hyst_rods):
+                rod.h_current = h0[j, r]
+                rod.b_current = rod.b_field_bottom(h0[j, r])
+        for h_dot in (h0 + 4.0, h0 - 7.0):
+            b_dot = ensemble.rod_bank.b_dot(h0, ensemble.rod_b, h_dot)
+            for j, cubesat in enumerate(cubesats):
+                rods = HysteresisRodBank.from_rods(cubesat.hyst_rods)
+                np.testing.assert_allclose(ensemble.rod_b[j], rods.b, rtol=1e-12)
+                np.testing.assert_allclose(b_dot[j], rods.b_dot(h0[j], rods.b, h_dot[j]), rtol=1e-12)
+
+    def test_different_geometry_raises(self):
+        cubesats = self._cubesats()
+        cubesats[1].translate(np.array([0.01, 0., 0.]))
+        with self.assertRaises(ValueError):
+            CubeSatEnsemble(cubesats)
+
+
+class DisturbanceTorquesTests(unittest.TestCase):
+    @staticmethod
+    def _gravity_torques(times, **kwargs):
+        orbit = OrbitData(benchmark_sim_params(), synthetic_orbit_dataset())
+        cubesat = benchmark_cubesat()
+        attitude = AttitudeData(cubesat)
+        torques = dt.DisturbanceTorques(gravity=True, **kwargs)
+        state = np.array([0.1, 0.2, 0.3, 0.0, 0.0, 0.0, 0.0, 0.0])
+        out = []
+        for t in times:
+            torques.torque(t, state, attitude, orbit, cubesat)
+            out.append(attitude.temp.gravityd.copy())
+        return np.array(out)
+
+    def test_update_period_hold(self):
+        every = self._gravity_torques([0.0, 0.5, 1.0])
+        held = self._gravity_torques([0.0, 0.5, 1.0], update_periods={'gravity': 1.0})
+        np.testing.assert_array_equal(held[1], every[0])
+        np.testing.assert_array_equal(held[2], every[2])
+
+    def test_update_period_extrapolate(self):
+        every = self._gravity_torques([0.0, 1.0, 1.5])
+        extrapolated = self._gravity_torques([0.0, 1.0, 1.5], update_periods={'gravity': 1.0}, hold='extrapolate')
+        np.testing.assert_allclose(extrapolated[2], every[1] + 0.5 * (every[1] - every[0]), rtol=1e-12)
+
+    @staticmethod
+    def test_diagnostics_only_on_save():
+        orbit = OrbitData(benchmark_sim_params(), synthetic_orbit_dataset())
+        cubesat = benchmark_cubesat()
+        attitude = AttitudeData(cubesat)
+        torques = dt.DisturbanceTorques(gravity=True, magnetic=True)
+        state = np.array([0.1, 0.2, 0.3, 0.0, 0.0, 0.0, 0.0, 0.0])
+        temp = torques.torque(0.0, state, attitude, orbit, cubesat).copy()
+        np.testing.assert_array_equal(attitude.temp.dcm_bo, 0)
+        torques.save_torques = True
+        saved = torques.torque(0.0, state, attitude, orbit, cubesat)
+        np.testing.assert_array_equal(saved, temp)
+        np.testing.assert_array_equal(attitude.save.states[0], state[0:3])
+        np.testing.assert_allclose(attitude.save.dcm_bo @ attitude.save.dcm_on, attitude.save.dcm_bn, atol=1e-14)
+        # a saved point in eclipse has no solar torque (not the one of the last saved point in the sun)
+        orbit = OrbitData(benchmark_sim_params(3000.0), synthetic_orbit_dataset())
+        torques = dt.DisturbanceTorques(solar=True)
+        for t, eclipse in ((0.0, 0), (2775.0, 1)):
+            torques.save_torques = True
+            torques.torque(t, state, attitude, orbit, cubesat)
+            assert attitude.save.is_eclipse == eclipse
+            assert np.any(attitude.save.solard != 0) != eclipse
+
+    @staticmethod
+    def test_diagnostics_only_of_saved_outputs():
+        orbit = OrbitData(benchmark_sim_params(), synthetic_orbit_dataset())
+        cubesat = benchmark_cubesat()
+        state = np.array([0.1, 0.2, 0.3, 0.0, 0.0, 0.0, 0.3, -0.2])
+        controls = []
+        for outputs in (None, ['angular_vel', 'mrp_bn']):
+            attitude = AttitudeData(cubesat)
+            torques = dt.DisturbanceTorques(gravity=True, hysteresis=True, outputs=outputs)
+            torques.save_torques = True
+            controls.append(torques.torque(0.0, state, attitude, orbit, cubesat).copy())
+            np.testing.assert_array_equal(attitude.save.states[0], state[0:3])
+        np.testing.assert_allclose(controls[1], controls[0], rtol=1e-12)
+        np.testing.assert_array_equal(attitude.save.dcm_bo, 0)
+        np.testing.assert_array_equal(attitude.save.hyst_rod, 0)
+
+    def test_get_set_state(self):
+        # a new object with the state of another one carries on with the same held torques (for checkpoints)
+        every = self._gravity_torques([0.0, 1.0, 1.5, 2.5], update_periods={'gravity': 1.0}, hold='extrapolate')
+        orbit = OrbitData(benchmark_sim_params(), synthetic_orbit_dataset())
+        cubesat = benchmark_cubesat()
+        attitude = AttitudeData(cubesat)
+        state = np.array([0.1, 0.2, 0.3, 0.0, 0.0, 0.0, 0.0, 0.0])
+        kwargs = dict(gravity=True, update_periods={'gravity': 1.0}, hold='extrapolate')
+        first = dt.DisturbanceTorques(**kwargs)
+        for t in (0.0, 1.0):
+            first.torque(t, state, attitude, orbit, cubesat)
+        second = dt.DisturbanceTorques(**kwargs)
+        second.set_state(first.get_state())
+        for t, expected in zip((1.5, 2.5), every[2:]):
+            second.torque(t, state, attitude, orbit, cubesat)
+            np.testing.assert_array_equal(attitude.temp.gravityd, expected)
+
+    def test_update_period_not_allowed(self):
+        with self.assertRaises(ValueError):
+            dt.DisturbanceTorques(magnetic=True, update_periods={'magnetic': 1.0})
+
+    @staticmethod
+    def _face_loop(v, rho, sun_vec, cubesat):
+        # the aerodynamic torque, solar pressure torque and solar power one face at a time (with the sun 1 m away)
+        torques = dt.DisturbanceTorques()
+        vm = np.linalg.norm(v)
+        ev = v / vm
+        aero = np.zeros(3)
+        solar = np.zeros(3)
+        power = 0.0
+        for face in cubesat.faces:
+            lever_arm = ut.cross_product_operator(face.centroid - cubesat.center_of_mass)
+            mu = ev @ face.normal
+            if mu >= 0:
+                force = -rho * vm**2 * (2 * (1 - face.accommodation_coeff) * mu**2 * face.normal +
+                                        face.accommodation_coeff * mu * ev) * face.area
+                force += face.accommodation_coeff * rho * vm * (0.05 * vm) * face.area * mu * face.normal
+                aero += lever_arm @ force
+            cos_theta = face.normal @ sun_vec
+            if cos_theta > 0:
+                force = -torques._a_solar_constant * face.area * cos_theta * \
+                        (2 * (face.diff_ref_coeff / 3 + face.spec_ref_coeff * cos_theta) * face.normal
+                         + (1 - face.spec_ref_coeff) * sun_vec)
+                solar += lever_arm @ force
+        for face in cubesat.solar_panel_faces:
+            cos_theta = face.normal @ sun_vec
+            if cos_theta > 0:
+                power += torques._a_solar_constant_2 * face.area * cos_theta * face.solar_power_efficiency
+        return aero, solar, power
+
+    def test_face_arrays_match_face_loop(self):
+        cubesat = CubeSatModel()
+        torques = dt.DisturbanceTorques()
+        sun_inertial, sat_inertial = np.array([1., 0., 0.]), np.zeros(3)
+        for i, (v, sun_vec) in enumerate(zip(np.random.randn(20, 3) * 7000, np.random.randn(20, 3))):
+            if i == 10:
+                cubesat.translate(np.array([0.01, -0.02, 0.005]))  # the packed arrays must follow the faces
+            sun_vec /= np.linalg.norm(sun_vec)
+            aero, solar, power = self._face_loop(v, 1e-12, sun_vec, cubesat)
+            np.testing.assert_allclose(torques.aerodynamic_torque(v, 1e-12, cubesat), aero, rtol=1e-10,
+                                       atol=1e-12 * np.abs(aero).max())
+            np.testing.assert_allclose(torques.solar_pressure(sun_vec, sun_inertial, sat_inertial, cubesat), solar,
+                                       rtol=1e-10, atol=1e-12 * np.abs(solar).max())
+            np.testing.assert_allclose(torques.solar_panel_power(sun_vec, sun_inertial, sat_inertial, cubesat), power,
+                                       rtol=1e-12)
+
+
+class OrbitDataTests(unittest.TestCase):
+    @staticmethod
+    def test_uniform_interpolation_matches_interp1d():
+        orbit = OrbitData(benchmark_sim_params(), synthetic_orbit_dataset())
+        assert orbit._uniform
+        for t in [0.0, 3.7, 10.0, 19.999, 25.0, 60.0]:
+            np.testing.assert_array_equal(orbit.interpolate(t), orbit._interp_data(t))
+
+    @staticmethod
+    def test_non_uniform_falls_back_to_interp1d():
+        data = synthetic_orbit_dataset()
+        data = data.isel(time=np.r_[0:3, 4:len(data.time)])
+        orbit = OrbitData(benchmark_sim_params(), data)
+        assert not orbit._uniform
+        np.testing.assert_array_equal(orbit.interpolate(33.3), orbit._interp_data(33.3))
+
+
+    @staticmethod
+    def test_presampled_matches_interpolate():
+        orbit = OrbitData(benchmark_sim_params(), synthetic_orbit_dataset())
+        time_step = 0.3
+        time = np.arange(0, 50, time_step)
+        presampled = PresampledOrbitData(orbit, time, time_step, block_steps=7)
+        for t in time[:-1]:
+            for stage_time in (t, t + 0.5 * time_step, t + 0.5 * time_step, t + time_step):
+                np.testing.assert_array_equal(presampled.interpolate(stage_time), orbit.interpolate(stage_time))
+        np.testing.assert_array_equal(presampled.interpolate(12.345), orbit.interpolate(12.345))
+
+
+@unittest.skipIf(GeoMag is None, 'pysofa is not installed')
+class MagneticFieldModelTests(unittest.TestCase):
+    @staticmethod
+    def test_array_matches_scalar():
+        geomag = GeoMag()
+        locations = np.array([[50.0, -106.0, 400e3], [-20.0, 170.0, 550e3], [90.0, 0.0, 420e3], [0.0, 0.0, 0.0]])
+        start = datetime.datetime(2019, 3, 24, 18, 35, 1)
+        times = [start + datetime.timedelta(seconds=100 * i) for i in range(len(locations))]
+        for output_format in ['geodetic', 'compass', 'cartesian', 'inertial']:
+            b = geomag.GeoMagArray(locations, times, output_format=output_format)
+            for i in range(len(locations)):
+                np.testing.assert_allclose(b[i], geomag.GeoMag(locations[i], times[i], output_format=output_format),
+                                           rtol=1e-10, atol=1e-8)
+
+
+@unittest.skipIf(itf is None, 'pysofa is not installed')
+class IcrfToFixedTests(unittest.TestCase):
+    @staticmethod
+    def test_cached_rotation_matches_icrf_to_fixed():
+        rotation = itf.IcrfToFixed()
+        epoch = datetime.datetime(2019, 3, 24, 18, 35, 1)
+        seconds = np.linspace(0, 2 * 86400, 50)
+        np.testing.assert_allclose(rotation(epoch, seconds), itf.icrf_to_fixed(epoch, seconds), atol=1e-10)
+        np.testing.assert_allclose(rotation(epoch), itf.icrf_to_fixed(epoch), atol=1e-10)
+        assert rotation(epoch) is rotation(epoch)
+
+
+class NrlmsiseTests(unittest.TestCase):
+    @staticmethod
+    def _density(alt, lat, lon, doy, sec, sw9=1):
+        flags = msis.nrlmsise_flags()
+        for i in range(1, 24):
+            flags.switches[i] = 1
+        flags.switches[9] = sw9
+        aph = msis.ap_array()
+        aph.a = [100.0 if np.ndim(alt) == 0 else np.full(np.shape(alt), 100.0)] * 7
+        output = msis.nrlmsise_output()
+        msis.gtd7(msis.nrlmsise_input(doy=doy, sec=sec, alt=alt, g_lat=lat, g_long=lon, lst=sec/3600 + lon/15,
+                                      f107A=150, f107=180, ap=4, ap_a=aph), flags, output)
+        return np.array(output.d + output.t)
+
+    def test_array_matches_scalar(self):
+        alt = np.array([0.0, 10.0, 32.5, 50.0, 72.5, 100.0, 120.0, 250.0, 400.0, 1000.0])
+        lat = np.linspace(-80, 80, len(alt))
+        lon = np.linspace(-170, 170, len(alt))
+        doy = np.arange(1, 365, 365 // len(alt))[:len(alt)].astype(float)
+        sec = np.linspace(0, 86000, len(alt))
+        for sw9 in [1, -1]:
+            d = self._density(alt, lat, lon, doy, sec, sw9)
+            for i in range(len(alt)):
+                np.testing.assert_allclose(d[:, i], self._density(alt[i], lat[i], lon[i], doy[i], sec[i], sw9),
+                                           rtol=1e-12)
+
+    def test_threads(self):
+        points = [(100.0 + 50*i, 10.0*i - 40, 30.0*i - 150, 20.0*i + 1, 8000.0*i) for i in range(10)]
+        expected = [self._density(*point) for point in points]
+        with ThreadPoolExecutor(4) as executor:
+            for _ in range(5):
+                np.testing.assert_array_equal(list(executor.map(lambda point: self._density(*point), points)),
+                                              expected)
+
 
 class UtilitiesTests(unittest.TestCase):
     @staticmethod
@@ -155,6 +998,19 @@ class TransformationsTests(unittest.TestCase):
             np.testing.assert_almost_equal(np.linalg.norm(dcm2[i]), 1)
             np.testing.assert_almost_equal(np.linalg.norm(dcm2[:, i]), 1)
 
+    @staticmethod
+    def test_mrp_to_dcm_array():
+        sigmas = np.array([tr.dcm_to_mrp(ut.random_dcm()) for _ in range(5)])
+        dcms = tr.mrp_to_dcm_array(sigmas)
+        for sigma, dcm in zip(sigmas, dcms):
+            np.testing.assert_almost_equal(dcm, tr.mrp_to_dcm(sigma))
+
+    @staticmethod
+    def test_mrp_switching_array():
+        states = np.array([[[0.1, 0.2, 0.3], [1., 2., 3.]], [[1.0, 1.0, 0.5], [1., 2., 3.]]])
+        expected = [ic.mrp_switching(s.copy()) for s in states]
+        np.testing.assert_almost_equal(ic.mrp_switching_array(states), expected)
+
     @staticmethod
     def test_dcm_to_quaternions_same_result():
         for i in range(30):  # this is a quick and poor way to check that sheppard's method works for all 4 cases
@@ -175,6 +1031,98 @@ class TransformationsTests(unittest.TestCase):
         except AssertionError:
             np.testing.assert_almost_equal(-b1, b2)
 
+    @staticmethod
+    def test_quaternion_arrays_match_scalar():
+        dcms = np.array([ut.random_dcm() for _ in range(30)] + [np.diag([1., -1., -1.]), np.diag([-1., 1., -1.])])
+        b = tr.dcm_to_quaternions_array(dcms)
+        np.testing.assert_almost_equal(b, [tr.dcm_to_quaternions(dcm) for dcm in dcms])
+        np.testing.assert_almost_equal(tr.quaternions_to_dcm_array(b), dcms)
+        np.testing.assert_almost_equal(tr.quaternions_to_dcm_array(b.reshape(2, 16, 4)), dcms.reshape(2, 16, 3, 3))
+
+    @staticmethod
+    def test_mrp_quaternions_reverse():
+        sigmas = np.array([tr.dcm_to_mrp(ut.random_dcm()) for _ in range(5)])
+        b = tr.mrp_to_quaternions(sigmas)
+        np.testing.assert_almost_equal(tr.quaternions_to_dcm_array(b), tr.mrp_to_dcm_array(sigmas))
+        np.testing.assert_almost_equal(tr.quaternions_to_mrp(b), sigmas)
+        np.testing.assert_almost_equal(tr.mrp_to_quaternions(sigmas[0]), b[0])
+
+
+class StatePropagationsTests(unittest.TestCase):
+    @staticmethod
+    def test_rod_rate_matches_field_rate():
+        # the rate of change of the rod magnetizations uses the rate of change of h along the rods, which is checked
+        # here against a finite difference of h along the integration
+        orbit = OrbitData(benchmark_sim_params(), synthetic_orbit_dataset())
+        cubesat = benchmark_cubesat()
+        attitude = AttitudeData(cubesat)
+        torques = dt.DisturbanceTorques(magnetic=True, hysteresis=True)
+        rods = cubesat.rod_bank
+        state = np.array([0.1, 0.2, 0.3, 0.05, -0.02, 0.03, 0.3, -0.2])
+        state_dot = st.state_dot_mrp(12.0, state, attitude, orbit, cubesat, torques).copy()
+        h = attitude.temp.h_rods.copy()
+        eps = 1e-4
+        st.state_dot_mrp(12.0 + eps, state + eps * state_dot, attitude, orbit, cubesat, torques)
+        h_dot = (attitude.temp.h_rods - h) / eps
+        np.testing.assert_allclose(state_dot[6:], rods.b_dot(h, state[6:], h_dot), rtol=1e-3)
+
+
+class IntegratorsTests(unittest.TestCase):
+    @staticmethod
+    def test_rk45_exponential_decay():
+        fn = lambda t, y: -y
+        y, error, stages = it.rk45(fn, 0.0, np.array([1.0, 2.0]), 0.1)
+        np.testing.assert_allclose(y, np.exp(-0.1) * np.array([1.0, 2.0]), rtol=1e-9)
+        assert np.all(np.abs(error) < 1e-7)
+        np.testing.assert_array_equal(stages[-1], fn(0.1, y))
+
+    @staticmethod
+    def test_rk45_first_stage_and_dense_output():
+        calls = []
+
+        def fn(t, y):
+            calls.append(t)
+            return np.array([y[1], -y[0]])
+
+        y0 = np.array([1.0, 0.0])
+        y, error, stages = it.rk45(fn, 0.0, y0, 0.2)
+        assert len(calls) == 7
+        # the last stage is the first stage of the next step
+        y2, error2, stages2 = it.rk45(fn, 0.2, y, 0.2, first_stage=stages[-1])
+        assert len(calls) == 13
+        for a, b in zip((y2, error2, stages2), it.rk45(fn, 0.2, y, 0.2)):
+            np.testing.assert_array_equal(a, b)
+        np.testing.assert_allclose(it.rk45_dense_output(y0, stages, 0.2, 0.0), y0, atol=1e-15)
+        np.testing.assert_allclose(it.rk45_dense_output(y0, stages, 0.2, 1.0), y, atol=1e-15)
+        for theta in (0.25, 0.5, 0.8):
+            np.testing.assert_allclose(it.rk45_dense_output(y0, stages, 0.2, theta),
+                                       [np.cos(0.2 * theta), -np.sin(0.2 * theta)], atol=1e-7)
+
+    @staticmethod
+    def test_rk45_adaptive_matches_rk4():
+        fn = lambda t, y: np.array([y[1], -y[0]])  # harmonic oscillator
+        y = y_rk4 = np.array([1.0, 0.0])
+        t = 0.0
+        h = 0.01
+        while t < 10.0:
+            h = min(h, 10.0 - t)
+            y_new, error, _ = it.rk45(fn, t, y, h)
+            err = it.error_norm(error, y, y_new, 1e-9, 1e-12)
+            if err <= 1:
+                t += h
+                y = y_new
+            h = it.new_step_size(h, err)
+        for i in range(1000):
+            y_rk4 = it.rk4(fn, i * 0.01, y_rk4, 0.01)
+        np.testing.assert_allclose(y, [np.cos(10.0), -np.sin(10.0)], atol=1e-7)
+        np.testing.assert_allclose(y, y_rk4, atol=1e-7)
+
+    @staticmethod
+    def test_new_step_size_limits():
+        assert it.new_step_size(1.0, 0.0) == 5.0
+        assert it.new_step_size(1.0, 1e10) == 0.2
+        assert it.new_step_size(1.0, 2.0) < 1.0
+
 
 if __name__ == '__main__':
     unittest.main()
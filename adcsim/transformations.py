@@ -61,6 +61,28 @@ def quaternions_to_dcm(b):
     return np.array(dcm)
 
 
+def quaternions_to_dcm_array(b):
+    """
+    Same as quaternions_to_dcm, but for an array of quaternions
+
+    :param b: quaternions (scalar first), shape (..., 4)
+    :return: DCMs, shape (..., 3, 3)
+    """
+    b = np.asarray(b)
+    b0, b1, b2, b3 = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+    dcm = np.empty(b.shape[:-1] + (3, 3))
+    dcm[..., 0, 0] = b0*b0 + b1*b1 - b2*b2 - b3*b3
+    dcm[..., 0, 1] = 2*(b1*b2 + b0*b3)
+    dcm[..., 0, 2] = 2*(b1*b3 - b0*b2)
+    dcm[..., 1, 0] = 2*(b1*b2 - b0*b3)
+    dcm[..., 1, 1] = b0*b0 - b1*b1 + b2*b2 - b3*b3
+    dcm[..., 1, 2] = 2*(b2*b3 + b0*b1)
+    dcm[..., 2, 0] = 2*(b1*b3 + b0*b2)
+    dcm[..., 2, 1] = 2*(b2*b3 - b0*b1)
+    dcm[..., 2, 2] = b0*b0 - b1*b1 - b2*b2 + b3*b3
+    return dcm
+
+
 def dcm_to_quaternions_bad(dcm):
     """
     This function generates the quaternion coordinates corresponding to the DCM input
@@ -119,6 +141,60 @@ def dcm_to_quaternions(dcm):
     return b
 
 
+def dcm_to_quaternions_array(dcm):
+    """
+    Same as dcm_to_quaternions (sheppard's method), but for an array of DCMs
+
+    :param dcm: DCMs, shape (..., 3, 3)
+    :return: quaternions (scalar first, the 'short rotation'), shape (..., 4)
+    """
+    dcm = np.asarray(dcm)
+    trace = np.trace(dcm, axis1=-2, axis2=-1)
+    b_2 = (1/4)*np.stack((1 + trace, 1 + 2*dcm[..., 0, 0] - trace, 1 + 2*dcm[..., 1, 1] - trace,
+                          1 + 2*dcm[..., 2, 2] - trace), axis=-1)
+    argmax = np.argmax(b_2, axis=-1)
+    largest = np.sqrt(np.take_along_axis(b_2, argmax[..., None], axis=-1))[..., 0]
+
+    # the 6 combinations of off diagonal elements, of which the row of the largest element gives 4*b[largest]*b
+    d01, d02, d12 = dcm[..., 0, 1], dcm[..., 0, 2], dcm[..., 1, 2]
+    d10, d20, d21 = dcm[..., 1, 0], dcm[..., 2, 0], dcm[..., 2, 1]
+    products = np.stack((np.stack((4*b_2[..., 0], d12 - d21, d20 - d02, d01 - d10), axis=-1),
+                         np.stack((d12 - d21, 4*b_2[..., 1], d01 + d10, d20 + d02), axis=-1),
+                         np.stack((d20 - d02, d01 + d10, 4*b_2[..., 2], d12 + d21), axis=-1),
+                         np.stack((d01 - d10, d20 + d02, d12 + d21, 4*b_2[..., 3]), axis=-1)), axis=-2)
+    b = np.take_along_axis(products, argmax[..., None, None], axis=-2)[..., 0, :] / (4*largest[..., None])
+
+    # last step to make sure we have the 'short rotation'
+    return np.where(b[..., :1] < 0, -b, b)
+
+
+def mrp_to_quaternions(sigma):
+    """
+    This function generates the quaternion coordinates corresponding to the MRP input
+
+    Taken from Part1/8_Modified-Rodrigues-Parameters-_MRP_.pdf page 89
+
+    :param sigma: MRP coordinate vector, or an array of them with shape (..., 3)
+    :return: quaternion coordinate vector (scalar first), shape (..., 4). It is the 'short rotation' if |sigma| <= 1
+    """
+    sigma = np.asarray(sigma)
+    s = np.sum(sigma * sigma, axis=-1)[..., None]
+    return np.concatenate(((1 - s)/(1 + s), 2*sigma/(1 + s)), axis=-1)
+
+
+def quaternions_to_mrp(b):
+    """
+    This function generates the MRP coordinates corresponding to the quaternion input
+
+    Taken from Part1/8_Modified-Rodrigues-Parameters-_MRP_.pdf page 89
+
+    :param b: quaternion coordinate vector (scalar first), or an array of them with shape (..., 4)
+    :return: MRP coordinate vector, shape (..., 3). |sigma| <= 1 for the 'short rotation' (b[0] >= 0)
+    """
+    b = np.asarray(b)
+    return b[..., 1:] / (1 + b[..., :1])
+
+
 def crp_to_dcm(q):
     """
     This function generates the DCM coordinates corresponding to the DCM input
@@ -147,17 +223,47 @@ def dcm_to_crp(dcm):
     return (1/c)*np.array([dcm[1, 2] - dcm[2, 1], dcm[2, 0] - dcm[0, 2], dcm[0, 1] - dcm[1, 0]])
 
 
-def mrp_to_dcm(sigma):
+def mrp_to_dcm(sigma, out=None):
     """
     This function generates the DCM coordinates corresponding to the MRP input
 
     Taken from Part1/8_Modified-Rodrigues-Parameters-_MRP_.pdf page 97
 
+    The matrix equation I + (8*[s]^2 - 4*(1 - s.s)*[s])/(1 + s.s)^2 is written out element by element (using
+    [s]^2 = s*s^T - (s.s)*I) because this is called in every step of the integration, and building the small matrices
+    with numpy takes much longer than the arithmetic.
+
     :param sigma: MRP coordinate vector
+    :param out: optional (3, 3) array to write the DCM into
     :return: DCM
     """
-    sigma_cross = ut.cross_product_operator(sigma)
-    s = sigma @ sigma
+    s1, s2, s3 = np.asarray(sigma).tolist()
+    s = s1*s1 + s2*s2 + s3*s3
+    d = 1.0 / (1 + s)**2
+    a = 4*(1 - s)
+    if out is None:
+        out = np.empty((3, 3))
+    out[0, 0] = 1 + 8*(s1*s1 - s)*d
+    out[0, 1] = (8*s1*s2 + a*s3)*d
+    out[0, 2] = (8*s1*s3 - a*s2)*d
+    out[1, 0] = (8*s2*s1 - a*s3)*d
+    out[1, 1] = 1 + 8*(s2*s2 - s)*d
+    out[1, 2] = (8*s2*s3 + a*s1)*d
+    out[2, 0] = (8*s3*s1 + a*s2)*d
+    out[2, 1] = (8*s3*s2 - a*s1)*d
+    out[2, 2] = 1 + 8*(s3*s3 - s)*d
+    return out
+
+
+def mrp_to_dcm_array(sigma):
+    """
+    Same as mrp_to_dcm, but for an array of MRP coordinate vectors
+
+    :param sigma: MRP coordinate vectors, shape (N, 3)
+    :return: DCMs, shape (N, 3, 3)
+    """
+    sigma_cross = ut.cross_product_operator_array(sigma)
+    s = np.einsum('ij,ij->i', sigma, sigma)[:, None, None]
     return np.identity(3) + (8*(sigma_cross @ sigma_cross) - 4*(1 - s)*sigma_cross)/(1 + s)**2
 
 